@@ -1 +1,78 @@
+"""Service tests for the Southampton Provenance Suite services.
+"""
+# Copyright (c) 2015 University of Southampton
+#
+# Permission is hereby granted, free of charge, to any person
+# obtaining a copy of this software and associated documentation files
+# (the "Software"), to deal in the Software without restriction,
+# including without limitation the rights to use, copy, modify, merge,
+# publish, distribute, sublicense, and/or sell copies of the Software,
+# and to permit persons to whom the Software is furnished to do so,
+# subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be
+# included in all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND,
+# EXPRESS OR IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF
+# MERCHANTABILITY, FITNESS FOR A PARTICULAR PURPOSE AND
+# NONINFRINGEMENT. IN NO EVENT SHALL THE AUTHORS OR COPYRIGHT HOLDERS
+# BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER LIABILITY, WHETHER IN AN
+# ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM, OUT OF OR IN
+# CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
 
+from __future__ import (absolute_import, division, print_function,
+                        unicode_literals)
+
+import os
+
+from prov_service_tests import runid
+
+# Set the run identifier when nose first imports the package, in its
+# main process, so that worker processes of nosetests --processes
+# inherit it and share one run, see runid.get_run_name.
+runid.get_run_name()
+
+
+def teardown_package():
+  """Package-level fixture run by nose after all tests. Prints
+  connection pool statistics, request latency percentiles, response
+  sizes by format, any cache outcomes and any streamed transfers for
+  this process. If ``PROV_TIMINGS_FILE`` is set, latency percentiles
+  are also written to that file as JSON. If ``PROV_HISTORY_FILE`` is
+  set, test durations and latency percentiles are saved in the
+  history, see :mod:`prov_service_tests.history`. Any ProvStore
+  documents which tests may have failed to delete are deleted in bulk
+  first, and any circuit breakers which saw failures are listed.
+  """
+  from prov_service_tests import budget
+  from prov_service_tests import cache
+  from prov_service_tests import history
+  from prov_service_tests import session
+  from prov_service_tests import sizes
+  from prov_service_tests import streaming
+  from prov_service_tests import timing
+  from prov_service_tests.test_provstore import ORPHANS
+  for url in ORPHANS.delete_all():
+    print("Warning: " + url + " may not have been deleted")
+  for breaker in budget.BREAKERS:
+    if breaker.failures or breaker.short_circuited:
+      print("Circuit breaker " + str(breaker))
+  print(session.STATISTICS)
+  print(timing.TIMINGS.to_table())
+  if len(sizes.SIZES):
+    print(sizes.SIZES.to_table())
+  if len(cache.STATISTICS):
+    print(cache.STATISTICS.to_table())
+  if len(streaming.TRANSFERS):
+    print(streaming.TRANSFERS.to_table())
+  timings_file = os.environ.get(timing.TIMINGS_FILE_ENV)
+  if timings_file:
+    with open(timings_file, "w") as f:
+      f.write(timing.TIMINGS.to_json())
+  test_history = history.get_history(default=False)
+  if test_history is not None and len(history.DURATIONS):
+    test_history.record(runid.get_run_name(),
+                        history.DURATIONS.snapshot(),
+                        timing.TIMINGS.report())
@@ -0,0 +1,284 @@
+"""Benchmark the harness overhead of each flow.
+
+Each flow in :data:`prov_service_tests.probes.FLOWS` is run, one probe
+at a time, in its own process against a zero-latency local stand-in
+server, see :mod:`prov_service_tests.server`, which runs in the
+benchmarking process. As the server does almost no work, the numbers
+reflect the cost of the harness itself - building headers, encoding
+and decoding JSON, loading documents and running test methods. For
+each flow, requests per second, CPU time per request and peak
+resident set size (RSS) of the flow's process are reported.
+
+Results can be saved as a JSON baseline and later runs compared
+against it, failing if the throughput of any flow has regressed by
+more than a threshold.
+
+Usage::
+
+    $ python -m prov_service_tests.benchmark --save baseline.json
+    $ python -m prov_service_tests.benchmark --compare baseline.json
+"""
+# Copyright (c) 2015 University of Southampton
+#
+# Permission is hereby granted, free of charge, to any person
+# obtaining a copy of this software and associated documentation files
+# (the "Software"), to deal in the Software without restriction,
+# including without limitation the rights to use, copy, modify, merge,
+# publish, distribute, sublicense, and/or sell copies of the Software,
+# and to permit persons to whom the Software is furnished to do so,
+# subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be
+# included in all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND,
+# EXPRESS OR IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF
+# MERCHANTABILITY, FITNESS FOR A PARTICULAR PURPOSE AND
+# NONINFRINGEMENT. IN NO EVENT SHALL THE AUTHORS OR COPYRIGHT HOLDERS
+# BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER LIABILITY, WHETHER IN AN
+# ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM, OUT OF OR IN
+# CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+
+from __future__ import (absolute_import, division, print_function,
+                        unicode_literals)
+
+import argparse
+import json
+import os
+import subprocess
+import sys
+try:
+  import resource
+except ImportError:
+  resource = None
+
+from prov_service_tests import probes
+from prov_service_tests import server
+from prov_service_tests import session
+from prov_service_tests import timing
+from prov_service_tests.test_provstore import ProvStoreTestCase
+from prov_service_tests.test_provstore import SHARED
+from prov_service_tests.test_provvalidator import ProvValidatorTestCase
+
+DEFAULT_DURATION = 10
+"""float: default time, in seconds, for which each flow is run"""
+
+DEFAULT_THRESHOLD = 0.1
+"""float: default fraction by which throughput may fall below the
+baseline before a comparison fails
+"""
+
+
+def get_peak_rss():
+  """Get peak resident set size of this process.
+
+  :return: bytes or None if not available on this platform
+  :rtype: int
+  """
+  if resource is None:
+    return None
+  peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+  # Linux reports kilobytes, OS X bytes.
+  return peak if sys.platform == "darwin" else peak * 1024
+
+
+def get_cpu_time():
+  """Get user and system CPU time used by this process.
+
+  :return: seconds
+  :rtype: float
+  """
+  times = os.times()
+  return times[0] + times[1]
+
+
+def run_flow(flow, duration):
+  """Run a flow's probes in turn, in this process, until a duration
+  has elapsed. The probes are run once beforehand, untimed, so that
+  connections are open and documents loaded.
+
+  :param flow: flow name
+  :type flow: str or unicode
+  :param duration: duration in seconds
+  :type duration: float
+  :return: result with ``flow``, ``probes``, ``errors``,
+    ``requests``, ``elapsed``, ``requests_per_second``,
+    ``cpu_seconds``, ``cpu_per_request`` (milliseconds) and
+    ``peak_rss`` (bytes) keys
+  :rtype: dict
+  """
+  selected = probes.get_probes([flow])
+  for probe in selected:
+    probe.run()
+  session.STATISTICS.reset()
+  count = 0
+  errors = 0
+  cpu_start = get_cpu_time()
+  start = timing.clock()
+  while timing.clock() - start < duration:
+    for probe in selected:
+      outcome = probe.run()
+      if outcome.skipped:
+        continue
+      count += 1
+      if not outcome.success:
+        errors += 1
+  elapsed = timing.clock() - start
+  cpu = get_cpu_time() - cpu_start
+  requests = session.STATISTICS.requests
+  SHARED.delete_all()
+  return {"flow": flow,
+          "probes": count,
+          "errors": errors,
+          "requests": requests,
+          "elapsed": elapsed,
+          "requests_per_second": requests / elapsed,
+          "cpu_seconds": cpu,
+          "cpu_per_request": cpu * 1000 / requests if requests else None,
+          "peak_rss": get_peak_rss()}
+
+
+def benchmark(flows, duration):
+  """Run each flow in its own process against a local stand-in
+  server.
+
+  :param flows: flow names
+  :type flows: list of str or unicode
+  :param duration: duration in seconds for which each flow is run
+  :type duration: float
+  :return: mapping from flow names to results, see :func:`run_flow`
+  :rtype: dict
+  """
+  local_server = server.ServiceServer()
+  local_server.start()
+  environment = dict(os.environ)
+  environment[ProvStoreTestCase.URL_ENV] = local_server.provstore_url
+  environment[ProvValidatorTestCase.URL_ENV] = \
+      local_server.provvalidator_url
+  environment.setdefault(ProvStoreTestCase.API_KEY_ENV, server.API_KEY)
+  results = {}
+  try:
+    for flow in flows:
+      output = subprocess.check_output(
+        [sys.executable, "-m", "prov_service_tests.benchmark",
+         "--flow", flow, "--duration", str(duration)],
+        env=environment)
+      # Tests may print warnings, the result is on the last line.
+      results[flow] = json.loads(
+        output.decode("utf-8").strip().split("\n")[-1])
+  finally:
+    local_server.stop()
+  return results
+
+
+def compare(results, baseline, threshold):
+  """Compare throughput of each flow against a baseline.
+
+  :param results: mapping from flow names to results
+  :type results: dict
+  :param baseline: mapping from flow names to baseline results
+  :type baseline: dict
+  :param threshold: fraction by which throughput may fall below the
+    baseline
+  :type threshold: float
+  :return: messages describing each flow whose throughput has
+    regressed by more than the threshold
+  :rtype: list of str or unicode
+  """
+  regressions = []
+  for flow in sorted(results):
+    if flow not in baseline:
+      continue
+    current = results[flow]["requests_per_second"]
+    previous = baseline[flow]["requests_per_second"]
+    if current < previous * (1 - threshold):
+      regressions.append("%s: %.1f requests/s, baseline %.1f (%.1f%%)" %
+                         (flow, current, previous,
+                          (current - previous) * 100 / previous))
+  return regressions
+
+
+def to_table(results, baseline=None):
+  """Get results as a text table.
+
+  :param results: mapping from flow names to results
+  :type results: dict
+  :param baseline: mapping from flow names to baseline results, if
+    given the change in throughput is included
+  :type baseline: dict
+  :return: table
+  :rtype: str or unicode
+  """
+  width = max([len("Flow")] + [len(flow) for flow in results])
+  row = "%-" + str(width) + "s %8s %6s %10s %10s %9s %10s"
+  lines = [row % ("Flow", "Requests", "Errors", "Requests/s", "CPU/req ms",
+                  "RSS MB", "vs base")]
+  for flow in sorted(results):
+    result = results[flow]
+    change = "-"
+    if baseline and flow in baseline:
+      previous = baseline[flow]["requests_per_second"]
+      change = "%+.1f%%" % ((result["requests_per_second"] - previous) *
+                            100 / previous)
+    cpu = result["cpu_per_request"]
+    rss = result["peak_rss"]
+    lines.append(row % (flow, result["requests"], result["errors"],
+                        "%.1f" % result["requests_per_second"],
+                        "-" if cpu is None else "%.3f" % cpu,
+                        "-" if rss is None else "%.1f" % (rss / 2 ** 20),
+                        change))
+  return "\n".join(lines)
+
+
+def main(argv=None):
+  """Run benchmark from the command-line.
+
+  :param argv: command-line arguments, excluding program name
+  :type argv: list of str or unicode
+  :return: exit code, 0 if no flow has regressed, 1 otherwise
+  :rtype: int
+  """
+  parser = argparse.ArgumentParser(
+    description="Benchmark the harness overhead of each flow.")
+  parser.add_argument("flows", nargs="*", metavar="flow",
+                      help="flow name (%s), default all flows" %
+                      ", ".join(sorted(probes.FLOWS)))
+  parser.add_argument("--duration", type=float, default=DEFAULT_DURATION,
+                      help="seconds for which each flow is run (default "
+                      "%(default)s)")
+  parser.add_argument("--save", metavar="FILE",
+                      help="save results as a JSON baseline")
+  parser.add_argument("--compare", metavar="FILE",
+                      help="compare results against a JSON baseline")
+  parser.add_argument("--threshold", type=float, default=DEFAULT_THRESHOLD,
+                      help="fraction by which throughput may fall below "
+                      "the baseline (default %(default)s)")
+  parser.add_argument("--flow", help=argparse.SUPPRESS)
+  args = parser.parse_args(argv)
+  if args.flow:
+    # Run one flow, in a process started by benchmark.
+    print(json.dumps(run_flow(args.flow, args.duration), sort_keys=True))
+    return 0
+  for flow in args.flows:
+    if flow not in probes.FLOWS:
+      parser.error("unknown flow: " + flow)
+  results = benchmark(args.flows or sorted(probes.FLOWS), args.duration)
+  baseline = None
+  if args.compare:
+    with open(args.compare) as f:
+      baseline = json.load(f)
+  print(to_table(results, baseline))
+  if args.save:
+    with open(args.save, "w") as f:
+      json.dump(results, f, indent=2, sort_keys=True)
+  if baseline is None:
+    return 0
+  regressions = compare(results, baseline, args.threshold)
+  for regression in regressions:
+    print("Regression: " + regression)
+  return 1 if regressions else 0
+
+
+if __name__ == "__main__":
+  sys.exit(main())
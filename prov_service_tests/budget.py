@@ -0,0 +1,406 @@
+"""Timeouts, a run deadline and circuit breakers, which bound the time
+a run takes when a service hangs or fails.
+
+Every request sent via :mod:`prov_service_tests.session` has connect
+and read timeouts, in seconds, set by ``PROV_CONNECT_TIMEOUT``
+(default 10) and ``PROV_READ_TIMEOUT`` (default 120), which can be
+overridden for each endpoint by ``PROV_TIMEOUTS``, a
+semicolon-separated list of endpoint templates and timeouts e.g.
+``POST /store/api/v0/documents/=5,300``. A single number sets both
+timeouts, and 0 means no timeout. The read timeout bounds each wait
+for data from the service, not the whole response.
+
+If ``PROV_DEADLINE`` is set to a number of seconds, the run must end
+within that time of its first request. Timeouts are cut to the time
+remaining, requests after the deadline fail with
+:class:`DeadlineExceeded` without being sent, and tests which start
+after it are skipped. Requests which delete documents are still sent,
+with their usual timeouts, so that a run cleans up after itself. The
+deadline is shared with child processes, via ``PROV_DEADLINE_AT``.
+
+A :class:`CircuitBreaker` guards a request on which other tests
+depend. After ``PROV_BREAKER_THRESHOLD`` (default 3) consecutive
+failures, the breaker opens and further attempts fail immediately
+with :class:`CircuitOpenError`, giving the last failure as the reason.
+After ``PROV_BREAKER_RESET`` seconds (default 30), one attempt is let
+through, closing the breaker if it succeeds.
+"""
+# Copyright (c) 2015 University of Southampton
+#
+# Permission is hereby granted, free of charge, to any person
+# obtaining a copy of this software and associated documentation files
+# (the "Software"), to deal in the Software without restriction,
+# including without limitation the rights to use, copy, modify, merge,
+# publish, distribute, sublicense, and/or sell copies of the Software,
+# and to permit persons to whom the Software is furnished to do so,
+# subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be
+# included in all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND,
+# EXPRESS OR IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF
+# MERCHANTABILITY, FITNESS FOR A PARTICULAR PURPOSE AND
+# NONINFRINGEMENT. IN NO EVENT SHALL THE AUTHORS OR COPYRIGHT HOLDERS
+# BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER LIABILITY, WHETHER IN AN
+# ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM, OUT OF OR IN
+# CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+
+from __future__ import (absolute_import, division, print_function,
+                        unicode_literals)
+
+import os
+import threading
+import time
+import unittest
+
+import requests
+
+from prov_service_tests import timing
+
+CONNECT_TIMEOUT_ENV = "PROV_CONNECT_TIMEOUT"
+"""str or unicode: environment variable holding connect timeout, in
+seconds"""
+
+READ_TIMEOUT_ENV = "PROV_READ_TIMEOUT"
+"""str or unicode: environment variable holding read timeout, in
+seconds"""
+
+TIMEOUTS_ENV = "PROV_TIMEOUTS"
+"""str or unicode: environment variable holding timeouts for
+endpoints"""
+
+DEADLINE_ENV = "PROV_DEADLINE"
+"""str or unicode: environment variable holding run deadline, in
+seconds from the first request"""
+
+DEADLINE_AT_ENV = "PROV_DEADLINE_AT"
+"""str or unicode: environment variable holding run deadline, in
+seconds since the epoch, shared with child processes"""
+
+BREAKER_THRESHOLD_ENV = "PROV_BREAKER_THRESHOLD"
+"""str or unicode: environment variable holding number of consecutive
+failures which open a circuit breaker"""
+
+BREAKER_RESET_ENV = "PROV_BREAKER_RESET"
+"""str or unicode: environment variable holding time, in seconds,
+after which an open circuit breaker lets an attempt through"""
+
+EXEMPT_METHODS = ["DELETE"]
+"""list of str or unicode: HTTP methods of requests which are sent
+after the run deadline, so that documents are still cleaned up"""
+
+DEFAULT_CONNECT_TIMEOUT = 10
+"""float: default connect timeout, in seconds"""
+
+DEFAULT_READ_TIMEOUT = 120
+"""float: default read timeout, in seconds"""
+
+DEFAULT_BREAKER_THRESHOLD = 3
+"""int: default number of consecutive failures which open a circuit
+breaker"""
+
+DEFAULT_BREAKER_RESET = 30
+"""float: default time, in seconds, after which an open circuit
+breaker lets an attempt through"""
+
+
+class DeadlineExceeded(requests.exceptions.Timeout):
+  """Raised instead of sending a request after the run deadline."""
+
+
+class CircuitOpenError(Exception):
+  """Raised instead of attempting an operation whose circuit breaker
+  is open. Tests short-circuited by a breaker are reported as errors,
+  not as assertion failures about the service's responses.
+  """
+
+
+def parse_timeout(value):
+  """Parse a connect and read timeout.
+
+  :param value: ``connect,read`` or a single number for both, in
+    seconds, where 0 means no timeout
+  :type value: str or unicode
+  :return: connect and read timeouts, each None if there is none
+  :rtype: tuple of float
+  :raises ValueError: if the value is invalid
+  """
+  timeouts = [float(timeout) or None for timeout in value.split(",")]
+  if len(timeouts) == 1:
+    timeouts = timeouts * 2
+  if len(timeouts) != 2:
+    raise ValueError("Timeout must be connect,read or a single number, "
+                     "not " + value)
+  return tuple(timeouts)
+
+
+class Timeouts(object):
+  """Connect and read timeouts for each endpoint.
+  """
+
+  def __init__(self, default, endpoints=None):
+    """Create timeouts.
+
+    :param default: default connect and read timeouts
+    :type default: tuple of float
+    :param endpoints: mapping from HTTP method and endpoint template,
+      see :attr:`prov_service_tests.timing.Sample.endpoint`, to
+      connect and read timeouts
+    :type endpoints: dict
+    """
+    self.default = default
+    """tuple of float: default connect and read timeouts"""
+    self.endpoints = endpoints or {}
+    """dict: connect and read timeouts by endpoint"""
+
+  def get(self, method, url):
+    """Get timeouts for a request.
+
+    :param method: HTTP method
+    :type method: str or unicode
+    :param url: URL
+    :type url: str or unicode
+    :return: connect and read timeouts
+    :rtype: tuple of float
+    """
+    endpoint = method + " " + timing.endpoint_template(url)
+    return self.endpoints.get(endpoint, self.default)
+
+
+def create_timeouts():
+  """Create timeouts from ``PROV_CONNECT_TIMEOUT``,
+  ``PROV_READ_TIMEOUT`` and ``PROV_TIMEOUTS``.
+
+  :return: timeouts
+  :rtype: :class:`Timeouts`
+  :raises ValueError: if a variable is invalid
+  """
+  default = (float(os.environ.get(CONNECT_TIMEOUT_ENV) or
+                   DEFAULT_CONNECT_TIMEOUT) or None,
+             float(os.environ.get(READ_TIMEOUT_ENV) or
+                   DEFAULT_READ_TIMEOUT) or None)
+  endpoints = {}
+  for entry in (os.environ.get(TIMEOUTS_ENV) or "").split(";"):
+    if not entry.strip():
+      continue
+    if "=" not in entry:
+      raise ValueError("%s entries must be endpoint=timeout, not %s" %
+                       (TIMEOUTS_ENV, entry))
+    endpoint, value = entry.rsplit("=", 1)
+    endpoints[" ".join(endpoint.split())] = parse_timeout(value)
+  return Timeouts(default, endpoints)
+
+
+class Deadline(object):
+  """Time by which a run must end.
+  """
+
+  def __init__(self, at, seconds):
+    """Create deadline.
+
+    :param at: deadline, in seconds since the epoch
+    :type at: float
+    :param seconds: run duration allowed, in seconds
+    :type seconds: float
+    """
+    self.at = at
+    """float: deadline, in seconds since the epoch"""
+    self.seconds = seconds
+    """float: run duration allowed, in seconds"""
+
+  def remaining(self):
+    """Get time remaining.
+
+    :return: seconds, 0 if the deadline has passed
+    :rtype: float
+    """
+    return max(0, self.at - time.time())
+
+  @property
+  def expired(self):
+    """bool: True if the deadline has passed"""
+    return time.time() >= self.at
+
+  def limit(self, timeouts):
+    """Cut connect and read timeouts to the time remaining.
+
+    :param timeouts: connect and read timeouts, each None if there is
+      none
+    :type timeouts: tuple of float
+    :return: timeouts
+    :rtype: tuple of float
+    :raises DeadlineExceeded: if the deadline has passed
+    """
+    remaining = self.remaining()
+    if remaining <= 0:
+      raise DeadlineExceeded(str(self))
+    return tuple([remaining if timeout is None else min(timeout, remaining)
+                  for timeout in timeouts])
+
+  def __str__(self):
+    return "Run deadline of %g s exceeded" % self.seconds
+
+
+_deadline = None
+_deadline_lock = threading.Lock()
+
+
+def get_deadline(start=True):
+  """Get the run deadline. If ``PROV_DEADLINE_AT`` is not already set,
+  the first call with ``start`` True starts the deadline from now and
+  shares it with child processes. This is done when the first request
+  is sent, see :func:`get_timeout`.
+
+  :param start: if False, do not start the deadline
+  :type start: bool
+  :return: deadline, or None if ``PROV_DEADLINE`` is not set or the
+    deadline has not started
+  :rtype: :class:`Deadline`
+  :raises ValueError: if a variable is not a number
+  """
+  global _deadline
+  with _deadline_lock:
+    seconds = float(os.environ.get(DEADLINE_ENV) or 0)
+    if not seconds:
+      return None
+    if _deadline is None or _deadline.seconds != seconds:
+      at = os.environ.get(DEADLINE_AT_ENV)
+      if at:
+        at = float(at)
+      elif not start:
+        return None
+      else:
+        at = time.time() + seconds
+        os.environ[DEADLINE_AT_ENV] = repr(at)
+      _deadline = Deadline(at, seconds)
+    return _deadline
+
+
+def check_deadline(method):
+  """Check that the run deadline has not passed.
+
+  :param method: HTTP method
+  :type method: str or unicode
+  :raises DeadlineExceeded: if the deadline has passed, unless the
+    method is in :data:`EXEMPT_METHODS`
+  """
+  deadline = get_deadline(start=False)
+  if (deadline is not None and deadline.expired and
+      method not in EXEMPT_METHODS):
+    raise DeadlineExceeded(str(deadline))
+
+
+def get_timeout(timeouts, method, url, timeout=None):
+  """Get the timeout for a request, cut to the time remaining before
+  the run deadline unless its method is in :data:`EXEMPT_METHODS`.
+
+  :param timeouts: timeouts, or None for no timeouts
+  :type timeouts: :class:`Timeouts`
+  :param method: HTTP method
+  :type method: str or unicode
+  :param url: URL
+  :type url: str or unicode
+  :param timeout: timeout given by the caller, one number or connect
+    and read timeouts, which overrides ``timeouts``, or None
+  :type timeout: float or tuple of float
+  :return: connect and read timeouts, or None if there is no timeout
+  :rtype: tuple of float
+  :raises DeadlineExceeded: if the deadline has passed
+  """
+  if timeout is None:
+    timeout = timeouts.get(method, url) if timeouts else (None, None)
+  elif not isinstance(timeout, tuple):
+    timeout = (timeout, timeout)
+  deadline = get_deadline()
+  if deadline is not None and method not in EXEMPT_METHODS:
+    timeout = deadline.limit(timeout)
+  return None if timeout == (None, None) else timeout
+
+
+class CircuitBreaker(object):
+  """Thread-safe circuit breaker, used as a context manager around an
+  operation. If the breaker is open, entering it raises
+  :class:`CircuitOpenError`. An exception raised by the operation,
+  other than :class:`unittest.SkipTest`, counts as a failure.
+  """
+
+  def __init__(self, name, threshold=None, reset=None):
+    """Create breaker and add it to :data:`BREAKERS`.
+
+    :param name: name of guarded operation
+    :type name: str or unicode
+    :param threshold: number of consecutive failures which open the
+      breaker, default ``PROV_BREAKER_THRESHOLD``
+    :type threshold: int
+    :param reset: time, in seconds, after which an open breaker lets
+      an attempt through, default ``PROV_BREAKER_RESET``
+    :type reset: float
+    """
+    self.name = name
+    """str or unicode: name of guarded operation"""
+    self.threshold = threshold or int(
+      os.environ.get(BREAKER_THRESHOLD_ENV) or DEFAULT_BREAKER_THRESHOLD)
+    """int: number of consecutive failures which open the breaker"""
+    self.reset = float(reset or os.environ.get(BREAKER_RESET_ENV) or
+                       DEFAULT_BREAKER_RESET)
+    """float: time, in seconds, after which an open breaker lets an
+    attempt through"""
+    self.failures = 0
+    """int: number of consecutive failures"""
+    self.short_circuited = 0
+    """int: number of attempts refused while the breaker was open"""
+    self.last_error = None
+    """str or unicode: last failure"""
+    self._lock = threading.Lock()
+    self._opened = None
+    self._trial = False
+    self._local = threading.local()
+    BREAKERS.append(self)
+
+  @property
+  def is_open(self):
+    """bool: True if the breaker is open"""
+    with self._lock:
+      return self._opened is not None
+
+  def __enter__(self):
+    with self._lock:
+      self._local.trial = False
+      if self._opened is None:
+        return self
+      if not self._trial and timing.clock() - self._opened >= self.reset:
+        # Let one attempt through to see if the operation has recovered.
+        self._trial = True
+        self._local.trial = True
+        return self
+      self.short_circuited += 1
+      raise CircuitOpenError(
+        "%s short-circuited after %d consecutive failures, last: %s" %
+        (self.name, self.failures, self.last_error))
+
+  def __exit__(self, exc_type, exc_value, traceback):
+    with self._lock:
+      if self._local.trial:
+        self._trial = False
+      if exc_type is None:
+        self.failures = 0
+        self._opened = None
+      elif not issubclass(exc_type, unittest.SkipTest):
+        self.failures += 1
+        self.last_error = "%s: %s" % (exc_type.__name__,
+                                      str(exc_value).split("\n")[0])
+        if self.failures >= self.threshold:
+          self._opened = timing.clock()
+    return False
+
+  def __str__(self):
+    return "%s: %s, %d consecutive failures, %d short-circuited" % (
+      self.name, "open" if self.is_open else "closed", self.failures,
+      self.short_circuited)
+
+
+BREAKERS = []
+"""list of :class:`CircuitBreaker`: circuit breakers in this
+process"""
@@ -0,0 +1,476 @@
+"""Optional HTTP cache for the pooled session.
+
+If ``PROV_CACHE_SIZE`` is set to a number of bytes, successful GET
+responses with an ``ETag``, a ``Last-Modified`` date or a freshness
+lifetime, from ``Cache-Control: max-age`` or ``Expires``, are cached,
+up to that total size of response bodies, least recently used first
+out. A fresh cached response is returned without a request being
+sent. A stale one is revalidated with a conditional request, using
+``If-None-Match`` and ``If-Modified-Since``, and returned if the
+service responds 304 NOT MODIFIED. Responses with ``Cache-Control:
+no-store`` are never cached and those with ``no-cache`` are always
+revalidated. A successful PUT, PATCH or DELETE removes a resource, and
+any resources below it, such as its formats, from the cache. A
+successful POST removes the resource itself.
+
+Cache hits, misses, revalidations, and uncacheable responses, are
+counted per endpoint in :data:`STATISTICS`.
+"""
+# Copyright (c) 2015 University of Southampton
+#
+# Permission is hereby granted, free of charge, to any person
+# obtaining a copy of this software and associated documentation files
+# (the "Software"), to deal in the Software without restriction,
+# including without limitation the rights to use, copy, modify, merge,
+# publish, distribute, sublicense, and/or sell copies of the Software,
+# and to permit persons to whom the Software is furnished to do so,
+# subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be
+# included in all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND,
+# EXPRESS OR IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF
+# MERCHANTABILITY, FITNESS FOR A PARTICULAR PURPOSE AND
+# NONINFRINGEMENT. IN NO EVENT SHALL THE AUTHORS OR COPYRIGHT HOLDERS
+# BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER LIABILITY, WHETHER IN AN
+# ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM, OUT OF OR IN
+# CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+
+from __future__ import (absolute_import, division, print_function,
+                        unicode_literals)
+
+import collections
+import datetime
+import email.utils
+import os
+import threading
+import time
+import requests
+from requests.structures import CaseInsensitiveDict
+from requests.utils import get_encoding_from_headers
+
+from prov_service_tests import http
+from prov_service_tests import timing
+
+CACHE_SIZE_ENV = "PROV_CACHE_SIZE"
+"""str or unicode: environment variable holding maximum total size, in
+bytes, of cached response bodies, the cache is disabled if not set or
+0
+"""
+
+HIT = "hit"
+"""str or unicode: a fresh cached response was returned"""
+
+MISS = "miss"
+"""str or unicode: a response was not cached, and has been"""
+
+REVALIDATED = "revalidated"
+"""str or unicode: a cached response was revalidated by a 304 NOT
+MODIFIED response"""
+
+UNCACHEABLE = "uncacheable"
+"""str or unicode: a response was not cached, and could not be"""
+
+OUTCOMES = [HIT, REVALIDATED, MISS, UNCACHEABLE]
+"""list of str or unicode: outcomes of requests to the cache"""
+
+EXCLUDED_HEADERS = ["content-encoding", "content-length",
+                    "transfer-encoding", "connection", "keep-alive"]
+"""list of str or unicode: headers of a response which are not cached,
+as the body is cached decoded"""
+
+
+def parse_cache_control(value):
+  """Parse a ``Cache-Control`` header.
+
+  :param value: header value
+  :type value: str or unicode
+  :return: mapping from lower-case directive names to values, or to
+    True for directives without values
+  :rtype: dict
+  """
+  directives = {}
+  for directive in (value or "").split(","):
+    if "=" in directive:
+      name, argument = directive.split("=", 1)
+      directives[name.strip().lower()] = argument.strip().strip('"')
+    elif directive.strip():
+      directives[directive.strip().lower()] = True
+  return directives
+
+
+def parse_date(value):
+  """Parse an HTTP date.
+
+  :param value: date e.g. ``Sun, 06 Nov 1994 08:49:37 GMT``
+  :type value: str or unicode
+  :return: seconds since epoch or None if not a valid date
+  :rtype: float
+  """
+  parsed = email.utils.parsedate_tz(value) if value else None
+  return email.utils.mktime_tz(parsed) if parsed else None
+
+
+def get_lifetime(headers):
+  """Get freshness lifetime of a response, from ``Cache-Control:
+  max-age``, or ``Expires`` relative to ``Date``, less any ``Age``.
+
+  :param headers: response headers
+  :type headers: dict
+  :return: seconds, 0 if the response must be revalidated
+  :rtype: float
+  """
+  directives = parse_cache_control(headers.get("Cache-Control"))
+  if "no-cache" in directives:
+    return 0
+  lifetime = 0
+  try:
+    if "max-age" in directives:
+      lifetime = int(directives["max-age"])
+    elif "expires" in headers:
+      expires = parse_date(headers.get("Expires"))
+      date = parse_date(headers.get("Date")) or time.time()
+      lifetime = expires - date if expires is not None else 0
+    lifetime -= int(headers.get("Age", 0))
+  except ValueError:
+    return 0
+  return max(0, lifetime)
+
+
+class CachedResponse(object):
+  """A cached response.
+  """
+
+  def __init__(self, response):
+    """Create cached response.
+
+    :param response: response whose content has been read
+    :type response: :class:`requests.Response`
+    """
+    self.status_code = response.status_code
+    """int: HTTP status code"""
+    self.reason = response.reason
+    """str or unicode: HTTP reason phrase"""
+    self.headers = dict([(name, value)
+                         for name, value in response.headers.items()
+                         if name.lower() not in EXCLUDED_HEADERS])
+    """dict: response headers"""
+    self.content = response.content
+    """bytes: decoded response body"""
+    self.stored = time.time()
+    """float: time at which the response was stored or last
+    revalidated"""
+    self.lifetime = get_lifetime(response.headers)
+    """float: freshness lifetime in seconds"""
+
+  @property
+  def fresh(self):
+    """bool: True if the response can be used without revalidation"""
+    return time.time() - self.stored < self.lifetime
+
+  def update(self, response):
+    """Update from a 304 NOT MODIFIED response.
+
+    :param response: response
+    :type response: :class:`requests.Response`
+    """
+    for name, value in response.headers.items():
+      if name.lower() not in EXCLUDED_HEADERS:
+        self.headers[name] = value
+    self.stored = time.time()
+    self.lifetime = get_lifetime(CaseInsensitiveDict(self.headers))
+
+  def add_conditions(self, request):
+    """Add ``If-None-Match`` and ``If-Modified-Since`` headers to a
+    request, to revalidate this response.
+
+    :param request: request
+    :type request: :class:`requests.PreparedRequest`
+    :return: True if headers were added, False if the response has no
+      ``ETag`` or ``Last-Modified``
+    :rtype: bool
+    """
+    headers = CaseInsensitiveDict(self.headers)
+    if "ETag" in headers:
+      request.headers["If-None-Match"] = headers["ETag"]
+    if "Last-Modified" in headers:
+      request.headers["If-Modified-Since"] = headers["Last-Modified"]
+    return "ETag" in headers or "Last-Modified" in headers
+
+  def to_response(self, request, connection=None):
+    """Create a response from this cached response.
+
+    :param request: request
+    :type request: :class:`requests.PreparedRequest`
+    :param connection: adapter
+    :type connection: :class:`requests.adapters.BaseAdapter`
+    :return: response
+    :rtype: :class:`requests.Response`
+    """
+    response = requests.Response()
+    response.status_code = self.status_code
+    response.reason = self.reason
+    response.headers = CaseInsensitiveDict(self.headers)
+    response.encoding = get_encoding_from_headers(response.headers)
+    response._content = self.content
+    response.url = request.url
+    response.request = request
+    response.connection = connection
+    response.elapsed = datetime.timedelta(0)
+    return response
+
+
+def is_cacheable(response):
+  """Check whether a response to a GET can be cached.
+
+  :param response: response
+  :type response: :class:`requests.Response`
+  :return: True if the response is 200 OK, may be stored and has a
+    validator or freshness lifetime
+  :rtype: bool
+  """
+  if response.status_code != requests.codes.ok:
+    return False
+  directives = parse_cache_control(response.headers.get("Cache-Control"))
+  if "no-store" in directives:
+    return False
+  return ("ETag" in response.headers or
+          "Last-Modified" in response.headers or
+          get_lifetime(response.headers) > 0)
+
+
+class CacheStatistics(object):
+  """Thread-safe counts of cache outcomes by endpoint.
+  """
+
+  def __init__(self):
+    self._lock = threading.Lock()
+    self._counts = {}
+
+  def add(self, endpoint, outcome):
+    """Count an outcome.
+
+    :param endpoint: HTTP method and endpoint template
+    :type endpoint: str or unicode
+    :param outcome: one of :data:`OUTCOMES`
+    :type outcome: str or unicode
+    """
+    with self._lock:
+      counts = self._counts.setdefault(
+        endpoint, dict([(key, 0) for key in OUTCOMES]))
+      counts[outcome] += 1
+
+  def reset(self):
+    """Reset all counts."""
+    with self._lock:
+      self._counts = {}
+
+  def snapshot(self):
+    """Get a copy of the counts, for example to pass to another
+    process.
+
+    :return: counts, which can be passed to :meth:`merge`
+    :rtype: dict
+    """
+    with self._lock:
+      return dict([(endpoint, dict(counts))
+                   for endpoint, counts in self._counts.items()])
+
+  def merge(self, snapshot):
+    """Add counts collected elsewhere, for example by another process.
+
+    :param snapshot: counts from :meth:`snapshot`
+    :type snapshot: dict
+    """
+    with self._lock:
+      for endpoint, other in snapshot.items():
+        counts = self._counts.setdefault(
+          endpoint, dict([(key, 0) for key in OUTCOMES]))
+        for outcome, count in other.items():
+          counts[outcome] += count
+
+  def report(self):
+    """Get counts and rates by endpoint.
+
+    :return: mapping from endpoint to count of each of
+      :data:`OUTCOMES` and ``requests``, and ``hit_rate`` and
+      ``revalidated_rate``, fractions of requests answered from the
+      cache without, and with, a conditional request
+    :rtype: dict
+    """
+    report = {}
+    with self._lock:
+      for endpoint, counts in self._counts.items():
+        total = sum(counts.values())
+        report[endpoint] = dict(counts)
+        report[endpoint].update({
+          "requests": total,
+          "hit_rate": counts[HIT] / total,
+          "revalidated_rate": counts[REVALIDATED] / total})
+    return report
+
+  def to_table(self):
+    """Get report as a text table.
+
+    :return: table
+    :rtype: str or unicode
+    """
+    report = self.report()
+    width = max([len("Endpoint")] + [len(key) for key in report])
+    row = "%-" + str(width) + "s %8s %6s %6s %6s %11s %6s %6s"
+    lines = [row % ("Endpoint", "Requests", "Hit", "304", "Miss",
+                    "Uncacheable", "Hit %", "304 %")]
+    for endpoint in sorted(report):
+      counts = report[endpoint]
+      lines.append(row % (endpoint, counts["requests"], counts[HIT],
+                          counts[REVALIDATED], counts[MISS],
+                          counts[UNCACHEABLE],
+                          "%.1f" % (counts["hit_rate"] * 100),
+                          "%.1f" % (counts["revalidated_rate"] * 100)))
+    return "\n".join(lines)
+
+  def __len__(self):
+    with self._lock:
+      return len(self._counts)
+
+
+STATISTICS = CacheStatistics()
+""":class:`CacheStatistics`: cache outcomes in this process"""
+
+
+class ResponseCache(object):
+  """Thread-safe cache of responses, bounded by the total size of
+  response bodies, with least recently used responses removed first.
+  """
+
+  def __init__(self, max_size):
+    """Create cache.
+
+    :param max_size: maximum total size, in bytes, of response bodies
+    :type max_size: int
+    """
+    self.max_size = max_size
+    self.size = 0
+    """int: total size, in bytes, of cached response bodies"""
+    self._lock = threading.Lock()
+    self._responses = collections.OrderedDict()
+
+  @staticmethod
+  def get_key(request):
+    """Get cache key of a request. Requests for the same URL with
+    different ``Accept`` headers are cached separately.
+
+    :param request: request
+    :type request: :class:`requests.PreparedRequest`
+    :return: key
+    :rtype: tuple
+    """
+    return (request.url, request.headers.get(http.ACCEPT, ""))
+
+  def get(self, key):
+    """Get a cached response, marking it as most recently used.
+
+    :param key: key
+    :type key: tuple
+    :return: response or None if not cached
+    :rtype: :class:`CachedResponse`
+    """
+    with self._lock:
+      cached = self._responses.pop(key, None)
+      if cached is not None:
+        self._responses[key] = cached
+      return cached
+
+  def put(self, key, cached):
+    """Cache a response, removing least recently used responses if
+    necessary. Responses larger than the cache are not cached.
+
+    :param key: key
+    :type key: tuple
+    :param cached: response
+    :type cached: :class:`CachedResponse`
+    :return: True if the response was cached
+    :rtype: bool
+    """
+    length = len(cached.content)
+    if length > self.max_size:
+      return False
+    with self._lock:
+      previous = self._responses.pop(key, None)
+      if previous is not None:
+        self.size -= len(previous.content)
+      while self._responses and self.size + length > self.max_size:
+        _, removed = self._responses.popitem(last=False)
+        self.size -= len(removed.content)
+      self._responses[key] = cached
+      self.size += length
+      return True
+
+  def invalidate(self, url, descendants=True):
+    """Remove responses for a URL and, optionally, URLs below it,
+    such as ``url/...`` and ``url.format``.
+
+    :param url: URL
+    :type url: str or unicode
+    :param descendants: if True, also remove responses for URLs below
+      this URL
+    :type descendants: bool
+    """
+    base = url.rstrip("/")
+    with self._lock:
+      for key in list(self._responses):
+        cached_url = key[0].rstrip("/")
+        if cached_url == base or (descendants and (
+            cached_url.startswith(base + "/") or
+            cached_url.startswith(base + "."))):
+          self.size -= len(self._responses.pop(key).content)
+
+  def send(self, request, send, connection=None):
+    """Send a request via the cache.
+
+    :param request: request
+    :type request: :class:`requests.PreparedRequest`
+    :param send: function which sends the request and returns a
+      response whose content has been read
+    :type send: function
+    :param connection: adapter, set as the connection of responses
+      from the cache
+    :type connection: :class:`requests.adapters.BaseAdapter`
+    :return: response
+    :rtype: :class:`requests.Response`
+    """
+    if request.method != "GET":
+      response = send()
+      if response.status_code < 400:
+        self.invalidate(request.url, request.method != "POST")
+      return response
+    endpoint = request.method + " " + timing.endpoint_template(request.url)
+    key = self.get_key(request)
+    cached = self.get(key)
+    if cached is not None and cached.fresh:
+      STATISTICS.add(endpoint, HIT)
+      return cached.to_response(request, connection)
+    conditional = cached is not None and cached.add_conditions(request)
+    response = send()
+    if conditional and response.status_code == requests.codes.not_modified:
+      cached.update(response)
+      STATISTICS.add(endpoint, REVALIDATED)
+      return cached.to_response(request, connection)
+    if is_cacheable(response) and self.put(key, CachedResponse(response)):
+      STATISTICS.add(endpoint, MISS)
+    else:
+      STATISTICS.add(endpoint, UNCACHEABLE)
+    return response
+
+
+def create_cache():
+  """Create a cache of the size given by ``PROV_CACHE_SIZE``.
+
+  :return: cache or None if ``PROV_CACHE_SIZE`` is not set or is 0
+  :rtype: :class:`ResponseCache`
+  :raises ValueError: if ``PROV_CACHE_SIZE`` is not an integer
+  """
+  max_size = int(os.environ.get(CACHE_SIZE_ENV) or 0)
+  return ResponseCache(max_size) if max_size > 0 else None
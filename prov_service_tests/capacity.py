@@ -0,0 +1,319 @@
+"""Find the maximum sustainable throughput of the services.
+
+Probes, see :mod:`prov_service_tests.probes`, are run closed-loop in
+steps, each at a fixed concurrency for a fixed duration. Between
+steps, the concurrency is adjusted, additive-increase
+multiplicative-decrease (AIMD) style, according to whether the step
+met service level objectives (SLOs) for p99 probe latency and error
+rate:
+
+* Concurrency starts by doubling after each step which meets the
+  SLOs (slow start).
+* Once a step has missed the SLOs, concurrency is increased by a
+  fixed amount after each step which meets them.
+* Concurrency is multiplied by a factor less than 1 after each step
+  which misses the SLOs.
+
+The search ends after a number of steps which miss the SLOs, when the
+maximum concurrency meets them, or after a maximum number of steps.
+The throughput and latency of each step - the throughput/latency
+curve - is reported, along with the knee point: the step with the
+highest throughput which met the SLOs.
+
+Usage::
+
+    $ python -m prov_service_tests.capacity --slo-p99 500 \\
+        --slo-error-rate 0.01 post-document
+"""
+# Copyright (c) 2015 University of Southampton
+#
+# Permission is hereby granted, free of charge, to any person
+# obtaining a copy of this software and associated documentation files
+# (the "Software"), to deal in the Software without restriction,
+# including without limitation the rights to use, copy, modify, merge,
+# publish, distribute, sublicense, and/or sell copies of the Software,
+# and to permit persons to whom the Software is furnished to do so,
+# subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be
+# included in all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND,
+# EXPRESS OR IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF
+# MERCHANTABILITY, FITNESS FOR A PARTICULAR PURPOSE AND
+# NONINFRINGEMENT. IN NO EVENT SHALL THE AUTHORS OR COPYRIGHT HOLDERS
+# BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER LIABILITY, WHETHER IN AN
+# ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM, OUT OF OR IN
+# CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+
+from __future__ import (absolute_import, division, print_function,
+                        unicode_literals)
+
+import argparse
+import itertools
+import json
+import sys
+import threading
+
+from prov_service_tests import load
+from prov_service_tests import probes
+from prov_service_tests import session
+from prov_service_tests import timing
+from prov_service_tests.test_provstore import SHARED
+
+
+class Step(object):
+  """Outcome of running probes at one concurrency.
+  """
+
+  def __init__(self, concurrency, report, requests, within_slo):
+    self.concurrency = concurrency
+    """int: number of probes run at once"""
+    self.report = report
+    """dict: report, see
+    :meth:`prov_service_tests.load.LoadReport.report`"""
+    self.requests = requests
+    """int: number of HTTP requests sent"""
+    self.within_slo = within_slo
+    """bool: True if p99 latency and error rate met the SLOs"""
+
+  @property
+  def requests_per_second(self):
+    """float: HTTP requests sent per second"""
+    elapsed = self.report["elapsed"]
+    return self.requests / elapsed if elapsed > 0 else 0
+
+  def to_dict(self):
+    """Get step as a dictionary.
+
+    :return: step with ``concurrency``, ``requests``,
+      ``requests_per_second``, ``within_slo`` and report keys
+    :rtype: dict
+    """
+    step = dict(self.report)
+    step.update({"concurrency": self.concurrency,
+                 "requests": self.requests,
+                 "requests_per_second": self.requests_per_second,
+                 "within_slo": self.within_slo})
+    return step
+
+
+def run_step(selected, concurrency, duration):
+  """Run probes closed-loop: each of a number of threads runs probes,
+  cycling through the selected probes, one after another until the
+  duration has elapsed.
+
+  :param selected: probes
+  :type selected: list of :class:`prov_service_tests.probes.Probe`
+  :param concurrency: number of threads
+  :type concurrency: int
+  :param duration: duration in seconds
+  :type duration: float
+  :return: report
+  :rtype: :class:`prov_service_tests.load.LoadReport`
+  """
+  report = load.LoadReport()
+  lock = threading.Lock()
+  cycle = itertools.cycle(selected)
+
+  def run_probes():
+    while timing.clock() < deadline:
+      with lock:
+        probe = next(cycle)
+      start = timing.clock()
+      outcome = probe.run()
+      report.add(outcome, timing.clock() - start)
+
+  threads = [threading.Thread(target=run_probes)
+             for _ in range(concurrency)]
+  report.started = timing.clock()
+  deadline = report.started + duration
+  for thread in threads:
+    thread.daemon = True
+    thread.start()
+  for thread in threads:
+    thread.join()
+  report.finished = timing.clock()
+  return report
+
+
+def search(selected, slo_p99, slo_error_rate, duration, initial=1,
+           increase=1, decrease=0.5, max_concurrency=64, max_steps=20,
+           max_misses=3, callback=None):
+  """Search for the highest throughput which meets the SLOs.
+
+  :param selected: probes
+  :type selected: list of :class:`prov_service_tests.probes.Probe`
+  :param slo_p99: maximum p99 probe latency, in milliseconds
+  :type slo_p99: float
+  :param slo_error_rate: maximum fraction of probes which fail
+  :type slo_error_rate: float
+  :param duration: duration of each step in seconds
+  :type duration: float
+  :param initial: concurrency of first step
+  :type initial: int
+  :param increase: concurrency added after a step which meets the
+    SLOs, once a step has missed them
+  :type increase: int
+  :param decrease: factor by which concurrency is multiplied after a
+    step which misses the SLOs
+  :type decrease: float
+  :param max_concurrency: maximum concurrency
+  :type max_concurrency: int
+  :param max_steps: maximum number of steps
+  :type max_steps: int
+  :param max_misses: number of steps which miss the SLOs after which
+    the search ends
+  :type max_misses: int
+  :param callback: function called with each :class:`Step`
+  :type callback: function
+  :return: steps
+  :rtype: list of :class:`Step`
+  """
+  steps = []
+  concurrency = initial
+  misses = 0
+  for _ in range(max_steps):
+    session.STATISTICS.reset()
+    report = run_step(selected, concurrency, duration).report()
+    within_slo = (report["probes"] > 0 and
+                  report["latency"]["p99"] <= slo_p99 and
+                  report["error_rate"] <= slo_error_rate)
+    step = Step(concurrency, report, session.STATISTICS.requests,
+                within_slo)
+    steps.append(step)
+    if callback is not None:
+      callback(step)
+    if within_slo:
+      if concurrency >= max_concurrency:
+        break
+      if misses:
+        concurrency += increase
+      else:
+        concurrency *= 2
+      concurrency = min(concurrency, max_concurrency)
+    else:
+      misses += 1
+      if misses >= max_misses:
+        break
+      concurrency = max(1, int(concurrency * decrease))
+  return steps
+
+
+def get_knee(steps):
+  """Get the step with the highest throughput which met the SLOs.
+
+  :param steps: steps
+  :type steps: list of :class:`Step`
+  :return: step or None if no step met the SLOs
+  :rtype: :class:`Step`
+  """
+  within_slo = [step for step in steps if step.within_slo]
+  if not within_slo:
+    return None
+  return max(within_slo, key=lambda step: step.report["throughput"])
+
+
+def format_step(step):
+  """Format a step as a row of a text table.
+
+  :param step: step
+  :type step: :class:`Step`
+  :return: row
+  :rtype: str or unicode
+  """
+  report = step.report
+  p99 = report["latency"]["p99"]
+  return "%11d %9.2f %10.1f %9s %9s %7.1f%% %4s" % (
+    step.concurrency, report["throughput"], step.requests_per_second,
+    "-" if p99 is None else "%.1f" % report["latency"]["p50"],
+    "-" if p99 is None else "%.1f" % p99,
+    report["error_rate"] * 100,
+    "ok" if step.within_slo else "miss")
+
+
+HEADER = "%11s %9s %10s %9s %9s %8s %4s" % (
+  "Concurrency", "Probes/s", "Requests/s", "p50 (ms)", "p99 (ms)",
+  "Errors", "SLO")
+"""str or unicode: header of table of steps"""
+
+
+def main(argv=None):
+  """Run capacity search from the command-line.
+
+  :param argv: command-line arguments, excluding program name
+  :type argv: list of str or unicode
+  :return: exit code, 0 if a step met the SLOs, 1 otherwise
+  :rtype: int
+  """
+  parser = argparse.ArgumentParser(
+    description="Find the maximum throughput which meets latency and "
+    "error rate objectives.")
+  parser.add_argument("patterns", nargs="*", metavar="probe",
+                      help="flow name (%s) or probe name pattern, "
+                      "default all probes" % ", ".join(sorted(probes.FLOWS)))
+  parser.add_argument("--slo-p99", type=float, default=1000,
+                      help="maximum p99 probe latency in milliseconds "
+                      "(default 1000)")
+  parser.add_argument("--slo-error-rate", type=float, default=0.01,
+                      help="maximum fraction of probes which fail "
+                      "(default 0.01)")
+  parser.add_argument("--step-duration", type=float, default=10,
+                      help="duration of each step in seconds (default 10)")
+  parser.add_argument("--initial", type=int, default=1,
+                      help="initial concurrency (default 1)")
+  parser.add_argument("--increase", type=int, default=1,
+                      help="concurrency added after a step which meets "
+                      "the SLOs (default 1)")
+  parser.add_argument("--decrease", type=float, default=0.5,
+                      help="factor by which concurrency is multiplied "
+                      "after a step which misses the SLOs (default 0.5)")
+  parser.add_argument("--max-concurrency", type=int, default=64,
+                      help="maximum concurrency (default 64)")
+  parser.add_argument("--max-steps", type=int, default=20,
+                      help="maximum number of steps (default 20)")
+  parser.add_argument("--max-misses", type=int, default=3,
+                      help="number of steps which miss the SLOs after "
+                      "which the search ends (default 3)")
+  parser.add_argument("--json", metavar="FILE",
+                      help="save steps and knee point as JSON")
+  load.add_service_arguments(parser)
+  args = parser.parse_args(argv)
+  args.workers = args.max_concurrency
+  local_server = load.configure(args)
+  print(HEADER)
+
+  def print_step(step):
+    print(format_step(step))
+    sys.stdout.flush()
+
+  try:
+    selected = probes.get_probes(args.patterns)
+    steps = search(selected, args.slo_p99, args.slo_error_rate,
+                   args.step_duration, args.initial, args.increase,
+                   args.decrease, args.max_concurrency, args.max_steps,
+                   args.max_misses, print_step)
+  finally:
+    SHARED.delete_all()
+    if local_server is not None:
+      local_server.stop()
+  knee = get_knee(steps)
+  if knee is None:
+    print("No step met the SLOs")
+  else:
+    print("Knee: concurrency %d, %.2f probes/s, %.1f requests/s, "
+          "p99 %.1f ms, %.1f%% errors" %
+          (knee.concurrency, knee.report["throughput"],
+           knee.requests_per_second, knee.report["latency"]["p99"],
+           knee.report["error_rate"] * 100))
+  if args.json:
+    with open(args.json, "w") as f:
+      json.dump({"steps": [step.to_dict() for step in steps],
+                 "knee": None if knee is None else knee.to_dict()},
+                f, indent=2, sort_keys=True)
+  return 0 if knee is not None else 1
+
+
+if __name__ == "__main__":
+  sys.exit(main())
@@ -0,0 +1,351 @@
+"""Profile cold and warm request latency of each endpoint.
+
+The first request to a service after it has been idle can be much
+slower than those that follow, for example while caches are filled
+or workers are started. This module measures, for each endpoint, the
+first request after an idle period, sent on a new connection, and a
+burst of warm requests sent on the same, kept-alive, connection.
+
+The requests profiled are those sent by the tests. The selected
+probes, see :mod:`prov_service_tests.probes`, are run once and the
+first request to each endpoint is captured. GET requests, and
+requests to ProvValidator, which stores nothing, are then replayed
+over connections opened by this module, so that the time of each
+phase of a request can be measured:
+
+- ``dns`` - resolving the host name.
+- ``tcp`` - opening the TCP connection.
+- ``tls`` - the TLS handshake, for HTTPS.
+- ``server`` - from sending the request to receiving the response
+  headers, the time taken by the service plus a round trip.
+- ``transfer`` - reading the response body.
+
+Usage::
+
+    $ python -m prov_service_tests.coldstart --idle 60 --warm 10 \\
+        validation-report
+"""
+# Copyright (c) 2015 University of Southampton
+#
+# Permission is hereby granted, free of charge, to any person
+# obtaining a copy of this software and associated documentation files
+# (the "Software"), to deal in the Software without restriction,
+# including without limitation the rights to use, copy, modify, merge,
+# publish, distribute, sublicense, and/or sell copies of the Software,
+# and to permit persons to whom the Software is furnished to do so,
+# subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be
+# included in all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND,
+# EXPRESS OR IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF
+# MERCHANTABILITY, FITNESS FOR A PARTICULAR PURPOSE AND
+# NONINFRINGEMENT. IN NO EVENT SHALL THE AUTHORS OR COPYRIGHT HOLDERS
+# BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER LIABILITY, WHETHER IN AN
+# ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM, OUT OF OR IN
+# CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+
+from __future__ import (absolute_import, division, print_function,
+                        unicode_literals)
+
+import argparse
+import json
+import os
+import socket
+import ssl
+import sys
+import time
+try:
+  from http.client import HTTPConnection
+  from urllib.parse import urlparse
+except ImportError:
+  from httplib import HTTPConnection
+  from urlparse import urlparse
+
+from prov_service_tests import load
+from prov_service_tests import probes
+from prov_service_tests import session
+from prov_service_tests import timing
+from prov_service_tests.test_provstore import SHARED
+from prov_service_tests.test_provvalidator import ProvValidatorTestCase
+
+PHASES = ["dns", "tcp", "tls", "server", "transfer"]
+"""list of str or unicode: names of timed phases of a request"""
+
+DEFAULT_IDLE = 30
+"""float: default idle period, in seconds, before each cold request"""
+
+DEFAULT_WARM = 10
+"""int: default number of warm requests to each endpoint"""
+
+DEFAULT_TIMEOUT = 60
+"""float: default socket timeout in seconds"""
+
+
+class Connection(object):
+  """A kept-alive connection whose opening is timed by phase.
+  """
+
+  def __init__(self, url, timeout=DEFAULT_TIMEOUT):
+    """Open connection to the host of a URL, timing DNS resolution,
+    TCP connection and any TLS handshake.
+
+    :param url: URL
+    :type url: str or unicode
+    :param timeout: socket timeout in seconds
+    :type timeout: float
+    :raises socket.error: if the connection cannot be opened
+    """
+    parsed = urlparse(url)
+    secure = parsed.scheme == "https"
+    port = parsed.port or (443 if secure else 80)
+    self.phases = {}
+    """dict: mapping from ``dns``, ``tcp`` and ``tls`` to seconds"""
+    start = timing.clock()
+    family, socktype, proto, _, address = socket.getaddrinfo(
+      parsed.hostname, port, 0, socket.SOCK_STREAM)[0]
+    self.phases["dns"] = timing.clock() - start
+    sock = socket.socket(family, socktype, proto)
+    sock.settimeout(timeout)
+    # As urllib3 does, so request headers and body are not delayed.
+    sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+    start = timing.clock()
+    sock.connect(address)
+    self.phases["tcp"] = timing.clock() - start
+    self.phases["tls"] = 0
+    if secure:
+      start = timing.clock()
+      sock = ssl.create_default_context().wrap_socket(
+        sock, server_hostname=parsed.hostname)
+      self.phases["tls"] = timing.clock() - start
+    self._connection = HTTPConnection(parsed.hostname, port,
+                                      timeout=timeout)
+    self._connection.sock = sock
+    self.closed = False
+    """bool: True if the server has closed the connection"""
+
+  def send(self, request):
+    """Send a request and read its response, timing each phase. Only
+    the first request sent on the connection includes the time taken
+    to open it.
+
+    :param request: request
+    :type request: :class:`requests.PreparedRequest`
+    :return: status code and mapping from each of :data:`PHASES` to
+      seconds
+    :rtype: tuple of (int, dict)
+    """
+    phases = self.phases
+    self.phases = {"dns": 0, "tcp": 0, "tls": 0}
+    parsed = urlparse(request.url)
+    path = parsed.path + ("?" + parsed.query if parsed.query else "")
+    start = timing.clock()
+    self._connection.request(request.method, path, request.body,
+                             dict(request.headers))
+    response = self._connection.getresponse()
+    phases["server"] = timing.clock() - start
+    start = timing.clock()
+    response.read()
+    phases["transfer"] = timing.clock() - start
+    self.closed = response.will_close
+    return response.status, phases
+
+  def close(self):
+    """Close the connection."""
+    self._connection.close()
+
+
+class Profile(object):
+  """Cold and warm timings of an endpoint.
+  """
+
+  def __init__(self, endpoint, cold, warm, status):
+    self.endpoint = endpoint
+    """str or unicode: HTTP method and endpoint template"""
+    self.cold = cold
+    """dict: mapping from each of :data:`PHASES` to seconds for the
+    cold request"""
+    self.warm = warm
+    """list of dict: mapping from each of :data:`PHASES` to seconds
+    for each warm request"""
+    self.status = status
+    """int: status code of the cold request"""
+
+  def report(self):
+    """Get cold and median warm timings.
+
+    :return: ``cold`` and ``warm`` mappings from each of
+      :data:`PHASES` and ``total`` to milliseconds, ``status``,
+      ``warm_requests`` and ``ratio``, of cold to warm total time
+    :rtype: dict
+    """
+    cold = dict([(phase, self.cold[phase] * 1000) for phase in PHASES])
+    cold["total"] = sum(cold.values())
+    warm = {}
+    for phase in PHASES:
+      warm[phase] = timing.percentile(
+        sorted([sample[phase] * 1000 for sample in self.warm]), 50)
+    warm["total"] = timing.percentile(
+      sorted([sum(sample.values()) * 1000 for sample in self.warm]), 50)
+    return {"status": self.status,
+            "cold": cold,
+            "warm": warm,
+            "warm_requests": len(self.warm),
+            "ratio": cold["total"] / warm["total"]
+                     if warm["total"] else None}
+
+
+def is_replayable(request):
+  """Check whether a request can safely be sent again. GET requests,
+  and requests to ProvValidator, which does not store documents, can
+  be. Requests with streamed bodies cannot.
+
+  :param request: request
+  :type request: :class:`requests.PreparedRequest`
+  :return: True if the request can be replayed
+  :rtype: bool
+  """
+  if request.body is not None and \
+      not isinstance(request.body, (bytes, type(""))):
+    return False
+  validator_url = os.environ.get(ProvValidatorTestCase.URL_ENV)
+  return request.method == "GET" or (
+    validator_url is not None and request.url.startswith(validator_url))
+
+
+def capture(selected):
+  """Run probes, capturing the first replayable request to each
+  endpoint.
+
+  :param selected: probes
+  :type selected: list of :class:`prov_service_tests.probes.Probe`
+  :return: mapping from endpoint to request
+  :rtype: dict
+  """
+  captured = {}
+
+  def observe(request):
+    endpoint = request.method + " " + timing.endpoint_template(request.url)
+    if endpoint not in captured and is_replayable(request):
+      captured[endpoint] = request
+
+  session.REQUEST_OBSERVERS.append(observe)
+  try:
+    for probe in selected:
+      probe.run()
+  finally:
+    session.REQUEST_OBSERVERS.remove(observe)
+  return captured
+
+
+def profile(endpoint, request, idle, warm_requests):
+  """Profile an endpoint. After the idle period, the request is sent
+  on a new connection, then sent again the given number of times on
+  the same connection. If the server closes the connection, a new
+  connection is opened and the time to do so included in the next
+  request.
+
+  :param endpoint: HTTP method and endpoint template
+  :type endpoint: str or unicode
+  :param request: request
+  :type request: :class:`requests.PreparedRequest`
+  :param idle: idle period in seconds
+  :type idle: float
+  :param warm_requests: number of warm requests
+  :type warm_requests: int
+  :return: profile
+  :rtype: :class:`Profile`
+  """
+  time.sleep(idle)
+  connection = Connection(request.url)
+  try:
+    status, cold = connection.send(request)
+    warm = []
+    for _ in range(warm_requests):
+      if connection.closed:
+        connection.close()
+        connection = Connection(request.url)
+      warm.append(connection.send(request)[1])
+  finally:
+    connection.close()
+  return Profile(endpoint, cold, warm, status)
+
+
+def to_table(profiles):
+  """Get cold and warm timings, in milliseconds, as a text table.
+
+  :param profiles: profiles
+  :type profiles: list of :class:`Profile`
+  :return: table
+  :rtype: str or unicode
+  """
+  width = max([len("Endpoint")] + [len(item.endpoint) for item in profiles])
+  row = "%-" + str(width) + "s %6s %7s %7s %7s %9s %9s %9s %9s %6s"
+  lines = [row % ("Endpoint", "Status", "DNS", "TCP", "TLS", "Cold srv",
+                  "Cold", "Warm srv", "Warm", "Ratio")]
+  for item in profiles:
+    report = item.report()
+    cold = report["cold"]
+    warm = report["warm"]
+    lines.append(row % (item.endpoint, report["status"],
+                        "%.1f" % cold["dns"], "%.1f" % cold["tcp"],
+                        "%.1f" % cold["tls"], "%.1f" % cold["server"],
+                        "%.1f" % cold["total"],
+                        "-" if warm["server"] is None
+                        else "%.1f" % warm["server"],
+                        "-" if warm["total"] is None
+                        else "%.1f" % warm["total"],
+                        "-" if report["ratio"] is None
+                        else "%.1fx" % report["ratio"]))
+  return "\n".join(lines)
+
+
+def main(argv=None):
+  """Profile endpoints from the command-line.
+
+  :param argv: command-line arguments, excluding program name
+  :type argv: list of str or unicode
+  :return: exit code, 0 if all cold requests succeeded, 1 otherwise
+  :rtype: int
+  """
+  parser = argparse.ArgumentParser(
+    description="Profile cold and warm request latency of each endpoint.")
+  parser.add_argument("patterns", nargs="*", metavar="probe",
+                      help="flow name (%s) or probe name pattern, "
+                      "default all probes" % ", ".join(sorted(probes.FLOWS)))
+  parser.add_argument("--idle", type=float, default=DEFAULT_IDLE,
+                      help="idle period, in seconds, before each cold "
+                      "request (default %d)" % DEFAULT_IDLE)
+  parser.add_argument("--warm", type=int, default=DEFAULT_WARM,
+                      help="number of warm requests to each endpoint "
+                      "(default %d)" % DEFAULT_WARM)
+  parser.add_argument("--json", metavar="FILE",
+                      help="save report as JSON")
+  load.add_service_arguments(parser)
+  args = parser.parse_args(argv)
+  args.workers = 1
+  local_server = load.configure(args)
+  try:
+    captured = capture(probes.get_probes(args.patterns))
+    profiles = []
+    for endpoint in sorted(captured):
+      print("Profiling " + endpoint, file=sys.stderr)
+      profiles.append(profile(endpoint, captured[endpoint],
+                              args.idle, args.warm))
+  finally:
+    SHARED.delete_all()
+    if local_server is not None:
+      local_server.stop()
+  print(to_table(profiles))
+  if args.json:
+    with open(args.json, "w") as f:
+      json.dump(dict([(item.endpoint, item.report()) for item in profiles]),
+                f, indent=2, sort_keys=True)
+  failures = [item for item in profiles if item.status >= 400]
+  return 1 if failures else 0
+
+
+if __name__ == "__main__":
+  sys.exit(main())
@@ -0,0 +1,324 @@
+"""Compression of request and response bodies.
+
+If ``PROV_COMPRESSION`` is set to ``gzip`` or ``deflate``, the pooled
+session, see :mod:`prov_service_tests.session`, asks for responses
+compressed with that content coding, and compresses request bodies
+with it. If a service answers a compressed request with 415
+UNSUPPORTED MEDIA TYPE, the request is sent again uncompressed and
+requests to that endpoint are no longer compressed. If
+``PROV_COMPRESSION`` is ``identity``, uncompressed responses are asked
+for. If it is not set, requests' default ``Accept-Encoding`` is used
+and request bodies are not compressed.
+
+Run as a program, this module runs probes once without compression
+and once with it, each in its own process, and compares latency and
+bytes transferred by endpoint and by format.
+
+Usage::
+
+    $ python -m prov_service_tests.compression --compression gzip \\
+        post-document fetch-formats
+"""
+# Copyright (c) 2015 University of Southampton
+#
+# Permission is hereby granted, free of charge, to any person
+# obtaining a copy of this software and associated documentation files
+# (the "Software"), to deal in the Software without restriction,
+# including without limitation the rights to use, copy, modify, merge,
+# publish, distribute, sublicense, and/or sell copies of the Software,
+# and to permit persons to whom the Software is furnished to do so,
+# subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be
+# included in all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND,
+# EXPRESS OR IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF
+# MERCHANTABILITY, FITNESS FOR A PARTICULAR PURPOSE AND
+# NONINFRINGEMENT. IN NO EVENT SHALL THE AUTHORS OR COPYRIGHT HOLDERS
+# BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER LIABILITY, WHETHER IN AN
+# ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM, OUT OF OR IN
+# CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+
+from __future__ import (absolute_import, division, print_function,
+                        unicode_literals)
+
+import argparse
+import json
+import os
+import subprocess
+import sys
+import threading
+import zlib
+
+from prov_service_tests import timing
+
+COMPRESSION_ENV = "PROV_COMPRESSION"
+"""str or unicode: environment variable holding content coding used
+for request and response bodies
+"""
+
+IDENTITY = "identity"
+"""str or unicode: content coding for no compression"""
+
+GZIP = "gzip"
+"""str or unicode: gzip content coding"""
+
+DEFLATE = "deflate"
+"""str or unicode: deflate (zlib) content coding"""
+
+CODINGS = [GZIP, DEFLATE]
+"""list of str or unicode: content codings which compress"""
+
+REFUSED = set()
+"""set of str or unicode: HTTP methods and endpoint templates, see
+:attr:`prov_service_tests.timing.Sample.endpoint`, whose service
+refused a compressed request body
+"""
+
+
+def get_coding():
+  """Get content coding from the ``PROV_COMPRESSION`` environment
+  variable.
+
+  :return: :data:`IDENTITY`, one of :data:`CODINGS`, or None if not
+    set
+  :rtype: str or unicode
+  :raises ValueError: if the variable is not a supported coding
+  """
+  coding = os.environ.get(COMPRESSION_ENV)
+  if not coding:
+    return None
+  coding = coding.lower()
+  if coding != IDENTITY and coding not in CODINGS:
+    raise ValueError("%s must be one of %s, not %s" %
+                     (COMPRESSION_ENV, ", ".join([IDENTITY] + CODINGS),
+                      coding))
+  return coding
+
+
+def compress(data, coding):
+  """Compress data.
+
+  :param data: data
+  :type data: bytes
+  :param coding: one of :data:`CODINGS`
+  :type coding: str or unicode
+  :return: compressed data
+  :rtype: bytes
+  """
+  if coding == GZIP:
+    compressor = zlib.compressobj(6, zlib.DEFLATED, 16 + zlib.MAX_WBITS)
+    return compressor.compress(data) + compressor.flush()
+  return zlib.compress(data)
+
+
+def decompress(data, coding):
+  """Decompress data.
+
+  :param data: compressed data
+  :type data: bytes
+  :param coding: one of :data:`CODINGS`
+  :type coding: str or unicode
+  :return: data
+  :rtype: bytes
+  :raises zlib.error: if the data is not valid
+  """
+  if coding == GZIP:
+    return zlib.decompress(data, 16 + zlib.MAX_WBITS)
+  return zlib.decompress(data)
+
+
+class EndpointBytes(object):
+  """Thread-safe collection of bytes sent and received, and latency,
+  by endpoint.
+  """
+
+  def __init__(self):
+    self._lock = threading.Lock()
+    self._endpoints = {}
+
+  def add(self, sample):
+    """Add a sample.
+
+    :param sample: sample
+    :type sample: :class:`prov_service_tests.timing.Sample`
+    """
+    with self._lock:
+      if sample.endpoint not in self._endpoints:
+        self._endpoints[sample.endpoint] = {"sent": 0, "wire": 0,
+                                            "total": []}
+      endpoint = self._endpoints[sample.endpoint]
+      endpoint["sent"] += sample.sent
+      endpoint["wire"] += sample.wire
+      endpoint["total"].append(sample.total)
+
+  def report(self):
+    """Get mean bytes and median latency by endpoint.
+
+    :return: mapping from endpoint to ``count``, ``sent`` and ``wire``
+      (mean bytes sent and received) and ``p50`` (milliseconds)
+    :rtype: dict
+    """
+    with self._lock:
+      return dict([(name, {
+        "count": len(endpoint["total"]),
+        "sent": endpoint["sent"] / len(endpoint["total"]),
+        "wire": endpoint["wire"] / len(endpoint["total"]),
+        "p50": timing.summarise([total * 1000
+                                 for total in endpoint["total"]])["p50"]})
+                   for name, endpoint in self._endpoints.items()])
+
+
+def run_probes(patterns, iterations):
+  """Run probes in turn, a number of times, in this process, after
+  running them once, unrecorded, to open connections.
+
+  :param patterns: flow names or probe name patterns
+  :type patterns: list of str or unicode
+  :param iterations: number of times each probe is run
+  :type iterations: int
+  :return: report with ``endpoints``, see
+    :meth:`EndpointBytes.report`, and ``formats``, see
+    :meth:`prov_service_tests.sizes.FormatSizes.report`, keys
+  :rtype: dict
+  """
+  # Imported here as the tests import this module via the session.
+  from prov_service_tests import probes
+  from prov_service_tests import sizes
+  from prov_service_tests.test_provstore import SHARED
+  selected = probes.get_probes(patterns)
+  for probe in selected:
+    probe.run()
+  endpoints = EndpointBytes()
+  sizes.SIZES.reset()
+  timing.OBSERVERS.append(endpoints.add)
+  try:
+    for _ in range(iterations):
+      for probe in selected:
+        probe.run()
+  finally:
+    timing.OBSERVERS.remove(endpoints.add)
+    SHARED.delete_all()
+  return {"endpoints": endpoints.report(),
+          "formats": sizes.SIZES.report()}
+
+
+def change(before, after):
+  """Format the percentage change between two values.
+
+  :param before: value before
+  :type before: float
+  :param after: value after
+  :type after: float
+  :return: change e.g. ``-42.1%``, or ``-`` if not known
+  :rtype: str or unicode
+  """
+  if not before or after is None:
+    return "-"
+  return "%+.1f%%" % ((after - before) * 100 / before)
+
+
+def to_table(uncompressed, compressed, coding):
+  """Get comparison of uncompressed and compressed runs as text
+  tables, by endpoint and by format.
+
+  :param uncompressed: report of uncompressed run
+  :type uncompressed: dict
+  :param compressed: report of compressed run
+  :type compressed: dict
+  :param coding: content coding of compressed run
+  :type coding: str or unicode
+  :return: tables
+  :rtype: str or unicode
+  """
+  before = uncompressed["endpoints"]
+  after = compressed["endpoints"]
+  names = sorted(set(before) & set(after))
+  width = max([len("Endpoint")] + [len(name) for name in names])
+  row = "%-" + str(width) + "s %9s %9s %8s %11s %11s %8s"
+  lines = [row % ("Endpoint", "p50 (ms)", coding[:9], "Change",
+                  "Bytes", coding[:11], "Change")]
+  for name in names:
+    bytes_before = before[name]["sent"] + before[name]["wire"]
+    bytes_after = after[name]["sent"] + after[name]["wire"]
+    lines.append(row % (name, "%.1f" % before[name]["p50"],
+                        "%.1f" % after[name]["p50"],
+                        change(before[name]["p50"], after[name]["p50"]),
+                        "%.0f" % bytes_before, "%.0f" % bytes_after,
+                        change(bytes_before, bytes_after)))
+  before = uncompressed["formats"]
+  after = compressed["formats"]
+  row = "%-6s %9s %9s %8s %11s %11s %8s"
+  lines.append("")
+  lines.append(row % ("Format", "Mean (ms)", coding[:9], "Change",
+                      "Wire (B)", coding[:11], "Change"))
+  for format in sorted(set(before) & set(after)):
+    lines.append(row % (format, "%.1f" % before[format]["mean_ms"],
+                        "%.1f" % after[format]["mean_ms"],
+                        change(before[format]["mean_ms"],
+                               after[format]["mean_ms"]),
+                        "%.0f" % before[format]["wire"],
+                        "%.0f" % after[format]["wire"],
+                        change(before[format]["wire"],
+                               after[format]["wire"])))
+  return "\n".join(lines)
+
+
+def main(argv=None):
+  """Compare runs with and without compression from the command-line.
+
+  :param argv: command-line arguments, excluding program name
+  :type argv: list of str or unicode
+  :return: exit code
+  :rtype: int
+  """
+  from prov_service_tests import load
+  from prov_service_tests import probes
+  parser = argparse.ArgumentParser(
+    description="Compare latency and bytes transferred with and without "
+    "compression.")
+  parser.add_argument("patterns", nargs="*", metavar="probe",
+                      help="flow name (%s) or probe name pattern, "
+                      "default all probes" % ", ".join(sorted(probes.FLOWS)))
+  parser.add_argument("--compression", choices=CODINGS, default=GZIP,
+                      help="content coding (default gzip)")
+  parser.add_argument("--iterations", type=int, default=3,
+                      help="number of times each probe is run (default 3)")
+  parser.add_argument("--json", metavar="FILE",
+                      help="save reports as JSON")
+  parser.add_argument("--run", help=argparse.SUPPRESS)
+  load.add_service_arguments(parser)
+  args = parser.parse_args(argv)
+  if args.run:
+    # Run probes, in a process started below, with PROV_COMPRESSION set.
+    print(json.dumps(run_probes(args.patterns, args.iterations)))
+    return 0
+  args.workers = 1
+  local_server = load.configure(args)
+  reports = {}
+  try:
+    for coding in [IDENTITY, args.compression]:
+      environment = dict(os.environ)
+      environment[COMPRESSION_ENV] = coding
+      output = subprocess.check_output(
+        [sys.executable, "-m", "prov_service_tests.compression",
+         "--run", coding, "--iterations", str(args.iterations)] +
+        args.patterns, env=environment)
+      # Tests may print warnings, the report is on the last line.
+      reports[coding] = json.loads(
+        output.decode("utf-8").strip().split("\n")[-1])
+  finally:
+    if local_server is not None:
+      local_server.stop()
+  print(to_table(reports[IDENTITY], reports[args.compression],
+                 args.compression))
+  if args.json:
+    with open(args.json, "w") as f:
+      json.dump(reports, f, indent=2, sort_keys=True)
+  return 0
+
+
+if __name__ == "__main__":
+  sys.exit(main())
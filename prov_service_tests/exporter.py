@@ -0,0 +1,401 @@
+"""Probe the services continuously and export Prometheus metrics.
+
+In daemon mode, the selected flows, see
+:data:`prov_service_tests.probes.FLOWS`, are run every interval,
+using the test methods of
+:class:`prov_service_tests.test_provstore.ProvStoreTestCase` and
+:class:`prov_service_tests.test_provvalidator.ProvValidatorTestCase`
+as probes. Per-endpoint request latency histograms, request counts by
+status, bytes sent and received, and per-probe success counters and
+last success timestamps are served, in the Prometheus text format, at
+``/metrics``.
+
+Metrics are held as counters and fixed-bucket histograms, keyed by
+endpoint template and probe name, so memory use does not grow with
+uptime. The per-request samples otherwise collected for
+end-of-run reports, see :data:`prov_service_tests.timing.TIMINGS`,
+are not collected in daemon mode.
+
+Usage::
+
+    $ python -m prov_service_tests.exporter --interval 60 --port 9100
+"""
+# Copyright (c) 2015 University of Southampton
+#
+# Permission is hereby granted, free of charge, to any person
+# obtaining a copy of this software and associated documentation files
+# (the "Software"), to deal in the Software without restriction,
+# including without limitation the rights to use, copy, modify, merge,
+# publish, distribute, sublicense, and/or sell copies of the Software,
+# and to permit persons to whom the Software is furnished to do so,
+# subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be
+# included in all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND,
+# EXPRESS OR IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF
+# MERCHANTABILITY, FITNESS FOR A PARTICULAR PURPOSE AND
+# NONINFRINGEMENT. IN NO EVENT SHALL THE AUTHORS OR COPYRIGHT HOLDERS
+# BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER LIABILITY, WHETHER IN AN
+# ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM, OUT OF OR IN
+# CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+
+from __future__ import (absolute_import, division, print_function,
+                        unicode_literals)
+
+import argparse
+import bisect
+import sys
+import threading
+import time
+try:
+  from http.server import BaseHTTPRequestHandler
+  from http.server import HTTPServer
+  from socketserver import ThreadingMixIn
+except ImportError:
+  from BaseHTTPServer import BaseHTTPRequestHandler
+  from BaseHTTPServer import HTTPServer
+  from SocketServer import ThreadingMixIn
+
+from prov_service_tests import http
+from prov_service_tests import load
+from prov_service_tests import probes
+from prov_service_tests import session
+from prov_service_tests import timing
+from prov_service_tests.test_provstore import SHARED
+
+BUCKETS = [0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60]
+"""list of float: upper bounds, in seconds, of histogram buckets"""
+
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+"""str or unicode: content type of Prometheus text format"""
+
+METRICS_PATH = "/metrics"
+"""str or unicode: path at which metrics are served"""
+
+
+def escape(value):
+  """Escape a Prometheus label value.
+
+  :param value: value
+  :type value: str or unicode
+  :return: escaped value
+  :rtype: str or unicode
+  """
+  return value.replace("\\", "\\\\").replace("\n", "\\n").replace(
+    "\"", "\\\"")
+
+
+def format_labels(labels):
+  """Format Prometheus labels.
+
+  :param labels: (name, value) tuples
+  :type labels: list of tuple
+  :return: labels e.g. ``{method="GET",endpoint="/"}``
+  :rtype: str or unicode
+  """
+  return "{" + ",".join(['%s="%s"' % (name, escape(value))
+                         for name, value in labels]) + "}"
+
+
+class Histogram(object):
+  """Histogram with fixed buckets.
+  """
+
+  def __init__(self, buckets=BUCKETS):
+    """Create histogram.
+
+    :param buckets: upper bounds of buckets, in ascending order
+    :type buckets: list of float
+    """
+    self.buckets = buckets
+    self.counts = [0] * (len(buckets) + 1)
+    """list of int: number of values in each bucket, the last being
+    values greater than every bound"""
+    self.sum = 0.0
+    """float: sum of values"""
+    self.count = 0
+    """int: number of values"""
+
+  def observe(self, value):
+    """Add a value.
+
+    :param value: value
+    :type value: float
+    """
+    self.counts[bisect.bisect_left(self.buckets, value)] += 1
+    self.sum += value
+    self.count += 1
+
+  def to_lines(self, name, labels):
+    """Get histogram in Prometheus text format.
+
+    :param name: metric name
+    :type name: str or unicode
+    :param labels: (name, value) tuples
+    :type labels: list of tuple
+    :return: lines
+    :rtype: list of str or unicode
+    """
+    lines = []
+    cumulative = 0
+    bounds = ["%g" % bound for bound in self.buckets] + ["+Inf"]
+    for bound, count in zip(bounds, self.counts):
+      cumulative += count
+      lines.append("%s_bucket%s %d" % (
+        name, format_labels(labels + [("le", bound)]), cumulative))
+    lines.append("%s_sum%s %.6f" % (name, format_labels(labels), self.sum))
+    lines.append("%s_count%s %d" % (name, format_labels(labels),
+                                    self.count))
+    return lines
+
+
+class Metrics(object):
+  """Thread-safe, bounded collection of request and probe metrics.
+  :meth:`observe` can be added to
+  :data:`prov_service_tests.timing.OBSERVERS`.
+  """
+
+  def __init__(self):
+    self._lock = threading.Lock()
+    self._requests = {}
+    self._latencies = {}
+    self._sent = {}
+    self._received = {}
+    self._runs = {}
+    self._durations = {}
+    self._last_success = {}
+
+  def observe(self, sample):
+    """Add a request sample.
+
+    :param sample: sample
+    :type sample: :class:`prov_service_tests.timing.Sample`
+    """
+    endpoint = (sample.method, sample.template)
+    with self._lock:
+      key = endpoint + (str(sample.status),)
+      self._requests[key] = self._requests.get(key, 0) + 1
+      if endpoint not in self._latencies:
+        self._latencies[endpoint] = Histogram()
+      self._latencies[endpoint].observe(sample.total)
+      self._sent[endpoint] = self._sent.get(endpoint, 0) + sample.sent
+      self._received[endpoint] = \
+          self._received.get(endpoint, 0) + sample.received
+
+  def add_outcome(self, outcome):
+    """Add a probe outcome.
+
+    :param outcome: outcome
+    :type outcome: :class:`prov_service_tests.probes.Outcome`
+    """
+    with self._lock:
+      if outcome.skipped:
+        result = "skipped"
+      else:
+        result = "success" if outcome.success else "failure"
+      key = (outcome.name, result)
+      self._runs[key] = self._runs.get(key, 0) + 1
+      if outcome.skipped:
+        return
+      if outcome.name not in self._durations:
+        self._durations[outcome.name] = Histogram()
+      self._durations[outcome.name].observe(outcome.duration)
+      if outcome.success:
+        self._last_success[outcome.name] = time.time()
+
+  def to_text(self):
+    """Get metrics in Prometheus text format.
+
+    :return: metrics
+    :rtype: str or unicode
+    """
+    lines = []
+
+    def header(name, kind, description):
+      lines.append("# HELP %s %s" % (name, description))
+      lines.append("# TYPE %s %s" % (name, kind))
+
+    def endpoint_labels(endpoint):
+      return [("method", endpoint[0]), ("endpoint", endpoint[1])]
+
+    with self._lock:
+      header("prov_requests_total", "counter",
+             "Requests sent, by endpoint and status.")
+      for key in sorted(self._requests):
+        lines.append("prov_requests_total%s %d" % (
+          format_labels(endpoint_labels(key) + [("status", key[2])]),
+          self._requests[key]))
+      header("prov_request_duration_seconds", "histogram",
+             "Time from sending a request to reading its response.")
+      for endpoint in sorted(self._latencies):
+        lines.extend(self._latencies[endpoint].to_lines(
+          "prov_request_duration_seconds", endpoint_labels(endpoint)))
+      header("prov_request_bytes_total", "counter",
+             "Bytes sent in request bodies.")
+      for endpoint in sorted(self._sent):
+        lines.append("prov_request_bytes_total%s %d" % (
+          format_labels(endpoint_labels(endpoint)), self._sent[endpoint]))
+      header("prov_response_bytes_total", "counter",
+             "Bytes received in response bodies.")
+      for endpoint in sorted(self._received):
+        lines.append("prov_response_bytes_total%s %d" % (
+          format_labels(endpoint_labels(endpoint)),
+          self._received[endpoint]))
+      header("prov_probe_runs_total", "counter",
+             "Probes run, by probe and result.")
+      for key in sorted(self._runs):
+        lines.append("prov_probe_runs_total%s %d" % (
+          format_labels([("probe", key[0]), ("result", key[1])]),
+          self._runs[key]))
+      header("prov_probe_duration_seconds", "histogram",
+             "Time taken to run a probe.")
+      for name in sorted(self._durations):
+        lines.extend(self._durations[name].to_lines(
+          "prov_probe_duration_seconds", [("probe", name)]))
+      header("prov_probe_last_success_timestamp_seconds", "gauge",
+             "Time at which a probe last succeeded.")
+      for name in sorted(self._last_success):
+        lines.append("prov_probe_last_success_timestamp_seconds%s %.3f" % (
+          format_labels([("probe", name)]), self._last_success[name]))
+    header("prov_connections_opened_total", "counter",
+           "Connections opened.")
+    lines.append("prov_connections_opened_total %d" %
+                 session.STATISTICS.connections)
+    return "\n".join(lines) + "\n"
+
+
+class MetricsRequestHandler(BaseHTTPRequestHandler):
+  """Serve :class:`Metrics` from :class:`MetricsServer` at
+  :data:`METRICS_PATH`.
+  """
+
+  def log_message(self, format, *args):
+    pass
+
+  def do_GET(self):
+    if self.path.split("?")[0] != METRICS_PATH:
+      self.send_error(404)
+      return
+    body = self.server.metrics.to_text().encode("utf-8")
+    self.send_response(200)
+    self.send_header(http.CONTENT_TYPE, CONTENT_TYPE)
+    self.send_header("Content-Length", str(len(body)))
+    self.end_headers()
+    self.wfile.write(body)
+
+
+class MetricsServer(ThreadingMixIn, HTTPServer):
+  """Threaded HTTP server exporting metrics.
+  """
+
+  daemon_threads = True
+  allow_reuse_address = True
+
+  def __init__(self, metrics, address=("127.0.0.1", 0)):
+    """Create server.
+
+    :param metrics: metrics
+    :type metrics: :class:`Metrics`
+    :param address: host and port, port 0 for any free port
+    :type address: tuple
+    """
+    HTTPServer.__init__(self, address, MetricsRequestHandler)
+    self.metrics = metrics
+    """:class:`Metrics`: metrics served"""
+    self._thread = None
+
+  @property
+  def url(self):
+    """str or unicode: URL of metrics"""
+    return "http://%s:%d%s" % (self.server_address[:2] + (METRICS_PATH,))
+
+  def start(self):
+    """Serve requests in a background thread."""
+    self._thread = threading.Thread(target=self.serve_forever)
+    self._thread.daemon = True
+    self._thread.start()
+
+  def stop(self):
+    """Stop serving requests and close the server socket."""
+    self.shutdown()
+    self.server_close()
+
+
+def probe(selected, interval, concurrency, metrics, stop=None):
+  """Run probes every interval until stopped. Each round of probes
+  starts ``interval`` seconds after the previous round started, or as
+  soon as it completes if it took longer.
+
+  :param selected: probes
+  :type selected: list of :class:`prov_service_tests.probes.Probe`
+  :param interval: interval in seconds
+  :type interval: float
+  :param concurrency: maximum number of probes run at once
+  :type concurrency: int
+  :param metrics: metrics to which outcomes are added
+  :type metrics: :class:`Metrics`
+  :param stop: event which, when set, stops probing, or None to probe
+    until interrupted
+  :type stop: :class:`threading.Event`
+  """
+  stop = stop or threading.Event()
+  while not stop.is_set():
+    start = timing.clock()
+    for outcome in probes.run_concurrently(selected, concurrency):
+      metrics.add_outcome(outcome)
+    stop.wait(max(0, interval - (timing.clock() - start)))
+
+
+def main(argv=None):
+  """Run probe daemon from the command-line until interrupted.
+
+  :param argv: command-line arguments, excluding program name
+  :type argv: list of str or unicode
+  :return: exit code
+  :rtype: int
+  """
+  parser = argparse.ArgumentParser(
+    description="Probe the services continuously and export metrics.")
+  parser.add_argument("patterns", nargs="*", metavar="probe",
+                      help="flow name (%s) or probe name pattern, "
+                      "default all flows" % ", ".join(sorted(probes.FLOWS)))
+  parser.add_argument("--interval", type=float, default=60,
+                      help="seconds between the start of each round of "
+                      "probes (default 60)")
+  parser.add_argument("--concurrency", type=int, default=4,
+                      help="maximum number of probes run at once (default 4)")
+  parser.add_argument("--host", default="127.0.0.1",
+                      help="host name or address on which metrics are "
+                      "served (default 127.0.0.1)")
+  parser.add_argument("--port", type=int, default=9100,
+                      help="port on which metrics are served (default 9100)")
+  load.add_service_arguments(parser)
+  args = parser.parse_args(argv)
+  args.workers = args.concurrency
+  metrics = Metrics()
+  # Per-request samples would accumulate for as long as the daemon runs.
+  if timing.TIMINGS.add in timing.OBSERVERS:
+    timing.OBSERVERS.remove(timing.TIMINGS.add)
+  timing.OBSERVERS.append(metrics.observe)
+  local_server = load.configure(args)
+  metrics_server = MetricsServer(metrics, (args.host, args.port))
+  metrics_server.start()
+  print("Serving metrics at " + metrics_server.url)
+  try:
+    selected = probes.get_probes(args.patterns or sorted(probes.FLOWS))
+    probe(selected, args.interval, args.concurrency, metrics)
+  except KeyboardInterrupt:
+    pass
+  finally:
+    SHARED.delete_all()
+    metrics_server.stop()
+    if local_server is not None:
+      local_server.stop()
+  return 0
+
+
+if __name__ == "__main__":
+  sys.exit(main())
@@ -0,0 +1,482 @@
+"""Check that translations by ProvValidator preserve documents.
+
+For each pair of formats A and B, a document in format A is
+translated to B and back to A, and the round-tripped document is
+compared to the original by a canonical fingerprint.
+
+Fingerprints are computed over PROV-N, so documents, including PROV-N
+documents, are first translated to PROV-N by ProvValidator, so that
+both sides of a round trip are serialized by the same code. A
+fingerprint is the sum, modulo 2^160, of the SHA-1 hashes of each
+canonicalized statement. Statements may span lines. Whitespace
+outside literals and comments is removed, attributes are sorted, and
+trailing placeholders and identifiers generated for blank nodes are
+dropped. The sum does not depend on the order of statements, as a PROV
+graph does not, but counts repeated statements. It is computed a chunk
+at a time as a document is streamed from the service, so
+multi-megabyte documents are compared in bounded memory. Intermediate
+documents are streamed to temporary files rather than held in memory,
+and the original and round-tripped documents are never held at the
+same time.
+
+The fingerprint of each source document is cached, keyed by file
+name, size and modification time, so each source is canonicalised
+and hashed only once however many round trips start from it.
+
+Usage::
+
+    $ python -m prov_service_tests.fidelity --generated entities=100000
+"""
+# Copyright (c) 2015 University of Southampton
+#
+# Permission is hereby granted, free of charge, to any person
+# obtaining a copy of this software and associated documentation files
+# (the "Software"), to deal in the Software without restriction,
+# including without limitation the rights to use, copy, modify, merge,
+# publish, distribute, sublicense, and/or sell copies of the Software,
+# and to permit persons to whom the Software is furnished to do so,
+# subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be
+# included in all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND,
+# EXPRESS OR IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF
+# MERCHANTABILITY, FITNESS FOR A PARTICULAR PURPOSE AND
+# NONINFRINGEMENT. IN NO EVENT SHALL THE AUTHORS OR COPYRIGHT HOLDERS
+# BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER LIABILITY, WHETHER IN AN
+# ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM, OUT OF OR IN
+# CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+
+from __future__ import (absolute_import, division, print_function,
+                        unicode_literals)
+
+import argparse
+import hashlib
+import itertools
+import json
+import os
+import re
+import sys
+import tempfile
+import threading
+import requests
+
+from prov_service_tests import generator
+from prov_service_tests import http
+from prov_service_tests import load
+from prov_service_tests import probes
+from prov_service_tests import session
+from prov_service_tests import standards
+from prov_service_tests import streaming
+from prov_service_tests.test_provvalidator import ProvValidatorTestCase
+from prov_service_tests.test_service import DOCUMENTS_DIRECTORY
+from prov_service_tests.test_service import ServiceTestCase
+
+CANONICAL_FORMAT = standards.PROVN
+"""str or unicode: format over which fingerprints are computed"""
+
+MODULUS = 2 ** 160
+"""int: modulus of the sum of statement hashes"""
+
+TOKEN = re.compile(br"""(\s+)|(//.*)|("(?:[^"\\]|\\.)*"|'(?:[^'\\]|\\.)*'"""
+                   br"""|<[^>]*>|[^"'<\s/()\[\],;=]+|.)""")
+"""regular expression: whitespace, a comment or a PROV-N token, being
+a string, qualified name or IRI literal, a name or a single character
+"""
+
+PLACEHOLDER = b"-"
+"""bytes: PROV-N placeholder for an optional argument"""
+
+BLANK_PREFIX = b"_:"
+"""bytes: prefix of identifiers generated for blank nodes"""
+
+
+def split_top_level(tokens, separator):
+  """Split tokens at separators which are not nested within
+  parentheses or brackets.
+
+  :param tokens: tokens
+  :type tokens: list of bytes
+  :param separator: separator
+  :type separator: bytes
+  :return: lists of tokens
+  :rtype: list of list of bytes
+  """
+  parts = [[]]
+  depth = 0
+  for token in tokens:
+    if token in (b"(", b"["):
+      depth += 1
+    elif token in (b")", b"]"):
+      depth -= 1
+    if token == separator and depth == 0:
+      parts.append([])
+    else:
+      parts[-1].append(token)
+  return parts
+
+
+def canonicalize(tokens):
+  """Get the canonical form of a PROV-N statement, which does not
+  depend on whitespace, the order of its attributes, trailing
+  placeholders for optional arguments or identifiers generated for
+  blank nodes.
+
+  :param tokens: tokens of statement, without whitespace or comments
+  :type tokens: list of bytes
+  :return: canonical statement
+  :rtype: bytes
+  """
+  if b"(" not in tokens or tokens[-1] != b")":
+    # e.g. document, prefix or endDocument.
+    return b" ".join(tokens)
+  start = tokens.index(b"(")
+  arguments = split_top_level(tokens[start + 1:-1], b",")
+  identifier = split_top_level(arguments[0], b";")
+  if len(identifier) == 2 and identifier[0] and \
+      identifier[0][0].startswith(BLANK_PREFIX):
+    arguments[0] = identifier[1]
+  attributes = []
+  if arguments[-1] and arguments[-1][0] == b"[":
+    attributes = sorted([b"".join(attribute) for attribute
+                         in split_top_level(arguments.pop()[1:-1], b",")
+                         if attribute])
+  while len(arguments) > 1 and arguments[-1] == [PLACEHOLDER]:
+    arguments.pop()
+  arguments = [b"".join(argument) for argument in arguments]
+  if attributes:
+    arguments.append(b"[" + b",".join(attributes) + b"]")
+  return b"".join(tokens[:start]) + b"(" + b",".join(arguments) + b")"
+
+
+class Fingerprint(object):
+  """Order-independent fingerprint of a PROV-N document, computed from
+  chunks of the document as they are read. Statements may span lines.
+  Each statement is canonicalized, see :func:`canonicalize`, before it
+  is hashed.
+  """
+
+  def __init__(self):
+    self._sum = 0
+    self._partial = b""
+    self._tokens = []
+    self._depth = 0
+    self.statements = 0
+    """int: number of statements hashed"""
+
+  def add_statement(self, tokens):
+    """Hash a statement and add it.
+
+    :param tokens: tokens of statement
+    :type tokens: list of bytes
+    """
+    statement = canonicalize(tokens)
+    self._sum = (self._sum +
+                 int(hashlib.sha1(statement).hexdigest(), 16)) % MODULUS
+    self.statements += 1
+
+  def add_line(self, line):
+    """Add the tokens of a line to the current statement, adding the
+    statement once its parentheses and brackets are balanced at the
+    end of a line.
+
+    :param line: line, without line terminator
+    :type line: bytes
+    """
+    for match in TOKEN.finditer(line):
+      if match.group(2):
+        break
+      token = match.group(3)
+      if not token:
+        continue
+      if token in (b"(", b"["):
+        self._depth += 1
+      elif token in (b")", b"]"):
+        self._depth -= 1
+      self._tokens.append(token)
+    if self._tokens and self._depth <= 0:
+      self.add_statement(self._tokens)
+      self._tokens = []
+      self._depth = 0
+
+  def update(self, chunk):
+    """Add a chunk of the document.
+
+    :param chunk: chunk
+    :type chunk: bytes
+    """
+    lines = (self._partial + chunk).split(b"\n")
+    self._partial = lines.pop()
+    for line in lines:
+      self.add_line(line)
+
+  def hexdigest(self):
+    """Get the fingerprint, once all chunks have been added.
+
+    :return: hexadecimal sum of statement hashes and number of
+      statements
+    :rtype: str or unicode
+    """
+    if self._partial:
+      self.add_line(self._partial)
+      self._partial = b""
+    if self._tokens:
+      # Unbalanced final statement.
+      self.add_statement(self._tokens)
+      self._tokens = []
+    return "%040x-%d" % (self._sum, self.statements)
+
+
+def translate(upload, from_format, to_format, write):
+  """Submit POST /provapi/documents/ to translate a document, and
+  stream the translation.
+
+  :param upload: document
+  :type upload: :class:`prov_service_tests.streaming.Upload`
+  :param from_format: format of document
+  :type from_format: str or unicode
+  :param to_format: format of translation
+  :type to_format: str or unicode
+  :param write: function called with each chunk of the translation
+  :type write: function
+  :raises ValueError: if the response code is not 200 OK
+  """
+  headers = {
+    http.CONTENT_TYPE: ProvValidatorTestCase.CONTENT_TYPES[from_format],
+    http.ACCEPT: ProvValidatorTestCase.CONTENT_TYPES[to_format]}
+  response = session.get_session().post(
+    os.environ[ProvValidatorTestCase.URL_ENV], headers=headers,
+    data=upload, stream=True)
+  # Record the upload against the POST, not the redirected GET.
+  streaming.record_upload(upload, (response.history or [response])[0])
+  if response.status_code != requests.codes.ok:
+    response.close()
+    raise ValueError("Translating %s to %s returned %d" %
+                     (from_format, to_format, response.status_code))
+  streaming.consume(response, write=write)
+
+
+def fingerprint_file(f, format):
+  """Compute the fingerprint of a document, translated to PROV-N by
+  ProvValidator. PROV-N documents are translated too, so that both
+  sides of a round trip are serialized the same way.
+
+  :param f: binary file, positioned at the start of the document
+  :type f: file
+  :param format: format of document
+  :type format: str or unicode
+  :return: fingerprint
+  :rtype: str or unicode
+  :raises ValueError: if the document cannot be translated
+  """
+  fingerprint = Fingerprint()
+  translate(streaming.upload_file(f), format, CANONICAL_FORMAT,
+            fingerprint.update)
+  return fingerprint.hexdigest()
+
+
+class FingerprintCache(object):
+  """Thread-safe cache of fingerprints of source documents, keyed by
+  file name, size and modification time. Each source is
+  fingerprinted once, even if requested by several threads at once.
+  """
+
+  def __init__(self):
+    self._lock = threading.Lock()
+    self._locks = {}
+    self._fingerprints = {}
+
+  def get(self, path, format):
+    """Get the fingerprint of a document in a file.
+
+    :param path: file name
+    :type path: str or unicode
+    :param format: format of document
+    :type format: str or unicode
+    :return: fingerprint
+    :rtype: str or unicode
+    :raises ValueError: if the document cannot be translated
+    """
+    status = os.stat(path)
+    key = (path, format, status.st_size, status.st_mtime)
+    with self._lock:
+      lock = self._locks.setdefault(key, threading.Lock())
+    with lock:
+      if key not in self._fingerprints:
+        with open(path, "rb") as f:
+          self._fingerprints[key] = fingerprint_file(f, format)
+      return self._fingerprints[key]
+
+  def __len__(self):
+    with self._lock:
+      return len(self._fingerprints)
+
+
+FINGERPRINTS = FingerprintCache()
+""":class:`FingerprintCache`: fingerprints of source documents"""
+
+
+class RoundTrip(object):
+  """Round trip of a document through another format.
+  """
+
+  def __init__(self, path, from_format, to_format):
+    self.path = path
+    """str or unicode: file holding the source document"""
+    self.from_format = from_format
+    """str or unicode: format of the source document"""
+    self.to_format = to_format
+    """str or unicode: format translated to and back from"""
+    self.name = from_format + " > " + to_format + " > " + from_format
+    """str or unicode: name"""
+    self.expected = None
+    """str or unicode: fingerprint of the source document"""
+    self.actual = None
+    """str or unicode: fingerprint of the round-tripped document"""
+    self.error = None
+    """str or unicode: error, or None"""
+
+  @property
+  def success(self):
+    """bool: True if the round trip preserved the document"""
+    return self.error is None and self.expected == self.actual
+
+  def run(self):
+    """Translate the document and back, and compare fingerprints.
+
+    :return: this round trip
+    :rtype: :class:`RoundTrip`
+    """
+    try:
+      self.expected = FINGERPRINTS.get(self.path, self.from_format)
+      with tempfile.TemporaryFile() as translated:
+        with open(self.path, "rb") as f:
+          translate(streaming.upload_file(f), self.from_format,
+                    self.to_format, translated.write)
+        translated.seek(0)
+        with tempfile.TemporaryFile() as returned:
+          translate(streaming.upload_file(translated), self.to_format,
+                    self.from_format, returned.write)
+          returned.seek(0)
+          self.actual = fingerprint_file(returned, self.from_format)
+    except (ValueError, requests.RequestException) as e:
+      self.error = str(e)
+    return self
+
+  def report(self):
+    """Get outcome.
+
+    :return: ``from``, ``to``, ``expected`` and ``actual``
+      fingerprints, ``match`` and ``error``
+    :rtype: dict
+    """
+    return {"from": self.from_format,
+            "to": self.to_format,
+            "expected": self.expected,
+            "actual": self.actual,
+            "match": self.success,
+            "error": self.error}
+
+
+def get_sources(parameters=None):
+  """Get source documents in each format.
+
+  :param parameters: parameters of generated documents, or None for
+    the ``primer.*`` documents
+  :type parameters: :class:`prov_service_tests.generator.Parameters`
+  :return: mapping from formats to file names
+  :rtype: dict
+  """
+  if parameters is None:
+    return dict([(format, os.path.join(DOCUMENTS_DIRECTORY, file_name))
+                 for format, file_name
+                 in ServiceTestCase.PRIMER_DOCUMENTS.items()])
+  return dict([(format, generator.generate(format, parameters))
+               for format in standards.FORMATS])
+
+
+def to_table(round_trips):
+  """Get outcomes as a text table, with a row for each source format
+  and a column for each intermediate format.
+
+  :param round_trips: round trips
+  :type round_trips: list of :class:`RoundTrip`
+  :return: table
+  :rtype: str or unicode
+  """
+  outcomes = dict([((item.from_format, item.to_format),
+                    "ok" if item.success else
+                    "error" if item.error else "DIFFERS")
+                   for item in round_trips])
+  formats = [format for format in standards.FORMATS
+             if any([key[1] == format for key in outcomes])]
+  row = "%-8s" + " %8s" * len(formats)
+  lines = [row % tuple(["From/via"] + formats)]
+  for from_format in standards.FORMATS:
+    if any([key[0] == from_format for key in outcomes]):
+      lines.append(row % tuple([from_format] +
+                               [outcomes.get((from_format, to_format), "-")
+                                for to_format in formats]))
+  return "\n".join(lines)
+
+
+def main(argv=None):
+  """Check round-trip fidelity from the command-line.
+
+  :param argv: command-line arguments, excluding program name
+  :type argv: list of str or unicode
+  :return: exit code, 0 if all round trips preserved documents, 1
+    otherwise
+  :rtype: int
+  """
+  parser = argparse.ArgumentParser(
+    description="Check that translations preserve documents.")
+  parser.add_argument("--from", dest="from_formats", action="append",
+                      choices=standards.FORMATS,
+                      help="source format, may be repeated (default all)")
+  parser.add_argument("--via", dest="via_formats", action="append",
+                      choices=standards.FORMATS,
+                      help="intermediate format, may be repeated "
+                      "(default all)")
+  parser.add_argument("--generated", metavar="PARAMETERS",
+                      type=generator.Parameters.parse,
+                      help="use generated documents with these parameters, "
+                      "e.g. entities=10000, rather than the primer")
+  parser.add_argument("--concurrency", type=int, default=4,
+                      help="round trips run at once (default 4)")
+  parser.add_argument("--json", metavar="FILE",
+                      help="save report as JSON")
+  load.add_service_arguments(parser)
+  args = parser.parse_args(argv)
+  args.workers = args.concurrency
+  local_server = load.configure(args)
+  try:
+    sources = get_sources(args.generated)
+    round_trips = [RoundTrip(sources[from_format], from_format, to_format)
+                   for from_format, to_format in itertools.product(
+                     args.from_formats or standards.FORMATS,
+                     args.via_formats or standards.FORMATS)]
+    probes.run_concurrently(round_trips, args.concurrency)
+  finally:
+    if local_server is not None:
+      local_server.stop()
+  print(to_table(round_trips))
+  for item in round_trips:
+    if item.error:
+      print("%s: %s" % (item.name, item.error))
+    elif not item.success:
+      print("%s: expected %s, got %s" % (item.name, item.expected,
+                                         item.actual))
+  print("Source fingerprints computed: %d" % len(FINGERPRINTS))
+  print(session.STATISTICS)
+  if args.json:
+    with open(args.json, "w") as f:
+      json.dump([item.report() for item in round_trips], f, indent=2,
+                sort_keys=True)
+  return 0 if all([item.success for item in round_trips]) else 1
+
+
+if __name__ == "__main__":
+  sys.exit(main())
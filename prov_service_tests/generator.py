@@ -0,0 +1,592 @@
+"""Generate synthetic PROV documents of configurable size.
+
+Documents contain entities, activities and agents, related by
+``wasGeneratedBy``, ``used``, ``wasAssociatedWith``,
+``wasAttributedTo`` and ``wasDerivedFrom`` relations chosen at random
+from a seeded generator, optionally split across bundles. The same
+parameters always give the same document, in every format in
+:data:`prov_service_tests.standards.FORMATS`.
+
+Documents are written to a file a statement at a time, so documents
+of hundreds of megabytes can be generated without being held in
+memory. Generated files are cached in a directory, by default
+``prov_service_tests/generated`` in the system temporary directory,
+or the directory named by ``PROV_GENERATED_DIRECTORY``.
+
+Usage::
+
+    $ python -m prov_service_tests.generator --entities 100000 \\
+        --bundles 4 --format json --format provx
+
+To post generated documents to ProvStore and ProvValidator, for a
+range of sizes, and print latency against document size::
+
+    $ python -m prov_service_tests.generator --sweep 100,1000,10000
+"""
+# Copyright (c) 2015 University of Southampton
+#
+# Permission is hereby granted, free of charge, to any person
+# obtaining a copy of this software and associated documentation files
+# (the "Software"), to deal in the Software without restriction,
+# including without limitation the rights to use, copy, modify, merge,
+# publish, distribute, sublicense, and/or sell copies of the Software,
+# and to permit persons to whom the Software is furnished to do so,
+# subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be
+# included in all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND,
+# EXPRESS OR IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF
+# MERCHANTABILITY, FITNESS FOR A PARTICULAR PURPOSE AND
+# NONINFRINGEMENT. IN NO EVENT SHALL THE AUTHORS OR COPYRIGHT HOLDERS
+# BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER LIABILITY, WHETHER IN AN
+# ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM, OUT OF OR IN
+# CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+
+from __future__ import (absolute_import, division, print_function,
+                        unicode_literals)
+
+import argparse
+import io
+import json
+import os
+import random
+import sys
+import tempfile
+
+from prov_service_tests import standards
+
+DIRECTORY_ENV = "PROV_GENERATED_DIRECTORY"
+"""str or unicode: environment variable holding directory in which
+generated documents are cached
+"""
+
+PARAMETERS_ENV = "PROV_GENERATED"
+"""str or unicode: environment variable holding comma-separated
+``name=value`` parameters of documents generated by tests e.g.
+``entities=10000,bundles=2``
+"""
+
+PROV_NAMESPACE = "http://www.w3.org/ns/prov#"
+"""str or unicode: PROV namespace"""
+
+EX_NAMESPACE = "http://example.org/"
+"""str or unicode: namespace of generated identifiers"""
+
+ELEMENTS = ["entity", "activity", "agent"]
+"""list of str or unicode: PROV element types"""
+
+RELATIONS = {
+  "wasGeneratedBy": ("entity", "activity"),
+  "used": ("activity", "entity"),
+  "wasAssociatedWith": ("activity", "agent"),
+  "wasAttributedTo": ("entity", "agent"),
+  "wasDerivedFrom": ("entity", "entity")
+}
+"""dict: mapping from PROV relation types to the element types they
+relate"""
+
+RELATION_ORDER = ["wasGeneratedBy", "used", "wasAssociatedWith",
+                  "wasAttributedTo", "wasDerivedFrom"]
+"""list of str or unicode: order in which relation types are written"""
+
+JSON_ROLES = {
+  "wasGeneratedBy": ("prov:entity", "prov:activity"),
+  "used": ("prov:activity", "prov:entity"),
+  "wasAssociatedWith": ("prov:activity", "prov:agent"),
+  "wasAttributedTo": ("prov:entity", "prov:agent"),
+  "wasDerivedFrom": ("prov:generatedEntity", "prov:usedEntity")
+}
+"""dict: mapping from PROV relation types to PROV-JSON and PROV-XML
+property names of their two arguments"""
+
+
+class Parameters(object):
+  """Parameters of a generated document. Counts are per bundle if
+  there are bundles.
+  """
+
+  def __init__(self, entities=100, activities=None, agents=None,
+               density=2.0, bundles=0, seed=0):
+    """Create parameters.
+
+    :param entities: number of entities
+    :type entities: int
+    :param activities: number of activities, default half the number
+      of entities
+    :type activities: int
+    :param agents: number of agents, default a tenth of the number of
+      entities
+    :type agents: int
+    :param density: number of relations per entity
+    :type density: float
+    :param bundles: number of bundles, or 0 for no bundles
+    :type bundles: int
+    :param seed: random number generator seed
+    :type seed: int
+    """
+    self.entities = int(entities)
+    self.activities = int(activities if activities is not None
+                          else (self.entities + 1) // 2)
+    self.agents = int(agents if agents is not None
+                      else (self.entities + 9) // 10)
+    self.density = float(density)
+    self.bundles = int(bundles)
+    self.seed = int(seed)
+
+  @classmethod
+  def parse(cls, value):
+    """Create parameters from comma-separated ``name=value`` pairs.
+
+    :param value: parameters e.g. ``entities=1000,bundles=2``
+    :type value: str or unicode
+    :return: parameters
+    :rtype: :class:`Parameters`
+    :raises ValueError: if a name or value is invalid
+    """
+    kwargs = {}
+    for pair in [pair for pair in value.split(",") if pair.strip()]:
+      name, _, number = pair.partition("=")
+      kwargs[name.strip()] = float(number) if name.strip() == "density" \
+          else int(number)
+    try:
+      return cls(**kwargs)
+    except TypeError as e:
+      raise ValueError(str(e))
+
+  def count(self, element_type):
+    """Get number of elements of a type in each bundle.
+
+    :param element_type: element type, a value in :data:`ELEMENTS`
+    :type element_type: str or unicode
+    :return: count
+    :rtype: int
+    """
+    return {"entity": self.entities,
+            "activity": self.activities,
+            "agent": self.agents}[element_type]
+
+  @property
+  def name(self):
+    """str or unicode: file name, without extension, encoding the
+    parameters"""
+    return "generated-e%d-a%d-g%d-r%s-b%d-s%d" % \
+        (self.entities, self.activities, self.agents,
+         ("%g" % self.density), self.bundles, self.seed)
+
+
+def units(parameters):
+  """Get identifiers of the bundles in a document, or None for a
+  document without bundles.
+
+  :param parameters: parameters
+  :type parameters: :class:`Parameters`
+  :return: bundle identifiers or ``[None]``
+  :rtype: list of str or unicode
+  """
+  if parameters.bundles == 0:
+    return [None]
+  return ["ex:bundle%d" % index for index in range(parameters.bundles)]
+
+
+def element_id(bundle, element_type, index):
+  """Get identifier of an element.
+
+  :param bundle: bundle identifier or None
+  :type bundle: str or unicode
+  :param element_type: element type
+  :type element_type: str or unicode
+  :param index: index of element
+  :type index: int
+  :return: qualified name e.g. ``ex:entity7`` or
+    ``ex:bundle1_entity7``
+  :rtype: str or unicode
+  """
+  if bundle is None:
+    return "ex:%s%d" % (element_type, index)
+  return "%s_%s%d" % (bundle, element_type, index)
+
+
+def elements(parameters, bundle, element_type):
+  """Generate identifiers of elements of a type.
+
+  :param parameters: parameters
+  :type parameters: :class:`Parameters`
+  :param bundle: bundle identifier or None
+  :type bundle: str or unicode
+  :param element_type: element type
+  :type element_type: str or unicode
+  :return: identifiers
+  :rtype: generator of str or unicode
+  """
+  for index in range(parameters.count(element_type)):
+    yield element_id(bundle, element_type, index)
+
+
+def relations(parameters, bundle, relation_type):
+  """Generate relations of a type, each relating two randomly chosen
+  elements. The relations are the same each time they are generated.
+
+  :param parameters: parameters
+  :type parameters: :class:`Parameters`
+  :param bundle: bundle identifier or None
+  :type bundle: str or unicode
+  :param relation_type: relation type, a key in :data:`RELATIONS`
+  :type relation_type: str or unicode
+  :return: identifier and the identifiers of the two related
+    elements
+  :rtype: generator of tuple
+  """
+  subject_type, object_type = RELATIONS[relation_type]
+  subjects = parameters.count(subject_type)
+  objects = parameters.count(object_type)
+  if subjects == 0 or objects == 0:
+    return
+  rng = random.Random("%d %s %s" % (parameters.seed, bundle, relation_type))
+  count = int(parameters.density * parameters.entities / len(RELATIONS))
+  for index in range(count):
+    yield ("_:%s%s%d" % ("" if bundle is None else bundle[len("ex:"):] + "_",
+                         relation_type, index),
+           element_id(bundle, subject_type, rng.randrange(subjects)),
+           element_id(bundle, object_type, rng.randrange(objects)))
+
+
+def write_provn(f, parameters):
+  """Write a document as PROV-N.
+
+  :param f: text file
+  :type f: file
+  :param parameters: parameters
+  :type parameters: :class:`Parameters`
+  """
+  f.write("document\n")
+  f.write("prefix ex <%s>\n" % EX_NAMESPACE)
+  for bundle in units(parameters):
+    indent = ""
+    if bundle is not None:
+      f.write("bundle %s\n" % bundle)
+      indent = "  "
+    for element_type in ELEMENTS:
+      for identifier in elements(parameters, bundle, element_type):
+        if element_type == "activity":
+          f.write("%sactivity(%s, -, -)\n" % (indent, identifier))
+        else:
+          f.write("%s%s(%s)\n" % (indent, element_type, identifier))
+    for relation_type in RELATION_ORDER:
+      for _, subject, obj in relations(parameters, bundle, relation_type):
+        if relation_type in ["wasGeneratedBy", "used", "wasAssociatedWith"]:
+          f.write("%s%s(%s, %s, -)\n" % (indent, relation_type, subject, obj))
+        else:
+          f.write("%s%s(%s, %s)\n" % (indent, relation_type, subject, obj))
+    if bundle is not None:
+      f.write("endBundle\n")
+  f.write("endDocument\n")
+
+
+TURTLE_TYPES = {"entity": "prov:Entity",
+                "activity": "prov:Activity",
+                "agent": "prov:Agent"}
+"""dict: mapping from element types to PROV-O classes"""
+
+
+def write_rdf(f, parameters, named_graphs):
+  """Write a document as PROV-O Turtle or TriG. In Turtle, bundles
+  are declared but their contents are merged into one graph. In TriG
+  each bundle is a named graph.
+
+  :param f: text file
+  :type f: file
+  :param parameters: parameters
+  :type parameters: :class:`Parameters`
+  :param named_graphs: write bundles as TriG named graphs
+  :type named_graphs: bool
+  """
+  f.write("@prefix prov: <%s> .\n" % PROV_NAMESPACE)
+  f.write("@prefix ex: <%s> .\n\n" % EX_NAMESPACE)
+  bundles = units(parameters)
+  if named_graphs and bundles != [None]:
+    f.write("{\n")
+  for bundle in bundles:
+    if bundle is not None:
+      f.write("%s a prov:Bundle .\n" % bundle)
+  if named_graphs and bundles != [None]:
+    f.write("}\n")
+  for bundle in bundles:
+    indent = ""
+    if named_graphs:
+      f.write("%s{\n" % (bundle + " " if bundle is not None else ""))
+      indent = "  "
+    for element_type in ELEMENTS:
+      for identifier in elements(parameters, bundle, element_type):
+        f.write("%s%s a %s .\n" % (indent, identifier,
+                                   TURTLE_TYPES[element_type]))
+    for relation_type in RELATION_ORDER:
+      for _, subject, obj in relations(parameters, bundle, relation_type):
+        f.write("%s%s prov:%s %s .\n" % (indent, subject, relation_type, obj))
+    if named_graphs:
+      f.write("}\n")
+
+
+def write_provx(f, parameters):
+  """Write a document as PROV-XML.
+
+  :param f: text file
+  :type f: file
+  :param parameters: parameters
+  :type parameters: :class:`Parameters`
+  """
+  f.write('<?xml version="1.0" encoding="UTF-8"?>\n')
+  f.write('<prov:document xmlns:prov="%s" xmlns:ex="%s">\n' %
+          (PROV_NAMESPACE, EX_NAMESPACE))
+  for bundle in units(parameters):
+    indent = "  "
+    if bundle is not None:
+      f.write('  <prov:bundleContent prov:id="%s">\n' % bundle)
+      indent = "    "
+    for element_type in ELEMENTS:
+      for identifier in elements(parameters, bundle, element_type):
+        f.write('%s<prov:%s prov:id="%s"/>\n' %
+                (indent, element_type, identifier))
+    for relation_type in RELATION_ORDER:
+      subject_role, object_role = JSON_ROLES[relation_type]
+      for _, subject, obj in relations(parameters, bundle, relation_type):
+        f.write('%s<prov:%s><%s prov:ref="%s"/><%s prov:ref="%s"/></prov:%s>\n'
+                % (indent, relation_type, subject_role, subject,
+                   object_role, obj, relation_type))
+    if bundle is not None:
+      f.write("  </prov:bundleContent>\n")
+  f.write("</prov:document>\n")
+
+
+def write_json_statements(f, parameters, bundle, indent):
+  """Write the statements of a document or bundle as the members of
+  a PROV-JSON object.
+
+  :param f: text file
+  :type f: file
+  :param parameters: parameters
+  :type parameters: :class:`Parameters`
+  :param bundle: bundle identifier or None
+  :type bundle: str or unicode
+  :param indent: indentation
+  :type indent: str or unicode
+  """
+  separator = ""
+  for element_type in ELEMENTS:
+    f.write('%s\n%s"%s": {' % (separator, indent, element_type))
+    member_separator = ""
+    for identifier in elements(parameters, bundle, element_type):
+      f.write('%s\n%s  "%s": {}' % (member_separator, indent, identifier))
+      member_separator = ","
+    f.write("\n%s}" % indent)
+    separator = ","
+  for relation_type in RELATION_ORDER:
+    subject_role, object_role = JSON_ROLES[relation_type]
+    f.write(',\n%s"%s": {' % (indent, relation_type))
+    member_separator = ""
+    for identifier, subject, obj in relations(parameters, bundle,
+                                              relation_type):
+      f.write('%s\n%s  "%s": {"%s": "%s", "%s": "%s"}' %
+              (member_separator, indent, identifier, subject_role, subject,
+               object_role, obj))
+      member_separator = ","
+    f.write("\n%s}" % indent)
+
+
+def write_json(f, parameters):
+  """Write a document as PROV-JSON.
+
+  :param f: text file
+  :type f: file
+  :param parameters: parameters
+  :type parameters: :class:`Parameters`
+  """
+  f.write('{\n  "prefix": %s' % json.dumps({"ex": EX_NAMESPACE}))
+  bundles = units(parameters)
+  if bundles == [None]:
+    f.write(",")
+    write_json_statements(f, parameters, None, "  ")
+  else:
+    f.write(',\n  "bundle": {')
+    separator = ""
+    for bundle in bundles:
+      f.write('%s\n    "%s": {\n      "prefix": %s,' %
+              (separator, bundle, json.dumps({"ex": EX_NAMESPACE})))
+      write_json_statements(f, parameters, bundle, "      ")
+      f.write("\n    }")
+      separator = ","
+    f.write("\n  }")
+  f.write("\n}\n")
+
+
+WRITERS = {
+  standards.PROVN: write_provn,
+  standards.TTL: lambda f, parameters: write_rdf(f, parameters, False),
+  standards.TRIG: lambda f, parameters: write_rdf(f, parameters, True),
+  standards.PROVX: write_provx,
+  standards.JSON: write_json
+}
+"""dict: mapping from :mod:`prov_service_tests.standards` formats to
+functions which write a document in that format"""
+
+
+def write_document(f, format, parameters):
+  """Write a document.
+
+  :param f: text file
+  :type f: file
+  :param format: a :mod:`prov_service_tests.standards` format
+  :type format: str or unicode
+  :param parameters: parameters
+  :type parameters: :class:`Parameters`
+  """
+  WRITERS[format](f, parameters)
+
+
+def get_directory():
+  """Get directory in which generated documents are cached, creating
+  it if necessary.
+
+  :return: directory
+  :rtype: str or unicode
+  """
+  directory = os.environ.get(DIRECTORY_ENV, os.path.join(
+    tempfile.gettempdir(), "prov_service_tests", "generated"))
+  if not os.path.isdir(directory):
+    try:
+      os.makedirs(directory)
+    except OSError:
+      if not os.path.isdir(directory):
+        raise
+  return directory
+
+
+def generate(format, parameters):
+  """Get the file holding a generated document, generating it if it
+  is not already in the cache directory. The document is written to a
+  temporary file which is then renamed, so a partially written
+  document is never used.
+
+  :param format: a :mod:`prov_service_tests.standards` format
+  :type format: str or unicode
+  :param parameters: parameters
+  :type parameters: :class:`Parameters`
+  :return: file name
+  :rtype: str or unicode
+  """
+  directory = get_directory()
+  path = os.path.join(directory, parameters.name + "." + format)
+  if not os.path.exists(path):
+    handle, temporary = tempfile.mkstemp(dir=directory)
+    with io.open(handle, "w", encoding="utf-8") as f:
+      write_document(f, format, parameters)
+    os.rename(temporary, path)
+  return path
+
+
+def get_parameters():
+  """Get parameters of documents generated by tests from the
+  ``PROV_GENERATED`` environment variable.
+
+  :return: parameters
+  :rtype: :class:`Parameters`
+  :raises ValueError: if the parameters are invalid
+  """
+  return Parameters.parse(os.environ.get(PARAMETERS_ENV, ""))
+
+
+def sweep(sizes, parameters):
+  """Post generated documents of a range of sizes, in every format,
+  to ProvStore and ProvValidator, and get the time taken by each
+  POST request.
+
+  :param sizes: numbers of entities
+  :type sizes: list of int
+  :param parameters: parameters of documents, other than number of
+    entities, activities and agents
+  :type parameters: :class:`Parameters`
+  :return: (entities, format, document size in bytes, test name, POST
+    total time in seconds) tuples
+  :rtype: list of tuple
+  """
+  from prov_service_tests import probes
+  from prov_service_tests import timing
+  rows = []
+  samples = []
+  previous = os.environ.get(PARAMETERS_ENV)
+  timing.OBSERVERS.append(samples.append)
+  try:
+    for size in sizes:
+      size_parameters = Parameters(size, None, None, parameters.density,
+                                   parameters.bundles, parameters.seed)
+      os.environ[PARAMETERS_ENV] = "entities=%d,density=%g,bundles=%d," \
+          "seed=%d" % (size, parameters.density, parameters.bundles,
+                       parameters.seed)
+      for probe in probes.get_probes(["*_generated_document_*"]):
+        format = probe.method.rsplit("_", 1)[1]
+        path = generate(format, size_parameters)
+        del samples[:]
+        outcome = probe.run()
+        posts = [sample.total for sample in samples
+                 if sample.method == "POST"]
+        rows.append((size, format, os.path.getsize(path),
+                     probe.test_class.__name__,
+                     posts[0] if outcome.success and posts else None))
+  finally:
+    timing.OBSERVERS.remove(samples.append)
+    if previous is None:
+      os.environ.pop(PARAMETERS_ENV, None)
+    else:
+      os.environ[PARAMETERS_ENV] = previous
+  return rows
+
+
+def main(argv=None):
+  """Generate documents, or run a size sweep, from the command-line.
+
+  :param argv: command-line arguments, excluding program name
+  :type argv: list of str or unicode
+  :return: exit code
+  :rtype: int
+  """
+  parser = argparse.ArgumentParser(
+    description="Generate synthetic PROV documents.")
+  parser.add_argument("--entities", type=int, default=100,
+                      help="entities per bundle (default 100)")
+  parser.add_argument("--activities", type=int,
+                      help="activities per bundle (default entities / 2)")
+  parser.add_argument("--agents", type=int,
+                      help="agents per bundle (default entities / 10)")
+  parser.add_argument("--density", type=float, default=2.0,
+                      help="relations per entity (default 2)")
+  parser.add_argument("--bundles", type=int, default=0,
+                      help="number of bundles (default 0)")
+  parser.add_argument("--seed", type=int, default=0,
+                      help="random number generator seed (default 0)")
+  parser.add_argument("--format", action="append",
+                      choices=standards.FORMATS,
+                      help="format, may be repeated (default all formats)")
+  parser.add_argument("--sweep", metavar="SIZES",
+                      help="comma-separated numbers of entities to post "
+                      "to the services, printing latency against size")
+  args = parser.parse_args(argv)
+  parameters = Parameters(args.entities, args.activities, args.agents,
+                          args.density, args.bundles, args.seed)
+  if args.sweep:
+    print("%10s %6s %12s %24s %12s" %
+          ("Entities", "Format", "Bytes", "Service", "POST (ms)"))
+    for size, format, length, service, total in sweep(
+        [int(size) for size in args.sweep.split(",")], parameters):
+      print("%10d %6s %12d %24s %12s" %
+            (size, format, length, service,
+             "failed" if total is None else "%.1f" % (total * 1000)))
+    return 0
+  for format in args.format or standards.FORMATS:
+    print(generate(format, parameters))
+  return 0
+
+
+if __name__ == "__main__":
+  sys.exit(main())
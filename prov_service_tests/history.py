@@ -0,0 +1,386 @@
+"""History of test durations and endpoint latencies across runs.
+
+Test durations, and per-endpoint latency percentiles, are saved in a
+SQLite database after each run of the tests by
+:mod:`prov_service_tests.runner`, which uses the history to run tests
+longest first. Runs by nose, see
+:func:`prov_service_tests.teardown_package`, are only saved if
+``PROV_HISTORY_FILE`` is set, as nose does not use the history. The
+history is also used to report tests and endpoints which have become
+significantly slower.
+
+Usage::
+
+    $ python -m prov_service_tests.history --recent 3 --baseline 10 \\
+        --threshold 0.5
+"""
+# Copyright (c) 2015 University of Southampton
+#
+# Permission is hereby granted, free of charge, to any person
+# obtaining a copy of this software and associated documentation files
+# (the "Software"), to deal in the Software without restriction,
+# including without limitation the rights to use, copy, modify, merge,
+# publish, distribute, sublicense, and/or sell copies of the Software,
+# and to permit persons to whom the Software is furnished to do so,
+# subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be
+# included in all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND,
+# EXPRESS OR IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF
+# MERCHANTABILITY, FITNESS FOR A PARTICULAR PURPOSE AND
+# NONINFRINGEMENT. IN NO EVENT SHALL THE AUTHORS OR COPYRIGHT HOLDERS
+# BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER LIABILITY, WHETHER IN AN
+# ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM, OUT OF OR IN
+# CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+
+from __future__ import (absolute_import, division, print_function,
+                        unicode_literals)
+
+import argparse
+import contextlib
+import os
+import sqlite3
+import sys
+import tempfile
+import threading
+import time
+
+HISTORY_FILE_ENV = "PROV_HISTORY_FILE"
+"""str or unicode: environment variable holding name of SQLite
+database in which history is saved, history is not saved if it is set
+to an empty value, or by nose runs if it is not set
+"""
+
+MAX_RUNS_ENV = "PROV_HISTORY_RUNS"
+"""str or unicode: environment variable holding number of most recent
+runs kept in the history"""
+
+DEFAULT_MAX_RUNS = 100
+"""int: default number of most recent runs kept in the history"""
+
+SCHEMA = [
+  "CREATE TABLE IF NOT EXISTS runs ("
+  "id INTEGER PRIMARY KEY AUTOINCREMENT, name TEXT UNIQUE, started REAL)",
+  "CREATE TABLE IF NOT EXISTS durations ("
+  "run INTEGER, test TEXT, duration REAL, success INTEGER)",
+  "CREATE INDEX IF NOT EXISTS durations_test ON durations (test, run)",
+  "CREATE TABLE IF NOT EXISTS endpoints ("
+  "run INTEGER, endpoint TEXT, count INTEGER, p50 REAL, p90 REAL, "
+  "p99 REAL)",
+  "CREATE INDEX IF NOT EXISTS endpoints_endpoint ON endpoints "
+  "(endpoint, run)"
+]
+"""list of str or unicode: statements creating the database tables"""
+
+
+def median(values):
+  """Get the median of values.
+
+  :param values: values
+  :type values: list of float
+  :return: median or None if there are no values
+  :rtype: float
+  """
+  values = sorted(values)
+  if not values:
+    return None
+  middle = len(values) // 2
+  if len(values) % 2:
+    return values[middle]
+  return (values[middle - 1] + values[middle]) / 2
+
+
+class History(object):
+  """SQLite database of test durations and endpoint latencies by run.
+  Each operation uses its own connection, so a history can be used by
+  several threads and processes. Only the most recent runs are kept.
+  """
+
+  def __init__(self, file_name, max_runs=None):
+    """Create history.
+
+    :param file_name: database file name, created if it does not
+      exist
+    :type file_name: str or unicode
+    :param max_runs: number of most recent runs kept, default
+      ``PROV_HISTORY_RUNS`` or :data:`DEFAULT_MAX_RUNS`
+    :type max_runs: int
+    """
+    self.file_name = file_name
+    self.max_runs = max_runs or int(
+      os.environ.get(MAX_RUNS_ENV) or DEFAULT_MAX_RUNS)
+    """int: number of most recent runs kept"""
+
+  @contextlib.contextmanager
+  def connect(self):
+    """Connect to the database, creating tables if necessary, and
+    commit changes when done.
+
+    :return: connection
+    :rtype: :class:`sqlite3.Connection`
+    """
+    directory = os.path.dirname(self.file_name)
+    if directory and not os.path.isdir(directory):
+      try:
+        os.makedirs(directory)
+      except OSError:
+        if not os.path.isdir(directory):
+          raise
+    connection = sqlite3.connect(self.file_name, timeout=30)
+    try:
+      for statement in SCHEMA:
+        connection.execute(statement)
+      yield connection
+      connection.commit()
+    finally:
+      connection.close()
+
+  def record(self, run_name, durations, endpoints=None):
+    """Add test durations and endpoint latencies to a run, creating
+    the run if necessary, and remove runs older than the most recent
+    :attr:`max_runs`.
+
+    :param run_name: run identifier
+    :type run_name: str or unicode
+    :param durations: mapping from test names to durations in seconds,
+      or to (duration, success) tuples
+    :type durations: dict
+    :param endpoints: endpoint latencies, see
+      :meth:`prov_service_tests.timing.Timings.report`
+    :type endpoints: dict
+    :return: run ID
+    :rtype: int
+    """
+    with self.connect() as connection:
+      connection.execute(
+        "INSERT OR IGNORE INTO runs (name, started) VALUES (?, ?)",
+        (run_name, time.time()))
+      run = connection.execute("SELECT id FROM runs WHERE name = ?",
+                               (run_name,)).fetchone()[0]
+      rows = []
+      for test, duration in durations.items():
+        success = None
+        if isinstance(duration, (tuple, list)):
+          duration, success = duration
+        rows.append((run, test, duration,
+                     None if success is None else int(success)))
+      connection.executemany("INSERT INTO durations VALUES (?, ?, ?, ?)",
+                             rows)
+      connection.executemany(
+        "INSERT INTO endpoints VALUES (?, ?, ?, ?, ?, ?)",
+        [(run, endpoint, latency["count"], latency["total"]["p50"],
+          latency["total"]["p90"], latency["total"]["p99"])
+         for endpoint, latency in (endpoints or {}).items()])
+      earliest = connection.execute(
+        "SELECT MIN(id) FROM (SELECT id FROM runs ORDER BY id DESC LIMIT ?)",
+        (self.max_runs,)).fetchone()[0]
+      connection.execute("DELETE FROM runs WHERE id < ?", (earliest,))
+      connection.execute("DELETE FROM durations WHERE run < ?", (earliest,))
+      connection.execute("DELETE FROM endpoints WHERE run < ?", (earliest,))
+      return run
+
+  def _recent(self, connection, query, runs):
+    """Get values from the most recent runs, most recent first.
+
+    :param connection: connection
+    :type connection: :class:`sqlite3.Connection`
+    :param query: query selecting key, run and value columns, with a
+      parameter for the earliest run
+    :type query: str or unicode
+    :param runs: number of runs
+    :type runs: int
+    :return: mapping from keys to lists of (run, value) tuples
+    :rtype: dict
+    """
+    earliest = connection.execute(
+      "SELECT MIN(id) FROM (SELECT id FROM runs ORDER BY id DESC LIMIT ?)",
+      (runs,)).fetchone()[0]
+    values = {}
+    for key, run, value in connection.execute(query, (earliest or 0,)):
+      if value is not None:
+        values.setdefault(key, []).append((run, value))
+    return values
+
+  def get_durations(self, runs=5):
+    """Get median duration of each test over recent runs. Durations of
+    failed tests, which may have stopped early or waited for a
+    timeout, are ignored.
+
+    :param runs: number of recent runs
+    :type runs: int
+    :return: mapping from test names to durations in seconds
+    :rtype: dict
+    """
+    with self.connect() as connection:
+      values = self._recent(
+        connection,
+        "SELECT test, run, duration FROM durations "
+        "WHERE run >= ? AND success IS NOT 0", runs)
+    return dict([(test, median([value for _, value in runs_values]))
+                 for test, runs_values in values.items()])
+
+  def get_trends(self, recent=3, baseline=10, threshold=0.5, minimum=0.05,
+                 endpoints=False):
+    """Get tests, or endpoints, whose median duration, or median p50
+    latency, over recent runs has grown by more than a threshold
+    compared to the preceding runs. Durations of failed tests are
+    ignored.
+
+    :param recent: number of recent runs
+    :type recent: int
+    :param baseline: number of runs before the recent runs compared
+      against
+    :type baseline: int
+    :param threshold: fractional growth which is flagged
+    :type threshold: float
+    :param minimum: growth, in seconds, below which growth is not
+      flagged
+    :type minimum: float
+    :param endpoints: if True, report endpoints rather than tests
+    :type endpoints: bool
+    :return: (name, baseline median, recent median, fractional
+      change, flagged) tuples, in seconds, ordered by change
+    :rtype: list of tuple
+    """
+    if endpoints:
+      query = "SELECT endpoint, run, p50 / 1000 FROM endpoints WHERE run >= ?"
+    else:
+      query = ("SELECT test, run, duration FROM durations "
+               "WHERE run >= ? AND success IS NOT 0")
+    with self.connect() as connection:
+      values = self._recent(connection, query, recent + baseline)
+      run_ids = [row[0] for row in connection.execute(
+        "SELECT id FROM runs ORDER BY id DESC LIMIT ?", (recent,))]
+    if not run_ids:
+      return []
+    first_recent = min(run_ids)
+    trends = []
+    for name, runs_values in values.items():
+      before = median([value for run, value in runs_values
+                       if run < first_recent])
+      after = median([value for run, value in runs_values
+                      if run >= first_recent])
+      if before is None or after is None or before <= 0:
+        continue
+      change = (after - before) / before
+      flagged = change > threshold and after - before > minimum
+      trends.append((name, before, after, change, flagged))
+    return sorted(trends, key=lambda trend: -trend[3])
+
+
+def get_history(default=True):
+  """Get history saved in the file named by ``PROV_HISTORY_FILE``,
+  default ``history.sqlite`` in a ``prov_service_tests`` directory in
+  the temporary directory.
+
+  :param default: if False, there is no history unless
+    ``PROV_HISTORY_FILE`` is set
+  :type default: bool
+  :return: history or None if ``PROV_HISTORY_FILE`` is empty, or
+    is not set and ``default`` is False
+  :rtype: :class:`History`
+  """
+  file_name = os.environ.get(HISTORY_FILE_ENV)
+  if file_name is None and default:
+    file_name = os.path.join(tempfile.gettempdir(), "prov_service_tests",
+                             "history.sqlite")
+  return History(file_name) if file_name else None
+
+
+class Durations(object):
+  """Thread-safe record of the most recent duration of each test run
+  in this process.
+  """
+
+  def __init__(self):
+    self._lock = threading.Lock()
+    self._durations = {}
+
+  def add(self, test, duration):
+    """Record a test duration.
+
+    :param test: test name
+    :type test: str or unicode
+    :param duration: duration in seconds
+    :type duration: float
+    """
+    with self._lock:
+      self._durations[test] = duration
+
+  def snapshot(self):
+    """Get durations.
+
+    :return: mapping from test names to durations in seconds
+    :rtype: dict
+    """
+    with self._lock:
+      return dict(self._durations)
+
+  def __len__(self):
+    with self._lock:
+      return len(self._durations)
+
+
+DURATIONS = Durations()
+""":class:`Durations`: durations of tests run in this process"""
+
+
+def to_table(trends):
+  """Get trends as a text table.
+
+  :param trends: trends, see :meth:`History.get_trends`
+  :type trends: list of tuple
+  :return: table
+  :rtype: str or unicode
+  """
+  width = max([len("Name")] + [len(trend[0]) for trend in trends])
+  row = "%-" + str(width) + "s %12s %12s %8s %s"
+  lines = [row % ("Name", "Before (ms)", "Recent (ms)", "Change", "")]
+  for name, before, after, change, flagged in trends:
+    lines.append(row % (name, "%.1f" % (before * 1000),
+                        "%.1f" % (after * 1000), "%+.1f%%" % (change * 100),
+                        "SLOWER" if flagged else ""))
+  return "\n".join(lines)
+
+
+def main(argv=None):
+  """Report trends from the command-line.
+
+  :param argv: command-line arguments, excluding program name
+  :type argv: list of str or unicode
+  :return: exit code, 0 if nothing has become slower, 1 otherwise
+  :rtype: int
+  """
+  parser = argparse.ArgumentParser(
+    description="Report tests and endpoints which have become slower.")
+  parser.add_argument("--recent", type=int, default=3,
+                      help="number of recent runs (default 3)")
+  parser.add_argument("--baseline", type=int, default=10,
+                      help="number of earlier runs compared against "
+                      "(default 10)")
+  parser.add_argument("--threshold", type=float, default=0.5,
+                      help="fractional growth flagged (default 0.5)")
+  parser.add_argument("--minimum", type=float, default=0.05,
+                      help="growth, in seconds, below which growth is not "
+                      "flagged (default 0.05)")
+  parser.add_argument("--endpoints", action="store_true",
+                      help="report endpoint p50 latencies, not tests")
+  parser.add_argument("--all", action="store_true",
+                      help="report everything, not just what has become "
+                      "slower")
+  args = parser.parse_args(argv)
+  history = get_history()
+  if history is None:
+    parser.error(HISTORY_FILE_ENV + " is empty")
+  trends = history.get_trends(args.recent, args.baseline, args.threshold,
+                              args.minimum, args.endpoints)
+  flagged = [trend for trend in trends if trend[4]]
+  print(to_table(trends if args.all else flagged))
+  return 1 if flagged else 0
+
+
+if __name__ == "__main__":
+  sys.exit(main())
@@ -31,3 +31,5 @@ ACCEPT = "Accept"
 """str or unicode: HTML header field - Accept"""
 AUTHORIZATION = "Authorization"
 """str or unicode: HTML header field - Authorization"""
+CONTENT_ENCODING = "Content-Encoding"
+"""str or unicode: HTTP header field - Content-Encoding"""
@@ -0,0 +1,320 @@
+"""Drive service test probes at a target request rate.
+
+Probes, see :mod:`prov_service_tests.probes`, are started open-loop at
+a fixed rate, regardless of how quickly earlier probes complete, and
+run by a pool of worker threads sharing the pooled session. The
+latency of a probe is measured from the time it was scheduled to
+start, so time spent waiting for a free worker is included. At the
+end of a run, throughput, error rate and probe latency percentiles
+are reported, along with the per-endpoint request latencies recorded
+by :mod:`prov_service_tests.timing`.
+
+Usage::
+
+    $ python -m prov_service_tests.load --rate 10 --workers 8 \\
+        --duration 60 translate-matrix fetch-formats
+
+Run ``python -m prov_service_tests.load --help`` for all options,
+including ``--local`` to run against
+:mod:`prov_service_tests.server` instead of the services named by
+``PROVSTORE_URL`` and ``PROVVALIDATOR_URL``.
+"""
+# Copyright (c) 2015 University of Southampton
+#
+# Permission is hereby granted, free of charge, to any person
+# obtaining a copy of this software and associated documentation files
+# (the "Software"), to deal in the Software without restriction,
+# including without limitation the rights to use, copy, modify, merge,
+# publish, distribute, sublicense, and/or sell copies of the Software,
+# and to permit persons to whom the Software is furnished to do so,
+# subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be
+# included in all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND,
+# EXPRESS OR IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF
+# MERCHANTABILITY, FITNESS FOR A PARTICULAR PURPOSE AND
+# NONINFRINGEMENT. IN NO EVENT SHALL THE AUTHORS OR COPYRIGHT HOLDERS
+# BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER LIABILITY, WHETHER IN AN
+# ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM, OUT OF OR IN
+# CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+
+from __future__ import (absolute_import, division, print_function,
+                        unicode_literals)
+
+import argparse
+import itertools
+import json
+import os
+import sys
+import threading
+import time
+try:
+  import queue
+except ImportError:
+  import Queue as queue
+
+from prov_service_tests import cache
+from prov_service_tests import probes
+from prov_service_tests import server
+from prov_service_tests import session
+from prov_service_tests import sizes
+from prov_service_tests import timing
+from prov_service_tests.test_provstore import ProvStoreTestCase
+from prov_service_tests.test_provstore import SHARED
+from prov_service_tests.test_provvalidator import ProvValidatorTestCase
+
+
+class LoadReport(object):
+  """Thread-safe collection of probe outcomes from a load run.
+  """
+
+  def __init__(self):
+    self._lock = threading.Lock()
+    self.latencies = []
+    """list of float: latency of each probe, in seconds, from when it
+    was scheduled to when it completed"""
+    self.errors = {}
+    """dict: mapping from error messages to number of occurrences"""
+    self.skipped = 0
+    """int: number of probes skipped, which are not counted as probes
+    run or as errors"""
+    self.started = None
+    """float: time at which the run started, from
+    :func:`prov_service_tests.timing.clock`"""
+    self.finished = None
+    """float: time at which the last probe completed"""
+
+  def add(self, outcome, latency):
+    """Add a probe outcome.
+
+    :param outcome: outcome
+    :type outcome: :class:`prov_service_tests.probes.Outcome`
+    :param latency: latency in seconds
+    :type latency: float
+    """
+    with self._lock:
+      if outcome.skipped:
+        self.skipped += 1
+        return
+      self.latencies.append(latency)
+      if not outcome.success:
+        message = outcome.name + ": " + outcome.error
+        self.errors[message] = self.errors.get(message, 0) + 1
+
+  @property
+  def count(self):
+    """int: number of probes run, excluding those skipped"""
+    return len(self.latencies)
+
+  @property
+  def error_count(self):
+    """int: number of probes which failed"""
+    return sum(self.errors.values())
+
+  def report(self):
+    """Get throughput, error rate and latency percentiles.
+
+    :return: report with ``probes``, ``errors``, ``error_rate``,
+      ``skipped``, ``elapsed`` (seconds), ``throughput`` (probes per
+      second) and ``latency`` (mapping from ``p50``, ``p90``, ``p99``
+      and ``max`` to milliseconds) keys
+    :rtype: dict
+    """
+    with self._lock:
+      elapsed = (self.finished or timing.clock()) - self.started
+      return {
+        "probes": self.count,
+        "errors": self.error_count,
+        "error_rate": self.error_count / self.count if self.count else 0,
+        "skipped": self.skipped,
+        "elapsed": elapsed,
+        "throughput": self.count / elapsed if elapsed > 0 else 0,
+        "latency": timing.summarise([latency * 1000
+                                     for latency in self.latencies])
+      }
+
+  def to_text(self):
+    """Get report as text.
+
+    :return: text
+    :rtype: str or unicode
+    """
+    report = self.report()
+    lines = ["Probes:     %d in %.1f s" % (report["probes"],
+                                           report["elapsed"]),
+             "Throughput: %.2f probes/s" % report["throughput"],
+             "Errors:     %d (%.1f%%)" % (report["errors"],
+                                          report["error_rate"] * 100)]
+    if report["skipped"]:
+      lines.append("Skipped:    %d" % report["skipped"])
+    if report["probes"]:
+      lines.append("Latency:    " + ", ".join(
+        ["%s %.1f ms" % (key, report["latency"][key])
+         for key in ["p50", "p90", "p99", "max"]]))
+    for message, count in sorted(self.errors.items()):
+      lines.append("  %5d x %s" % (count, message))
+    return "\n".join(lines)
+
+
+def worker(tasks, report):
+  """Run probes from a queue until a None task is received.
+
+  :param tasks: queue of (scheduled start time, probe) tuples
+  :type tasks: :class:`queue.Queue`
+  :param report: report to which outcomes are added
+  :type report: :class:`LoadReport`
+  """
+  while True:
+    task = tasks.get()
+    if task is None:
+      return
+    scheduled, probe = task
+    outcome = probe.run()
+    report.add(outcome, timing.clock() - scheduled)
+
+
+def run(selected, rate, workers, duration):
+  """Run probes at a fixed rate. Probes are started in turn, cycling
+  through the selected probes, every ``1 / rate`` seconds until the
+  duration has elapsed. The run then waits for started probes to
+  complete.
+
+  :param selected: probes
+  :type selected: list of :class:`prov_service_tests.probes.Probe`
+  :param rate: probes started per second
+  :type rate: float
+  :param workers: number of worker threads
+  :type workers: int
+  :param duration: duration in seconds
+  :type duration: float
+  :return: report
+  :rtype: :class:`LoadReport`
+  """
+  report = LoadReport()
+  tasks = queue.Queue()
+  threads = [threading.Thread(target=worker, args=(tasks, report))
+             for _ in range(workers)]
+  for thread in threads:
+    thread.daemon = True
+    thread.start()
+  report.started = timing.clock()
+  interval = 1.0 / rate
+  for index, probe in enumerate(itertools.cycle(selected)):
+    scheduled = report.started + index * interval
+    if scheduled - report.started >= duration:
+      break
+    delay = scheduled - timing.clock()
+    if delay > 0:
+      time.sleep(delay)
+    tasks.put((scheduled, probe))
+  for _ in threads:
+    tasks.put(None)
+  for thread in threads:
+    thread.join()
+  report.finished = timing.clock()
+  return report
+
+
+def configure(args):
+  """Set service URL and API key environment variables from
+  command-line arguments, starting a local stand-in server if
+  requested.
+
+  :param args: parsed command-line arguments
+  :type args: :class:`argparse.Namespace`
+  :return: local server or None
+  :rtype: :class:`prov_service_tests.server.ServiceServer`
+  """
+  local_server = None
+  if args.local:
+    local_server = server.ServiceServer(latency=args.local_latency,
+                                        error_rate=args.local_error_rate)
+    local_server.start()
+    os.environ[ProvStoreTestCase.URL_ENV] = local_server.provstore_url
+    os.environ[ProvValidatorTestCase.URL_ENV] = \
+        local_server.provvalidator_url
+    os.environ.setdefault(ProvStoreTestCase.API_KEY_ENV, server.API_KEY)
+  if args.provstore_url:
+    os.environ[ProvStoreTestCase.URL_ENV] = args.provstore_url
+  if args.provvalidator_url:
+    os.environ[ProvValidatorTestCase.URL_ENV] = args.provvalidator_url
+  os.environ.setdefault(session.POOL_SIZE_ENV, str(args.workers))
+  return local_server
+
+
+def add_service_arguments(parser):
+  """Add arguments to select the services to run against.
+
+  :param parser: parser
+  :type parser: :class:`argparse.ArgumentParser`
+  """
+  parser.add_argument("--local", action="store_true",
+                      help="run against a local stand-in server")
+  parser.add_argument("--local-latency", type=float, default=0,
+                      help="delay, in seconds, before each response from "
+                      "the local server")
+  parser.add_argument("--local-error-rate", type=float, default=0,
+                      help="fraction of requests answered with 503 by the "
+                      "local server")
+  parser.add_argument("--provstore-url",
+                      help="ProvStore URL, overrides PROVSTORE_URL")
+  parser.add_argument("--provvalidator-url",
+                      help="ProvValidator URL, overrides PROVVALIDATOR_URL")
+
+
+def main(argv=None):
+  """Run load test from the command-line.
+
+  :param argv: command-line arguments, excluding program name
+  :type argv: list of str or unicode
+  :return: exit code, 0 if no probes failed, 1 otherwise
+  :rtype: int
+  """
+  parser = argparse.ArgumentParser(
+    description="Drive service test probes at a target rate.")
+  parser.add_argument("patterns", nargs="*", metavar="probe",
+                      help="flow name (%s) or probe name pattern, "
+                      "default all probes" % ", ".join(sorted(probes.FLOWS)))
+  parser.add_argument("--rate", type=float, default=1.0,
+                      help="probes started per second (default 1)")
+  parser.add_argument("--workers", type=int, default=4,
+                      help="number of worker threads (default 4)")
+  parser.add_argument("--duration", type=float, default=60,
+                      help="duration in seconds (default 60)")
+  parser.add_argument("--json", metavar="FILE",
+                      help="save report as JSON")
+  add_service_arguments(parser)
+  args = parser.parse_args(argv)
+  local_server = configure(args)
+  try:
+    selected = probes.get_probes(args.patterns)
+    timing.TIMINGS.reset()
+    sizes.SIZES.reset()
+    cache.STATISTICS.reset()
+    report = run(selected, args.rate, args.workers, args.duration)
+  finally:
+    SHARED.delete_all()
+    if local_server is not None:
+      local_server.stop()
+  print(report.to_text())
+  print(session.STATISTICS)
+  print(timing.TIMINGS.to_table())
+  if len(sizes.SIZES):
+    print(sizes.SIZES.to_table())
+  if len(cache.STATISTICS):
+    print(cache.STATISTICS.to_table())
+  if args.json:
+    with open(args.json, "w") as f:
+      json.dump({"probes": report.report(),
+                 "endpoints": timing.TIMINGS.report(),
+                 "formats": sizes.SIZES.report(),
+                 "cache": cache.STATISTICS.report()},
+                f, indent=2, sort_keys=True)
+  return 1 if report.error_count else 0
+
+
+if __name__ == "__main__":
+  sys.exit(main())
@@ -0,0 +1,95 @@
+"""Run the ProvValidator translation and validation matrices
+concurrently in one process.
+
+The format-by-format translation tests, and the per-format normal
+form and validation matrix tests, are independent of each other so
+they can be run at the same time. They are run by a bounded pool of
+threads sharing the pooled session, see
+:func:`prov_service_tests.probes.run_concurrently`, which avoids the
+cost of starting a process per worker as ``nosetests --processes``
+does.
+
+Usage::
+
+    $ python -m prov_service_tests.matrix --concurrency 16
+"""
+# Copyright (c) 2015 University of Southampton
+#
+# Permission is hereby granted, free of charge, to any person
+# obtaining a copy of this software and associated documentation files
+# (the "Software"), to deal in the Software without restriction,
+# including without limitation the rights to use, copy, modify, merge,
+# publish, distribute, sublicense, and/or sell copies of the Software,
+# and to permit persons to whom the Software is furnished to do so,
+# subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be
+# included in all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND,
+# EXPRESS OR IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF
+# MERCHANTABILITY, FITNESS FOR A PARTICULAR PURPOSE AND
+# NONINFRINGEMENT. IN NO EVENT SHALL THE AUTHORS OR COPYRIGHT HOLDERS
+# BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER LIABILITY, WHETHER IN AN
+# ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM, OUT OF OR IN
+# CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+
+from __future__ import (absolute_import, division, print_function,
+                        unicode_literals)
+
+import argparse
+import sys
+
+from prov_service_tests import load
+from prov_service_tests import probes
+from prov_service_tests import session
+from prov_service_tests import timing
+
+PATTERNS = ["ProvValidatorTestCase.test_post_translate_*",
+            "ProvValidatorTestCase.test_get_validation_normal_form_format_*",
+            "ProvValidatorTestCase.test_get_validation_matrix_format_*"]
+"""list of str or unicode: patterns of probes in the matrix"""
+
+
+def main(argv=None):
+  """Run the matrix from the command-line.
+
+  :param argv: command-line arguments, excluding program name
+  :type argv: list of str or unicode
+  :return: exit code, 0 if all probes passed, 1 otherwise
+  :rtype: int
+  """
+  parser = argparse.ArgumentParser(
+    description="Run the translation and validation matrices concurrently.")
+  parser.add_argument("patterns", nargs="*", metavar="probe",
+                      help="probe name pattern, default the translation, "
+                      "normal form and validation matrices")
+  parser.add_argument("--concurrency", type=int, default=8,
+                      help="maximum number of probes run at once (default 8)")
+  load.add_service_arguments(parser)
+  args = parser.parse_args(argv)
+  args.workers = args.concurrency
+  local_server = load.configure(args)
+  try:
+    selected = probes.get_probes(args.patterns or PATTERNS)
+    start = timing.clock()
+    outcomes = probes.run_concurrently(selected, args.concurrency)
+    elapsed = timing.clock() - start
+  finally:
+    if local_server is not None:
+      local_server.stop()
+  for outcome in outcomes:
+    print("%s ... %s" % (outcome.name,
+                         "ok" if outcome.success else outcome.error))
+  failures = len([outcome for outcome in outcomes
+                  if not outcome.success and not outcome.skipped])
+  skipped = len([outcome for outcome in outcomes if outcome.skipped])
+  print("Ran %d probes in %.2f s, %d failed, %d skipped" %
+        (len(outcomes), elapsed, failures, skipped))
+  print(session.STATISTICS)
+  return 1 if failures else 0
+
+
+if __name__ == "__main__":
+  sys.exit(main())
@@ -0,0 +1,189 @@
+"""Run service tests as probes outside of a test runner.
+
+A probe is a single test method of :class:`ProvStoreTestCase` or
+:class:`ProvValidatorTestCase`, identified by class and method name,
+e.g. ``ProvStoreTestCase.test_get_document_format_1_ttl``. Running the
+test methods themselves means that load, benchmark and monitoring
+modes send exactly the same requests as the tests.
+"""
+# Copyright (c) 2015 University of Southampton
+#
+# Permission is hereby granted, free of charge, to any person
+# obtaining a copy of this software and associated documentation files
+# (the "Software"), to deal in the Software without restriction,
+# including without limitation the rights to use, copy, modify, merge,
+# publish, distribute, sublicense, and/or sell copies of the Software,
+# and to permit persons to whom the Software is furnished to do so,
+# subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be
+# included in all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND,
+# EXPRESS OR IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF
+# MERCHANTABILITY, FITNESS FOR A PARTICULAR PURPOSE AND
+# NONINFRINGEMENT. IN NO EVENT SHALL THE AUTHORS OR COPYRIGHT HOLDERS
+# BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER LIABILITY, WHETHER IN AN
+# ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM, OUT OF OR IN
+# CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+
+from __future__ import (absolute_import, division, print_function,
+                        unicode_literals)
+
+import fnmatch
+import threading
+import unittest
+try:
+  import queue
+except ImportError:
+  import Queue as queue
+
+from prov_service_tests import timing
+from prov_service_tests.test_provstore import ProvStoreTestCase
+from prov_service_tests.test_provvalidator import ProvValidatorTestCase
+
+CLASSES = [ProvStoreTestCase, ProvValidatorTestCase]
+"""list of class: test classes whose test methods are probes"""
+
+FLOWS = {
+  "post-document": ["ProvStoreTestCase.test_post_document_*"],
+  "fetch-formats": ["ProvStoreTestCase.test_get_document_format_*",
+                    "ProvStoreTestCase.test_get_document_bundles_*"],
+  "translate-matrix": ["ProvValidatorTestCase.test_post_translate_*"],
+  "validation-report": ["ProvValidatorTestCase.test_get_metrics",
+                        "ProvValidatorTestCase.test_get_validation_*"]
+}
+"""dict: mapping from flow names to probe name patterns"""
+
+
+class Probe(object):
+  """A test method run as a probe.
+  """
+
+  def __init__(self, test_class, method, memoize=False):
+    self.test_class = test_class
+    """class: test class"""
+    self.method = method
+    """str or unicode: test method name"""
+    self.name = test_class.__name__ + "." + method
+    """str or unicode: probe name"""
+    self.memoize = memoize
+    """bool: if True, the test may reuse results memoized by earlier
+    tests, see
+    :attr:`prov_service_tests.test_service.ServiceTestCase.memoize`.
+    False by default, so that each run of a probe measures its whole
+    flow e.g. each run of a validation probe validates a document."""
+
+  def run(self):
+    """Run the test method, including ``setUp`` and ``tearDown``.
+
+    :return: outcome
+    :rtype: :class:`Outcome`
+    """
+    result = unittest.TestResult()
+    start = timing.clock()
+    test = self.test_class(self.method)
+    test.memoize = self.memoize
+    test.run(result)
+    duration = timing.clock() - start
+    error = None
+    for _, trace in result.errors + result.failures:
+      error = trace.strip().split("\n")[-1]
+    for _, reason in result.skipped:
+      error = "Skipped: " + reason
+    return Outcome(self.name, error, duration, bool(result.skipped))
+
+  def __repr__(self):
+    return self.name
+
+
+class Outcome(object):
+  """Outcome of running a probe.
+  """
+
+  def __init__(self, name, error, duration, skipped=False):
+    self.name = name
+    """str or unicode: probe name"""
+    self.error = error
+    """str or unicode: last line of error or failure, or None if the
+    probe succeeded"""
+    self.duration = duration
+    """float: duration in seconds"""
+    self.skipped = skipped
+    """bool: True if the probe was skipped, in which case it did not
+    succeed but did not fail either"""
+
+  @property
+  def success(self):
+    """bool: True if the probe succeeded"""
+    return self.error is None
+
+
+def get_probes(patterns=None, memoize=False):
+  """Get probes whose names match any of a list of patterns. Patterns
+  may be flow names from :data:`FLOWS` or shell-style wildcards
+  matched against probe names. Test methods which have been expanded
+  into parameterized test methods, and so are not themselves tests,
+  are excluded.
+
+  :param patterns: patterns or None for all probes
+  :type patterns: list of str or unicode
+  :param memoize: if True, probes may reuse results memoized by
+    earlier probes, see :attr:`Probe.memoize`
+  :type memoize: bool
+  :return: probes, in order of class then method name
+  :rtype: list of :class:`Probe`
+  :raises ValueError: if no probe matches a pattern
+  """
+  probes = []
+  loader = unittest.TestLoader()
+  for test_class in CLASSES:
+    for method in loader.getTestCaseNames(test_class):
+      if getattr(getattr(test_class, method), "__test__", True):
+        probes.append(Probe(test_class, method, memoize))
+  if not patterns:
+    return probes
+  selected = []
+  for pattern in patterns:
+    matched = [probe for probe in probes
+               if any([fnmatch.fnmatchcase(probe.name, flow_pattern)
+                       for flow_pattern in FLOWS.get(pattern, [pattern])])]
+    if not matched:
+      raise ValueError("No probes match " + pattern)
+    selected.extend([probe for probe in matched if probe not in selected])
+  return selected
+
+
+def run_concurrently(selected, concurrency):
+  """Run probes concurrently in this process, using a bounded number
+  of threads which share the pooled session.
+
+  :param selected: probes
+  :type selected: list of :class:`Probe`
+  :param concurrency: maximum number of probes run at once
+  :type concurrency: int
+  :return: outcomes, in the same order as the probes
+  :rtype: list of :class:`Outcome`
+  """
+  outcomes = [None] * len(selected)
+  tasks = queue.Queue()
+  for index, probe in enumerate(selected):
+    tasks.put((index, probe))
+
+  def run_tasks():
+    while True:
+      try:
+        index, probe = tasks.get_nowait()
+      except queue.Empty:
+        return
+      outcomes[index] = probe.run()
+
+  threads = [threading.Thread(target=run_tasks)
+             for _ in range(max(1, min(concurrency, len(selected))))]
+  for thread in threads:
+    thread.daemon = True
+    thread.start()
+  for thread in threads:
+    thread.join()
+  return outcomes
@@ -0,0 +1,485 @@
+"""Sweep ProvValidator's random graph endpoint over sizes.
+
+ProvValidator's GET /provapi/documents/random/{nodes}/{degree}/{seed}
+generates a random document with a number of nodes, each with a
+number of edges. A sweep requests each (nodes, degree) pair of a
+grid, with a fixed seed, a number of times, and reports the median
+generation latency and response size of each, giving a curve of how
+generation time scales with graph size.
+
+Each document is stored in a local, content-addressed cache. Its
+content is held once, in a file named by its SHA-1 digest, and a key
+file, named by nodes, degree, seed and format, holds the digest. The
+cached documents are deterministic, size-graded inputs which can be
+reused, without being generated again, by:
+
+- ``--post``, which posts each to ProvStore, and translates each
+  using ProvValidator, and reports the latency of each, against size.
+- ``random`` document sources in scenarios, see
+  :mod:`prov_service_tests.scenario`.
+
+Documents are cached in ``prov_service_tests/random`` in the system
+temporary directory, or the directory named by
+``PROV_RANDOM_DIRECTORY``.
+
+Usage::
+
+    $ python -m prov_service_tests.randomgraph --nodes 10,100,1000 \\
+        --degree 1,2,4 --seed 1 --post
+"""
+# Copyright (c) 2015 University of Southampton
+#
+# Permission is hereby granted, free of charge, to any person
+# obtaining a copy of this software and associated documentation files
+# (the "Software"), to deal in the Software without restriction,
+# including without limitation the rights to use, copy, modify, merge,
+# publish, distribute, sublicense, and/or sell copies of the Software,
+# and to permit persons to whom the Software is furnished to do so,
+# subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be
+# included in all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND,
+# EXPRESS OR IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF
+# MERCHANTABILITY, FITNESS FOR A PARTICULAR PURPOSE AND
+# NONINFRINGEMENT. IN NO EVENT SHALL THE AUTHORS OR COPYRIGHT HOLDERS
+# BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER LIABILITY, WHETHER IN AN
+# ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM, OUT OF OR IN
+# CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+
+from __future__ import (absolute_import, division, print_function,
+                        unicode_literals)
+
+import argparse
+import hashlib
+import json
+import os
+import random
+import sys
+import tempfile
+import requests
+
+from prov_service_tests import http
+from prov_service_tests import load
+from prov_service_tests import session
+from prov_service_tests import standards
+from prov_service_tests import timing
+from prov_service_tests.test_provvalidator import ProvValidatorTestCase
+
+DIRECTORY_ENV = "PROV_RANDOM_DIRECTORY"
+"""str or unicode: environment variable holding directory in which
+random graphs are cached
+"""
+
+DEFAULT_NODES = [10, 100, 1000]
+"""list of int: default numbers of nodes swept"""
+
+DEFAULT_DEGREES = [1, 2, 4]
+"""list of int: default numbers of edges per node swept"""
+
+DEFAULT_SEED = 1
+"""int: default random number generator seed"""
+
+DEFAULT_REPEAT = 3
+"""int: default number of requests for each graph size"""
+
+
+def get_directory():
+  """Get directory in which random graphs are cached.
+
+  :return: directory
+  :rtype: str or unicode
+  """
+  return os.environ.get(DIRECTORY_ENV, os.path.join(
+    tempfile.gettempdir(), "prov_service_tests", "random"))
+
+
+def write_file(path, content):
+  """Write a file, via a temporary file which is then renamed, so a
+  partially written file is never used.
+
+  :param path: file name
+  :type path: str or unicode
+  :param content: content
+  :type content: bytes
+  """
+  directory = os.path.dirname(path)
+  if not os.path.isdir(directory):
+    try:
+      os.makedirs(directory)
+    except OSError:
+      if not os.path.isdir(directory):
+        raise
+  handle, temporary = tempfile.mkstemp(dir=directory)
+  with os.fdopen(handle, "wb") as f:
+    f.write(content)
+  os.rename(temporary, path)
+
+
+class RandomGraphCache(object):
+  """Content-addressed cache of random graphs, keyed by nodes, degree,
+  seed and format. The cache is safe to share between processes.
+  """
+
+  def __init__(self, directory=None):
+    """Create cache.
+
+    :param directory: directory, default from :func:`get_directory`
+    :type directory: str or unicode
+    """
+    self.directory = directory or get_directory()
+    """str or unicode: directory"""
+
+  def get_key_path(self, nodes, degree, seed, format):
+    """Get name of the file holding the digest of a graph.
+
+    :param nodes: number of nodes
+    :type nodes: int
+    :param degree: number of edges per node
+    :type degree: int
+    :param seed: random number generator seed
+    :type seed: int
+    :param format: a :mod:`prov_service_tests.standards` format
+    :type format: str or unicode
+    :return: file name
+    :rtype: str or unicode
+    """
+    return os.path.join(self.directory, "keys",
+                        "%d-%d-%d.%s" % (nodes, degree, seed, format))
+
+  def get_object_path(self, digest):
+    """Get name of the file holding content with a digest.
+
+    :param digest: SHA-1 hex digest
+    :type digest: str or unicode
+    :return: file name
+    :rtype: str or unicode
+    """
+    return os.path.join(self.directory, "objects", digest[:2], digest)
+
+  def get(self, nodes, degree, seed, format):
+    """Get the file holding a cached graph.
+
+    :param nodes: number of nodes
+    :type nodes: int
+    :param degree: number of edges per node
+    :type degree: int
+    :param seed: random number generator seed
+    :type seed: int
+    :param format: a :mod:`prov_service_tests.standards` format
+    :type format: str or unicode
+    :return: file name or None if the graph is not cached
+    :rtype: str or unicode
+    """
+    try:
+      with open(self.get_key_path(nodes, degree, seed, format)) as f:
+        path = self.get_object_path(f.read().strip())
+    except (IOError, OSError):
+      return None
+    return path if os.path.exists(path) else None
+
+  def put(self, nodes, degree, seed, format, content):
+    """Cache a graph.
+
+    :param nodes: number of nodes
+    :type nodes: int
+    :param degree: number of edges per node
+    :type degree: int
+    :param seed: random number generator seed
+    :type seed: int
+    :param format: a :mod:`prov_service_tests.standards` format
+    :type format: str or unicode
+    :param content: graph
+    :type content: bytes
+    :return: file name
+    :rtype: str or unicode
+    """
+    digest = hashlib.sha1(content).hexdigest()
+    path = self.get_object_path(digest)
+    if not os.path.exists(path):
+      write_file(path, content)
+    write_file(self.get_key_path(nodes, degree, seed, format),
+               digest.encode("ascii"))
+    return path
+
+  def fetch(self, nodes, degree, seed, format):
+    """Get the file holding a graph, requesting it from ProvValidator
+    and caching it if it is not already cached.
+
+    :param nodes: number of nodes
+    :type nodes: int
+    :param degree: number of edges per node
+    :type degree: int
+    :param seed: random number generator seed
+    :type seed: int
+    :param format: a :mod:`prov_service_tests.standards` format
+    :type format: str or unicode
+    :return: file name
+    :rtype: str or unicode
+    :raises ValueError: if the graph cannot be got
+    """
+    path = self.get(nodes, degree, seed, format)
+    if path is None:
+      content, _ = get_random_graph(nodes, degree, seed, format)
+      path = self.put(nodes, degree, seed, format, content)
+    return path
+
+
+CACHE = RandomGraphCache()
+""":class:`RandomGraphCache`: cache in the directory given by
+:func:`get_directory` when this module was imported"""
+
+
+def get_random_graph(nodes, degree, seed, format):
+  """Submit GET /provapi/documents/random/{nodes}/{degree}/{seed}.
+
+  :param nodes: number of nodes
+  :type nodes: int
+  :param degree: number of edges per node
+  :type degree: int
+  :param seed: random number generator seed
+  :type seed: int
+  :param format: a :mod:`prov_service_tests.standards` format
+  :type format: str or unicode
+  :return: graph and time taken, in seconds
+  :rtype: tuple of (bytes, float)
+  :raises ValueError: if the response code is not 200 OK or the graph
+    is not in the format
+  """
+  url = os.environ[ProvValidatorTestCase.URL_ENV] + \
+      "random/%d/%d/%d" % (nodes, degree, seed)
+  content_type = ProvValidatorTestCase.CONTENT_TYPES[format]
+  start = timing.clock()
+  response = session.get_session().get(url,
+                                       headers={http.ACCEPT: content_type})
+  content = response.content
+  elapsed = timing.clock() - start
+  if response.status_code != requests.codes.ok:
+    raise ValueError("GET " + url + " returned " +
+                     str(response.status_code))
+  returned = response.headers.get(http.CONTENT_TYPE, content_type)
+  if returned.split(";")[0].strip() != content_type:
+    raise ValueError("GET " + url + " returned " + returned +
+                     ", not " + content_type)
+  return content, elapsed
+
+
+class Point(object):
+  """Outcome of requests for a graph of one size.
+  """
+
+  def __init__(self, nodes, degree, seed):
+    self.nodes = nodes
+    """int: number of nodes"""
+    self.degree = degree
+    """int: number of edges per node"""
+    self.seed = seed
+    """int: random number generator seed"""
+    self.latencies = []
+    """list of float: time taken by each request, in seconds"""
+    self.digests = set()
+    """set of str or unicode: SHA-1 digests of graphs returned"""
+    self.length = None
+    """int: size of graph in bytes"""
+    self.path = None
+    """str or unicode: file holding the cached graph"""
+    self.error = None
+    """str or unicode: error, or None"""
+    self.reuse = {}
+    """dict: mapping from names of operations reusing the graph, see
+    :func:`reuse`, to time taken in seconds, or None if they failed"""
+
+  @property
+  def deterministic(self):
+    """bool: True if every request returned the same graph"""
+    return len(self.digests) == 1
+
+  def report(self):
+    """Get outcome.
+
+    :return: ``nodes``, ``degree``, ``seed``, ``bytes``, ``latency``,
+      a mapping from ``p50``, ``p90``, ``p99`` and ``max`` to
+      milliseconds, ``deterministic``, ``path``, ``error`` and
+      ``reuse``, a mapping from operations to milliseconds
+    :rtype: dict
+    """
+    return {"nodes": self.nodes,
+            "degree": self.degree,
+            "seed": self.seed,
+            "bytes": self.length,
+            "latency": timing.summarise([latency * 1000
+                                         for latency in self.latencies]),
+            "deterministic": self.deterministic,
+            "path": self.path,
+            "error": self.error,
+            "reuse": dict([(name, None if seconds is None
+                            else seconds * 1000)
+                           for name, seconds in self.reuse.items()])}
+
+
+def sweep(nodes_list, degrees, seed, format, repeat, cache=CACHE):
+  """Request a graph of each size in a grid, a number of times, and
+  cache the graphs.
+
+  :param nodes_list: numbers of nodes
+  :type nodes_list: list of int
+  :param degrees: numbers of edges per node
+  :type degrees: list of int
+  :param seed: random number generator seed
+  :type seed: int
+  :param format: a :mod:`prov_service_tests.standards` format
+  :type format: str or unicode
+  :param repeat: number of requests for each size
+  :type repeat: int
+  :param cache: cache
+  :type cache: :class:`RandomGraphCache`
+  :return: points, in order of nodes then degree
+  :rtype: list of :class:`Point`
+  """
+  points = []
+  for nodes in nodes_list:
+    for degree in degrees:
+      point = Point(nodes, degree, seed)
+      points.append(point)
+      try:
+        for _ in range(repeat):
+          content, elapsed = get_random_graph(nodes, degree, seed, format)
+          point.latencies.append(elapsed)
+          point.digests.add(hashlib.sha1(content).hexdigest())
+        point.length = len(content)
+        point.path = cache.put(nodes, degree, seed, format, content)
+      except (ValueError, requests.RequestException) as e:
+        point.error = str(e)
+  return points
+
+
+def reuse(points, format, cache=CACHE):
+  """Post each cached graph to ProvStore, then delete it, and
+  translate it to PROV-JSON using ProvValidator, timing each.
+
+  :param points: points with cached graphs
+  :type points: list of :class:`Point`
+  :param format: a :mod:`prov_service_tests.standards` format
+  :type format: str or unicode
+  :param cache: cache
+  :type cache: :class:`RandomGraphCache`
+  """
+  from prov_service_tests import scenario
+  rng = random.Random(0)
+  for point in points:
+    if point.error is not None:
+      continue
+    source = scenario.Source(
+      "random", lambda _: cache.fetch(point.nodes, point.degree,
+                                      point.seed, format))
+    operations = [
+      ("post", scenario.compile_post_document({"format": format}, source)),
+      ("translate", scenario.compile_translate(
+        {"from": format, "to": standards.JSON}, source))]
+    for name, operation in operations:
+      start = timing.clock()
+      error = operation(rng)
+      point.reuse[name] = timing.clock() - start if error is None else None
+
+
+def to_table(points):
+  """Get points as a text table, with the time taken per thousand
+  edges, so that how latency scales with size can be seen.
+
+  :param points: points
+  :type points: list of :class:`Point`
+  :return: table
+  :rtype: str or unicode
+  """
+  names = sorted(set([name for point in points for name in point.reuse]))
+  row = "%8s %6s %10s %9s %9s %12s %13s" + " %11s" * len(names)
+  lines = [row % tuple(["Nodes", "Degree", "Bytes", "p50 (ms)", "max (ms)",
+                        "ms/1k edges", "Deterministic"] +
+                       [name + " (ms)" for name in names])]
+  for point in points:
+    if point.error is not None:
+      lines.append("%8d %6d %s" % (point.nodes, point.degree, point.error))
+      continue
+    report = point.report()
+    edges = point.nodes * point.degree
+    lines.append(row % tuple(
+      [point.nodes, point.degree, point.length,
+       "%.1f" % report["latency"]["p50"], "%.1f" % report["latency"]["max"],
+       "%.2f" % (report["latency"]["p50"] * 1000 / edges) if edges else "-",
+       "yes" if point.deterministic else "no"] +
+      ["failed" if report["reuse"].get(name) is None
+       else "%.1f" % report["reuse"][name] for name in names]))
+  return "\n".join(lines)
+
+
+def parse_integers(value):
+  """Parse comma-separated integers.
+
+  :param value: e.g. ``10,100,1000``
+  :type value: str or unicode
+  :return: integers
+  :rtype: list of int
+  """
+  return [int(item) for item in value.split(",") if item.strip()]
+
+
+def main(argv=None):
+  """Run a sweep from the command-line.
+
+  :param argv: command-line arguments, excluding program name
+  :type argv: list of str or unicode
+  :return: exit code, 0 if all requests succeeded, 1 otherwise
+  :rtype: int
+  """
+  parser = argparse.ArgumentParser(
+    description="Sweep ProvValidator's random graph endpoint over sizes.")
+  parser.add_argument("--nodes", type=parse_integers,
+                      default=DEFAULT_NODES,
+                      help="comma-separated numbers of nodes (default %s)" %
+                      ",".join([str(nodes) for nodes in DEFAULT_NODES]))
+  parser.add_argument("--degree", type=parse_integers,
+                      default=DEFAULT_DEGREES,
+                      help="comma-separated numbers of edges per node "
+                      "(default %s)" %
+                      ",".join([str(degree) for degree in DEFAULT_DEGREES]))
+  parser.add_argument("--seed", type=int, default=DEFAULT_SEED,
+                      help="random number generator seed (default %d)" %
+                      DEFAULT_SEED)
+  parser.add_argument("--format", choices=standards.FORMATS,
+                      default=standards.PROVN,
+                      help="format requested (default %s)" % standards.PROVN)
+  parser.add_argument("--repeat", type=int, default=DEFAULT_REPEAT,
+                      help="requests for each size (default %d)" %
+                      DEFAULT_REPEAT)
+  parser.add_argument("--post", action="store_true",
+                      help="post each graph to ProvStore and translate it "
+                      "using ProvValidator")
+  parser.add_argument("--json", metavar="FILE",
+                      help="save report as JSON")
+  load.add_service_arguments(parser)
+  args = parser.parse_args(argv)
+  args.workers = 1
+  local_server = load.configure(args)
+  try:
+    points = sweep(args.nodes, args.degree, args.seed, args.format,
+                   args.repeat)
+    if args.post:
+      reuse(points, args.format)
+  finally:
+    if local_server is not None:
+      local_server.stop()
+  print(to_table(points))
+  print("Cached in " + CACHE.directory)
+  if args.json:
+    with open(args.json, "w") as f:
+      json.dump([point.report() for point in points], f, indent=2,
+                sort_keys=True)
+  failed = [point for point in points if point.error is not None or
+            None in point.reuse.values()]
+  return 1 if failed else 0
+
+
+if __name__ == "__main__":
+  sys.exit(main())
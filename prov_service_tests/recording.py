@@ -0,0 +1,273 @@
+"""Record service traffic to a file.
+
+If ``PROV_RECORD_FILE`` is set, every request sent via
+:mod:`prov_service_tests.session` is appended to that file, as one
+line of JSON, once its response has been received. Each line holds
+the time the request was sent, its method, URL, endpoint template,
+headers, a SHA-1 digest and size of its body, the response status
+code and size and the connect, time-to-first-byte and total times.
+For a request which created a document, the URL of the document is
+also held, so that it can be mapped to the document created when the
+request is replayed, see :mod:`prov_service_tests.replay`.
+
+Request bodies are stored once each, however many requests sent them,
+in a directory beside the file, named by digest. The value of the
+``Authorization`` header is not recorded. Bodies of streamed uploads
+are not recorded.
+
+Lines are only ever appended, so a file can hold several runs. Each
+process in a run starts with a line holding the ProvStore and
+ProvValidator URLs it was run against and the run identifier,
+``PROV_RUN_ID``. Each request line also holds the run identifier, so
+that lines written by the processes of a run, such as those of
+``prov_service_tests.runner`` or ``nosetests --processes``, can be
+gathered into one run.
+"""
+# Copyright (c) 2015 University of Southampton
+#
+# Permission is hereby granted, free of charge, to any person
+# obtaining a copy of this software and associated documentation files
+# (the "Software"), to deal in the Software without restriction,
+# including without limitation the rights to use, copy, modify, merge,
+# publish, distribute, sublicense, and/or sell copies of the Software,
+# and to permit persons to whom the Software is furnished to do so,
+# subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be
+# included in all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND,
+# EXPRESS OR IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF
+# MERCHANTABILITY, FITNESS FOR A PARTICULAR PURPOSE AND
+# NONINFRINGEMENT. IN NO EVENT SHALL THE AUTHORS OR COPYRIGHT HOLDERS
+# BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER LIABILITY, WHETHER IN AN
+# ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM, OUT OF OR IN
+# CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+
+from __future__ import (absolute_import, division, print_function,
+                        unicode_literals)
+
+import hashlib
+import io
+import json
+import os
+import tempfile
+import threading
+import time
+try:
+  from urllib.parse import urljoin
+except ImportError:
+  from urlparse import urljoin
+
+from prov_service_tests import http
+from prov_service_tests import runid
+from prov_service_tests import timing
+
+RECORD_FILE_ENV = "PROV_RECORD_FILE"
+"""str or unicode: environment variable holding name of file to which
+traffic is recorded
+"""
+
+PROVSTORE_URL_ENV = "PROVSTORE_URL"
+"""str or unicode: environment variable holding ProvStore URL, as in
+:class:`prov_service_tests.test_provstore.ProvStoreTestCase`"""
+
+PROVVALIDATOR_URL_ENV = "PROVVALIDATOR_URL"
+"""str or unicode: environment variable holding ProvValidator URL, as
+in :class:`prov_service_tests.test_provvalidator.ProvValidatorTestCase`
+"""
+
+REDACTED = "-"
+"""str or unicode: value recorded for ``Authorization`` headers"""
+
+EXCLUDED_HEADERS = ["content-length", "transfer-encoding"]
+"""list of str or unicode: request headers which are not recorded, as
+they are set when a request is sent"""
+
+
+def get_bodies_directory(path):
+  """Get directory in which request bodies recorded in a file are
+  stored.
+
+  :param path: recording file name
+  :type path: str or unicode
+  :return: directory
+  :rtype: str or unicode
+  """
+  return path + ".bodies"
+
+
+def get_created_url(method, url, response):
+  """Get URL of a document created by a request: the URL of a
+  ProvStore document, from the ``id`` in a 201 CREATED response, or
+  the ``Location`` of a 303 SEE OTHER response from ProvValidator.
+
+  :param method: request method
+  :type method: str or unicode
+  :param url: request URL
+  :type url: str or unicode
+  :param response: response
+  :type response: :class:`requests.Response`
+  :return: URL or None
+  :rtype: str or unicode
+  """
+  if method != "POST" or response is None:
+    return None
+  if response.status_code == 303:
+    location = response.headers.get("Location")
+    return urljoin(url, location) if location else None
+  if response.status_code == 201:
+    try:
+      # Raises RuntimeError if the response was streamed.
+      return url + str(json.loads(response.text)["id"])
+    except (ValueError, KeyError, TypeError, RuntimeError):
+      return None
+  return None
+
+
+def to_line(entry):
+  """Get an entry as a compact line of JSON.
+
+  :param entry: entry
+  :type entry: dict
+  :return: UTF-8 encoded line, ending with a newline
+  :rtype: bytes
+  """
+  line = json.dumps(entry, separators=(",", ":"), sort_keys=True)
+  return (line + "\n").encode("utf-8")
+
+
+class Recorder(object):
+  """Thread-safe, append-only recorder of requests, an observer in
+  :data:`prov_service_tests.timing.OBSERVERS`.
+  """
+
+  def __init__(self, path):
+    """Create recorder.
+
+    :param path: file name
+    :type path: str or unicode
+    """
+    self.path = path
+    """str or unicode: file name"""
+    self.bodies = get_bodies_directory(path)
+    """str or unicode: directory holding request bodies"""
+    self.count = 0
+    """int: number of requests recorded"""
+    self._lock = threading.Lock()
+    self._stored = set()
+    self._file = None
+
+  def write(self, entry):
+    """Append a line. Before the first line, a line with the service
+    URLs and run identifier is appended. This is done when the first
+    request is recorded, rather than when the recorder is created, so
+    that it holds the URLs of any local stand-in server.
+
+    :param entry: entry
+    :type entry: dict
+    """
+    with self._lock:
+      if self._file is None:
+        directory = os.path.dirname(os.path.abspath(self.path))
+        if not os.path.isdir(directory):
+          os.makedirs(directory)
+        self._file = io.open(self.path, "ab")
+        self._file.write(to_line(
+          {"provstore": os.environ.get(PROVSTORE_URL_ENV),
+           "provvalidator": os.environ.get(PROVVALIDATOR_URL_ENV),
+           "run": runid.get_run_name(),
+           "started": round(time.time(), 6)}))
+      self._file.write(to_line(entry))
+      self._file.flush()
+
+  def store_body(self, body):
+    """Store a request body, if not already stored.
+
+    :param body: body
+    :type body: bytes
+    :return: SHA-1 hex digest
+    :rtype: str or unicode
+    """
+    digest = hashlib.sha1(body).hexdigest()
+    with self._lock:
+      if digest in self._stored:
+        return digest
+      self._stored.add(digest)
+    path = os.path.join(self.bodies, digest)
+    if not os.path.exists(path):
+      if not os.path.isdir(self.bodies):
+        try:
+          os.makedirs(self.bodies)
+        except OSError:
+          if not os.path.isdir(self.bodies):
+            raise
+      handle, temporary = tempfile.mkstemp(dir=self.bodies)
+      with os.fdopen(handle, "wb") as f:
+        f.write(body)
+      os.rename(temporary, path)
+    return digest
+
+  def add(self, sample):
+    """Record a request.
+
+    :param sample: sample
+    :type sample: :class:`prov_service_tests.timing.Sample`
+    """
+    request = sample.request
+    if request is None:
+      return
+    headers = {}
+    for name, value in request.headers.items():
+      if name.lower() == http.AUTHORIZATION.lower():
+        headers[name] = REDACTED
+      elif name.lower() not in EXCLUDED_HEADERS:
+        headers[name] = value
+    body = request.body
+    if isinstance(body, type("")):
+      body = body.encode("utf-8")
+    entry = {"at": round(sample.timestamp - (sample.total or 0), 6),
+             "m": sample.method,
+             "u": sample.url,
+             "p": sample.template,
+             "h": headers,
+             "s": sample.status,
+             "n": sample.sent,
+             "r": sample.received,
+             "c": round(sample.connect, 6),
+             "f": round(sample.ttfb, 6),
+             "t": round(sample.total or 0, 6),
+             "i": runid.get_run_name()}
+    if body is None or isinstance(body, bytes):
+      entry["b"] = self.store_body(body) if body else None
+    else:
+      # A streamed upload, whose body has already been consumed.
+      entry["b"] = None
+      entry["x"] = True
+    created = get_created_url(sample.method, sample.url, sample.response)
+    if created is not None:
+      entry["l"] = created
+    self.write(entry)
+    with self._lock:
+      self.count += 1
+
+
+def create_recorder():
+  """Create a recorder if ``PROV_RECORD_FILE`` is set and add it to
+  :data:`prov_service_tests.timing.OBSERVERS`.
+
+  :return: recorder or None
+  :rtype: :class:`Recorder`
+  """
+  path = os.environ.get(RECORD_FILE_ENV)
+  if not path:
+    return None
+  recorder = Recorder(path)
+  timing.OBSERVERS.append(recorder.add)
+  return recorder
+
+
+RECORDER = create_recorder()
+""":class:`Recorder`: recorder for this process, or None if
+``PROV_RECORD_FILE`` is not set"""
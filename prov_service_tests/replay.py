@@ -0,0 +1,567 @@
+"""Replay service traffic recorded by :mod:`prov_service_tests.recording`.
+
+The requests of a recorded run are sent again, concurrently, at the
+times at which they were originally sent relative to the first
+request, divided by a speed-up factor, or as quickly as possible.
+Each replayed request's status code is compared to the recorded one,
+and its latency to the recorded latency, for each endpoint. 200 OK
+and 304 NOT MODIFIED are treated as matching, as whether a
+conditional request is answered with 304 depends on the service's
+entity tags.
+
+Recorded URLs of the ProvStore and ProvValidator services are
+replaced by those currently configured. Requests for documents
+created by recorded requests wait for the replayed request which
+created the document, and for the previous request for the document,
+and are then sent to the document it created.
+``Authorization`` headers are replaced using ``PROVSTORE_API_KEY``.
+Requests with streamed bodies, which are not recorded, are skipped,
+as are requests for the documents they created.
+
+Usage::
+
+    $ PROV_RECORD_FILE=traffic.jsonl python -m prov_service_tests.load \\
+        --rate 10 --duration 60
+    $ python -m prov_service_tests.replay traffic.jsonl --speed 4
+
+Run ``python -m prov_service_tests.replay --help`` for all options.
+"""
+# Copyright (c) 2015 University of Southampton
+#
+# Permission is hereby granted, free of charge, to any person
+# obtaining a copy of this software and associated documentation files
+# (the "Software"), to deal in the Software without restriction,
+# including without limitation the rights to use, copy, modify, merge,
+# publish, distribute, sublicense, and/or sell copies of the Software,
+# and to permit persons to whom the Software is furnished to do so,
+# subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be
+# included in all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND,
+# EXPRESS OR IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF
+# MERCHANTABILITY, FITNESS FOR A PARTICULAR PURPOSE AND
+# NONINFRINGEMENT. IN NO EVENT SHALL THE AUTHORS OR COPYRIGHT HOLDERS
+# BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER LIABILITY, WHETHER IN AN
+# ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM, OUT OF OR IN
+# CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+
+from __future__ import (absolute_import, division, print_function,
+                        unicode_literals)
+
+import argparse
+import io
+import json
+import os
+import sys
+import threading
+import time
+try:
+  import queue
+except ImportError:
+  import Queue as queue
+
+from prov_service_tests import http
+from prov_service_tests import load
+from prov_service_tests import recording
+from prov_service_tests import session
+from prov_service_tests import timing
+from prov_service_tests.test_provstore import ProvStoreTestCase
+from prov_service_tests.test_provvalidator import ProvValidatorTestCase
+
+MAX = "max"
+"""str or unicode: speed at which requests are sent as quickly as
+possible"""
+
+MATCHING_STATUSES = [200, 304]
+"""list of int: status codes treated as matching each other"""
+
+SEPARATORS = "/.?"
+"""str or unicode: characters which may follow the URL of a created
+document in the URLs of requests for it"""
+
+
+def parse_speed(value):
+  """Parse a speed-up factor.
+
+  :param value: a positive number, or ``max``
+  :type value: str or unicode
+  :return: speed-up factor, or None for ``max``
+  :rtype: float
+  :raises argparse.ArgumentTypeError: if the value is invalid
+  """
+  if value == MAX:
+    return None
+  try:
+    speed = float(value)
+  except ValueError:
+    speed = 0
+  if speed <= 0:
+    raise argparse.ArgumentTypeError(
+      "speed must be a positive number or " + MAX)
+  return speed
+
+
+def statuses_match(recorded, replayed):
+  """Check whether a replayed status code matches a recorded one.
+
+  :param recorded: recorded status code
+  :type recorded: int
+  :param replayed: replayed status code
+  :type replayed: int
+  :return: True if the status codes match
+  :rtype: bool
+  """
+  return recorded == replayed or (recorded in MATCHING_STATUSES and
+                                  replayed in MATCHING_STATUSES)
+
+
+def get_prefixes(url):
+  """Get the URLs of documents which a URL could be a request for: the
+  URL itself and each prefix of it followed by one of
+  :data:`SEPARATORS`.
+
+  :param url: URL
+  :type url: str or unicode
+  :return: prefixes, longest first
+  :rtype: list of str or unicode
+  """
+  return [url] + [url[:index] for index in range(len(url) - 1, 0, -1)
+                  if url[index] in SEPARATORS]
+
+
+def to_milliseconds(value):
+  """Format a number of milliseconds, which may be None.
+
+  :param value: milliseconds or None
+  :type value: float
+  :return: formatted value, or ``-`` if None
+  :rtype: str or unicode
+  """
+  return "-" if value is None else "%.1f" % value
+
+
+class Recording(object):
+  """A recorded run.
+  """
+
+  def __init__(self, path, header, records):
+    """Create recording.
+
+    :param path: recording file name
+    :type path: str or unicode
+    :param header: service URLs, as recorded
+    :type header: dict
+    :param records: requests, as recorded
+    :type records: list of dict
+    """
+    self.path = path
+    """str or unicode: recording file name"""
+    self.header = header
+    """dict: service URLs, as recorded"""
+    self.records = records
+    """list of dict: requests, in the order they were sent"""
+
+  def get_body(self, record):
+    """Get the body of a recorded request.
+
+    :param record: request
+    :type record: dict
+    :return: body, or None if it had no body
+    :rtype: bytes
+    """
+    if not record.get("b"):
+      return None
+    with open(os.path.join(recording.get_bodies_directory(self.path),
+                           record["b"]), "rb") as f:
+      return f.read()
+
+  def rebase(self, url):
+    """Replace the recorded URL of a service, at the start of a URL,
+    with its current URL.
+
+    :param url: URL
+    :type url: str or unicode
+    :return: URL
+    :rtype: str or unicode
+    """
+    for key, env in [("provstore", ProvStoreTestCase.URL_ENV),
+                     ("provvalidator", ProvValidatorTestCase.URL_ENV)]:
+      recorded = self.header.get(key)
+      current = os.environ.get(env)
+      if recorded and current and url.startswith(recorded):
+        return current + url[len(recorded):]
+    return url
+
+
+def load_recording(path, run=-1):
+  """Load a run from a recording file. Lines written by the processes
+  of one run, which share a run identifier, are gathered into one run,
+  ordered by the first line of the run. Lines without a run identifier,
+  written by earlier versions, belong to the run started by the
+  previous header line.
+
+  :param path: recording file name
+  :type path: str or unicode
+  :param run: index of run in the file, default the last
+  :type run: int
+  :return: recording
+  :rtype: :class:`Recording`
+  :raises IndexError: if there is no such run
+  """
+  runs = []
+  ids = {}
+  current = None
+  with io.open(path, encoding="utf-8") as f:
+    for line in f:
+      if not line.strip():
+        continue
+      entry = json.loads(line)
+      if "m" not in entry:
+        current = ids.get(entry.get("run"))
+        if current is None:
+          current = (entry, [])
+          runs.append(current)
+          if entry.get("run") is not None:
+            ids[entry["run"]] = current
+        elif entry.get("started") is not None:
+          # Keep the time the first process of the run started.
+          header = current[0]
+          header["started"] = min(header.get("started", entry["started"]),
+                                  entry["started"])
+      elif entry.get("i") in ids:
+        ids[entry["i"]][1].append(entry)
+      elif current is not None:
+        current[1].append(entry)
+  header, records = runs[run]
+  # Lines are written once each response is received.
+  records.sort(key=lambda record: record["at"])
+  return Recording(path, header, records)
+
+
+class ReplayReport(object):
+  """Thread-safe collection of replayed requests, by endpoint.
+  """
+
+  def __init__(self):
+    self._lock = threading.Lock()
+    self._endpoints = {}
+    self.lateness = []
+    """list of float: delay, in seconds, between the time each request
+    was scheduled to be sent and the time it was sent"""
+    self.started = None
+    """float: time at which the replay started, from
+    :func:`prov_service_tests.timing.clock`"""
+    self.finished = None
+    """float: time at which the last request completed"""
+    self.recorded_elapsed = 0
+    """float: time, in seconds, taken by the recorded run"""
+
+  def add(self, record, status=None, latency=None, lateness=None,
+          error=None):
+    """Add a replayed request.
+
+    :param record: request, as recorded
+    :type record: dict
+    :param status: replayed status code, or None if not sent
+    :type status: int
+    :param latency: replayed latency in seconds
+    :type latency: float
+    :param lateness: delay, in seconds, in sending the request
+    :type lateness: float
+    :param error: reason the request was not sent or failed, or None
+    :type error: str or unicode
+    """
+    endpoint = record["m"] + " " + record["p"]
+    with self._lock:
+      if endpoint not in self._endpoints:
+        self._endpoints[endpoint] = {"count": 0, "mismatches": {},
+                                     "errors": {}, "recorded": [],
+                                     "replayed": []}
+      counts = self._endpoints[endpoint]
+      counts["count"] += 1
+      if error is not None:
+        counts["errors"][error] = counts["errors"].get(error, 0) + 1
+        return
+      self.lateness.append(lateness)
+      counts["recorded"].append(record["t"] * 1000)
+      counts["replayed"].append(latency * 1000)
+      if not statuses_match(record["s"], status):
+        mismatch = "%d != %d" % (status, record["s"])
+        counts["mismatches"][mismatch] = \
+            counts["mismatches"].get(mismatch, 0) + 1
+
+  @property
+  def error_count(self):
+    """int: number of requests which failed, were skipped or whose
+    status codes did not match"""
+    with self._lock:
+      return sum([sum(counts["errors"].values()) +
+                  sum(counts["mismatches"].values())
+                  for counts in self._endpoints.values()])
+
+  def report(self):
+    """Get replay outcomes.
+
+    :return: report with ``elapsed`` and ``recorded_elapsed``
+      (seconds), ``lateness`` (mapping from ``p50``, ``p90``, ``p99``
+      and ``max`` to milliseconds) and ``endpoints`` (mapping from
+      endpoint to ``count``, ``mismatches`` and ``errors``, each a
+      mapping from message to count, and ``recorded`` and
+      ``replayed`` latency percentiles in milliseconds) keys
+    :rtype: dict
+    """
+    with self._lock:
+      endpoints = {}
+      for endpoint, counts in self._endpoints.items():
+        endpoints[endpoint] = {
+          "count": counts["count"],
+          "mismatches": dict(counts["mismatches"]),
+          "errors": dict(counts["errors"]),
+          "recorded": timing.summarise(counts["recorded"]),
+          "replayed": timing.summarise(counts["replayed"])
+        }
+      return {"elapsed": (self.finished or timing.clock()) - self.started,
+              "recorded_elapsed": self.recorded_elapsed,
+              "lateness": timing.summarise([lateness * 1000 for lateness
+                                            in self.lateness]),
+              "endpoints": endpoints}
+
+  def to_table(self):
+    """Get replay outcomes as a text table, with a row for each
+    endpoint, followed by the mismatches and errors.
+
+    :return: table
+    :rtype: str or unicode
+    """
+    report = self.report()
+    lines = ["Replayed in %.1f s, recorded in %.1f s, lateness p99 %s ms" %
+             (report["elapsed"], report["recorded_elapsed"],
+              to_milliseconds(report["lateness"]["p99"])),
+             "%-65s %6s %6s %8s %8s %6s" %
+             ("Endpoint", "Count", "Differ", "Rec p50", "Rep p50", "Ratio")]
+    for endpoint, outcome in sorted(report["endpoints"].items()):
+      recorded = outcome["recorded"]["p50"]
+      replayed = outcome["replayed"]["p50"]
+      lines.append("%-65s %6d %6d %8s %8s %6s" % (
+        endpoint, outcome["count"],
+        sum(outcome["mismatches"].values()) +
+        sum(outcome["errors"].values()),
+        to_milliseconds(recorded), to_milliseconds(replayed),
+        "%.2f" % (replayed / recorded) if recorded and replayed else "-"))
+    for endpoint, outcome in sorted(report["endpoints"].items()):
+      for message, count in sorted(list(outcome["mismatches"].items()) +
+                                   list(outcome["errors"].items())):
+        lines.append("  %5d x %s: %s" % (count, endpoint, message))
+    return "\n".join(lines)
+
+
+class Replay(object):
+  """Replay of a recorded run.
+  """
+
+  def __init__(self, recorded, speed=1.0, concurrency=4):
+    """Create replay, working out which requests are for documents
+    created by earlier requests, and which request for the same
+    document precedes each of them.
+
+    :param recorded: recorded run
+    :type recorded: :class:`Recording`
+    :param speed: speed-up factor, or None to send requests as quickly
+      as possible
+    :type speed: float
+    :param concurrency: number of requests sent at once
+    :type concurrency: int
+    """
+    self.recorded = recorded
+    """:class:`Recording`: recorded run"""
+    self.speed = speed
+    """float: speed-up factor, or None"""
+    self.concurrency = concurrency
+    """int: number of requests sent at once"""
+    self.report = ReplayReport()
+    """:class:`ReplayReport`: outcomes"""
+    self.http_session = session.create_session()
+    """:class:`requests.Session`: session, without a response cache so
+    that each request is sent as recorded"""
+    for adapter in self.http_session.adapters.values():
+      adapter.cache = None
+    self._created = {}
+    self._events = {}
+    self._dependencies = []
+    creators = {}
+    latest = {}
+    for index, record in enumerate(recorded.records):
+      url = recorded.rebase(record["u"])
+      dependency = None
+      for prefix in get_prefixes(url):
+        if prefix in creators:
+          creator = creators[prefix]
+          dependency = (creator, prefix, latest[creator])
+          latest[creator] = index
+          self._events[dependency[2]] = threading.Event()
+          break
+      self._dependencies.append(dependency)
+      if record.get("l"):
+        creators[recorded.rebase(record["l"])] = index
+        latest[index] = index
+        self._events[index] = threading.Event()
+
+  def get_url(self, index):
+    """Get the URL to which a request is to be replayed. A request for
+    a document created by an earlier request waits until the replay of
+    the previous request for that document, or of the request which
+    created it, has completed, as the outcome of a request can depend
+    on earlier ones e.g. ProvValidator only has normal forms for
+    documents which have been validated.
+
+    :param index: index of request
+    :type index: int
+    :return: URL, or None if the document was not created
+    :rtype: str or unicode
+    """
+    url = self.recorded.rebase(self.recorded.records[index]["u"])
+    if self._dependencies[index] is None:
+      return url
+    creator, prefix, previous = self._dependencies[index]
+    self._events[previous].wait()
+    created = self._created.get(creator)
+    if created is None:
+      return None
+    return created + url[len(prefix):]
+
+  def send(self, index, scheduled):
+    """Replay a request.
+
+    :param index: index of request
+    :type index: int
+    :param scheduled: time at which it was scheduled to be sent, from
+      :func:`prov_service_tests.timing.clock`
+    :type scheduled: float
+    """
+    record = self.recorded.records[index]
+    try:
+      if record.get("x"):
+        self.report.add(record, error="streamed body not recorded")
+        return
+      url = self.get_url(index)
+      if url is None:
+        self.report.add(record, error="document not created")
+        return
+      headers = dict(record["h"])
+      for name in headers:
+        if name.lower() == http.AUTHORIZATION.lower():
+          headers[name] = "ApiKey " + \
+              os.environ.get(ProvStoreTestCase.API_KEY_ENV, "")
+      body = self.recorded.get_body(record)
+      start = timing.clock()
+      try:
+        response = self.http_session.request(
+          record["m"], url, headers=headers, data=body,
+          allow_redirects=False)
+      except Exception as e:
+        self.report.add(record, error=type(e).__name__)
+        return
+      latency = timing.clock() - start
+      if index in self._events:
+        self._created[index] = recording.get_created_url(
+          record["m"], url, response)
+      self.report.add(record, response.status_code, latency,
+                      start - scheduled)
+    finally:
+      if index in self._events:
+        self._events[index].set()
+
+  def worker(self, tasks):
+    """Replay requests from a queue until a None task is received.
+
+    :param tasks: queue of (request index, scheduled time) tuples
+    :type tasks: :class:`queue.Queue`
+    """
+    while True:
+      task = tasks.get()
+      if task is None:
+        return
+      self.send(*task)
+
+  def run(self):
+    """Replay the recorded requests, each at its recorded offset from
+    the first request divided by the speed-up factor, and wait for
+    them to complete. A request waiting for an earlier request for its
+    document occupies a worker, so requests are queued in the order
+    they were sent, after the requests they wait for.
+
+    :return: report
+    :rtype: :class:`ReplayReport`
+    """
+    records = self.recorded.records
+    tasks = queue.Queue()
+    threads = [threading.Thread(target=self.worker, args=(tasks,))
+               for _ in range(self.concurrency)]
+    for thread in threads:
+      thread.daemon = True
+      thread.start()
+    self.report.started = timing.clock()
+    if records:
+      self.report.recorded_elapsed = \
+          records[-1]["at"] + records[-1]["t"] - records[0]["at"]
+    for index, record in enumerate(records):
+      scheduled = self.report.started
+      if self.speed is not None:
+        scheduled += (record["at"] - records[0]["at"]) / self.speed
+        delay = scheduled - timing.clock()
+        if delay > 0:
+          time.sleep(delay)
+      else:
+        scheduled = timing.clock()
+      tasks.put((index, scheduled))
+    for _ in threads:
+      tasks.put(None)
+    for thread in threads:
+      thread.join()
+    self.report.finished = timing.clock()
+    return self.report
+
+
+def main(argv=None):
+  """Replay recorded traffic from the command-line.
+
+  :param argv: command-line arguments, excluding program name
+  :type argv: list of str or unicode
+  :return: exit code, 0 if all status codes matched, 1 otherwise
+  :rtype: int
+  """
+  parser = argparse.ArgumentParser(
+    description="Replay recorded service traffic.")
+  parser.add_argument("file", help="recording file, see PROV_RECORD_FILE")
+  parser.add_argument("--run", type=int, default=-1,
+                      help="index of run in file (default -1, the last)")
+  parser.add_argument("--speed", type=parse_speed, default=1.0,
+                      help="speed-up factor, or max to send requests as "
+                      "quickly as possible (default 1)")
+  parser.add_argument("--concurrency", type=int, default=8,
+                      help="requests sent at once (default 8)")
+  parser.add_argument("--json", metavar="FILE",
+                      help="save report as JSON")
+  load.add_service_arguments(parser)
+  args = parser.parse_args(argv)
+  args.workers = args.concurrency
+  recorded = load_recording(args.file, args.run)
+  local_server = load.configure(args)
+  try:
+    report = Replay(recorded, args.speed, args.concurrency).run()
+  finally:
+    if local_server is not None:
+      local_server.stop()
+  print(report.to_table())
+  print(session.STATISTICS)
+  if args.json:
+    with open(args.json, "w") as f:
+      json.dump(report.report(), f, indent=2, sort_keys=True)
+  return 1 if report.error_count else 0
+
+
+if __name__ == "__main__":
+  sys.exit(main())
@@ -0,0 +1,69 @@
+"""Identify test runs.
+
+A run is identified by ``PROV_RUN_ID``, which is set to a new
+identifier, if not already set, when the package is first imported.
+Processes started by the run, such as the workers of
+``prov_service_tests.runner`` and ``nosetests --processes``, inherit
+it, so that they can share one validated graph, one run in the test
+history and one run in a recording.
+"""
+# Copyright (c) 2015 University of Southampton
+#
+# Permission is hereby granted, free of charge, to any person
+# obtaining a copy of this software and associated documentation files
+# (the "Software"), to deal in the Software without restriction,
+# including without limitation the rights to use, copy, modify, merge,
+# publish, distribute, sublicense, and/or sell copies of the Software,
+# and to permit persons to whom the Software is furnished to do so,
+# subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be
+# included in all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND,
+# EXPRESS OR IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF
+# MERCHANTABILITY, FITNESS FOR A PARTICULAR PURPOSE AND
+# NONINFRINGEMENT. IN NO EVENT SHALL THE AUTHORS OR COPYRIGHT HOLDERS
+# BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER LIABILITY, WHETHER IN AN
+# ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM, OUT OF OR IN
+# CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+
+from __future__ import (absolute_import, division, print_function,
+                        unicode_literals)
+
+import os
+import uuid
+
+RUN_ID_ENV = "PROV_RUN_ID"
+"""str or unicode: environment variable holding an identifier for a
+test run, shared by all processes in the run
+"""
+
+_run_owner = None
+
+
+def get_run_name():
+  """Get identifier of this run, from ``PROV_RUN_ID``, setting it to
+  a new identifier if not set. Child processes started afterwards,
+  such as those of ``nosetests --processes``, share the identifier.
+
+  :return: run identifier
+  :rtype: str or unicode
+  """
+  global _run_owner
+  if not os.environ.get(RUN_ID_ENV):
+    os.environ[RUN_ID_ENV] = uuid.uuid4().hex
+    _run_owner = os.getpid()
+  return os.environ[RUN_ID_ENV]
+
+
+def is_run_owner():
+  """Check whether this process started the run, by setting
+  ``PROV_RUN_ID``, rather than inheriting it from a parent process or
+  the environment.
+
+  :return: True if this process set ``PROV_RUN_ID``
+  :rtype: bool
+  """
+  return _run_owner == os.getpid()
@@ -0,0 +1,281 @@
+"""Run the service tests in parallel, balanced by duration.
+
+The tests of :class:`prov_service_tests.test_provstore.ProvStoreTestCase`
+and :class:`prov_service_tests.test_provvalidator.ProvValidatorTestCase`,
+with each parameterized case a separate test, are run as probes, see
+:mod:`prov_service_tests.probes`, by a pool of processes or threads.
+
+The duration of each test is saved in the history, see
+:mod:`prov_service_tests.history`, after each run, and the median
+duration over recent runs used to balance the next run. In process
+mode, tests are split into one batch per process, assigning tests
+longest first to the batch with the least total duration so far. In
+thread mode, tests are queued longest first. Outcomes, request
+timings, response sizes, cache outcomes, streamed transfers and
+connection statistics from every worker are merged into one report.
+Shared ProvStore documents, and any documents which tests failed to
+delete, are deleted by each worker process, or once in thread mode.
+
+``PROV_RUN_ID`` is set, if not already, so that processes share one
+validated graph, see
+:class:`prov_service_tests.test_provvalidator.ValidatedGraph`.
+
+Usage::
+
+    $ python -m prov_service_tests.runner --workers 4
+    $ python -m prov_service_tests.runner --mode thread --workers 16 \\
+        translate-matrix
+"""
+# Copyright (c) 2015 University of Southampton
+#
+# Permission is hereby granted, free of charge, to any person
+# obtaining a copy of this software and associated documentation files
+# (the "Software"), to deal in the Software without restriction,
+# including without limitation the rights to use, copy, modify, merge,
+# publish, distribute, sublicense, and/or sell copies of the Software,
+# and to permit persons to whom the Software is furnished to do so,
+# subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be
+# included in all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND,
+# EXPRESS OR IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF
+# MERCHANTABILITY, FITNESS FOR A PARTICULAR PURPOSE AND
+# NONINFRINGEMENT. IN NO EVENT SHALL THE AUTHORS OR COPYRIGHT HOLDERS
+# BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER LIABILITY, WHETHER IN AN
+# ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM, OUT OF OR IN
+# CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+
+from __future__ import (absolute_import, division, print_function,
+                        unicode_literals)
+
+import argparse
+import heapq
+import multiprocessing
+import sys
+
+from prov_service_tests import cache
+from prov_service_tests import history
+from prov_service_tests import load
+from prov_service_tests import probes
+from prov_service_tests import runid
+from prov_service_tests import session
+from prov_service_tests import sizes
+from prov_service_tests import streaming
+from prov_service_tests import timing
+from prov_service_tests.test_provstore import ORPHANS
+from prov_service_tests.test_provstore import SHARED
+
+DEFAULT_DURATION = 1.0
+"""float: duration, in seconds, assumed for a test if no test has a
+saved duration"""
+
+PROCESS = "process"
+"""str or unicode: mode in which tests are run by a pool of processes"""
+
+THREAD = "thread"
+"""str or unicode: mode in which tests are run by a pool of threads"""
+
+
+def order_longest_first(selected, durations):
+  """Order probes by saved duration, longest first. Probes with no
+  saved duration are assumed to take the mean saved duration.
+
+  :param selected: probes
+  :type selected: list of :class:`prov_service_tests.probes.Probe`
+  :param durations: mapping from probe names to durations in seconds
+  :type durations: dict
+  :return: (estimated duration, probe) tuples, longest first
+  :rtype: list of tuple
+  """
+  known = [durations[probe.name] for probe in selected
+           if probe.name in durations]
+  default = sum(known) / len(known) if known else DEFAULT_DURATION
+  estimates = [(durations.get(probe.name, default), probe)
+               for probe in selected]
+  return sorted(estimates, key=lambda estimate: (-estimate[0],
+                                                 estimate[1].name))
+
+
+def partition(selected, durations, count):
+  """Split probes into batches of roughly equal total duration, using
+  the longest processing time first rule.
+
+  :param selected: probes
+  :type selected: list of :class:`prov_service_tests.probes.Probe`
+  :param durations: mapping from probe names to durations in seconds
+  :type durations: dict
+  :param count: maximum number of batches
+  :type count: int
+  :return: non-empty batches of probes, each longest first
+  :rtype: list of list of :class:`prov_service_tests.probes.Probe`
+  """
+  batches = [[] for _ in range(max(1, min(count, len(selected))))]
+  totals = [(0.0, index) for index in range(len(batches))]
+  for duration, probe in order_longest_first(selected, durations):
+    total, index = heapq.heappop(totals)
+    batches[index].append(probe)
+    heapq.heappush(totals, (total + duration, index))
+  return [batch for batch in batches if batch]
+
+
+def delete_documents():
+  """Delete shared ProvStore documents, then any documents which tests
+  failed to delete, as ``tearDownClass`` and
+  :func:`prov_service_tests.teardown_package` do for nose.
+
+  :return: URLs of documents which may not have been deleted
+  :rtype: list of str or unicode
+  """
+  for url in SHARED.delete_all():
+    ORPHANS.add(url)
+  return ORPHANS.delete_all()
+
+
+def run_batch(names):
+  """Run a batch of probes, in a worker process.
+
+  :param names: probe names
+  :type names: list of str or unicode
+  :return: ``outcomes``, ``timings``, ``sizes``, ``cache``,
+    ``transfers``, ``requests``, ``connections`` and ``undeleted``
+    document URLs of the batch
+  :rtype: dict
+  """
+  timing.TIMINGS.reset()
+  sizes.SIZES.reset()
+  cache.STATISTICS.reset()
+  streaming.TRANSFERS.reset()
+  session.STATISTICS.reset()
+  by_name = dict([(probe.name, probe)
+                  for probe in probes.get_probes(memoize=True)])
+  try:
+    outcomes = [by_name[name].run() for name in names]
+  finally:
+    undeleted = delete_documents()
+  return {"outcomes": outcomes,
+          "timings": timing.TIMINGS.snapshot(),
+          "sizes": sizes.SIZES.snapshot(),
+          "cache": cache.STATISTICS.snapshot(),
+          "transfers": streaming.TRANSFERS.snapshot(),
+          "requests": session.STATISTICS.requests,
+          "connections": session.STATISTICS.connections,
+          "undeleted": undeleted}
+
+
+def run(selected, workers, mode, durations):
+  """Run probes in parallel. In process mode, the timings, sizes,
+  cache outcomes, transfers and connection statistics of each process
+  are merged into those of this process, and documents which a process
+  may not have deleted are recorded in
+  :data:`prov_service_tests.test_provstore.ORPHANS`.
+
+  :param selected: probes
+  :type selected: list of :class:`prov_service_tests.probes.Probe`
+  :param workers: number of processes or threads
+  :type workers: int
+  :param mode: :data:`PROCESS` or :data:`THREAD`
+  :type mode: str or unicode
+  :param durations: mapping from probe names to durations in seconds
+  :type durations: dict
+  :return: outcomes
+  :rtype: list of :class:`prov_service_tests.probes.Outcome`
+  """
+  if mode == THREAD:
+    ordered = [probe for _, probe in order_longest_first(selected,
+                                                         durations)]
+    try:
+      return probes.run_concurrently(ordered, workers)
+    finally:
+      delete_documents()
+  batches = partition(selected, durations, workers)
+  pool = multiprocessing.Pool(len(batches))
+  try:
+    results = pool.map(run_batch,
+                       [[probe.name for probe in batch] for batch in batches],
+                       chunksize=1)
+  finally:
+    pool.close()
+    pool.join()
+  outcomes = []
+  for result in results:
+    outcomes.extend(result["outcomes"])
+    timing.TIMINGS.merge(result["timings"])
+    sizes.SIZES.merge(result["sizes"])
+    cache.STATISTICS.merge(result["cache"])
+    streaming.TRANSFERS.merge(result["transfers"])
+    session.STATISTICS.merge(result["requests"], result["connections"])
+    for url in result["undeleted"]:
+      ORPHANS.add(url)
+  return outcomes
+
+
+def main(argv=None):
+  """Run tests in parallel from the command-line.
+
+  :param argv: command-line arguments, excluding program name
+  :type argv: list of str or unicode
+  :return: exit code, 0 if all tests passed, 1 otherwise
+  :rtype: int
+  """
+  parser = argparse.ArgumentParser(
+    description="Run the service tests in parallel.")
+  parser.add_argument("patterns", nargs="*", metavar="probe",
+                      help="flow name (%s) or test name pattern, "
+                      "default all tests" % ", ".join(sorted(probes.FLOWS)))
+  parser.add_argument("--workers", type=int, default=4,
+                      help="number of processes or threads (default 4)")
+  parser.add_argument("--mode", choices=[PROCESS, THREAD], default=PROCESS,
+                      help="run tests in processes or threads (default "
+                      "process)")
+  load.add_service_arguments(parser)
+  args = parser.parse_args(argv)
+  local_server = load.configure(args)
+  run_name = runid.get_run_name()
+  test_history = history.get_history()
+  durations = {}
+  if test_history is not None:
+    durations = test_history.get_durations()
+  try:
+    selected = probes.get_probes(args.patterns, memoize=True)
+    start = timing.clock()
+    outcomes = run(selected, args.workers, args.mode, durations)
+    elapsed = timing.clock() - start
+  finally:
+    if local_server is not None:
+      local_server.stop()
+  for url in ORPHANS.urls:
+    print("Warning: " + url + " may not have been deleted")
+  outcomes.sort(key=lambda outcome: outcome.name)
+  for outcome in outcomes:
+    print("%s ... %s" % (outcome.name,
+                         "ok" if outcome.success else outcome.error))
+  failures = len([outcome for outcome in outcomes
+                  if not outcome.success and not outcome.skipped])
+  skipped = len([outcome for outcome in outcomes if outcome.skipped])
+  print("Ran %d tests in %.2f s (%.2f s of tests), %d failed, "
+        "%d skipped" %
+        (len(outcomes), elapsed,
+         sum([outcome.duration for outcome in outcomes]), failures,
+         skipped))
+  print(session.STATISTICS)
+  print(timing.TIMINGS.to_table())
+  if len(sizes.SIZES):
+    print(sizes.SIZES.to_table())
+  if len(cache.STATISTICS):
+    print(cache.STATISTICS.to_table())
+  if len(streaming.TRANSFERS):
+    print(streaming.TRANSFERS.to_table())
+  if test_history is not None:
+    test_history.record(run_name,
+                        dict([(outcome.name,
+                               (outcome.duration, outcome.success))
+                              for outcome in outcomes]),
+                        timing.TIMINGS.report())
+  return 1 if failures else 0
+
+
+if __name__ == "__main__":
+  sys.exit(main())
@@ -0,0 +1,710 @@
+"""Run workloads described by YAML scenarios.
+
+A scenario describes a weighted mix of ProvStore and ProvValidator
+operations, the documents they use, the think time between
+operations and the number of concurrent users, for example::
+
+    name: production
+    duration: 300
+    concurrency: 8
+    think_time: [0.5, 2.0]
+    documents:
+      primer: primer
+      large:
+        generated: entities=1000,bundles=2
+    mix:
+      - operation: get-format
+        weight: 60
+        document: primer
+        formats: [json, provn, ttl]
+      - operation: translate
+        weight: 30
+        document: large
+        from: json
+        to: provn
+      - operation: validate
+        weight: 10
+        document: primer
+        then: [validation/normalForm]
+
+A scenario is compiled once, by :func:`compile_scenario`, into a
+:class:`Plan`. Compiling loads documents, stores any documents that
+operations fetch from ProvStore, and builds each operation's URLs,
+headers and request bodies. Running a plan then only chooses an
+operation, by bisecting cumulative weights, and sends its prepared
+requests, so no part of the scenario is interpreted per request.
+
+Each of the ``concurrency`` users runs operations one after another,
+waiting for the think time between them, until the duration has
+elapsed.
+
+Document sources are:
+
+- ``primer`` - the ``primer.*`` documents used by the tests.
+- ``generated: parameters`` - documents generated by
+  :mod:`prov_service_tests.generator`, with parameters as for
+  ``PROV_GENERATED``.
+- ``files: {format: path}`` - files, with paths relative to the
+  scenario file.
+- ``random: {nodes: n, degree: d, seed: s}`` - random graphs from
+  ProvValidator, cached by :mod:`prov_service_tests.randomgraph`.
+
+Operations are:
+
+- ``get-format`` - GET a stored document from ProvStore in one of
+  ``formats`` (default all), chosen at random.
+- ``post-document`` - POST a document, in ``format`` (default
+  ``json``), to ProvStore, then DELETE it.
+- ``translate`` - POST a document to ProvValidator to translate it
+  ``from`` one format ``to`` another (default ``json`` to ``json``).
+- ``validate`` - POST a document, in ``format`` (default ``json``),
+  to ProvValidator, GET its validation report, then GET each path in
+  ``then``, relative to the document, e.g. ``validation/normalForm``.
+
+Each operation may be given a ``name``, used in reports.
+
+Usage::
+
+    $ python -m prov_service_tests.scenario production.yaml
+"""
+# Copyright (c) 2015 University of Southampton
+#
+# Permission is hereby granted, free of charge, to any person
+# obtaining a copy of this software and associated documentation files
+# (the "Software"), to deal in the Software without restriction,
+# including without limitation the rights to use, copy, modify, merge,
+# publish, distribute, sublicense, and/or sell copies of the Software,
+# and to permit persons to whom the Software is furnished to do so,
+# subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be
+# included in all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND,
+# EXPRESS OR IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF
+# MERCHANTABILITY, FITNESS FOR A PARTICULAR PURPOSE AND
+# NONINFRINGEMENT. IN NO EVENT SHALL THE AUTHORS OR COPYRIGHT HOLDERS
+# BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER LIABILITY, WHETHER IN AN
+# ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM, OUT OF OR IN
+# CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+
+from __future__ import (absolute_import, division, print_function,
+                        unicode_literals)
+
+import argparse
+import bisect
+import io
+import json
+import os
+import random
+import sys
+import threading
+import time
+import requests
+import yaml
+
+from prov_service_tests import generator
+from prov_service_tests import http
+from prov_service_tests import load
+from prov_service_tests import probes
+from prov_service_tests import randomgraph
+from prov_service_tests import session
+from prov_service_tests import standards
+from prov_service_tests import timing
+from prov_service_tests.test_provstore import ORPHANS
+from prov_service_tests.test_provstore import ProvStoreTestCase
+from prov_service_tests.test_provstore import SharedDocuments
+from prov_service_tests.test_provvalidator import ProvValidatorTestCase
+from prov_service_tests.test_service import DOCUMENTS_DIRECTORY
+from prov_service_tests.test_service import ServiceTestCase
+
+PRIMER = "primer"
+"""str or unicode: name of the source of the ``primer.*`` documents"""
+
+DEFAULT_DURATION = 60
+"""float: default duration of a scenario in seconds"""
+
+DEFAULT_CONCURRENCY = 1
+"""int: default number of concurrent users"""
+
+
+class Source(object):
+  """Documents in each format, loaded from files on first use.
+  """
+
+  def __init__(self, name, get_path):
+    """Create source.
+
+    :param name: name
+    :type name: str or unicode
+    :param get_path: function which returns the name of the file
+      holding the document in a given format
+    :type get_path: function
+    """
+    self.name = name
+    """str or unicode: name"""
+    self._get_path = get_path
+    self._documents = {}
+
+  def get_path(self, format):
+    """Get file holding the document in a format.
+
+    :param format: a :mod:`prov_service_tests.standards` format
+    :type format: str or unicode
+    :return: file name
+    :rtype: str or unicode
+    :raises ValueError: if the source has no document in the format
+    """
+    return self._get_path(format)
+
+  def get_bytes(self, format):
+    """Get the document in a format.
+
+    :param format: a :mod:`prov_service_tests.standards` format
+    :type format: str or unicode
+    :return: document
+    :rtype: bytes
+    :raises ValueError: if the source has no document in the format
+    """
+    if format not in self._documents:
+      with open(self.get_path(format), "rb") as f:
+        self._documents[format] = f.read()
+    return self._documents[format]
+
+
+def compile_source(name, definition, directory):
+  """Compile a document source.
+
+  :param name: name
+  :type name: str or unicode
+  :param definition: ``primer``, or a mapping with ``generated``,
+    ``files`` or ``random`` key
+  :type definition: str or unicode or dict
+  :param directory: directory relative to which file names are
+    resolved
+  :type directory: str or unicode
+  :return: source
+  :rtype: :class:`Source`
+  :raises ValueError: if the definition is invalid
+  """
+  if definition == PRIMER:
+    def get_path(format):
+      return os.path.join(DOCUMENTS_DIRECTORY,
+                          ServiceTestCase.PRIMER_DOCUMENTS[format])
+  elif isinstance(definition, dict) and "generated" in definition:
+    parameters = generator.Parameters.parse(str(definition["generated"]))
+
+    def get_path(format):
+      return generator.generate(format, parameters)
+  elif isinstance(definition, dict) and "files" in definition:
+    files = dict([(format, os.path.join(directory, path))
+                  for format, path in definition["files"].items()])
+
+    def get_path(format):
+      if format not in files:
+        raise ValueError("Document " + name + " has no " + format + " file")
+      return files[format]
+  elif isinstance(definition, dict) and "random" in definition:
+    graph = definition["random"]
+    nodes, degree = int(graph["nodes"]), int(graph["degree"])
+    seed = int(graph.get("seed", randomgraph.DEFAULT_SEED))
+
+    def get_path(format):
+      return randomgraph.CACHE.fetch(nodes, degree, seed, format)
+  else:
+    raise ValueError("Document " + name + " must be " + PRIMER +
+                     ", generated, files or random")
+  return Source(name, get_path)
+
+
+def check_format(format):
+  """Check a format is supported.
+
+  :param format: format
+  :type format: str or unicode
+  :return: format
+  :rtype: str or unicode
+  :raises ValueError: if it is not a :mod:`prov_service_tests.standards`
+    format
+  """
+  if format not in standards.FORMATS:
+    raise ValueError("Unknown format " + str(format) + ", expected one of " +
+                     ", ".join(standards.FORMATS))
+  return format
+
+
+def check_status(response, status):
+  """Check the status code of a response.
+
+  :param response: response
+  :type response: :class:`requests.Response`
+  :param status: expected status code
+  :type status: int
+  :return: error or None if the status code is as expected
+  :rtype: str or unicode
+  """
+  if response.status_code == status:
+    return None
+  return "%s %s returned %d" % (
+    response.request.method,
+    timing.endpoint_template(response.request.url),
+    response.status_code)
+
+
+def store_document(path):
+  """Submit authorized POST /store/api/v0/documents/ with a JSON
+  document loaded from a file.
+
+  :param path: file name
+  :type path: str or unicode
+  :return: URL of stored document
+  :rtype: str or unicode
+  :raises ValueError: if the response code is not 201 CREATED
+  """
+  url = os.environ[ProvStoreTestCase.URL_ENV]
+  authorization = "ApiKey " + os.environ[ProvStoreTestCase.API_KEY_ENV]
+  with io.open(path, encoding="utf-8") as f:
+    request = {"public": True,
+               "rec_id": "scenario" + str(os.getpid()),
+               "content": f.read()}
+  response = session.get_session().post(
+    url,
+    headers=ProvStoreTestCase.get_headers(standards.JSON, authorization),
+    data=json.dumps(request))
+  if response.status_code != requests.codes.created:
+    raise ValueError("POST " + path + " returned " +
+                     str(response.status_code))
+  return url + str(json.loads(response.text)["id"])
+
+
+STORED = SharedDocuments(store_document,
+                         ProvStoreTestCase.delete_shared_document)
+""":class:`prov_service_tests.test_provstore.SharedDocuments`:
+ProvStore documents fetched by scenarios, keyed by file name"""
+
+
+def compile_get_format(entry, source):
+  """Compile a ``get-format`` operation.
+
+  :param entry: operation definition
+  :type entry: dict
+  :param source: document source
+  :type source: :class:`Source`
+  :return: function which runs the operation using a random number
+    generator and returns an error or None
+  :rtype: function
+  """
+  document_url = STORED.get(source.get_path(standards.JSON))
+  urls = [document_url + "." +
+          ProvStoreTestCase.EXTENSIONS.get(format, format)
+          for format in [check_format(format) for format
+                         in entry.get("formats", standards.FORMATS)]]
+  http_session = session.get_session()
+
+  def get_format(rng):
+    return check_status(http_session.get(rng.choice(urls)),
+                        requests.codes.ok)
+
+  return get_format
+
+
+def compile_post_document(entry, source):
+  """Compile a ``post-document`` operation, see
+  :func:`compile_get_format`.
+  """
+  format = check_format(entry.get("format", standards.JSON))
+  url = os.environ[ProvStoreTestCase.URL_ENV]
+  authorization = "ApiKey " + os.environ[ProvStoreTestCase.API_KEY_ENV]
+  headers = ProvStoreTestCase.get_headers(format, authorization)
+  delete_headers = {http.AUTHORIZATION: authorization}
+  body = json.dumps({"public": True,
+                     "rec_id": "scenario" + str(os.getpid()),
+                     "content": source.get_bytes(format).decode("utf-8")})
+  http_session = session.get_session()
+
+  def post_document(rng):
+    response = http_session.post(url, headers=headers, data=body)
+    error = check_status(response, requests.codes.created)
+    if error is not None:
+      return error
+    document_url = url + str(json.loads(response.text)["id"])
+    response = http_session.delete(document_url, headers=delete_headers)
+    error = check_status(response, requests.codes.no_content)
+    if error is not None:
+      ORPHANS.add(document_url)
+    return error
+
+  return post_document
+
+
+def compile_translate(entry, source):
+  """Compile a ``translate`` operation, see :func:`compile_get_format`.
+  """
+  from_format = check_format(entry.get("from", standards.JSON))
+  to_format = check_format(entry.get("to", standards.JSON))
+  url = os.environ[ProvValidatorTestCase.URL_ENV]
+  headers = {
+    http.CONTENT_TYPE: ProvValidatorTestCase.CONTENT_TYPES[from_format],
+    http.ACCEPT: ProvValidatorTestCase.CONTENT_TYPES[to_format]}
+  body = source.get_bytes(from_format)
+  http_session = session.get_session()
+
+  def translate(rng):
+    return check_status(http_session.post(url, headers=headers, data=body),
+                        requests.codes.ok)
+
+  return translate
+
+
+def compile_validate(entry, source):
+  """Compile a ``validate`` operation, see :func:`compile_get_format`.
+  """
+  format = check_format(entry.get("format", standards.JSON))
+  url = os.environ[ProvValidatorTestCase.URL_ENV]
+  headers = {
+    http.CONTENT_TYPE: ProvValidatorTestCase.CONTENT_TYPES[format]}
+  body = source.get_bytes(format)
+  paths = ["/validation/report"] + ["/" + path.lstrip("/")
+                                    for path in entry.get("then", [])]
+  http_session = session.get_session()
+
+  def validate(rng):
+    response = http_session.post(url, headers=headers, data=body,
+                                 allow_redirects=False)
+    error = check_status(response, requests.codes.see_other)
+    if error is not None:
+      return error
+    graph_url = response.headers["location"]
+    for path in paths:
+      error = check_status(http_session.get(graph_url + path),
+                           requests.codes.ok)
+      if error is not None:
+        return error
+    return None
+
+  return validate
+
+
+OPERATIONS = {
+  "get-format": compile_get_format,
+  "post-document": compile_post_document,
+  "translate": compile_translate,
+  "validate": compile_validate
+}
+"""dict: mapping from operation names to functions which compile them"""
+
+
+def compile_think_time(definition):
+  """Compile a think time.
+
+  :param definition: seconds, or minimum and maximum seconds of a
+    uniformly distributed think time
+  :type definition: float or list of float
+  :return: function which returns a think time in seconds, given a
+    random number generator
+  :rtype: function
+  :raises ValueError: if the definition is invalid
+  """
+  if isinstance(definition, (list, tuple)):
+    if len(definition) != 2:
+      raise ValueError("think_time must be seconds or [minimum, maximum]")
+    minimum, maximum = float(definition[0]), float(definition[1])
+    return lambda rng: rng.uniform(minimum, maximum)
+  seconds = float(definition or 0)
+  return lambda rng: seconds
+
+
+class Operation(object):
+  """A compiled operation.
+  """
+
+  def __init__(self, name, weight, run):
+    self.name = name
+    """str or unicode: name"""
+    self.weight = weight
+    """float: weight"""
+    self.run = run
+    """function: runs the operation using a random number generator,
+    returning an error or None"""
+
+
+class ScenarioReport(load.LoadReport):
+  """Thread-safe collection of operation outcomes from a scenario
+  run, by operation as well as overall.
+  """
+
+  def __init__(self):
+    super(ScenarioReport, self).__init__()
+    self.operations = {}
+    """dict: mapping from operation names to latencies in seconds"""
+
+  def add(self, outcome, latency):
+    super(ScenarioReport, self).add(outcome, latency)
+    with self._lock:
+      self.operations.setdefault(outcome.name, []).append(latency)
+
+  def summarise(self):
+    """Get count and latency percentiles of each operation.
+
+    :return: mapping from operation names to ``count`` and ``latency``,
+      a mapping from ``p50``, ``p90``, ``p99`` and ``max`` to
+      milliseconds
+    :rtype: dict
+    """
+    with self._lock:
+      return dict([(name, {"count": len(latencies),
+                           "latency": timing.summarise(
+                             [latency * 1000 for latency in latencies])})
+                   for name, latencies in self.operations.items()])
+
+  def to_table(self, plan):
+    """Get count, share and latency of each operation as a text table.
+
+    :param plan: plan run
+    :type plan: :class:`Plan`
+    :return: table
+    :rtype: str or unicode
+    """
+    width = max([len("Operation")] +
+                [len(operation.name) for operation in plan.operations])
+    row = "%-" + str(width) + "s %7s %7s %7s %9s %9s"
+    lines = [row % ("Operation", "Weight", "Count", "Share", "p50 (ms)",
+                    "p99 (ms)")]
+    with self._lock:
+      total = sum([len(latencies) for latencies in self.operations.values()])
+      for operation in plan.operations:
+        latencies = self.operations.get(operation.name, [])
+        summary = timing.summarise([latency * 1000 for latency in latencies])
+        lines.append(row % (
+          operation.name, "%.1f%%" % (operation.weight / plan.total * 100),
+          len(latencies),
+          "%.1f%%" % (len(latencies) / total * 100 if total else 0),
+          "-" if summary["p50"] is None else "%.1f" % summary["p50"],
+          "-" if summary["p99"] is None else "%.1f" % summary["p99"]))
+    return "\n".join(lines)
+
+
+class Plan(object):
+  """A compiled scenario.
+  """
+
+  def __init__(self, name, operations, think_time, duration, concurrency,
+               seed=None):
+    self.name = name
+    """str or unicode: scenario name"""
+    self.operations = operations
+    """list of :class:`Operation`: operations"""
+    self.think_time = think_time
+    """function: returns a think time given a random number generator"""
+    self.duration = duration
+    """float: duration in seconds"""
+    self.concurrency = concurrency
+    """int: number of concurrent users"""
+    self.seed = seed
+    """int: random number generator seed, or None"""
+    self.cumulative = []
+    """list of float: cumulative weights of operations"""
+    total = 0
+    for operation in operations:
+      total += operation.weight
+      self.cumulative.append(total)
+    self.total = total
+    """float: total weight"""
+
+  def user(self, index, deadline, report):
+    """Run operations, with think times between them, until the
+    deadline.
+
+    :param index: user index, used to seed its random number generator
+    :type index: int
+    :param deadline: time, from :func:`prov_service_tests.timing.clock`,
+      after which no operation is started
+    :type deadline: float
+    :param report: report to which outcomes are added
+    :type report: :class:`ScenarioReport`
+    """
+    rng = random.Random(None if self.seed is None else self.seed + index)
+    operations = self.operations
+    cumulative = self.cumulative
+    total = self.total
+    think_time = self.think_time
+    while timing.clock() < deadline:
+      operation = operations[bisect.bisect_right(
+        cumulative, rng.random() * total)]
+      start = timing.clock()
+      try:
+        error = operation.run(rng)
+      except Exception as e:
+        error = type(e).__name__ + ": " + str(e)
+      latency = timing.clock() - start
+      report.add(probes.Outcome(operation.name, error, latency), latency)
+      delay = min(think_time(rng), deadline - timing.clock())
+      if delay > 0:
+        time.sleep(delay)
+
+  def run(self):
+    """Run the plan.
+
+    :return: report
+    :rtype: :class:`ScenarioReport`
+    """
+    report = ScenarioReport()
+    report.started = timing.clock()
+    deadline = report.started + self.duration
+    threads = [threading.Thread(target=self.user,
+                                args=(index, deadline, report))
+               for index in range(self.concurrency)]
+    for thread in threads:
+      thread.daemon = True
+      thread.start()
+    for thread in threads:
+      thread.join()
+    report.finished = timing.clock()
+    return report
+
+  def __str__(self):
+    lines = ["Scenario %s: %d users for %.0f s" %
+             (self.name, self.concurrency, self.duration)]
+    for operation in self.operations:
+      lines.append("  %5.1f%% %s" % (operation.weight / self.total * 100,
+                                     operation.name))
+    return "\n".join(lines)
+
+
+def get_operation_name(entry):
+  """Get the name of an operation, if not given in its definition.
+
+  :param entry: operation definition
+  :type entry: dict
+  :return: name
+  :rtype: str or unicode
+  """
+  operation = entry["operation"]
+  if operation == "translate":
+    return "translate %s %s to %s" % (entry["document"],
+                                      entry.get("from", standards.JSON),
+                                      entry.get("to", standards.JSON))
+  if operation == "get-format":
+    return "get-format %s %s" % (entry["document"],
+                                 ",".join(entry.get("formats",
+                                                    standards.FORMATS)))
+  if operation == "validate" and entry.get("then"):
+    return "validate %s then %s" % (entry["document"],
+                                    ",".join(entry["then"]))
+  return "%s %s %s" % (operation, entry["document"],
+                       entry.get("format", standards.JSON))
+
+
+def compile_scenario(scenario, directory="."):
+  """Compile a scenario into a plan. Documents fetched from ProvStore
+  are stored, see :data:`STORED`.
+
+  :param scenario: scenario
+  :type scenario: dict
+  :param directory: directory relative to which file names are
+    resolved
+  :type directory: str or unicode
+  :return: plan
+  :rtype: :class:`Plan`
+  :raises ValueError: if the scenario is invalid
+  """
+  if not isinstance(scenario, dict) or not scenario.get("mix"):
+    raise ValueError("Scenario must have a mix of operations")
+  sources = {PRIMER: compile_source(PRIMER, PRIMER, directory)}
+  for name, definition in (scenario.get("documents") or {}).items():
+    sources[name] = compile_source(name, definition, directory)
+  operations = []
+  for entry in scenario["mix"]:
+    entry = dict(entry)
+    entry.setdefault("document", PRIMER)
+    if entry.get("operation") not in OPERATIONS:
+      raise ValueError("Unknown operation " + str(entry.get("operation")) +
+                       ", expected one of " + ", ".join(sorted(OPERATIONS)))
+    if entry["document"] not in sources:
+      raise ValueError("Unknown document " + str(entry["document"]))
+    weight = float(entry.get("weight", 1))
+    if weight <= 0:
+      raise ValueError("Weight of " + entry["operation"] +
+                       " must be positive")
+    run = OPERATIONS[entry["operation"]](entry, sources[entry["document"]])
+    operations.append(Operation(entry.get("name") or
+                                get_operation_name(entry), weight, run))
+  seed = scenario.get("seed")
+  return Plan(scenario.get("name", "scenario"),
+              operations,
+              compile_think_time(scenario.get("think_time")),
+              float(scenario.get("duration", DEFAULT_DURATION)),
+              int(scenario.get("concurrency", DEFAULT_CONCURRENCY)),
+              None if seed is None else int(seed))
+
+
+def load_scenario(file_name):
+  """Load a scenario from a YAML file.
+
+  :param file_name: file name
+  :type file_name: str or unicode
+  :return: scenario
+  :rtype: dict
+  :raises ValueError: if the file is not valid YAML
+  """
+  with open(file_name) as f:
+    try:
+      return yaml.safe_load(f)
+    except yaml.YAMLError as e:
+      raise ValueError(file_name + ": " + str(e))
+
+
+def main(argv=None):
+  """Run a scenario from the command-line.
+
+  :param argv: command-line arguments, excluding program name
+  :type argv: list of str or unicode
+  :return: exit code, 0 if no operations failed, 1 otherwise
+  :rtype: int
+  """
+  parser = argparse.ArgumentParser(
+    description="Run a workload described by a YAML scenario.")
+  parser.add_argument("scenario", help="scenario file")
+  parser.add_argument("--duration", type=float,
+                      help="duration in seconds, overrides the scenario")
+  parser.add_argument("--concurrency", type=int,
+                      help="number of concurrent users, overrides the "
+                      "scenario")
+  parser.add_argument("--json", metavar="FILE",
+                      help="save report as JSON")
+  load.add_service_arguments(parser)
+  args = parser.parse_args(argv)
+  scenario = load_scenario(args.scenario)
+  if args.duration is not None:
+    scenario["duration"] = args.duration
+  if args.concurrency is not None:
+    scenario["concurrency"] = args.concurrency
+  args.workers = int(scenario.get("concurrency", DEFAULT_CONCURRENCY))
+  local_server = load.configure(args)
+  try:
+    plan = compile_scenario(scenario, os.path.dirname(args.scenario))
+    print(plan)
+    timing.TIMINGS.reset()
+    report = plan.run()
+  finally:
+    STORED.delete_all()
+    ORPHANS.delete_all()
+    if local_server is not None:
+      local_server.stop()
+  print(report.to_text())
+  print(report.to_table(plan))
+  print(session.STATISTICS)
+  print(timing.TIMINGS.to_table())
+  if args.json:
+    with open(args.json, "w") as f:
+      json.dump({"scenario": plan.name,
+                 "probes": report.report(),
+                 "operations": report.summarise(),
+                 "endpoints": timing.TIMINGS.report()},
+                f, indent=2, sort_keys=True)
+  return 1 if report.error_count else 0
+
+
+if __name__ == "__main__":
+  sys.exit(main())
@@ -0,0 +1,625 @@
+"""Local stand-in for the ProvStore and ProvValidator services.
+
+The stand-in implements the endpoints exercised by
+:mod:`prov_service_tests.test_provstore` and
+:mod:`prov_service_tests.test_provvalidator`, with enough behaviour
+for the tests to pass, so that the tests, and the load and benchmark
+modes built on them, can be run offline. It does not translate or
+validate documents: every format of a document is the document as
+submitted.
+
+ProvStore is served under ``/store/api/v0/documents/`` and
+ProvValidator under ``/validator/provapi/documents/``. Latency and
+errors can be injected into every response, to exercise the harness
+against a slow or failing service.
+
+Usage::
+
+    $ python -m prov_service_tests.server --port 8080 --latency 0.05 \
+        --error-rate 0.01
+"""
+# Copyright (c) 2015 University of Southampton
+#
+# Permission is hereby granted, free of charge, to any person
+# obtaining a copy of this software and associated documentation files
+# (the "Software"), to deal in the Software without restriction,
+# including without limitation the rights to use, copy, modify, merge,
+# publish, distribute, sublicense, and/or sell copies of the Software,
+# and to permit persons to whom the Software is furnished to do so,
+# subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be
+# included in all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND,
+# EXPRESS OR IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF
+# MERCHANTABILITY, FITNESS FOR A PARTICULAR PURPOSE AND
+# NONINFRINGEMENT. IN NO EVENT SHALL THE AUTHORS OR COPYRIGHT HOLDERS
+# BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER LIABILITY, WHETHER IN AN
+# ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM, OUT OF OR IN
+# CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+
+from __future__ import (absolute_import, division, print_function,
+                        unicode_literals)
+
+import argparse
+import collections
+import hashlib
+import itertools
+import json
+import random
+import sys
+import threading
+import time
+import uuid
+try:
+  from http.server import BaseHTTPRequestHandler
+  from http.server import HTTPServer
+  from socketserver import ThreadingMixIn
+except ImportError:
+  from BaseHTTPServer import BaseHTTPRequestHandler
+  from BaseHTTPServer import HTTPServer
+  from SocketServer import ThreadingMixIn
+
+from prov_service_tests import compression
+from prov_service_tests import http
+
+PROVSTORE_PATH = "/store/api/v0/documents/"
+"""str or unicode: path of ProvStore documents"""
+
+PROVVALIDATOR_PATH = "/validator/provapi/documents/"
+"""str or unicode: path of ProvValidator documents"""
+
+API_KEY = "user:12345qwert"
+"""str or unicode: ProvStore API key, any key is accepted"""
+
+VALIDATION_REPORT = "validation/report"
+"""str or unicode: ProvValidator validation report, which must be
+requested before any other validation-related resource"""
+
+VALIDATION_RESOURCES = ["metrics", "validation/matrix.txt",
+                        "validation/matrix.png",
+                        "validation/matrix/diagonal",
+                        "validation/normalForm"]
+"""list of str or unicode: ProvValidator validation-related
+resources, excluding normal form formats"""
+
+MAX_VALIDATOR_DOCUMENTS = 1000
+"""int: default number of ProvValidator documents kept, least recently
+used documents being evicted, so that memory use is bounded however
+many documents load and soak runs translate"""
+
+
+class Store(object):
+  """Thread-safe store of documents, keyed by document ID, optionally
+  holding at most a given number of documents, the least recently used
+  being evicted.
+  """
+
+  def __init__(self, max_documents=None):
+    """Create store.
+
+    :param max_documents: maximum number of documents, or None for no
+      maximum
+    :type max_documents: int
+    """
+    self.max_documents = max_documents
+    """int: maximum number of documents, or None"""
+    self._lock = threading.Lock()
+    self._documents = collections.OrderedDict()
+    self._ids = itertools.count(1)
+
+  def add(self, content, content_type, document_id=None):
+    """Add a document.
+
+    :param content: document
+    :type content: bytes
+    :param content_type: content type
+    :type content_type: str or unicode
+    :param document_id: ID or None to allocate the next integer ID
+    :type document_id: str or unicode
+    :return: document ID
+    :rtype: str or unicode
+    """
+    with self._lock:
+      if document_id is None:
+        document_id = str(next(self._ids))
+      self._documents[document_id] = {"content": content,
+                                      "content_type": content_type,
+                                      "validated": False}
+      if self.max_documents is not None:
+        while len(self._documents) > self.max_documents:
+          self._documents.popitem(last=False)
+    return document_id
+
+  def get(self, document_id):
+    """Get a document.
+
+    :param document_id: document ID
+    :type document_id: str or unicode
+    :return: document, with ``content``, ``content_type`` and
+      ``validated`` keys, or None if there is no such document
+    :rtype: dict
+    """
+    with self._lock:
+      document = self._documents.pop(document_id, None)
+      if document is not None:
+        # Most recently used documents are last.
+        self._documents[document_id] = document
+      return document
+
+  def remove(self, document_id):
+    """Remove a document.
+
+    :param document_id: document ID
+    :type document_id: str or unicode
+    :return: True if the document was removed, False if there is no
+      such document
+    :rtype: bool
+    """
+    with self._lock:
+      return self._documents.pop(document_id, None) is not None
+
+  def ids(self):
+    """Get document IDs.
+
+    :return: document IDs
+    :rtype: list of str or unicode
+    """
+    with self._lock:
+      return list(self._documents)
+
+
+def split_extension(segment):
+  """Split a path segment into a name and an extension.
+
+  :param segment: path segment e.g. ``123.json``
+  :type segment: str or unicode
+  :return: name and extension, or None if there is no extension
+  :rtype: tuple
+  """
+  if "." in segment:
+    name, extension = segment.split(".", 1)
+    return name, extension
+  return segment, None
+
+
+def get_bundle_ids(content):
+  """Get IDs of bundles in a PROV-JSON document.
+
+  :param content: document
+  :type content: bytes
+  :return: bundle IDs, the indices of the bundles
+  :rtype: list of int
+  """
+  try:
+    document = json.loads(content.decode("utf-8"))
+  except ValueError:
+    return []
+  if not isinstance(document, dict):
+    return []
+  return list(range(len(document.get("bundle", {}))))
+
+
+def random_document(nodes, degree, seed=None):
+  """Create a PROV-N document with a number of entities, each derived
+  from a number of randomly chosen entities.
+
+  :param nodes: number of entities
+  :type nodes: int
+  :param degree: number of derivations per entity
+  :type degree: int
+  :param seed: random number generator seed, or None for a different
+    document each time
+  :type seed: int
+  :return: document
+  :rtype: bytes
+  """
+  rng = random.Random(seed)
+  lines = ["document", "prefix ex <http://example/>"]
+  lines.extend(["entity(ex:e%d)" % node for node in range(nodes)])
+  for node in range(nodes):
+    lines.extend(["wasDerivedFrom(ex:e%d, ex:e%d)" %
+                  (node, rng.randrange(nodes)) for _ in range(degree)])
+  lines.append("endDocument")
+  return "\n".join(lines).encode("utf-8")
+
+
+class ServiceRequestHandler(BaseHTTPRequestHandler):
+  """Handler for ProvStore and ProvValidator requests. Connections are
+  kept alive between requests.
+  """
+
+  protocol_version = "HTTP/1.1"
+  disable_nagle_algorithm = True
+  # Buffer writes so headers and body are sent together.
+  wbufsize = -1
+
+  def log_message(self, format, *args):
+    pass
+
+  def respond(self, status, body=b"", content_type="application/json",
+              headers=None):
+    """Send a response. Successful responses to GET have an ``ETag``
+    and, if the request's ``If-None-Match`` matches it, 304 NOT
+    MODIFIED is sent instead.
+
+    :param status: HTTP status code
+    :type status: int
+    :param body: response body
+    :type body: bytes
+    :param content_type: content type
+    :type content_type: str or unicode
+    :param headers: additional headers
+    :type headers: dict
+    """
+    coding = self.get_response_coding() if body else None
+    headers = dict(headers or {})
+    if self.command == "GET" and status == 200:
+      etag = hashlib.sha1(body).hexdigest()[:20]
+      if coding is not None:
+        etag += "-" + coding
+      headers["ETag"] = '"' + etag + '"'
+      matches = [match.strip() for match
+                 in self.headers.get("If-None-Match", "").split(",")]
+      if headers["ETag"] in matches or "*" in matches:
+        self.send_response(304)
+        self.send_header("ETag", headers["ETag"])
+        self.end_headers()
+        return
+    if coding is not None:
+      body = compression.compress(body, coding)
+    self.send_response(status)
+    self.send_header(http.CONTENT_TYPE, content_type)
+    if coding is not None:
+      self.send_header(http.CONTENT_ENCODING, coding)
+    self.send_header("Content-Length", str(len(body)))
+    for name, value in headers.items():
+      self.send_header(name, value)
+    self.end_headers()
+    if self.command != "HEAD":
+      self.wfile.write(body)
+
+  def respond_json(self, status, value):
+    """Send a JSON response.
+
+    :param status: HTTP status code
+    :type status: int
+    :param value: value to be serialized as JSON
+    :type value: object
+    """
+    self.respond(status, json.dumps(value).encode("utf-8"))
+
+  def get_response_coding(self):
+    """Get content coding with which to compress a response, from
+    the request's ``Accept-Encoding``.
+
+    :return: one of :data:`prov_service_tests.compression.CODINGS` or
+      None
+    :rtype: str or unicode
+    """
+    accepted = []
+    for coding in self.headers.get("Accept-Encoding", "").split(","):
+      parameters = [part.strip() for part in coding.lower().split(";")]
+      if "q=0" not in parameters and "q=0.0" not in parameters:
+        accepted.append(parameters[0])
+    for coding in compression.CODINGS:
+      if coding in accepted:
+        return coding
+    return None
+
+  def read_body(self):
+    """Read the request body, which may use chunked transfer encoding
+    and may be compressed.
+
+    :return: body
+    :rtype: bytes
+    """
+    body = self.read_raw_body()
+    coding = self.get_request_coding()
+    if coding in compression.CODINGS:
+      return compression.decompress(body, coding)
+    return body
+
+  def get_request_coding(self):
+    """Get content coding of the request body.
+
+    :return: content coding
+    :rtype: str or unicode
+    """
+    return self.headers.get(http.CONTENT_ENCODING,
+                            compression.IDENTITY).strip().lower()
+
+  def read_raw_body(self):
+    """Read the request body, which may use chunked transfer encoding.
+
+    :return: body
+    :rtype: bytes
+    """
+    if self.headers.get("Transfer-Encoding", "").lower() == "chunked":
+      chunks = []
+      while True:
+        size = int(self.rfile.readline().split(b";", 1)[0].strip(), 16)
+        if size == 0:
+          # Skip any trailers up to the final empty line.
+          while self.rfile.readline().strip():
+            pass
+          return b"".join(chunks)
+        chunks.append(self.rfile.read(size))
+        self.rfile.readline()
+    length = int(self.headers.get("Content-Length", 0))
+    return self.rfile.read(length) if length else b""
+
+  def base_url(self):
+    """Get scheme and host of the server as seen by the client.
+
+    :return: URL
+    :rtype: str or unicode
+    """
+    return "http://" + self.headers.get("Host", "%s:%d" %
+                                        self.server.server_address)
+
+  def route(self):
+    """Dispatch a request to the ProvStore or ProvValidator handler,
+    responding 404 NOT FOUND to any other path. The server's injected
+    latency is applied first and, with probability of the server's
+    error rate, the request body is discarded and 503 SERVICE
+    UNAVAILABLE returned. Request bodies with an unsupported content
+    coding are answered with 415 UNSUPPORTED MEDIA TYPE.
+    """
+    latency = self.server.latency
+    if self.server.jitter:
+      latency += random.uniform(0, self.server.jitter)
+    if latency > 0:
+      time.sleep(latency)
+    if self.server.error_rate and random.random() < self.server.error_rate:
+      self.read_raw_body()
+      self.respond(503)
+      return
+    coding = self.get_request_coding()
+    if coding != compression.IDENTITY and coding not in compression.CODINGS:
+      self.read_raw_body()
+      self.respond(415)
+      return
+    path = self.path.split("?", 1)[0]
+    if path.startswith(PROVSTORE_PATH):
+      self.handle_provstore(path[len(PROVSTORE_PATH):].strip("/").split("/"))
+    elif path.startswith(PROVVALIDATOR_PATH):
+      self.handle_provvalidator(path[len(PROVVALIDATOR_PATH):])
+    else:
+      self.respond(404)
+
+  do_GET = route
+  do_POST = route
+  do_DELETE = route
+
+  def handle_provstore(self, segments):
+    """Handle a ProvStore request.
+
+    :param segments: path segments following the documents path
+    :type segments: list of str or unicode
+    """
+    store = self.server.provstore
+    if segments == [""]:
+      if self.command == "POST":
+        if http.AUTHORIZATION not in self.headers:
+          self.respond(401)
+          return
+        try:
+          request = json.loads(self.read_body().decode("utf-8"))
+          content = request["content"].encode("utf-8")
+        except (ValueError, KeyError, TypeError, AttributeError):
+          # As ProvStore does for a malformed or incomplete request.
+          self.respond(400)
+          return
+        document_id = store.add(content, self.headers.get(http.CONTENT_TYPE))
+        self.respond_json(201, {"id": int(document_id)})
+      elif self.command == "GET":
+        self.respond_json(200, {"objects": [{"id": int(document_id)}
+                                            for document_id in store.ids()]})
+      else:
+        self.respond(405)
+      return
+    document_id, extension = split_extension(segments[0])
+    document = store.get(document_id)
+    if document is None:
+      self.respond(404)
+      return
+    if self.command == "DELETE":
+      if http.AUTHORIZATION not in self.headers:
+        self.respond(401)
+      elif len(segments) == 1:
+        store.remove(document_id)
+        self.respond(204)
+      else:
+        self.respond(405)
+      return
+    if self.command != "GET":
+      self.respond(405)
+      return
+    if len(segments) == 1:
+      if extension is None:
+        self.respond_json(200, {"id": int(document_id)})
+      else:
+        self.respond(200, document["content"], document["content_type"])
+    elif segments[1] == "flattened":
+      self.respond(200, document["content"], document["content_type"])
+    elif segments[1] == "bundles":
+      bundle_ids = get_bundle_ids(document["content"])
+      if len(segments) == 2:
+        self.respond_json(200, {"objects": [{"id": bundle_id}
+                                            for bundle_id in bundle_ids]})
+        return
+      bundle_id, extension = split_extension(segments[2])
+      if not bundle_id.isdigit() or int(bundle_id) not in bundle_ids:
+        self.respond(404)
+      else:
+        self.respond(200, document["content"], document["content_type"])
+    else:
+      self.respond(404)
+
+  def handle_provvalidator(self, path):
+    """Handle a ProvValidator request.
+
+    :param path: path following the documents path
+    :type path: str or unicode
+    """
+    store = self.server.provvalidator
+    if path == "":
+      if self.command != "POST":
+        self.respond(405)
+        return
+      content_type = self.headers.get(http.CONTENT_TYPE, "")
+      document_id = store.add(self.read_body(), content_type,
+                              uuid.uuid4().hex)
+      location = self.base_url() + PROVVALIDATOR_PATH + document_id
+      self.respond(303, headers={"Location": location})
+      return
+    if self.command != "GET":
+      self.respond(405)
+      return
+    segments = path.split("/")
+    if segments[0] == "random":
+      if len(segments) in [3, 4] and all([segment.isdigit()
+                                          for segment in segments[1:]]):
+        self.respond(200, random_document(*[int(segment)
+                                            for segment in segments[1:]]),
+                     "text/provenance-notation")
+      else:
+        self.respond(404)
+      return
+    document_id, extension = split_extension(segments[0])
+    document = store.get(document_id)
+    if document is None:
+      self.respond(404)
+      return
+    resource = "/".join(segments[1:])
+    if resource in ["", "original"]:
+      self.respond(200, document["content"], document["content_type"])
+    elif resource == VALIDATION_REPORT:
+      document["validated"] = True
+      self.respond(200, b"<validationReport/>", "application/xml")
+    elif resource in VALIDATION_RESOURCES or \
+        resource.startswith("validation/normalForm."):
+      if document["validated"]:
+        self.respond(200, document["content"], document["content_type"])
+      else:
+        self.respond(404)
+    else:
+      self.respond(404)
+
+
+class ServiceServer(ThreadingMixIn, HTTPServer):
+  """Threaded HTTP server holding ProvStore and ProvValidator
+  documents.
+  """
+
+  daemon_threads = True
+  allow_reuse_address = True
+  request_queue_size = 128
+
+  def __init__(self, address=("127.0.0.1", 0), latency=0, jitter=0,
+               error_rate=0, max_documents=MAX_VALIDATOR_DOCUMENTS):
+    """Create server.
+
+    :param address: host and port, port 0 for any free port
+    :type address: tuple
+    :param latency: delay, in seconds, before each response
+    :type latency: float
+    :param jitter: maximum random delay, in seconds, added to latency
+    :type jitter: float
+    :param error_rate: fraction of requests, 0 to 1, answered with 503
+      SERVICE UNAVAILABLE
+    :type error_rate: float
+    :param max_documents: maximum number of ProvValidator documents
+      kept
+    :type max_documents: int
+    """
+    HTTPServer.__init__(self, address, ServiceRequestHandler)
+    self.provstore = Store()
+    """:class:`Store`: ProvStore documents"""
+    self.provvalidator = Store(max_documents)
+    """:class:`Store`: ProvValidator documents, the least recently used
+    being evicted"""
+    self.latency = latency
+    """float: delay, in seconds, before each response"""
+    self.jitter = jitter
+    """float: maximum random delay, in seconds, added to latency"""
+    self.error_rate = error_rate
+    """float: fraction of requests answered with 503 SERVICE
+    UNAVAILABLE"""
+    self._thread = None
+
+  @property
+  def url(self):
+    """str or unicode: base URL of server"""
+    return "http://%s:%d" % self.server_address[:2]
+
+  @property
+  def provstore_url(self):
+    """str or unicode: ProvStore URL, a value for ``PROVSTORE_URL``"""
+    return self.url + PROVSTORE_PATH
+
+  @property
+  def provvalidator_url(self):
+    """str or unicode: ProvValidator URL, a value for
+    ``PROVVALIDATOR_URL``"""
+    return self.url + PROVVALIDATOR_PATH
+
+  def start(self):
+    """Serve requests in a background thread."""
+    self._thread = threading.Thread(target=self.serve_forever)
+    self._thread.daemon = True
+    self._thread.start()
+
+  def stop(self):
+    """Stop serving requests and close the server socket."""
+    self.shutdown()
+    self.server_close()
+
+
+def main(argv=None):
+  """Run server from the command-line until interrupted.
+
+  :param argv: command-line arguments, excluding program name
+  :type argv: list of str or unicode
+  :return: exit code
+  :rtype: int
+  """
+  parser = argparse.ArgumentParser(
+    description="Local stand-in for ProvStore and ProvValidator.")
+  parser.add_argument("--host", default="127.0.0.1",
+                      help="host name or address (default 127.0.0.1)")
+  parser.add_argument("--port", type=int, default=8080,
+                      help="port (default 8080)")
+  parser.add_argument("--latency", type=float, default=0,
+                      help="delay, in seconds, before each response")
+  parser.add_argument("--jitter", type=float, default=0,
+                      help="maximum random delay, in seconds, added to "
+                      "latency")
+  parser.add_argument("--error-rate", type=float, default=0,
+                      help="fraction of requests answered with 503")
+  parser.add_argument("--max-documents", type=int,
+                      default=MAX_VALIDATOR_DOCUMENTS,
+                      help="maximum number of ProvValidator documents kept "
+                      "(default %d)" % MAX_VALIDATOR_DOCUMENTS)
+  args = parser.parse_args(argv)
+  service_server = ServiceServer((args.host, args.port), args.latency,
+                                 args.jitter, args.error_rate,
+                                 args.max_documents)
+  print("export %s=%s" % ("PROVSTORE_URL", service_server.provstore_url))
+  print("export %s=%s" % ("PROVVALIDATOR_URL",
+                          service_server.provvalidator_url))
+  print("export %s=%s" % ("PROVSTORE_API_KEY", API_KEY))
+  try:
+    service_server.serve_forever()
+  except KeyboardInterrupt:
+    pass
+  finally:
+    service_server.server_close()
+  return 0
+
+
+if __name__ == "__main__":
+  sys.exit(main())
@@ -0,0 +1,393 @@
+"""Shared, pooled HTTP session used by service tests.
+
+A single :class:`requests.Session` is created per process and reused
+by every request so that TCP and TLS connections to the services are
+kept alive between requests rather than being opened anew each time.
+The session's connection pool records how many connections were
+opened and how many requests reused an existing connection, and
+every request is timed by :mod:`prov_service_tests.timing`.
+
+The session is configured using optional environment variables:
+
+- ``PROV_POOL_SIZE`` - maximum number of connections kept alive per
+  host (default 10).
+- ``PROV_RETRIES`` - number of times a failed connection or
+  idempotent request is retried (default 0). Requests which fail
+  while reading the response, such as those timing out, are not
+  retried.
+- ``PROV_RETRY_BACKOFF`` - backoff factor, in seconds, between
+  retries (default 0).
+- ``PROV_CACHE_SIZE`` - maximum size, in bytes, of responses cached,
+  see :mod:`prov_service_tests.cache` (default 0, no caching).
+- ``PROV_CONNECT_TIMEOUT``, ``PROV_READ_TIMEOUT`` and
+  ``PROV_TIMEOUTS`` - connect and read timeouts, in seconds, see
+  :mod:`prov_service_tests.budget` (default 10 and 120).
+"""
+# Copyright (c) 2015 University of Southampton
+#
+# Permission is hereby granted, free of charge, to any person
+# obtaining a copy of this software and associated documentation files
+# (the "Software"), to deal in the Software without restriction,
+# including without limitation the rights to use, copy, modify, merge,
+# publish, distribute, sublicense, and/or sell copies of the Software,
+# and to permit persons to whom the Software is furnished to do so,
+# subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be
+# included in all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND,
+# EXPRESS OR IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF
+# MERCHANTABILITY, FITNESS FOR A PARTICULAR PURPOSE AND
+# NONINFRINGEMENT. IN NO EVENT SHALL THE AUTHORS OR COPYRIGHT HOLDERS
+# BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER LIABILITY, WHETHER IN AN
+# ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM, OUT OF OR IN
+# CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+
+from __future__ import (absolute_import, division, print_function,
+                        unicode_literals)
+
+import os
+import threading
+import requests
+from requests.adapters import HTTPAdapter
+try:
+  from urllib3 import connection
+  from urllib3 import connectionpool
+  from urllib3.util.retry import Retry
+except ImportError:
+  from requests.packages.urllib3 import connection
+  from requests.packages.urllib3 import connectionpool
+  from requests.packages.urllib3.util.retry import Retry
+
+from prov_service_tests import budget
+from prov_service_tests import cache
+from prov_service_tests import compression
+from prov_service_tests import http
+# Imported so that traffic is recorded if PROV_RECORD_FILE is set.
+from prov_service_tests import recording
+from prov_service_tests import timing
+
+POOL_SIZE_ENV = "PROV_POOL_SIZE"
+"""str or unicode: environment variable holding maximum number of
+connections kept alive per host
+"""
+
+RETRIES_ENV = "PROV_RETRIES"
+"""str or unicode: environment variable holding number of retries"""
+
+BACKOFF_ENV = "PROV_RETRY_BACKOFF"
+"""str or unicode: environment variable holding retry backoff factor"""
+
+DEFAULT_POOL_SIZE = 10
+"""int: default maximum number of connections kept alive per host"""
+
+DEFAULT_RETRIES = 0
+"""int: default number of retries"""
+
+DEFAULT_BACKOFF = 0
+"""float: default retry backoff factor"""
+
+
+class ConnectionStatistics(object):
+  """Thread-safe counts of requests sent and connections opened.
+  """
+
+  def __init__(self):
+    self._lock = threading.Lock()
+    self.requests = 0
+    """int: number of requests sent"""
+    self.connections = 0
+    """int: number of connections opened"""
+
+  def add_request(self):
+    """Record that a request has been sent."""
+    with self._lock:
+      self.requests += 1
+
+  def add_connection(self):
+    """Record that a new connection has been opened."""
+    with self._lock:
+      self.connections += 1
+
+  @property
+  def reused(self):
+    """int: number of requests sent over an already-open connection"""
+    return max(0, self.requests - self.connections)
+
+  def reset(self):
+    """Reset all counts to zero."""
+    with self._lock:
+      self.requests = 0
+      self.connections = 0
+
+  def merge(self, requests, connections):
+    """Add counts from elsewhere, for example another process.
+
+    :param requests: number of requests sent
+    :type requests: int
+    :param connections: number of connections opened
+    :type connections: int
+    """
+    with self._lock:
+      self.requests += requests
+      self.connections += connections
+
+  def __str__(self):
+    return "Connections: %d requests, %d opened, %d reused" % \
+        (self.requests, self.connections, self.reused)
+
+
+STATISTICS = ConnectionStatistics()
+""":class:`ConnectionStatistics`: statistics for this process"""
+
+REQUEST_OBSERVERS = []
+"""list of function: functions called with a copy of each
+:class:`requests.PreparedRequest` before it is sent"""
+
+_local = threading.local()
+
+
+def _timed_connect(connect):
+  """Record a new connection in :data:`STATISTICS` and add the time
+  taken to open it to the time spent connecting by the current
+  thread's request.
+
+  :param connect: function that opens the connection
+  :type connect: function
+  """
+  STATISTICS.add_connection()
+  start = timing.clock()
+  try:
+    connect()
+  finally:
+    _local.connect = getattr(_local, "connect", 0) + timing.clock() - start
+
+
+class CountingHTTPConnection(connection.HTTPConnection):
+  """HTTP connection which records each new connection in
+  :data:`STATISTICS` and times it.
+  """
+
+  def connect(self):
+    _timed_connect(super(CountingHTTPConnection, self).connect)
+
+
+class CountingHTTPSConnection(connection.HTTPSConnection):
+  """HTTPS connection which records each new connection in
+  :data:`STATISTICS` and times it.
+  """
+
+  def connect(self):
+    _timed_connect(super(CountingHTTPSConnection, self).connect)
+
+
+class CountingHTTPConnectionPool(connectionpool.HTTPConnectionPool):
+  """HTTP connection pool of :class:`CountingHTTPConnection`."""
+  ConnectionCls = CountingHTTPConnection
+
+
+class CountingHTTPSConnectionPool(connectionpool.HTTPSConnectionPool):
+  """HTTPS connection pool of :class:`CountingHTTPSConnection`."""
+  ConnectionCls = CountingHTTPSConnection
+
+
+class PoolingHTTPAdapter(HTTPAdapter):
+  """Transport adapter whose connection pools count the connections
+  they open and which counts and times the requests it sends. Unless
+  a response is streamed, its content is read before the request's
+  :class:`prov_service_tests.timing.Sample` is recorded. The sample
+  of a streamed response is recorded when it is consumed by
+  :func:`prov_service_tests.streaming.consume`. Request bodies may be
+  compressed, see :mod:`prov_service_tests.compression`, and responses
+  cached, see :mod:`prov_service_tests.cache`.
+  """
+
+  def init_poolmanager(self, *args, **kwargs):
+    super(PoolingHTTPAdapter, self).init_poolmanager(*args, **kwargs)
+    self.poolmanager.pool_classes_by_scheme = {
+      "http": CountingHTTPConnectionPool,
+      "https": CountingHTTPSConnectionPool
+    }
+
+  coding = None
+  """str or unicode: content coding with which request bodies are
+  compressed, one of :data:`prov_service_tests.compression.CODINGS`,
+  or None"""
+
+  cache = None
+  """:class:`prov_service_tests.cache.ResponseCache`: cache of
+  responses, or None"""
+
+  timeouts = None
+  """:class:`prov_service_tests.budget.Timeouts`: connect and read
+  timeouts by endpoint, or None"""
+
+  def compress(self, request):
+    """Compress the body of a request, unless it is empty, streamed,
+    already encoded or its endpoint has refused compressed bodies.
+
+    :param request: request
+    :type request: :class:`requests.PreparedRequest`
+    :return: uncompressed body or None if the body was not compressed
+    :rtype: bytes
+    """
+    body = request.body
+    if (self.coding is None or not body or
+        http.CONTENT_ENCODING in request.headers or
+        request.method + " " + timing.endpoint_template(request.url)
+        in compression.REFUSED):
+      return None
+    if isinstance(body, type("")):
+      body = body.encode("utf-8")
+    if not isinstance(body, bytes):
+      return None
+    request.body = compression.compress(body, self.coding)
+    request.headers[http.CONTENT_ENCODING] = self.coding
+    request.headers["Content-Length"] = str(len(request.body))
+    return body
+
+  def send(self, request, stream=False, timeout=None, **kwargs):
+    kwargs["timeout"] = budget.get_timeout(
+      self.timeouts, request.method, request.url, timeout)
+    for observer in list(REQUEST_OBSERVERS):
+      observer(request.copy())
+    try:
+      if self.cache is None or stream:
+        return self.send_timed(request, stream=stream, **kwargs)
+      return self.cache.send(
+        request, lambda: self.send_timed(request, **kwargs), self)
+    except requests.exceptions.RequestException:
+      # A timeout cut short by the run deadline is reported as such.
+      budget.check_deadline(request.method)
+      raise
+
+  def send_timed(self, request, stream=False, **kwargs):
+    """Send a request, counting and timing it, and compressing its
+    body if configured to do so.
+
+    :param request: request
+    :type request: :class:`requests.PreparedRequest`
+    :param stream: if True, do not read the response body
+    :type stream: bool
+    :return: response
+    :rtype: :class:`requests.Response`
+    """
+    uncompressed = self.compress(request)
+    STATISTICS.add_request()
+    _local.connect = 0
+    start = timing.clock()
+    response = super(PoolingHTTPAdapter, self).send(
+      request, stream=stream, **kwargs)
+    if (uncompressed is not None and
+        response.status_code == requests.codes.unsupported_media_type):
+      # Send again uncompressed, and stop compressing for this endpoint.
+      response.content
+      response.close()
+      compression.REFUSED.add(
+        request.method + " " + timing.endpoint_template(request.url))
+      request.body = uncompressed
+      del request.headers[http.CONTENT_ENCODING]
+      request.headers["Content-Length"] = str(len(uncompressed))
+      return self.send_timed(request, stream=stream, **kwargs)
+    sample = timing.Sample(request.method,
+                           request.url,
+                           response.status_code,
+                           _local.connect,
+                           timing.clock() - start,
+                           None,
+                           start)
+    # Chunked uploads have no Content-Length but count what they send.
+    sample.sent = int(request.headers.get("Content-Length", 0)) or \
+        getattr(request.body, "length", 0)
+    sample.encoding = response.headers.get(http.CONTENT_ENCODING)
+    sample.request = request
+    sample.response = response
+    if stream:
+      # Recorded by prov_service_tests.streaming.consume.
+      response.pending_sample = sample
+    else:
+      # Read content so the total time includes the response body.
+      sample.received = len(response.content)
+      sample.wire = get_wire_length(response, sample.received)
+      sample.total = timing.clock() - start
+      timing.record(sample)
+    return response
+
+
+def get_wire_length(response, default):
+  """Get number of bytes of a response body read from the connection,
+  before any content encoding was decoded.
+
+  :param response: response whose body has been read
+  :type response: :class:`requests.Response`
+  :param default: value if the number of bytes is not known
+  :type default: int
+  :return: bytes
+  :rtype: int
+  """
+  tell = getattr(response.raw, "tell", None)
+  try:
+    return tell() if tell is not None else default
+  except (IOError, OSError, ValueError):
+    return default
+
+
+def create_session():
+  """Create a session configured from the ``PROV_POOL_SIZE``,
+  ``PROV_RETRIES``, ``PROV_RETRY_BACKOFF``, ``PROV_COMPRESSION``,
+  ``PROV_CACHE_SIZE`` and timeout environment variables, see
+  :mod:`prov_service_tests.budget`.
+
+  :return: session
+  :rtype: :class:`requests.Session`
+  :raises ValueError: if an environment variable is not a number or
+    a supported content coding, or timeouts are invalid
+  """
+  coding = compression.get_coding()
+  pool_size = int(os.environ.get(POOL_SIZE_ENV, DEFAULT_POOL_SIZE))
+  retries = int(os.environ.get(RETRIES_ENV, DEFAULT_RETRIES))
+  backoff = float(os.environ.get(BACKOFF_ENV, DEFAULT_BACKOFF))
+  # Read errors are not retried, as by default in requests, so that
+  # read timeouts surface as ReadTimeout rather than ConnectionError.
+  retry = Retry(total=retries,
+                read=False,
+                backoff_factor=backoff,
+                raise_on_redirect=False,
+                raise_on_status=False)
+  adapter = PoolingHTTPAdapter(pool_connections=pool_size,
+                               pool_maxsize=pool_size,
+                               max_retries=retry)
+  http_session = requests.Session()
+  if coding is not None:
+    http_session.headers["Accept-Encoding"] = coding
+    if coding in compression.CODINGS:
+      adapter.coding = coding
+  adapter.cache = cache.create_cache()
+  adapter.timeouts = budget.create_timeouts()
+  http_session.mount("http://", adapter)
+  http_session.mount("https://", adapter)
+  return http_session
+
+
+_session = None
+_session_pid = None
+_session_lock = threading.Lock()
+
+
+def get_session():
+  """Get the session for this process, creating it if necessary. A
+  new session is created in a process forked after the session was
+  created, so that processes do not share connections.
+
+  :return: session
+  :rtype: :class:`requests.Session`
+  """
+  global _session, _session_pid
+  with _session_lock:
+    if _session is None or _session_pid != os.getpid():
+      _session = create_session()
+      _session_pid = os.getpid()
+      STATISTICS.reset()
+    return _session
@@ -0,0 +1,197 @@
+"""Response size and transfer rate accounting by format.
+
+Every successful GET of a document in one of
+:data:`prov_service_tests.standards.FORMATS`, as identified by the
+extension of the request URL, is passed to :data:`SIZES`, which
+totals the bytes received on the wire, the bytes once any content
+encoding has been decoded, the content encodings used and the time
+taken, so that the serializations can be compared for size and
+speed.
+"""
+# Copyright (c) 2015 University of Southampton
+#
+# Permission is hereby granted, free of charge, to any person
+# obtaining a copy of this software and associated documentation files
+# (the "Software"), to deal in the Software without restriction,
+# including without limitation the rights to use, copy, modify, merge,
+# publish, distribute, sublicense, and/or sell copies of the Software,
+# and to permit persons to whom the Software is furnished to do so,
+# subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be
+# included in all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND,
+# EXPRESS OR IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF
+# MERCHANTABILITY, FITNESS FOR A PARTICULAR PURPOSE AND
+# NONINFRINGEMENT. IN NO EVENT SHALL THE AUTHORS OR COPYRIGHT HOLDERS
+# BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER LIABILITY, WHETHER IN AN
+# ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM, OUT OF OR IN
+# CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+
+from __future__ import (absolute_import, division, print_function,
+                        unicode_literals)
+
+import threading
+
+from prov_service_tests import standards
+from prov_service_tests import timing
+
+EXTENSIONS = {
+  "xml": standards.PROVX
+}
+"""dict: mapping from file extensions, other than those in
+:data:`prov_service_tests.standards.FORMATS`, to formats
+"""
+
+IDENTITY = "identity"
+"""str or unicode: content encoding of responses without a
+``Content-Encoding``
+"""
+
+
+def get_format(sample):
+  """Get format of the document requested by a sample.
+
+  :param sample: sample
+  :type sample: :class:`prov_service_tests.timing.Sample`
+  :return: a :mod:`prov_service_tests.standards` format or None if
+    the URL has no recognised extension
+  :rtype: str or unicode
+  """
+  segment = sample.template.rstrip("/").split("/")[-1]
+  if "." not in segment:
+    return None
+  extension = segment.rsplit(".", 1)[1]
+  if extension in standards.FORMATS:
+    return extension
+  return EXTENSIONS.get(extension)
+
+
+class FormatSizes(object):
+  """Thread-safe totals of response sizes and times by format.
+  """
+
+  def __init__(self):
+    self._lock = threading.Lock()
+    self._sizes = {}
+
+  def add(self, sample):
+    """Add a sample, if it is a successful GET of a document in a
+    recognised format. 304 NOT MODIFIED responses, which have no body,
+    are not added.
+
+    :param sample: sample
+    :type sample: :class:`prov_service_tests.timing.Sample`
+    """
+    format = get_format(sample)
+    if sample.method != "GET" or sample.status >= 300 or format is None:
+      return
+    with self._lock:
+      if format not in self._sizes:
+        self._sizes[format] = {"count": 0, "wire": 0, "decoded": 0,
+                               "seconds": 0.0, "encodings": {}}
+      sizes = self._sizes[format]
+      sizes["count"] += 1
+      sizes["wire"] += sample.wire
+      sizes["decoded"] += sample.received
+      sizes["seconds"] += sample.total
+      encoding = sample.encoding or IDENTITY
+      sizes["encodings"][encoding] = sizes["encodings"].get(encoding, 0) + 1
+
+  def reset(self):
+    """Remove all samples."""
+    with self._lock:
+      self._sizes = {}
+
+  def snapshot(self):
+    """Get a copy of the totals, for example to pass to another
+    process.
+
+    :return: totals, which can be passed to :meth:`merge`
+    :rtype: dict
+    """
+    with self._lock:
+      return dict([(format, dict(sizes, encodings=dict(sizes["encodings"])))
+                   for format, sizes in self._sizes.items()])
+
+  def merge(self, snapshot):
+    """Add totals collected elsewhere, for example by another process.
+
+    :param snapshot: totals from :meth:`snapshot`
+    :type snapshot: dict
+    """
+    with self._lock:
+      for format, other in snapshot.items():
+        if format not in self._sizes:
+          self._sizes[format] = {"count": 0, "wire": 0, "decoded": 0,
+                                 "seconds": 0.0, "encodings": {}}
+        sizes = self._sizes[format]
+        for key in ["count", "wire", "decoded", "seconds"]:
+          sizes[key] += other[key]
+        for encoding, count in other["encodings"].items():
+          sizes["encodings"][encoding] = \
+              sizes["encodings"].get(encoding, 0) + count
+
+  def report(self):
+    """Get mean sizes, compression ratio, mean time and transfer rate
+    by format.
+
+    :return: mapping from format to ``count``, ``wire`` and
+      ``decoded`` (mean bytes), ``ratio`` (decoded bytes per wire
+      byte), ``encodings`` (mapping from content encoding to count),
+      ``mean_ms`` and ``bytes_per_second`` (wire bytes)
+    :rtype: dict
+    """
+    report = {}
+    with self._lock:
+      for format, sizes in self._sizes.items():
+        count = sizes["count"]
+        seconds = sizes["seconds"]
+        report[format] = {
+          "count": count,
+          "wire": sizes["wire"] / count,
+          "decoded": sizes["decoded"] / count,
+          "ratio": sizes["decoded"] / sizes["wire"] if sizes["wire"] else None,
+          "encodings": dict(sizes["encodings"]),
+          "mean_ms": seconds * 1000 / count,
+          "bytes_per_second": sizes["wire"] / seconds if seconds > 0 else None
+        }
+    return report
+
+  def to_table(self):
+    """Get report as a text table.
+
+    :return: table
+    :rtype: str or unicode
+    """
+    report = self.report()
+    row = "%-6s %6s %12s %12s %6s %9s %10s  %s"
+    lines = [row % ("Format", "Count", "Wire (B)", "Decoded (B)", "Ratio",
+                    "Mean (ms)", "KB/s", "Encodings")]
+    for format in sorted(report):
+      sizes = report[format]
+      ratio = sizes["ratio"]
+      rate = sizes["bytes_per_second"]
+      lines.append(row % (
+        format, sizes["count"], "%.0f" % sizes["wire"],
+        "%.0f" % sizes["decoded"],
+        "-" if ratio is None else "%.2f" % ratio,
+        "%.1f" % sizes["mean_ms"],
+        "-" if rate is None else "%.1f" % (rate / 1024),
+        ", ".join(["%s %d" % (encoding, count) for encoding, count
+                   in sorted(sizes["encodings"].items())])))
+    return "\n".join(lines)
+
+  def __len__(self):
+    with self._lock:
+      return len(self._sizes)
+
+
+SIZES = FormatSizes()
+""":class:`FormatSizes`: response sizes collected in this process, an
+observer in :data:`prov_service_tests.timing.OBSERVERS`
+"""
+
+timing.OBSERVERS.append(SIZES.add)
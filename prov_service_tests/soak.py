@@ -0,0 +1,449 @@
+"""Soak test the harness for memory and resource leaks.
+
+The ProvStore create, fetch and delete flows and the ProvValidator
+translate and validate flows, see :mod:`prov_service_tests.probes`,
+are run in a loop, for hours if need be, as they would be by a
+long-running probe. At regular intervals, the harness's resident set
+size (RSS), open file descriptors, open sockets and, where
+:mod:`tracemalloc` is available, memory allocated by Python are
+sampled. Once a warm-up period has passed, the first sample becomes
+the baseline. At the end of the run, the last sample is compared to
+the baseline and the run fails if any has grown beyond a threshold.
+The allocators whose memory grew most are reported.
+
+Documents which tests may have failed to delete, see
+:data:`prov_service_tests.test_provstore.ORPHANS`, are deleted in
+bulk at each sample and at the end of the run.
+
+With ``--local``, the stand-in server runs in the soak process and
+the documents it stores count as growth, so to soak test against the
+stand-in, run it in its own process with ``python -m
+prov_service_tests.server``.
+
+Latencies, sizes and cache outcomes, which are collected for the
+whole of a normal run, are reset at each sample, so that only the
+last interval's are reported, as their growth is by design.
+
+Usage::
+
+    $ python -m prov_service_tests.soak --duration 14400 --interval 60
+"""
+# Copyright (c) 2015 University of Southampton
+#
+# Permission is hereby granted, free of charge, to any person
+# obtaining a copy of this software and associated documentation files
+# (the "Software"), to deal in the Software without restriction,
+# including without limitation the rights to use, copy, modify, merge,
+# publish, distribute, sublicense, and/or sell copies of the Software,
+# and to permit persons to whom the Software is furnished to do so,
+# subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be
+# included in all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND,
+# EXPRESS OR IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF
+# MERCHANTABILITY, FITNESS FOR A PARTICULAR PURPOSE AND
+# NONINFRINGEMENT. IN NO EVENT SHALL THE AUTHORS OR COPYRIGHT HOLDERS
+# BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER LIABILITY, WHETHER IN AN
+# ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM, OUT OF OR IN
+# CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+
+from __future__ import (absolute_import, division, print_function,
+                        unicode_literals)
+
+import argparse
+import gc
+import json
+import os
+import sys
+try:
+  import resource
+except ImportError:
+  resource = None
+try:
+  import tracemalloc
+except ImportError:
+  tracemalloc = None
+
+from prov_service_tests import benchmark
+from prov_service_tests import cache
+from prov_service_tests import load
+from prov_service_tests import probes
+from prov_service_tests import session
+from prov_service_tests import sizes
+from prov_service_tests import streaming
+from prov_service_tests import timing
+from prov_service_tests.test_provstore import ORPHANS
+from prov_service_tests.test_provstore import SHARED
+
+DEFAULT_PATTERNS = ["post-document", "fetch-formats",
+                    "ProvStoreTestCase.test_delete_document",
+                    "translate-matrix", "validation-report"]
+"""list of str or unicode: flows and probe name patterns run by
+default"""
+
+DEFAULT_DURATION = 4 * 60 * 60
+"""float: default duration in seconds"""
+
+DEFAULT_INTERVAL = 60
+"""float: default time, in seconds, between samples"""
+
+DEFAULT_WARMUP = 300
+"""float: default time, in seconds, before the baseline is sampled"""
+
+DEFAULT_THRESHOLD = 0.2
+"""float: default fraction by which RSS and allocated memory may grow
+before the run fails"""
+
+DEFAULT_FD_THRESHOLD = 10
+"""int: default number by which open file descriptors and sockets may
+grow before the run fails"""
+
+DEFAULT_TOP = 10
+"""int: default number of allocators reported"""
+
+FD_DIRECTORIES = ["/proc/self/fd", "/dev/fd"]
+"""list of str or unicode: directories listing open file descriptors,
+in order of preference"""
+
+
+def get_rss():
+  """Get current resident set size of this process. Where this is
+  not available, the peak is used.
+
+  :return: bytes or None if not available on this platform
+  :rtype: int
+  """
+  try:
+    with open("/proc/self/statm") as f:
+      return int(f.read().split()[1]) * resource.getpagesize()
+  except (IOError, OSError, IndexError, ValueError, AttributeError):
+    return benchmark.get_peak_rss()
+
+
+def get_open_files():
+  """Get number of open file descriptors, and how many of those are
+  sockets, of this process.
+
+  :return: file descriptors and sockets, either None if not available
+    on this platform
+  :rtype: tuple of (int, int)
+  """
+  for directory in FD_DIRECTORIES:
+    try:
+      names = os.listdir(directory)
+    except OSError:
+      continue
+    sockets = 0
+    for name in names:
+      try:
+        if os.readlink(os.path.join(directory, name)).startswith("socket:"):
+          sockets += 1
+      except OSError:
+        # Closed since listed, or not a link e.g. on OS X.
+        pass
+    return len(names), sockets if directory == FD_DIRECTORIES[0] else None
+  return None, None
+
+
+class ResourceSample(object):
+  """Resources used by this process at a point in a soak run.
+  """
+
+  def __init__(self, elapsed, iterations, failures):
+    self.elapsed = elapsed
+    """float: seconds since the run started"""
+    self.iterations = iterations
+    """int: number of times all probes have been run"""
+    self.failures = failures
+    """int: number of probes which have failed"""
+    self.rss = get_rss()
+    """int: resident set size in bytes, or None"""
+    self.fds, self.sockets = get_open_files()
+    self.traced = None
+    """int: bytes allocated by Python, or None if not traced"""
+    if tracemalloc is not None and tracemalloc.is_tracing():
+      self.traced = tracemalloc.get_traced_memory()[0]
+    self.orphans = len(ORPHANS)
+    """int: number of documents which may not have been deleted"""
+
+  def to_dict(self):
+    """Get sample as a dictionary.
+
+    :return: sample
+    :rtype: dict
+    """
+    return {"elapsed": self.elapsed,
+            "iterations": self.iterations,
+            "failures": self.failures,
+            "rss": self.rss,
+            "fds": self.fds,
+            "sockets": self.sockets,
+            "traced": self.traced,
+            "orphans": self.orphans}
+
+
+def get_growth(baseline, sample, threshold, fd_threshold):
+  """Compare a sample to the baseline.
+
+  :param baseline: baseline sample
+  :type baseline: :class:`ResourceSample`
+  :param sample: sample
+  :type sample: :class:`ResourceSample`
+  :param threshold: fraction by which RSS and allocated memory may grow
+  :type threshold: float
+  :param fd_threshold: number by which file descriptors and sockets
+    may grow
+  :type fd_threshold: int
+  :return: descriptions of resources which grew beyond their threshold
+  :rtype: list of str or unicode
+  """
+  growth = []
+  for name, label in [("rss", "RSS"), ("traced", "Allocated memory")]:
+    before = getattr(baseline, name)
+    after = getattr(sample, name)
+    if before and after is not None and \
+        (after - before) / before > threshold:
+      growth.append("%s grew from %.1f MB to %.1f MB (%+.1f%%)" %
+                    (label, before / 1048576, after / 1048576,
+                     (after - before) / before * 100))
+  for name, label in [("fds", "Open file descriptors"),
+                      ("sockets", "Open sockets")]:
+    before = getattr(baseline, name)
+    after = getattr(sample, name)
+    if before is not None and after is not None and \
+        after - before > fd_threshold:
+      growth.append("%s grew from %d to %d" % (label, before, after))
+  return growth
+
+
+def get_top_allocators(baseline, snapshot, top):
+  """Get the source lines whose allocated memory grew most between
+  two :mod:`tracemalloc` snapshots.
+
+  :param baseline: earlier snapshot
+  :type baseline: :class:`tracemalloc.Snapshot`
+  :param snapshot: later snapshot
+  :type snapshot: :class:`tracemalloc.Snapshot`
+  :param top: number of source lines
+  :type top: int
+  :return: descriptions of source lines and their growth
+  :rtype: list of str or unicode
+  """
+  filters = [tracemalloc.Filter(False, tracemalloc.__file__),
+             tracemalloc.Filter(False, "<frozen importlib._bootstrap>")]
+  statistics = snapshot.filter_traces(filters).compare_to(
+    baseline.filter_traces(filters), "lineno")
+  return [str(statistic) for statistic in statistics[:top]
+          if statistic.size_diff > 0]
+
+
+def reset_collectors():
+  """Reset collectors whose growth during a run is by design."""
+  timing.TIMINGS.reset()
+  sizes.SIZES.reset()
+  cache.STATISTICS.reset()
+  streaming.TRANSFERS.reset()
+
+
+def format_sample(sample):
+  """Format a sample as a line of text.
+
+  :param sample: sample
+  :type sample: :class:`ResourceSample`
+  :return: text
+  :rtype: str or unicode
+  """
+  def megabytes(value):
+    return "-" if value is None else "%.1f" % (value / 1048576)
+
+  def count(value):
+    return "-" if value is None else str(value)
+
+  return "%8.0f %10d %8d %9s %10s %5s %7s %7s" % (
+    sample.elapsed, sample.iterations, sample.failures,
+    megabytes(sample.rss), megabytes(sample.traced), count(sample.fds),
+    count(sample.sockets), sample.orphans)
+
+
+HEADER = "%8s %10s %8s %9s %10s %5s %7s %7s" % (
+  "Time (s)", "Iterations", "Failures", "RSS (MB)", "Alloc (MB)", "FDs",
+  "Sockets", "Orphans")
+"""str or unicode: header of lines formatted by :func:`format_sample`"""
+
+
+class SoakReport(object):
+  """Outcome of a soak run.
+  """
+
+  def __init__(self):
+    self.samples = []
+    """list of :class:`ResourceSample`: samples, in order"""
+    self.baseline = None
+    """:class:`ResourceSample`: baseline sample"""
+    self.growth = []
+    """list of str or unicode: resources which grew beyond their
+    threshold"""
+    self.allocators = []
+    """list of str or unicode: source lines whose allocated memory
+    grew most"""
+    self.orphans = []
+    """list of str or unicode: URLs of documents which may still not
+    have been deleted"""
+
+  def to_dict(self):
+    """Get report as a dictionary.
+
+    :return: report
+    :rtype: dict
+    """
+    return {"samples": [sample.to_dict() for sample in self.samples],
+            "baseline": self.baseline.to_dict() if self.baseline else None,
+            "growth": self.growth,
+            "allocators": self.allocators,
+            "orphans_deleted": ORPHANS.deleted,
+            "orphans": self.orphans}
+
+
+def run(selected, duration, interval, warmup, threshold, fd_threshold,
+        top, output=sys.stderr):
+  """Run probes in a loop, sampling resource usage.
+
+  :param selected: probes
+  :type selected: list of :class:`prov_service_tests.probes.Probe`
+  :param duration: duration in seconds
+  :type duration: float
+  :param interval: time, in seconds, between samples
+  :type interval: float
+  :param warmup: time, in seconds, before the baseline is sampled
+  :type warmup: float
+  :param threshold: fraction by which RSS and allocated memory may grow
+  :type threshold: float
+  :param fd_threshold: number by which file descriptors and sockets
+    may grow
+  :type fd_threshold: int
+  :param top: number of allocators reported
+  :type top: int
+  :param output: file to which each sample is written as it is taken
+  :type output: file
+  :return: report
+  :rtype: :class:`SoakReport`
+  """
+  report = SoakReport()
+  if tracemalloc is not None:
+    tracemalloc.start()
+  baseline_snapshot = None
+  start = timing.clock()
+  next_sample = start + interval
+  iterations = 0
+  failures = 0
+  print(HEADER, file=output)
+  try:
+    while True:
+      for probe in selected:
+        outcome = probe.run()
+        if not outcome.success and not outcome.skipped:
+          failures += 1
+      iterations += 1
+      now = timing.clock()
+      finished = now - start >= duration
+      if now < next_sample and not finished:
+        continue
+      next_sample = now + interval
+      ORPHANS.delete_all()
+      reset_collectors()
+      gc.collect()
+      sample = ResourceSample(now - start, iterations, failures)
+      report.samples.append(sample)
+      print(format_sample(sample), file=output)
+      if report.baseline is None and (now - start >= warmup or finished):
+        report.baseline = sample
+        if tracemalloc is not None:
+          baseline_snapshot = tracemalloc.take_snapshot()
+      if finished:
+        break
+    report.growth = get_growth(report.baseline, report.samples[-1],
+                               threshold, fd_threshold)
+    if baseline_snapshot is not None:
+      report.allocators = get_top_allocators(
+        baseline_snapshot, tracemalloc.take_snapshot(), top)
+  finally:
+    if tracemalloc is not None:
+      tracemalloc.stop()
+  report.orphans = ORPHANS.urls
+  return report
+
+
+def main(argv=None):
+  """Run soak test from the command-line.
+
+  :param argv: command-line arguments, excluding program name
+  :type argv: list of str or unicode
+  :return: exit code, 0 if no resource grew beyond its threshold, 1
+    otherwise
+  :rtype: int
+  """
+  parser = argparse.ArgumentParser(
+    description="Soak test the harness for memory and resource leaks.")
+  parser.add_argument("patterns", nargs="*", metavar="probe",
+                      help="flow name (%s) or probe name pattern, default "
+                      "the ProvStore create, fetch and delete and "
+                      "ProvValidator translate and validate flows" %
+                      ", ".join(sorted(probes.FLOWS)))
+  parser.add_argument("--duration", type=float, default=DEFAULT_DURATION,
+                      help="duration in seconds (default %d)" %
+                      DEFAULT_DURATION)
+  parser.add_argument("--interval", type=float, default=DEFAULT_INTERVAL,
+                      help="time, in seconds, between samples (default %d)"
+                      % DEFAULT_INTERVAL)
+  parser.add_argument("--warmup", type=float, default=DEFAULT_WARMUP,
+                      help="time, in seconds, before the baseline is "
+                      "sampled (default %d)" % DEFAULT_WARMUP)
+  parser.add_argument("--threshold", type=float, default=DEFAULT_THRESHOLD,
+                      help="fraction by which RSS and allocated memory may "
+                      "grow (default %.1f)" % DEFAULT_THRESHOLD)
+  parser.add_argument("--fd-threshold", type=int,
+                      default=DEFAULT_FD_THRESHOLD,
+                      help="number by which open file descriptors and "
+                      "sockets may grow (default %d)" % DEFAULT_FD_THRESHOLD)
+  parser.add_argument("--top", type=int, default=DEFAULT_TOP,
+                      help="number of allocators reported (default %d)" %
+                      DEFAULT_TOP)
+  parser.add_argument("--json", metavar="FILE",
+                      help="save report as JSON")
+  load.add_service_arguments(parser)
+  args = parser.parse_args(argv)
+  args.workers = 1
+  local_server = load.configure(args)
+  try:
+    selected = probes.get_probes(args.patterns or DEFAULT_PATTERNS)
+    report = run(selected, args.duration, args.interval, args.warmup,
+                 args.threshold, args.fd_threshold, args.top)
+  finally:
+    for url in SHARED.delete_all():
+      ORPHANS.add(url)
+    ORPHANS.delete_all()
+    if local_server is not None:
+      local_server.stop()
+  report.orphans = ORPHANS.urls
+  print(session.STATISTICS)
+  print("Orphaned documents: %d deleted, %d remaining" %
+        (ORPHANS.deleted, len(report.orphans)))
+  for url in report.orphans:
+    print("Warning: " + url + " may not have been deleted")
+  if report.allocators:
+    print("Allocators whose memory grew most since the baseline:")
+    for allocator in report.allocators:
+      print("  " + allocator)
+  for growth in report.growth:
+    print("Leak: " + growth)
+  if args.json:
+    with open(args.json, "w") as f:
+      json.dump(report.to_dict(), f, indent=2, sort_keys=True)
+  return 1 if report.growth else 0
+
+
+if __name__ == "__main__":
+  sys.exit(main())
@@ -0,0 +1,306 @@
+"""Streaming uploads and downloads of large documents.
+
+In streaming mode, enabled by setting ``PROV_STREAMING``, documents
+are uploaded from files using chunked transfer encoding and
+downloaded documents are consumed a chunk at a time, hashed and
+counted rather than held in memory. The number of bytes transferred,
+and the rate, are recorded in :data:`TRANSFERS` for each endpoint.
+"""
+# Copyright (c) 2015 University of Southampton
+#
+# Permission is hereby granted, free of charge, to any person
+# obtaining a copy of this software and associated documentation files
+# (the "Software"), to deal in the Software without restriction,
+# including without limitation the rights to use, copy, modify, merge,
+# publish, distribute, sublicense, and/or sell copies of the Software,
+# and to permit persons to whom the Software is furnished to do so,
+# subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be
+# included in all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND,
+# EXPRESS OR IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF
+# MERCHANTABILITY, FITNESS FOR A PARTICULAR PURPOSE AND
+# NONINFRINGEMENT. IN NO EVENT SHALL THE AUTHORS OR COPYRIGHT HOLDERS
+# BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER LIABILITY, WHETHER IN AN
+# ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM, OUT OF OR IN
+# CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+
+from __future__ import (absolute_import, division, print_function,
+                        unicode_literals)
+
+import hashlib
+import json
+import threading
+
+from prov_service_tests import session
+from prov_service_tests import timing
+
+STREAMING_ENV = "PROV_STREAMING"
+"""str or unicode: environment variable which, if set to a non-empty
+value, enables streaming mode
+"""
+
+CHUNK_SIZE = 64 * 1024
+"""int: size, in bytes or characters, of chunks read from files and
+responses"""
+
+UPLOAD = "upload"
+"""str or unicode: direction of a transfer from harness to service"""
+
+DOWNLOAD = "download"
+"""str or unicode: direction of a transfer from service to harness"""
+
+
+class Transfers(object):
+  """Thread-safe totals of bytes transferred, and time taken, by
+  direction and endpoint.
+  """
+
+  def __init__(self):
+    self._lock = threading.Lock()
+    self._transfers = {}
+
+  def add(self, direction, endpoint, length, seconds):
+    """Add a transfer.
+
+    :param direction: :data:`UPLOAD` or :data:`DOWNLOAD`
+    :type direction: str or unicode
+    :param endpoint: HTTP method and endpoint template
+    :type endpoint: str or unicode
+    :param length: number of bytes
+    :type length: int
+    :param seconds: time taken
+    :type seconds: float
+    """
+    with self._lock:
+      key = (direction, endpoint)
+      count, total_length, total_seconds = \
+          self._transfers.get(key, (0, 0, 0.0))
+      self._transfers[key] = (count + 1, total_length + length,
+                              total_seconds + seconds)
+
+  def reset(self):
+    """Remove all transfers."""
+    with self._lock:
+      self._transfers = {}
+
+  def snapshot(self):
+    """Get a copy of the totals, for example to pass to another
+    process.
+
+    :return: totals, which can be passed to :meth:`merge`
+    :rtype: dict
+    """
+    with self._lock:
+      return dict(self._transfers)
+
+  def merge(self, snapshot):
+    """Add totals collected elsewhere, for example by another process.
+
+    :param snapshot: totals from :meth:`snapshot`
+    :type snapshot: dict
+    """
+    with self._lock:
+      for key, (count, length, seconds) in snapshot.items():
+        total_count, total_length, total_seconds = \
+            self._transfers.get(key, (0, 0, 0.0))
+        self._transfers[key] = (total_count + count, total_length + length,
+                                total_seconds + seconds)
+
+  def report(self):
+    """Get transfers, bytes and bytes/second by direction and
+    endpoint.
+
+    :return: mapping from (direction, endpoint) tuples to
+      ``transfers``, ``bytes`` and ``bytes_per_second``
+    :rtype: dict
+    """
+    with self._lock:
+      return dict([(key, {"transfers": count,
+                          "bytes": length,
+                          "bytes_per_second":
+                            length / seconds if seconds > 0 else None})
+                   for key, (count, length, seconds)
+                   in self._transfers.items()])
+
+  def to_table(self):
+    """Get report as a text table.
+
+    :return: table
+    :rtype: str or unicode
+    """
+    report = self.report()
+    width = max([len("Endpoint")] + [len(key[1]) for key in report])
+    row = "%-8s %-" + str(width) + "s %6s %14s %12s"
+    lines = [row % ("", "Endpoint", "Count", "Bytes", "KB/s")]
+    for key in sorted(report):
+      transfer = report[key]
+      rate = transfer["bytes_per_second"]
+      lines.append(row % (key[0], key[1], transfer["transfers"],
+                          transfer["bytes"],
+                          "-" if rate is None else "%.1f" % (rate / 1024)))
+    return "\n".join(lines)
+
+  def __len__(self):
+    with self._lock:
+      return len(self._transfers)
+
+
+TRANSFERS = Transfers()
+""":class:`Transfers`: transfers made in this process"""
+
+
+class Upload(object):
+  """Iterable request body which reads a file in chunks, so that it
+  is sent using chunked transfer encoding, and counts the bytes sent.
+  """
+
+  def __init__(self, chunks):
+    """Create upload.
+
+    :param chunks: chunks of body
+    :type chunks: iterable of bytes
+    """
+    self._chunks = chunks
+    self.length = 0
+    """int: number of bytes sent so far"""
+
+  def __iter__(self):
+    for chunk in self._chunks:
+      self.length += len(chunk)
+      yield chunk
+
+
+def read_chunks(f, chunk_size=CHUNK_SIZE):
+  """Read a file in chunks.
+
+  :param f: file
+  :type f: file
+  :param chunk_size: chunk size
+  :type chunk_size: int
+  :return: chunks
+  :rtype: generator of bytes or str or unicode
+  """
+  while True:
+    chunk = f.read(chunk_size)
+    if not chunk:
+      return
+    yield chunk
+
+
+def upload_file(f):
+  """Create an upload of a binary file.
+
+  :param f: binary file
+  :type f: file
+  :return: upload
+  :rtype: :class:`Upload`
+  """
+  return Upload(read_chunks(f))
+
+
+def upload_json_content(f, fields):
+  """Create an upload of a JSON object whose ``content`` member is
+  the contents of a text file. The contents are escaped a chunk at a
+  time as they are sent.
+
+  :param f: text file
+  :type f: file
+  :param fields: other members of the object
+  :type fields: dict
+  :return: upload
+  :rtype: :class:`Upload`
+  """
+  def chunks():
+    yield b'{"content": "'
+    for chunk in read_chunks(f):
+      # json.dumps gives a quoted, ASCII-only string literal.
+      yield json.dumps(chunk)[1:-1].encode("ascii")
+    yield b'"'
+    for name, value in sorted(fields.items()):
+      yield (", " + json.dumps(name) + ": " +
+             json.dumps(value)).encode("utf-8")
+    yield b"}"
+  return Upload(chunks())
+
+
+def record_upload(upload, response):
+  """Record an upload in :data:`TRANSFERS`, once its response has
+  been received.
+
+  :param upload: upload
+  :type upload: :class:`Upload`
+  :param response: response
+  :type response: :class:`requests.Response`
+  """
+  TRANSFERS.add(UPLOAD,
+                response.request.method + " " +
+                timing.endpoint_template(response.request.url),
+                upload.length,
+                response.elapsed.total_seconds())
+
+
+class Download(object):
+  """Summary of a consumed response body.
+  """
+
+  def __init__(self, length, digest, seconds):
+    self.length = length
+    """int: number of bytes"""
+    self.digest = digest
+    """str or unicode: SHA-1 hex digest of body"""
+    self.seconds = seconds
+    """float: time taken to read body"""
+
+  @property
+  def bytes_per_second(self):
+    """float: transfer rate or None if no time was taken"""
+    return self.length / self.seconds if self.seconds > 0 else None
+
+
+def consume(response, chunk_size=CHUNK_SIZE, write=None):
+  """Read a streamed response body a chunk at a time, hashing and
+  counting it rather than holding it in memory. The download is
+  recorded in :data:`TRANSFERS` and, if the request was timed, its
+  :class:`prov_service_tests.timing.Sample` is recorded now that the
+  body has been read.
+
+  :param response: response to a request made with ``stream=True``
+  :type response: :class:`requests.Response`
+  :param chunk_size: chunk size
+  :type chunk_size: int
+  :param write: function called with each chunk, e.g. to write the
+    body to a file, or None
+  :type write: function
+  :return: download
+  :rtype: :class:`Download`
+  """
+  digest = hashlib.sha1()
+  length = 0
+  start = timing.clock()
+  try:
+    for chunk in response.iter_content(chunk_size):
+      digest.update(chunk)
+      length += len(chunk)
+      if write is not None:
+        write(chunk)
+  finally:
+    response.close()
+  end = timing.clock()
+  pending = getattr(response, "pending_sample", None)
+  if pending is not None:
+    response.pending_sample = None
+    pending.total = end - pending.started
+    pending.received = length
+    pending.wire = session.get_wire_length(response, length)
+    timing.record(pending)
+  download = Download(length, digest.hexdigest(), end - start)
+  TRANSFERS.add(DOWNLOAD,
+                response.request.method + " " +
+                timing.endpoint_template(response.request.url),
+                length,
+                download.seconds)
+  return download
@@ -25,17 +25,205 @@
 from __future__ import (absolute_import, division, print_function,
                         unicode_literals)
 
+import atexit
+import io
 import json
 import os
 import requests
+import threading
 import unittest
+try:
+  import queue
+except ImportError:
+  import Queue as queue
 from nose.tools import istest
 from nose_parameterized import parameterized
 
+from prov_service_tests import budget
 from prov_service_tests import http
+from prov_service_tests import session
 from prov_service_tests import standards
+from prov_service_tests import streaming
+from prov_service_tests.test_service import DOCUMENTS
 from prov_service_tests.test_service import ServiceTestCase
 
+
+class SharedDocuments(object):
+  """Per-process, thread-safe pool of documents which are each
+  created once, shared read-only by any number of tests, then deleted
+  together. Documents are keyed by file name and created on first use,
+  so that only tests which use a document fail if it cannot be
+  created.
+  """
+
+  def __init__(self, create, delete):
+    """Create pool.
+
+    :param create: function which creates a document, given its file
+      name, and returns its URL
+    :type create: function
+    :param delete: function which deletes a document, given its URL,
+      and returns True if it was deleted
+    :type delete: function
+    """
+    self._create = create
+    self._delete = delete
+    self._lock = threading.Lock()
+    self._locks = {}
+    self._urls = {}
+    self._pid = os.getpid()
+    self._registered = False
+
+  def get(self, file_name):
+    """Get URL of a document, creating it if necessary.
+
+    :param file_name: file name
+    :type file_name: str or unicode
+    :return: URL
+    :rtype: str or unicode
+    """
+    with self._lock:
+      if self._pid != os.getpid():
+        # Documents created by a parent process belong to it.
+        self._pid = os.getpid()
+        self._locks = {}
+        self._urls = {}
+        self._registered = False
+      if not self._registered:
+        # Clean up after runs, e.g. of probes, which do not call
+        # tearDownClass.
+        atexit.register(self.delete_all)
+        self._registered = True
+      lock = self._locks.setdefault(file_name, threading.Lock())
+    with lock:
+      if file_name not in self._urls:
+        url = self._create(file_name)
+        with self._lock:
+          self._urls[file_name] = url
+      return self._urls[file_name]
+
+  def delete_all(self):
+    """Delete all documents concurrently.
+
+    :return: URLs of documents which may not have been deleted
+    :rtype: list of str or unicode
+    """
+    with self._lock:
+      if self._pid != os.getpid():
+        return []
+      urls = list(self._urls.values())
+      self._urls = {}
+    return delete_documents(self._delete, urls)
+
+
+class OrphanedDocuments(object):
+  """Thread-safe record of documents which tests may have failed to
+  delete, so that they can be deleted later in bulk.
+  """
+
+  def __init__(self, delete):
+    """Create record.
+
+    :param delete: function which deletes a document, given its URL,
+      and returns True if it was deleted or no longer exists
+    :type delete: function
+    """
+    self._delete = delete
+    self._lock = threading.Lock()
+    self._urls = set()
+    self.deleted = 0
+    """int: number of documents deleted by :meth:`delete_all`"""
+
+  def add(self, url):
+    """Record a document which may not have been deleted.
+
+    :param url: URL
+    :type url: str or unicode
+    """
+    with self._lock:
+      self._urls.add(url)
+
+  @property
+  def urls(self):
+    """list of str or unicode: URLs of documents not yet deleted"""
+    with self._lock:
+      return sorted(self._urls)
+
+  def delete_all(self):
+    """Delete all documents concurrently. Documents which could not
+    be deleted remain recorded.
+
+    :return: URLs of documents which may still not have been deleted
+    :rtype: list of str or unicode
+    """
+    with self._lock:
+      urls = list(self._urls)
+      self._urls = set()
+    failed = delete_documents(self._delete, urls)
+    with self._lock:
+      self._urls.update(failed)
+      self.deleted += len(urls) - len(failed)
+    return failed
+
+  def __len__(self):
+    with self._lock:
+      return len(self._urls)
+
+
+DELETE_CONCURRENCY = 8
+"""int: maximum number of documents deleted at once"""
+
+
+def delete_documents(delete, urls, concurrency=DELETE_CONCURRENCY):
+  """Delete documents concurrently, using a bounded number of threads.
+
+  :param delete: function which deletes a document, given its URL,
+    and returns True if it was deleted
+  :type delete: function
+  :param urls: document URLs
+  :type urls: list of str or unicode
+  :param concurrency: maximum number of documents deleted at once
+  :type concurrency: int
+  :return: URLs of documents which may not have been deleted
+  :rtype: list of str or unicode
+  """
+  failed = []
+  tasks = queue.Queue()
+  for url in urls:
+    tasks.put(url)
+
+  def delete_tasks():
+    while True:
+      try:
+        url = tasks.get_nowait()
+      except queue.Empty:
+        return
+      try:
+        deleted = delete(url)
+      except Exception:
+        deleted = False
+      if not deleted:
+        failed.append(url)
+
+  threads = [threading.Thread(target=delete_tasks)
+             for _ in range(max(1, min(concurrency, len(urls))))]
+  for thread in threads:
+    thread.daemon = True
+    thread.start()
+  for thread in threads:
+    thread.join()
+  return failed
+
+
+POST_BREAKER = budget.CircuitBreaker("POST /store/api/v0/documents/")
+""":class:`prov_service_tests.budget.CircuitBreaker`: breaker guarding
+:meth:`ProvStoreTestCase.post` and
+:meth:`ProvStoreTestCase.create_shared_document`, so that tests
+needing a stored document fail immediately while ProvStore is failing
+to store documents
+"""
+
+
 @istest
 class ProvStoreTestCase(ServiceTestCase):
   """Test class for ProvStore service. These tests check that
@@ -77,6 +265,87 @@ class ProvStoreTestCase(ServiceTestCase):
   file extensions understood by ProvStore
   """
 
+  @classmethod
+  def tearDownClass(cls):
+    super(ProvStoreTestCase, cls).tearDownClass()
+    for url in SHARED.delete_all():
+      print("Warning: " + url + " may not have been deleted")
+      ORPHANS.add(url)
+
+  @classmethod
+  def get_headers(cls, format, authorization):
+    """Get headers for an authorized POST /store/api/v0/documents/.
+
+    :param format: a :mod:`prov_service_tests.standards` format
+    :type format: str or unicode
+    :param authorization: value of ``Authorization`` header
+    :type authorization: str or unicode
+    :return: headers
+    :rtype: dict
+    """
+    return {http.CONTENT_TYPE: ProvStoreTestCase.CONTENT_TYPES[format],
+            http.ACCEPT: ProvStoreTestCase.CONTENT_TYPES[standards.JSON],
+            http.AUTHORIZATION: authorization}
+
+  @classmethod
+  def create_shared_document(cls, file_name):
+    """Submit authorized POST /store/api/v0/documents/ with a JSON
+    document loaded from a ``documents`` directory, to be shared by
+    tests.
+
+    :param file_name: file name
+    :type file_name: str or unicode
+    :return: URL of stored document
+    :rtype: str or unicode
+    :raises AssertionError: if the response code is not 201 CREATED,
+      or :data:`POST_BREAKER` is open
+    """
+    url = os.environ[ProvStoreTestCase.URL_ENV]
+    authorization = "ApiKey " + os.environ[ProvStoreTestCase.API_KEY_ENV]
+    request = {"public": True,
+               "rec_id": cls.__name__ + str(os.getpid()),
+               "content": DOCUMENTS.get(file_name)[1]}
+    with POST_BREAKER:
+      response = session.get_session().post(
+        url,
+        headers=cls.get_headers(standards.JSON, authorization),
+        data=json.dumps(request))
+      if response.status_code != requests.codes.created:
+        raise cls.failureException("POST " + file_name + " returned " +
+                                   str(response.status_code))
+      return url + str(json.loads(response.text)["id"])
+
+  @classmethod
+  def delete_shared_document(cls, document_url):
+    """Submit authorized DELETE /store/api/v0/documents/:id/.
+
+    :param document_url: document URL
+    :type document_url: str or unicode
+    :return: True if the response code is 204 NO CONTENT
+    :rtype: bool
+    """
+    authorization = "ApiKey " + os.environ[ProvStoreTestCase.API_KEY_ENV]
+    response = session.get_session().delete(
+      document_url, headers={http.AUTHORIZATION: authorization})
+    return response.status_code == requests.codes.no_content
+
+  @classmethod
+  def delete_orphaned_document(cls, document_url):
+    """Submit authorized DELETE /store/api/v0/documents/:id/ for a
+    document which may already have been deleted.
+
+    :param document_url: document URL
+    :type document_url: str or unicode
+    :return: True if the response code is 204 NO CONTENT or 404 NOT
+      FOUND
+    :rtype: bool
+    """
+    authorization = "ApiKey " + os.environ[ProvStoreTestCase.API_KEY_ENV]
+    response = session.get_session().delete(
+      document_url, headers={http.AUTHORIZATION: authorization})
+    return response.status_code in [requests.codes.no_content,
+                                    requests.codes.not_found]
+
   def setUp(self):
     super(ProvStoreTestCase, self).setUp()
     self.url = os.environ[ProvStoreTestCase.URL_ENV]
@@ -87,42 +356,63 @@ class ProvStoreTestCase(ServiceTestCase):
   def tearDown(self):
     super(ProvStoreTestCase, self).tearDown()
     if self.document_url is not None:
-      response = requests.delete( \
+      response = self.session.delete( \
         self.document_url, 
         headers={http.AUTHORIZATION: self.authorization})
       if response.status_code != requests.codes.no_content:
         print("Warning: " + self.document_url + 
               " may not have been deleted")
+        ORPHANS.add(self.document_url)
 
   def post(self, document, format=standards.JSON):
     """Submit authorized POST /store/api/v0/documents/.
     The document URL is cached by the class. A test is done to check
-    that the response code is 201 CREATED.
+    that the response code is 201 CREATED. If the document is a file,
+    it is read and sent a chunk at a time, using chunked transfer
+    encoding.
     
     :param document: document in given format
-    :type document: str or unicode
+    :type document: str or unicode or text file
     :param format: a :mod:`prov_service_tests.standards` format
     :type format: str or unicode
     :return: URL of stored document
     :rtype: str or unicode
+    :raises prov_service_tests.budget.CircuitOpenError: if
+      :data:`POST_BREAKER` is open
     """
-    headers = {http.CONTENT_TYPE: ProvStoreTestCase.CONTENT_TYPES[format],
-               http.ACCEPT: ProvStoreTestCase.CONTENT_TYPES[standards.JSON],
-               http.AUTHORIZATION: self.authorization}
-    request = {"content": document, 
-               "public": True, 
+    headers = self.get_headers(format, self.authorization)
+    request = {"public": True, 
                "rec_id": self.__class__.__name__ + str(os.getpid())}
-    response = requests.post(self.url, 
-                             headers=headers, 
-                             data=json.dumps(request))
-    self.assertEqual(requests.codes.created, response.status_code)
-    response_json = json.loads(response.text)
-    return self.url + str(response_json["id"])
+    with POST_BREAKER:
+      if hasattr(document, "read"):
+        upload = streaming.upload_json_content(document, request)
+        response = self.session.post(self.url, headers=headers, data=upload)
+        streaming.record_upload(upload, response)
+      else:
+        request["content"] = document
+        response = self.session.post(self.url, 
+                                     headers=headers, 
+                                     data=json.dumps(request))
+      self.assertEqual(requests.codes.created, response.status_code)
+      response_json = json.loads(response.text)
+      return self.url + str(response_json["id"])
+
+  def get_shared_document(self, file_name):
+    """Get URL of a document shared by tests, see :data:`SHARED`,
+    creating it if necessary. The document must not be changed or
+    deleted.
+
+    :param file_name: file name
+    :type file_name: str or unicode
+    :return: URL of stored document
+    :rtype: str or unicode
+    """
+    return SHARED.get(file_name)
 
   def test_get_documents(self):
     """Test GET /store/api/v0/documents/.
     """
-    response = requests.get(self.url)
+    response = self.session.get(self.url)
     self.assertEqual(requests.codes.ok, response.status_code)
 
   @parameterized.expand(standards.FORMATS)
@@ -132,69 +422,80 @@ class ProvStoreTestCase(ServiceTestCase):
     self.document_url = self.post(self.get_primer(format), format)
     self.assertNotEqual(None, self.document_url)
 
+  @parameterized.expand(standards.FORMATS)
+  def test_post_generated_document(self, format):
+    """Test POST /store/api/v0/documents/ with a generated document,
+    see :mod:`prov_service_tests.generator`.
+    """
+    if self.streaming:
+      with io.open(self.get_generated_path(format), encoding="utf-8") as f:
+        self.document_url = self.post(f, format)
+    else:
+      self.document_url = self.post(self.get_generated_document(format),
+                                    format)
+    self.assertNotEqual(None, self.document_url)
+
   def test_delete_document(self):
     """Test DELETE /store/api/v0/documents/:id/.
     """
     self.document_url = self.post(self.get_primer(standards.JSON))
 
     headers = {http.AUTHORIZATION: self.authorization}
-    response = requests.delete(self.document_url, headers=headers)
+    response = self.session.delete(self.document_url, headers=headers)
     self.assertEqual(requests.codes.no_content, response.status_code)
     self.document_url = None
 
   def test_get_document(self):
     """Test GET /store/api/v0/documents/:id/.
     """
-    self.document_url = self.post(self.get_primer(standards.JSON))
+    document_url = self.get_shared_document("primer.json")
 
-    response = requests.get(self.document_url)
+    response = self.session.get(document_url)
     self.assertEqual(requests.codes.ok, response.status_code)
 
   @parameterized.expand(standards.FORMATS)
   def test_get_document_format(self, format):
     """Test GET /store/api/v0/documents/:id.:format.
     """
-    self.document_url = self.post(self.get_primer(standards.JSON))
+    document_url = self.get_shared_document("primer.json")
 
     # Map format to extension supported by ProvStore
     if format in ProvStoreTestCase.EXTENSIONS:
       format = ProvStoreTestCase.EXTENSIONS[format]
-    response = requests.get(self.document_url + "." + format)
+    response = self.download(document_url + "." + format)
     self.assertEqual(requests.codes.ok, response.status_code)
 
   def test_get_document_flattened(self):
     """Test GET /store/api/v0/documents/:id/flattened/.
     """
-    self.document_url = self.post(self.get_primer(standards.JSON))
+    document_url = self.get_shared_document("primer.json")
     headers = {http.ACCEPT: ProvStoreTestCase.CONTENT_TYPES[standards.PROVN]}
-    response = requests.get(self.document_url + "/flattened",
-                            headers=headers)
+    response = self.download(document_url + "/flattened",
+                             headers=headers)
     self.assertEqual(requests.codes.ok, response.status_code)
 
   def test_get_document_flattened_views_data(self):
     """Test GET /store/api/v0/documents/:id/flattened/views/data.
     """
-    self.document_url = self.post(self.get_primer(standards.JSON))
+    document_url = self.get_shared_document("primer.json")
     headers = {http.ACCEPT: ProvStoreTestCase.CONTENT_TYPES[standards.PROVN]}
-    response = requests.get(self.document_url + "/flattened/views/data",
-                            headers=headers)
+    response = self.download(document_url + "/flattened/views/data",
+                             headers=headers)
     self.assertEqual(requests.codes.ok, response.status_code)
 
   def test_get_document_bundles(self):
     """Test GET /store/api/v0/documents/:id/bundles.
     """
-    self.document_url = self.post(self.get_primer(standards.JSON))
+    document_url = self.get_shared_document("primer.json")
 
-    response = requests.get(self.document_url + "/bundles")
+    response = self.session.get(document_url + "/bundles")
     self.assertEqual(requests.codes.ok, response.status_code)
 
-  def post_bundle(self, document):
+  def get_bundle(self, file_name):
     """Submit GET /store/api/v0/documents/:doc_id/bundles/:bundle_id.
 
-    - Submit authorized POST /store/api/v0/documents/ with a document
-      that contains bundles. 
-    - Extract the document URL from HTTP response.
-    - Cache the document URL in the class.
+    - Get the URL of a shared document that contains bundles, see
+      :meth:`get_shared_document`.
     - Submit GET /store/api/v0/documents/:doc_id/bundles/ request.
     - Get the  URL of the first bundle.
     - Submit GET /store/api/v0/documents/:doc_id/bundles/:bundle_id
@@ -204,38 +505,50 @@ class ProvStoreTestCase(ServiceTestCase):
     Tests are done to check response codes and that at least one
     bundle is available.
 
-    :param document: document in JSON format
-    :type document: str or unicode
+    :param file_name: file name of document in JSON format
+    :type file_name: str or unicode
     :return: URL of bundle
     :rtype: str or unicode
     """
-    self.document_url = self.post(document)
+    document_url = self.get_shared_document(file_name)
 
-    response = requests.get(self.document_url + "/bundles")
+    response = self.session.get(document_url + "/bundles")
     self.assertEqual(requests.codes.ok, response.status_code)    
 
     response_json = json.loads(response.text)
     objects = response_json["objects"]
     self.assertTrue(len(objects) > 0, msg="Expected at least one bundle")
 
-    bundle_url = self.document_url + "/bundles/" + str(objects[0]["id"])
-    response = requests.get(bundle_url)
+    bundle_url = document_url + "/bundles/" + str(objects[0]["id"])
+    response = self.session.get(bundle_url)
     self.assertEqual(requests.codes.ok, response.status_code)
     return bundle_url
 
   def test_get_document_bundles_bundle(self):
     """Test GET /store/api/v0/documents/:doc_id/bundles/:bundle_id.
     """
-    self.post_bundle(self.get_document("bundle.json"))
+    self.get_bundle("bundle.json")
 
   @parameterized.expand(standards.FORMATS)
   def test_get_document_bundles_bundle_format(self, format):
     """Test GET /store/api/v0/documents/:doc_id/bundles/:bundle_id(.:format).
     """
-    bundle_url = self.post_bundle(self.get_document("bundle.json"))
+    bundle_url = self.get_bundle("bundle.json")
 
     # Map format to extension supported by ProvStore
     if format in ProvStoreTestCase.EXTENSIONS:
       format = ProvStoreTestCase.EXTENSIONS[format]
-    response = requests.get(bundle_url + "." + format)
+    response = self.download(bundle_url + "." + format)
     self.assertEqual(requests.codes.ok, response.status_code)
+
+
+SHARED = SharedDocuments(ProvStoreTestCase.create_shared_document,
+                         ProvStoreTestCase.delete_shared_document)
+""":class:`SharedDocuments`: ProvStore documents shared by tests in
+this process
+"""
+
+ORPHANS = OrphanedDocuments(ProvStoreTestCase.delete_orphaned_document)
+""":class:`OrphanedDocuments`: ProvStore documents which tests in this
+process may have failed to delete
+"""
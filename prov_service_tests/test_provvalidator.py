@@ -25,18 +25,174 @@
 from __future__ import (absolute_import, division, print_function,
                         unicode_literals)
 
+import atexit
+import glob
+import hashlib
 import itertools
 import json
 import os
 import requests
+import tempfile
+import threading
+import time
 import unittest
+try:
+  import fcntl
+except ImportError:
+  fcntl = None
 from nose.tools import istest
 from nose_parameterized import parameterized
 
+from prov_service_tests import budget
 from prov_service_tests import http
+from prov_service_tests import runid
 from prov_service_tests import standards
+from prov_service_tests import streaming
 from prov_service_tests.test_service import ServiceTestCase
 
+VALIDATED_MAX_AGE = 3600
+"""int: time, in seconds, after which a validated graph is validated
+again rather than reused
+"""
+
+
+class ValidatedGraph(object):
+  """Thread-safe memo of the URL of a validated graph, so that a
+  document is validated once and the graph shared by all tests which
+  need a validation report. If ``PROV_RUN_ID`` is set, the URL is also
+  shared between processes in the same run, via a file locked while
+  the document is validated. The process which started the run
+  removes the run's files when it exits, see :meth:`remove_shared`.
+  """
+
+  def __init__(self, directory=None):
+    """Create memo.
+
+    :param directory: directory holding files shared between processes,
+      default ``prov_service_tests`` in the temporary directory
+    :type directory: str or unicode
+    """
+    self.directory = directory or os.path.join(tempfile.gettempdir(),
+                                               "prov_service_tests")
+    self._lock = threading.Lock()
+    self._locks = {}
+    self._graphs = {}
+
+  def get(self, url, validate):
+    """Get URL of validated graph, validating a document if there
+    is no such graph or it is older than :data:`VALIDATED_MAX_AGE`.
+
+    :param url: ProvValidator URL
+    :type url: str or unicode
+    :param validate: function which validates a document and returns
+      the graph URL
+    :type validate: function
+    :return: graph URL
+    :rtype: str or unicode
+    """
+    with self._lock:
+      lock = self._locks.setdefault(url, threading.Lock())
+    # Only validations of the same document wait for each other.
+    with lock:
+      with self._lock:
+        graph = self._graphs.get(url)
+      if graph is None or time.time() - graph["created"] > VALIDATED_MAX_AGE:
+        run_id = os.environ.get(runid.RUN_ID_ENV)
+        if run_id:
+          graph = self._get_shared(run_id, url, validate)
+        else:
+          graph = {"url": validate(), "created": time.time()}
+        with self._lock:
+          self._graphs[url] = graph
+      return graph["url"]
+
+  def _get_shared(self, run_id, url, validate):
+    """Get validated graph shared between processes in a run.
+
+    :param run_id: run identifier
+    :type run_id: str or unicode
+    :param url: ProvValidator URL
+    :type url: str or unicode
+    :param validate: function which validates a document and returns
+      the graph URL
+    :type validate: function
+    :return: graph with ``url`` and ``created`` keys
+    :rtype: dict
+    """
+    if not os.path.isdir(self.directory):
+      try:
+        os.makedirs(self.directory)
+      except OSError:
+        if not os.path.isdir(self.directory):
+          raise
+    path = os.path.join(self.directory, "%s%s.json" % (
+      self.get_prefix(run_id),
+      hashlib.sha1(url.encode("utf-8")).hexdigest()))
+    with open(path + ".lock", "a") as lock:
+      if fcntl is not None:
+        fcntl.flock(lock.fileno(), fcntl.LOCK_EX)
+      try:
+        with open(path) as f:
+          graph = json.load(f)
+        if time.time() - graph["created"] <= VALIDATED_MAX_AGE:
+          return graph
+      except (IOError, OSError, ValueError, KeyError):
+        pass
+      graph = {"url": validate(), "created": time.time()}
+      with open(path, "w") as f:
+        json.dump(graph, f)
+      return graph
+
+  @staticmethod
+  def get_prefix(run_id):
+    """Get prefix of the names of files shared by processes in a run.
+
+    :param run_id: run identifier
+    :type run_id: str or unicode
+    :return: prefix
+    :rtype: str or unicode
+    """
+    return "validated-%s-" % hashlib.sha1(
+      run_id.encode("utf-8")).hexdigest()[:16]
+
+  def remove_shared(self, run_id=None):
+    """Remove files shared by processes in a run, and any files left
+    by earlier runs which are older than :data:`VALIDATED_MAX_AGE`.
+
+    :param run_id: run identifier, default ``PROV_RUN_ID``
+    :type run_id: str or unicode
+    """
+    run_id = run_id or os.environ.get(runid.RUN_ID_ENV)
+    prefix = self.get_prefix(run_id) if run_id else None
+    for path in glob.glob(os.path.join(self.directory, "validated-*")):
+      try:
+        if ((prefix and os.path.basename(path).startswith(prefix)) or
+            time.time() - os.path.getmtime(path) > VALIDATED_MAX_AGE):
+          os.remove(path)
+      except OSError:
+        pass
+
+  def clear(self):
+    """Forget graphs validated by this process."""
+    with self._lock:
+      self._graphs = {}
+
+
+VALIDATED = ValidatedGraph()
+""":class:`ValidatedGraph`: validated graph shared by tests"""
+
+if runid.is_run_owner():
+  # Processes which inherited the run share its files until it ends.
+  atexit.register(VALIDATED.remove_shared)
+
+VALIDATE_BREAKER = budget.CircuitBreaker("ProvValidatorTestCase.validate")
+""":class:`prov_service_tests.budget.CircuitBreaker`: breaker guarding
+:meth:`ProvValidatorTestCase.validate`, so that tests needing a
+validated graph fail immediately while ProvValidator is failing to
+validate documents
+"""
+
+
 @istest
 class ProvValidatorTestCase(ServiceTestCase):
   """Test class for ProvValidator service. These tests check that
@@ -78,7 +234,8 @@ class ProvValidatorTestCase(ServiceTestCase):
     check that the response code is 303 SEE OTHER.
   
     :param document: document in given format
-    :type document: str or unicode
+    :type document: str or unicode or bytes or binary file or
+      :class:`prov_service_tests.streaming.Upload`
     :param format: a :mod:`prov_service_tests.standards` format
     :type format: str or unicode
     :return: URL of stored document
@@ -86,7 +243,7 @@ class ProvValidatorTestCase(ServiceTestCase):
     """
     headers={http.CONTENT_TYPE: 
              ProvValidatorTestCase.CONTENT_TYPES[format]}
-    response = requests.post( \
+    response = self.session.post( \
       self.url,
       headers=headers,
       allow_redirects=False,
@@ -101,55 +258,85 @@ class ProvValidatorTestCase(ServiceTestCase):
     """
     headers = {http.CONTENT_TYPE: ProvValidatorTestCase.CONTENT_TYPES[format1],
                http.ACCEPT: ProvValidatorTestCase.CONTENT_TYPES[format2]}
-    response = requests.post(self.url, 
-                             headers=headers, 
-                             data=self.get_primer(format1))
+    response = self.session.post(self.url, 
+                                 headers=headers, 
+                                 data=self.get_primer_bytes(format1))
     self.assertEqual(requests.codes.ok, response.status_code)
 
+  @parameterized.expand(standards.FORMATS)
+  def test_translate_generated_document(self, format):
+    """Test POST /provapi/documents/ with a generated document, see
+    :mod:`prov_service_tests.generator`.
+    """
+    with open(self.get_generated_path(format), "rb") as f:
+      if self.streaming:
+        upload = streaming.upload_file(f)
+        response = self.post_translate(upload, format)
+        streaming.record_upload(upload, response)
+      else:
+        self.post_translate(f, format)
+
   def test_translate_get_document(self):
     """Test GET /provapi/documents/{docId}.
     """
-    response = self.post_translate(self.get_primer(standards.JSON),
+    response = self.post_translate(self.get_primer_bytes(standards.JSON),
                                    standards.JSON)
 
     graph_url = response.headers["location"]
-    response = requests.get(graph_url)
+    response = self.session.get(graph_url)
     self.assertEqual(requests.codes.ok, response.status_code)
 
   def test_translate_get_document_original(self):
     """Test GET /provapi/documents/{docId}/original.
     """
-    response = self.post_translate(self.get_primer(standards.JSON),
+    response = self.post_translate(self.get_primer_bytes(standards.JSON),
                                    standards.JSON)
 
     graph_url = response.headers["location"]
-    response = requests.get(graph_url + "/original")
+    response = self.session.get(graph_url + "/original")
     self.assertEqual(requests.codes.ok, response.status_code)
 
   @parameterized.expand(standards.FORMATS)
   def test_translate_get_document_type(self, format):
     """Test GET /provapi/documents/{docId}.{type}.
     """
-    response = self.post_translate(self.get_primer(standards.JSON),
+    response = self.post_translate(self.get_primer_bytes(standards.JSON),
                                    standards.JSON)
 
     graph_url = response.headers["location"]
-    response = requests.get(graph_url + "." + format)
+    response = self.download(graph_url + "." + format)
     self.assertEqual(requests.codes.ok, response.status_code)
 
   @parameterized.expand(standards.FORMATS)
   def test_post_validate(self, format):
     """Test POST /provapi/documents for validation.
     """
-    response = requests.post( \
+    response = self.session.post( \
       self.url, 
-      files={"statements": self.get_primer(format)},
+      files={"statements": self.get_primer_bytes(format)},
       data={"validate": "Validate", 
             "type": format},
       allow_redirects=True)
     self.assertEqual(requests.codes.ok, response.status_code)
 
   def validate(self):
+    """Get the URL of a validated graph, shared by all tests, see
+    :data:`VALIDATED`, validating a document using
+    :meth:`validate_document` if necessary. The graph must not be
+    changed. If :attr:`memoize` is False, a document is always
+    validated.
+
+    :return: graph URL
+    :rtype: str or unicode
+    :raises prov_service_tests.budget.CircuitOpenError: if
+      :data:`VALIDATE_BREAKER` is open
+    """
+    with VALIDATE_BREAKER:
+      if not self.memoize:
+        return self.validate_document()
+      return VALIDATED.get(self.url, self.validate_document)
+
+  def validate_document(self):
     """Submit POST /provapi/documents then GET
       /provapi/documents/{docId}/validation/report to validate
       document.
@@ -167,10 +354,10 @@ class ProvValidatorTestCase(ServiceTestCase):
     :return: graph URL
     :rtype: str or unicode
     """
-    response = self.post_translate(self.get_primer(standards.JSON),
+    response = self.post_translate(self.get_primer_bytes(standards.JSON),
                                    standards.JSON)
     graph_url = response.headers["location"]
-    response = requests.get(graph_url + "/validation/report")
+    response = self.session.get(graph_url + "/validation/report")
     self.assertEqual(requests.codes.ok, response.status_code)
     return graph_url
 
@@ -179,7 +366,7 @@ class ProvValidatorTestCase(ServiceTestCase):
     """
     graph_url = self.validate()
 
-    response = requests.get(graph_url + "/metrics")
+    response = self.session.get(graph_url + "/metrics")
     self.assertEqual(requests.codes.ok, response.status_code)
 
   @parameterized.expand(["txt", "png"])
@@ -188,7 +375,7 @@ class ProvValidatorTestCase(ServiceTestCase):
     """
     graph_url = self.validate()
 
-    response = requests.get(graph_url + "/validation/matrix." + format)
+    response = self.session.get(graph_url + "/validation/matrix." + format)
     self.assertEqual(requests.codes.ok, response.status_code)
 
   def test_get_validation_matrix_diagonal(self):
@@ -196,7 +383,7 @@ class ProvValidatorTestCase(ServiceTestCase):
     """
     graph_url = self.validate()
 
-    response = requests.get(graph_url + "/validation/matrix/diagonal")
+    response = self.session.get(graph_url + "/validation/matrix/diagonal")
     self.assertEqual(requests.codes.ok, response.status_code)
 
   def test_get_validation_normal_form(self):
@@ -204,7 +391,7 @@ class ProvValidatorTestCase(ServiceTestCase):
     """
     graph_url = self.validate()
 
-    response = requests.get(graph_url + "/validation/normalForm")
+    response = self.session.get(graph_url + "/validation/normalForm")
     self.assertEqual(requests.codes.ok, response.status_code)
 
   @parameterized.expand(standards.FORMATS)
@@ -213,17 +400,17 @@ class ProvValidatorTestCase(ServiceTestCase):
     """
     graph_url = self.validate()
 
-    response = requests.get(graph_url + "/validation/normalForm." + format)
+    response = self.download(graph_url + "/validation/normalForm." + format)
     self.assertEqual(requests.codes.ok, response.status_code)
 
   def test_get_random_nodes_degree(self):
     """Test GET /provapi/documents/random/{nodes}/{degree}.
     """
-    response = requests.get(self.url + "random/1/1")
+    response = self.session.get(self.url + "random/1/1")
     self.assertEqual(requests.codes.ok, response.status_code)
 
   def test_get_random_nodes_degree_seed(self):
     """Test GET /provapi/documents/random/{nodes}/{degree}/{seed}.
     """
-    response = requests.get(self.url + "random/1/2/3")
+    response = self.session.get(self.url + "random/1/2/3")
     self.assertEqual(requests.codes.ok, response.status_code)
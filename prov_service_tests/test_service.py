@@ -26,23 +26,119 @@ from __future__ import (absolute_import, division, print_function,
                         unicode_literals)
 
 import inspect
+import io
 import os
 import requests
 import tempfile
+import threading
+import time
 import unittest
 from nose.tools import istest
 from nose.tools import nottest
 from nose_parameterized import parameterized
 
+from prov_service_tests import budget
+from prov_service_tests import generator
+from prov_service_tests import history
+from prov_service_tests import session
+# Imported so that response sizes are recorded by format.
+from prov_service_tests import sizes
 from prov_service_tests import standards
+from prov_service_tests import streaming
+from prov_service_tests import timing
+
+DOCUMENTS_DIRECTORY = os.path.join(
+  os.path.dirname(os.path.abspath(inspect.getfile(inspect.currentframe()))),
+  "documents")
+"""str or unicode: ``documents`` directory, in the same directory as
+this module
+"""
+
+
+class DocumentCache(object):
+  """Process-wide, thread-safe cache of documents loaded from a
+  directory, keyed by file name. Each document is held both as bytes,
+  ready for upload, and as text. A cached document is reloaded if the
+  modification time of its file has changed, which is checked at most
+  once every ``check_interval`` seconds.
+  """
+
+  def __init__(self, directory, check_interval=1.0):
+    """Create cache.
+
+    :param directory: directory holding documents
+    :type directory: str or unicode
+    :param check_interval: minimum interval, in seconds, between
+      checks of a file's modification time
+    :type check_interval: float
+    """
+    self.directory = directory
+    self.check_interval = check_interval
+    self._lock = threading.Lock()
+    self._documents = {}
+
+  def get(self, file_name):
+    """Get a document.
+
+    :param file_name: file name
+    :type file_name: str or unicode
+    :return: document as bytes and as text
+    :rtype: tuple
+    :raises OSError: if there are problems accessing the directory or
+      loading the file
+    """
+    now = time.time()
+    with self._lock:
+      entry = self._documents.get(file_name)
+      if entry is not None and now - entry["checked"] < self.check_interval:
+        return entry["data"], entry["text"]
+      path = os.path.join(self.directory, file_name)
+      mtime = os.stat(path).st_mtime
+      if entry is None or entry["mtime"] != mtime:
+        with open(path, "rb") as f:
+          data = f.read()
+        entry = {"data": data, "text": data.decode("utf-8"), "mtime": mtime}
+        self._documents[file_name] = entry
+      entry["checked"] = now
+      return entry["data"], entry["text"]
+
+  def clear(self):
+    """Remove all documents from the cache."""
+    with self._lock:
+      self._documents = {}
+
+
+DOCUMENTS = DocumentCache(DOCUMENTS_DIRECTORY)
+""":class:`DocumentCache`: cache of documents in
+:data:`DOCUMENTS_DIRECTORY`
+"""
+
 
 @nottest
 class ServiceTestCase(unittest.TestCase):
 
   _multiprocess_can_split_ = True
 
+  memoize = True
+  """bool: if True, tests reuse results memoized by earlier tests, such
+  as a validated graph, rather than repeating the requests which
+  produced them. Probes run by load and monitoring tools set this to
+  False, see :class:`prov_service_tests.probes.Probe`, so that every
+  probe sends the requests of its flow."""
+
   def setUp(self):
     super(ServiceTestCase, self).setUp()
+    # The deadline starts with the first request, not the first test.
+    deadline = budget.get_deadline(start=False)
+    if deadline is not None and deadline.expired:
+      self.skipTest(str(deadline))
+    self.session = session.get_session()
+    self.streaming = bool(os.environ.get(streaming.STREAMING_ENV))
+    # Cleanups run after tearDown, so its requests are included.
+    start = timing.clock()
+    name = self.__class__.__name__ + "." + self._testMethodName
+    self.addCleanup(
+      lambda: history.DURATIONS.add(name, timing.clock() - start))
 
   PRIMER_DOCUMENTS = {
     standards.PROVN: "primer.provn",
@@ -58,6 +154,7 @@ class ServiceTestCase(unittest.TestCase):
   def get_document(self, file_name):
     """Load a document from a file relative to a ``documents``
     directory assumed to be in the same directory as the caller.
+    Documents are cached in :data:`DOCUMENTS`.
 
     :param file_name: file name
     :type file_name: str or unicode
@@ -66,11 +163,22 @@ class ServiceTestCase(unittest.TestCase):
     :raises OSError: if there are problems accessing the directory or
       loading the file 
     """
-    directory = os.path.join(
-      os.path.dirname(os.path.abspath(inspect.getfile(
-            inspect.currentframe()))), "documents")
-    with open(os.path.join(directory, file_name), "r") as f:
-          return f.read()
+    return DOCUMENTS.get(file_name)[1]
+
+  def get_document_bytes(self, file_name):
+    """Load a document, as bytes ready for upload, from a file
+    relative to a ``documents`` directory assumed to be in the same
+    directory as the caller. Documents are cached in
+    :data:`DOCUMENTS`.
+
+    :param file_name: file name
+    :type file_name: str or unicode
+    :return: document
+    :rtype: bytes
+    :raises OSError: if there are problems accessing the directory or
+      loading the file 
+    """
+    return DOCUMENTS.get(file_name)[0]
 
   def get_primer(self, format):
     """Load document a from a ``primer.format`` file within a 
@@ -85,3 +193,69 @@ class ServiceTestCase(unittest.TestCase):
       loading the file 
     """
     return self.get_document(ServiceTestCase.PRIMER_DOCUMENTS[format])
+
+  def get_primer_bytes(self, format):
+    """Load document a, as bytes ready for upload, from a
+    ``primer.format`` file within a ``documents`` directory assumed
+    to be in the same directory as the caller.
+
+    :param format: a :mod:`prov_service_tests.standards` value
+    :type format: str or unicode
+    :return: document
+    :rtype: bytes
+    :raises OSError: if there are problems accessing the directory or
+      loading the file 
+    """
+    return self.get_document_bytes(ServiceTestCase.PRIMER_DOCUMENTS[format])
+
+  def get_generated_path(self, format):
+    """Get name of file holding a generated document with parameters
+    from the ``PROV_GENERATED`` environment variable, generating the
+    document if necessary. See :mod:`prov_service_tests.generator`.
+    Tests using generated documents are opt-in, so the test is skipped
+    if ``PROV_GENERATED`` is not set.
+
+    :param format: a :mod:`prov_service_tests.standards` value
+    :type format: str or unicode
+    :return: file name
+    :rtype: str or unicode
+    :raises ValueError: if ``PROV_GENERATED`` is invalid
+    :raises unittest.SkipTest: if ``PROV_GENERATED`` is not set
+    """
+    if not os.environ.get(generator.PARAMETERS_ENV):
+      self.skipTest(generator.PARAMETERS_ENV + " is not set")
+    return generator.generate(format, generator.get_parameters())
+
+  def get_generated_document(self, format):
+    """Load a generated document with parameters from the
+    ``PROV_GENERATED`` environment variable, generating the document
+    if necessary. See :mod:`prov_service_tests.generator`.
+
+    :param format: a :mod:`prov_service_tests.standards` value
+    :type format: str or unicode
+    :return: document
+    :rtype: str or unicode
+    :raises ValueError: if ``PROV_GENERATED`` is invalid
+    :raises unittest.SkipTest: if ``PROV_GENERATED`` is not set
+    """
+    with io.open(self.get_generated_path(format), encoding="utf-8") as f:
+      return f.read()
+
+  def download(self, url, headers=None):
+    """Submit GET request for a document. In streaming mode, the
+    response body is consumed a chunk at a time, using
+    :func:`prov_service_tests.streaming.consume`, rather than being
+    held in memory.
+
+    :param url: URL
+    :type url: str or unicode
+    :param headers: HTTP headers
+    :type headers: dict
+    :return: response
+    :rtype: :class:`requests.Response`
+    """
+    if not self.streaming:
+      return self.session.get(url, headers=headers)
+    response = self.session.get(url, headers=headers, stream=True)
+    streaming.consume(response)
+    return response
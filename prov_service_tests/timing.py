@@ -0,0 +1,325 @@
+"""Per-request latency instrumentation.
+
+Every request sent via :mod:`prov_service_tests.session` is timed and
+a :class:`Sample` passed to each function in :data:`OBSERVERS`. By
+default, :data:`TIMINGS` is the only observer and collects samples by
+endpoint template, e.g. ``GET /store/api/v0/documents/:id.json``, so
+that latency percentiles can be reported at the end of a run.
+"""
+# Copyright (c) 2015 University of Southampton
+#
+# Permission is hereby granted, free of charge, to any person
+# obtaining a copy of this software and associated documentation files
+# (the "Software"), to deal in the Software without restriction,
+# including without limitation the rights to use, copy, modify, merge,
+# publish, distribute, sublicense, and/or sell copies of the Software,
+# and to permit persons to whom the Software is furnished to do so,
+# subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be
+# included in all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND,
+# EXPRESS OR IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF
+# MERCHANTABILITY, FITNESS FOR A PARTICULAR PURPOSE AND
+# NONINFRINGEMENT. IN NO EVENT SHALL THE AUTHORS OR COPYRIGHT HOLDERS
+# BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER LIABILITY, WHETHER IN AN
+# ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM, OUT OF OR IN
+# CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+
+from __future__ import (absolute_import, division, print_function,
+                        unicode_literals)
+
+import json
+import math
+import threading
+import time
+try:
+  from urllib.parse import urlparse
+except ImportError:
+  from urlparse import urlparse
+
+TIMINGS_FILE_ENV = "PROV_TIMINGS_FILE"
+"""str or unicode: environment variable holding name of file to which
+timings are written as JSON
+"""
+
+PERCENTILES = [50, 90, 99]
+"""list of int: percentiles reported for each endpoint"""
+
+METRICS = ["connect", "ttfb", "total"]
+"""list of str or unicode: names of timed phases of a request"""
+
+clock = getattr(time, "perf_counter", time.time)
+"""function: high-resolution clock returning seconds"""
+
+PLACEHOLDERS = {
+  "documents": ":id",
+  "bundles": ":bundle_id"
+}
+"""dict: mapping from path segments to placeholders for the segment
+that follows them in an endpoint template
+"""
+
+RANDOM = "random"
+"""str or unicode: path segment preceding ProvValidator random graph
+parameters
+"""
+
+RANDOM_PLACEHOLDERS = [":nodes", ":degree", ":seed"]
+"""list of str or unicode: placeholders for ProvValidator random graph
+parameters
+"""
+
+
+def endpoint_template(url):
+  """Get endpoint template for a URL, replacing document, bundle and
+  random graph parameters by placeholders. Any file extension on a
+  replaced segment is retained e.g.
+  ``https://host/store/api/v0/documents/123/bundles/45.json`` becomes
+  ``/store/api/v0/documents/:id/bundles/:bundle_id.json``.
+
+  :param url: URL
+  :type url: str or unicode
+  :return: endpoint template
+  :rtype: str or unicode
+  """
+  segments = urlparse(url).path.split("/")
+  template = []
+  placeholder = None
+  random_parameters = None
+  for segment in segments:
+    if random_parameters and segment:
+      template.append(random_parameters.pop(0))
+      continue
+    if placeholder is not None and segment and segment != RANDOM:
+      extension = ""
+      if "." in segment:
+        extension = segment[segment.index("."):]
+      template.append(placeholder + extension)
+    else:
+      template.append(segment)
+    placeholder = PLACEHOLDERS.get(segment)
+    if segment == RANDOM:
+      random_parameters = list(RANDOM_PLACEHOLDERS)
+  return "/".join(template)
+
+
+def percentile(values, percent):
+  """Get a percentile of a list of values using the nearest-rank
+  method.
+
+  :param values: values, sorted in ascending order
+  :type values: list of float
+  :param percent: percentile, 0 to 100
+  :type percent: int or float
+  :return: value or None if there are no values
+  :rtype: float
+  """
+  if not values:
+    return None
+  rank = int(math.ceil(percent / 100.0 * len(values)))
+  return values[max(0, min(rank, len(values)) - 1)]
+
+
+def summarise(values):
+  """Summarise values as percentiles and maximum.
+
+  :param values: values
+  :type values: list of float
+  :return: mapping from ``p50``, ``p90``, ``p99`` and ``max`` to values
+  :rtype: dict
+  """
+  values = sorted(values)
+  summary = {}
+  for percent in PERCENTILES:
+    summary["p" + str(percent)] = percentile(values, percent)
+  summary["max"] = values[-1] if values else None
+  return summary
+
+
+class Sample(object):
+  """Timings of one HTTP request. All times are in seconds.
+  """
+
+  __slots__ = ["method", "url", "template", "status", "connect",
+               "ttfb", "total", "started", "timestamp", "sent", "received",
+               "wire", "encoding", "request", "response"]
+
+  def __init__(self, method, url, status, connect, ttfb, total,
+               started=None):
+    self.method = method
+    """str or unicode: HTTP method"""
+    self.url = url
+    """str or unicode: request URL"""
+    self.template = endpoint_template(url)
+    """str or unicode: endpoint template"""
+    self.status = status
+    """int: HTTP status code"""
+    self.connect = connect
+    """float: time spent opening connections, 0 if a connection was
+    reused"""
+    self.ttfb = ttfb
+    """float: time from sending request to receiving response headers"""
+    self.total = total
+    """float: time from sending request to reading response body, or
+    None if the body has not yet been read"""
+    self.started = started
+    """float: time at which request was sent, from :func:`clock`"""
+    self.timestamp = time.time()
+    """float: time at which request completed, seconds since epoch"""
+    self.sent = 0
+    """int: number of bytes in request body"""
+    self.received = 0
+    """int: number of bytes in response body, once it has been read"""
+    self.wire = 0
+    """int: number of bytes in response body as received, before any
+    content encoding was decoded"""
+    self.encoding = None
+    """str or unicode: content encoding of response, or None"""
+    self.request = None
+    """:class:`requests.PreparedRequest`: request, available to
+    observers only, or None"""
+    self.response = None
+    """:class:`requests.Response`: response, available to observers
+    only, or None"""
+
+  @property
+  def endpoint(self):
+    """str or unicode: HTTP method and endpoint template"""
+    return self.method + " " + self.template
+
+
+class Timings(object):
+  """Thread-safe collection of request timings by endpoint.
+  """
+
+  def __init__(self):
+    self._lock = threading.Lock()
+    self._timings = {}
+
+  def add(self, sample):
+    """Add a sample.
+
+    :param sample: sample
+    :type sample: :class:`Sample`
+    """
+    with self._lock:
+      if sample.endpoint not in self._timings:
+        self._timings[sample.endpoint] = \
+            {"count": 0, "errors": 0, "connect": [], "ttfb": [], "total": []}
+      timings = self._timings[sample.endpoint]
+      timings["count"] += 1
+      if sample.status >= 400:
+        timings["errors"] += 1
+      for metric in METRICS:
+        timings[metric].append(getattr(sample, metric))
+
+  def reset(self):
+    """Remove all samples."""
+    with self._lock:
+      self._timings = {}
+
+  def snapshot(self):
+    """Get a copy of the timings collected, for example to pass to
+    another process.
+
+    :return: timings, which can be passed to :meth:`merge`
+    :rtype: dict
+    """
+    with self._lock:
+      return dict([(endpoint, dict([(key, list(value)
+                                     if isinstance(value, list) else value)
+                                    for key, value in timings.items()]))
+                   for endpoint, timings in self._timings.items()])
+
+  def merge(self, snapshot):
+    """Add timings collected elsewhere, for example by another
+    process.
+
+    :param snapshot: timings from :meth:`snapshot`
+    :type snapshot: dict
+    """
+    with self._lock:
+      for endpoint, other in snapshot.items():
+        if endpoint not in self._timings:
+          self._timings[endpoint] = \
+              {"count": 0, "errors": 0, "connect": [], "ttfb": [], "total": []}
+        timings = self._timings[endpoint]
+        timings["count"] += other["count"]
+        timings["errors"] += other["errors"]
+        for metric in METRICS:
+          timings[metric].extend(other[metric])
+
+  def report(self):
+    """Get percentiles and maximum of each timed phase, in
+    milliseconds, for each endpoint.
+
+    :return: mapping from endpoint to ``count``, ``errors`` and, for
+      each of ``connect``, ``ttfb`` and ``total``, a mapping from
+      ``p50``, ``p90``, ``p99`` and ``max`` to milliseconds
+    :rtype: dict
+    """
+    report = {}
+    with self._lock:
+      for endpoint, timings in self._timings.items():
+        report[endpoint] = {"count": timings["count"],
+                            "errors": timings["errors"]}
+        for metric in METRICS:
+          report[endpoint][metric] = summarise(
+            [value * 1000 for value in timings[metric]])
+    return report
+
+  def to_json(self):
+    """Get report as JSON.
+
+    :return: JSON
+    :rtype: str or unicode
+    """
+    return json.dumps(self.report(), indent=2, sort_keys=True)
+
+  def to_table(self):
+    """Get report of total time, with connect and time-to-first-byte
+    medians, as a text table.
+
+    :return: table
+    :rtype: str or unicode
+    """
+    report = self.report()
+    width = max([len("Endpoint")] + [len(key) for key in report])
+    row = "%-" + str(width) + "s %6s %6s %9s %9s %9s %9s %9s %9s"
+    lines = [row % ("Endpoint", "Count", "Errors", "conn p50", "ttfb p50",
+                    "p50 (ms)", "p90 (ms)", "p99 (ms)", "max (ms)")]
+    for endpoint in sorted(report):
+      timings = report[endpoint]
+      total = timings["total"]
+      lines.append(row % (endpoint, timings["count"], timings["errors"],
+                          "%.1f" % timings["connect"]["p50"],
+                          "%.1f" % timings["ttfb"]["p50"],
+                          "%.1f" % total["p50"],
+                          "%.1f" % total["p90"],
+                          "%.1f" % total["p99"],
+                          "%.1f" % total["max"]))
+    return "\n".join(lines)
+
+
+TIMINGS = Timings()
+""":class:`Timings`: timings collected in this process"""
+
+OBSERVERS = [TIMINGS.add]
+"""list of function: functions called with each :class:`Sample`"""
+
+
+def record(sample):
+  """Pass a sample to each observer in :data:`OBSERVERS`. The
+  sample's request and response are then released, so that observers
+  which keep samples do not keep responses.
+
+  :param sample: sample
+  :type sample: :class:`Sample`
+  """
+  for observer in list(OBSERVERS):
+    observer(sample)
+  sample.request = None
+  sample.response = None
@@ -0,0 +1,78 @@
+"""Offline unit tests of the service test harness.
+
+These tests do not use the ProvStore or ProvValidator services. Any
+which need a service use the local stand-in server,
+:mod:`prov_service_tests.server`.
+"""
+# Copyright (c) 2015 University of Southampton
+#
+# Permission is hereby granted, free of charge, to any person
+# obtaining a copy of this software and associated documentation files
+# (the "Software"), to deal in the Software without restriction,
+# including without limitation the rights to use, copy, modify, merge,
+# publish, distribute, sublicense, and/or sell copies of the Software,
+# and to permit persons to whom the Software is furnished to do so,
+# subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be
+# included in all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND,
+# EXPRESS OR IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF
+# MERCHANTABILITY, FITNESS FOR A PARTICULAR PURPOSE AND
+# NONINFRINGEMENT. IN NO EVENT SHALL THE AUTHORS OR COPYRIGHT HOLDERS
+# BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER LIABILITY, WHETHER IN AN
+# ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM, OUT OF OR IN
+# CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+
+from __future__ import (absolute_import, division, print_function,
+                        unicode_literals)
+
+import os
+import unittest
+
+from prov_service_tests import server
+from prov_service_tests import test_provstore
+from prov_service_tests import test_provvalidator
+
+SERVICE_ENVS = [test_provstore.ProvStoreTestCase.URL_ENV,
+                test_provvalidator.ProvValidatorTestCase.URL_ENV,
+                test_provstore.ProvStoreTestCase.API_KEY_ENV]
+"""list of str or unicode: environment variables set to use the local
+stand-in server"""
+
+
+class LocalServerTestCase(unittest.TestCase):
+  """Test case which starts a local stand-in server for each test, and
+  points the service URL and API key environment variables at it
+  until the test ends.
+  """
+
+  def setUp(self):
+    super(LocalServerTestCase, self).setUp()
+    self.server = server.ServiceServer()
+    self.server.start()
+    self.addCleanup(self.server.stop)
+    for env in SERVICE_ENVS:
+      self.addCleanup(restore_env, env, os.environ.get(env))
+    os.environ[test_provstore.ProvStoreTestCase.URL_ENV] = \
+        self.server.provstore_url
+    os.environ[test_provvalidator.ProvValidatorTestCase.URL_ENV] = \
+        self.server.provvalidator_url
+    os.environ[test_provstore.ProvStoreTestCase.API_KEY_ENV] = \
+        server.API_KEY
+
+
+def restore_env(env, value):
+  """Restore an environment variable.
+
+  :param env: environment variable
+  :type env: str or unicode
+  :param value: previous value, or None if it was not set
+  :type value: str or unicode
+  """
+  if value is None:
+    os.environ.pop(env, None)
+  else:
+    os.environ[env] = value
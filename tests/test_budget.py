@@ -0,0 +1,194 @@
+"""Unit tests for :mod:`prov_service_tests.budget`.
+"""
+# Copyright (c) 2015 University of Southampton
+#
+# Permission is hereby granted, free of charge, to any person
+# obtaining a copy of this software and associated documentation files
+# (the "Software"), to deal in the Software without restriction,
+# including without limitation the rights to use, copy, modify, merge,
+# publish, distribute, sublicense, and/or sell copies of the Software,
+# and to permit persons to whom the Software is furnished to do so,
+# subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be
+# included in all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND,
+# EXPRESS OR IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF
+# MERCHANTABILITY, FITNESS FOR A PARTICULAR PURPOSE AND
+# NONINFRINGEMENT. IN NO EVENT SHALL THE AUTHORS OR COPYRIGHT HOLDERS
+# BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER LIABILITY, WHETHER IN AN
+# ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM, OUT OF OR IN
+# CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+
+from __future__ import (absolute_import, division, print_function,
+                        unicode_literals)
+
+import os
+import threading
+import time
+import unittest
+
+from prov_service_tests import budget
+from tests import restore_env
+
+
+class Failure(Exception):
+  """Raised by an operation guarded by a breaker under test."""
+
+
+class TimeoutsTestCase(unittest.TestCase):
+
+  def test_parse_timeout(self):
+    self.assertEqual((5.0, 300.0), budget.parse_timeout("5,300"))
+    self.assertEqual((2.5, 2.5), budget.parse_timeout("2.5"))
+    self.assertEqual((None, 10.0), budget.parse_timeout("0,10"))
+
+  def test_parse_invalid_timeout(self):
+    self.assertRaises(ValueError, budget.parse_timeout, "1,2,3")
+    self.assertRaises(ValueError, budget.parse_timeout, "soon")
+
+  def test_endpoint(self):
+    timeouts = budget.Timeouts(
+      (10, 120), {"POST /store/api/v0/documents/": (5, 300)})
+    self.assertEqual((5, 300), timeouts.get(
+      "POST", "http://host/store/api/v0/documents/"))
+    self.assertEqual((10, 120), timeouts.get(
+      "GET", "http://host/store/api/v0/documents/"))
+
+  def test_get_timeout(self):
+    timeouts = budget.Timeouts((10, 120))
+    self.assertEqual((10, 120),
+                     budget.get_timeout(timeouts, "GET", "http://host/"))
+    self.assertEqual((3, 3),
+                     budget.get_timeout(timeouts, "GET", "http://host/", 3))
+    self.assertIsNone(budget.get_timeout(None, "GET", "http://host/"))
+
+
+class DeadlineTestCase(unittest.TestCase):
+
+  def setUp(self):
+    for env in [budget.DEADLINE_ENV, budget.DEADLINE_AT_ENV]:
+      self.addCleanup(restore_env, env, os.environ.pop(env, None))
+    self.addCleanup(setattr, budget, "_deadline", None)
+    budget._deadline = None
+
+  def test_limit(self):
+    deadline = budget.Deadline(time.time() + 60, 60)
+    connect, read = deadline.limit((5, None))
+    self.assertEqual(5, connect)
+    self.assertTrue(55 < read <= 60)
+    self.assertFalse(deadline.expired)
+
+  def test_expired(self):
+    deadline = budget.Deadline(time.time() - 1, 60)
+    self.assertTrue(deadline.expired)
+    self.assertEqual(0, deadline.remaining())
+    self.assertRaises(budget.DeadlineExceeded, deadline.limit, (5, 5))
+
+  def test_not_set(self):
+    self.assertIsNone(budget.get_deadline())
+
+  def test_started_by_first_request(self):
+    os.environ[budget.DEADLINE_ENV] = "60"
+    self.assertIsNone(budget.get_deadline(start=False))
+    budget.check_deadline("GET")
+    self.assertNotIn(budget.DEADLINE_AT_ENV, os.environ)
+    budget.get_timeout(None, "GET", "http://host/")
+    self.assertIn(budget.DEADLINE_AT_ENV, os.environ)
+    self.assertEqual(60, budget.get_deadline(start=False).seconds)
+
+  def test_exempt_method(self):
+    os.environ[budget.DEADLINE_ENV] = "60"
+    os.environ[budget.DEADLINE_AT_ENV] = repr(time.time() - 1)
+    self.assertRaises(budget.DeadlineExceeded, budget.check_deadline, "GET")
+    self.assertRaises(budget.DeadlineExceeded, budget.get_timeout,
+                      None, "GET", "http://host/")
+    budget.check_deadline("DELETE")
+    self.assertEqual((1, 2), budget.get_timeout(None, "DELETE",
+                                                "http://host/", (1, 2)))
+
+
+class CircuitBreakerTestCase(unittest.TestCase):
+
+  def create_breaker(self, threshold=2, reset=0.05):
+    breaker = budget.CircuitBreaker("operation", threshold, reset)
+    self.addCleanup(budget.BREAKERS.remove, breaker)
+    return breaker
+
+  def fail_once(self, breaker):
+    with self.assertRaises(Failure):
+      with breaker:
+        raise Failure("down")
+
+  def test_opens_after_threshold(self):
+    breaker = self.create_breaker()
+    self.fail_once(breaker)
+    self.assertFalse(breaker.is_open)
+    self.fail_once(breaker)
+    self.assertTrue(breaker.is_open)
+    with self.assertRaises(budget.CircuitOpenError) as context:
+      with breaker:
+        self.fail("Operation attempted while breaker is open")
+    self.assertIn("Failure: down", str(context.exception))
+    self.assertEqual(1, breaker.short_circuited)
+
+  def test_open_is_not_assertion_failure(self):
+    self.assertFalse(issubclass(budget.CircuitOpenError, AssertionError))
+
+  def test_success_resets_failures(self):
+    breaker = self.create_breaker()
+    self.fail_once(breaker)
+    with breaker:
+      pass
+    self.fail_once(breaker)
+    self.assertFalse(breaker.is_open)
+
+  def test_skip_is_not_failure(self):
+    breaker = self.create_breaker(threshold=1)
+    with self.assertRaises(unittest.SkipTest):
+      with breaker:
+        raise unittest.SkipTest("skipped")
+    self.assertFalse(breaker.is_open)
+
+  def test_half_open_success_closes(self):
+    breaker = self.create_breaker()
+    self.fail_once(breaker)
+    self.fail_once(breaker)
+    time.sleep(breaker.reset)
+    with breaker:
+      pass
+    self.assertFalse(breaker.is_open)
+    self.assertEqual(0, breaker.failures)
+
+  def test_half_open_failure_reopens(self):
+    breaker = self.create_breaker()
+    self.fail_once(breaker)
+    self.fail_once(breaker)
+    time.sleep(breaker.reset)
+    self.fail_once(breaker)
+    self.assertTrue(breaker.is_open)
+    self.assertRaises(budget.CircuitOpenError, breaker.__enter__)
+
+  def test_half_open_allows_one_trial(self):
+    breaker = self.create_breaker()
+    self.fail_once(breaker)
+    self.fail_once(breaker)
+    time.sleep(breaker.reset)
+    errors = []
+
+    def attempt():
+      try:
+        with breaker:
+          pass
+      except budget.CircuitOpenError as e:
+        errors.append(e)
+
+    with breaker:
+      # Another attempt during the trial is short-circuited.
+      thread = threading.Thread(target=attempt)
+      thread.start()
+      thread.join()
+    self.assertEqual(1, len(errors))
+    self.assertFalse(breaker.is_open)
@@ -0,0 +1,188 @@
+"""Unit tests for :mod:`prov_service_tests.cache`.
+"""
+# Copyright (c) 2015 University of Southampton
+#
+# Permission is hereby granted, free of charge, to any person
+# obtaining a copy of this software and associated documentation files
+# (the "Software"), to deal in the Software without restriction,
+# including without limitation the rights to use, copy, modify, merge,
+# publish, distribute, sublicense, and/or sell copies of the Software,
+# and to permit persons to whom the Software is furnished to do so,
+# subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be
+# included in all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND,
+# EXPRESS OR IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF
+# MERCHANTABILITY, FITNESS FOR A PARTICULAR PURPOSE AND
+# NONINFRINGEMENT. IN NO EVENT SHALL THE AUTHORS OR COPYRIGHT HOLDERS
+# BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER LIABILITY, WHETHER IN AN
+# ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM, OUT OF OR IN
+# CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+
+from __future__ import (absolute_import, division, print_function,
+                        unicode_literals)
+
+import json
+import unittest
+
+import requests
+from requests.structures import CaseInsensitiveDict
+
+from prov_service_tests import cache
+from prov_service_tests import http
+from prov_service_tests import server
+from prov_service_tests import session
+from prov_service_tests import standards
+from prov_service_tests import test_provstore
+from tests import LocalServerTestCase
+
+
+def create_response(content=b"", headers=None, status_code=200):
+  """Create a response whose content has been read.
+
+  :param content: body
+  :type content: bytes
+  :param headers: headers
+  :type headers: dict
+  :param status_code: HTTP status code
+  :type status_code: int
+  :return: response
+  :rtype: :class:`requests.Response`
+  """
+  response = requests.Response()
+  response.status_code = status_code
+  response.headers = CaseInsensitiveDict(
+    {"ETag": '"1"'} if headers is None else headers)
+  response._content = content
+  return response
+
+
+def create_cached(content, headers=None):
+  """Create a cached response.
+
+  :param content: body
+  :type content: bytes
+  :param headers: headers
+  :type headers: dict
+  :return: cached response
+  :rtype: :class:`prov_service_tests.cache.CachedResponse`
+  """
+  return cache.CachedResponse(create_response(content, headers))
+
+
+class LifetimeTestCase(unittest.TestCase):
+
+  def test_max_age(self):
+    self.assertEqual(60, cache.get_lifetime(
+      CaseInsensitiveDict({"Cache-Control": "public, max-age=90",
+                           "Age": "30"})))
+
+  def test_no_cache(self):
+    self.assertEqual(0, cache.get_lifetime(
+      CaseInsensitiveDict({"Cache-Control": "no-cache, max-age=90"})))
+
+  def test_expires(self):
+    self.assertEqual(120, cache.get_lifetime(CaseInsensitiveDict({
+      "Date": "Sun, 06 Nov 1994 08:49:37 GMT",
+      "Expires": "Sun, 06 Nov 1994 08:51:37 GMT"})))
+
+  def test_is_cacheable(self):
+    self.assertTrue(cache.is_cacheable(create_response()))
+    self.assertFalse(cache.is_cacheable(create_response(headers={})))
+    self.assertFalse(cache.is_cacheable(
+      create_response(headers={"ETag": '"1"', "Cache-Control": "no-store"})))
+    self.assertFalse(cache.is_cacheable(create_response(status_code=404)))
+
+
+class ResponseCacheTestCase(unittest.TestCase):
+
+  def test_least_recently_used_removed(self):
+    responses = cache.ResponseCache(10)
+    responses.put("a", create_cached(b"aaaaaa"))
+    responses.put("b", create_cached(b"bbbb"))
+    responses.get("a")
+    responses.put("c", create_cached(b"cccc"))
+    self.assertIsNone(responses.get("b"))
+    self.assertIsNotNone(responses.get("a"))
+    self.assertIsNotNone(responses.get("c"))
+    self.assertEqual(10, responses.size)
+
+  def test_replace(self):
+    responses = cache.ResponseCache(10)
+    responses.put("a", create_cached(b"aaaaaa"))
+    responses.put("a", create_cached(b"aa"))
+    self.assertEqual(2, responses.size)
+
+  def test_too_large(self):
+    responses = cache.ResponseCache(10)
+    self.assertFalse(responses.put("a", create_cached(b"a" * 11)))
+    self.assertEqual(0, responses.size)
+
+  def test_invalidate(self):
+    responses = cache.ResponseCache(100)
+    for url in ["http://host/documents/1", "http://host/documents/1.json",
+                "http://host/documents/1/bundles",
+                "http://host/documents/12"]:
+      responses.put((url, ""), create_cached(b"x"))
+    responses.invalidate("http://host/documents/1", descendants=False)
+    self.assertIsNone(responses.get(("http://host/documents/1", "")))
+    self.assertIsNotNone(responses.get(("http://host/documents/1.json", "")))
+    responses.invalidate("http://host/documents/1/")
+    self.assertIsNone(responses.get(("http://host/documents/1.json", "")))
+    self.assertIsNone(responses.get(("http://host/documents/1/bundles", "")))
+    self.assertIsNotNone(responses.get(("http://host/documents/12", "")))
+    self.assertEqual(1, responses.size)
+
+
+class RevalidationTestCase(LocalServerTestCase):
+
+  def setUp(self):
+    super(RevalidationTestCase, self).setUp()
+    cache.STATISTICS.reset()
+    self.addCleanup(cache.STATISTICS.reset)
+    self.http_session = session.create_session()
+    for adapter in self.http_session.adapters.values():
+      adapter.cache = cache.ResponseCache(1000000)
+    self.addCleanup(self.http_session.close)
+    self.authorization = "ApiKey " + server.API_KEY
+    response = self.http_session.post(
+      self.server.provstore_url,
+      headers=test_provstore.ProvStoreTestCase.get_headers(
+        standards.JSON, self.authorization),
+      data=json.dumps({"public": True, "rec_id": "cache",
+                       "content": '{"entity": {"ex:a": {}}}'}))
+    self.assertEqual(requests.codes.created, response.status_code)
+    self.document_url = self.server.provstore_url + \
+        str(response.json()["id"])
+
+  def get_outcomes(self, endpoint):
+    counts = cache.STATISTICS.report()[endpoint]
+    return dict([(outcome, counts[outcome]) for outcome in cache.OUTCOMES])
+
+  def test_revalidated(self):
+    first = self.http_session.get(self.document_url + ".json")
+    second = self.http_session.get(self.document_url + ".json")
+    self.assertEqual(requests.codes.ok, second.status_code)
+    self.assertEqual(first.content, second.content)
+    self.assertEqual({cache.HIT: 0, cache.REVALIDATED: 1, cache.MISS: 1,
+                      cache.UNCACHEABLE: 0},
+                     self.get_outcomes(
+                       "GET /store/api/v0/documents/:id.json"))
+
+  def test_accept_cached_separately(self):
+    self.http_session.get(self.document_url + ".json")
+    self.http_session.get(self.document_url + ".json",
+                          headers={http.ACCEPT: "text/plain"})
+    self.assertEqual(2, self.get_outcomes(
+      "GET /store/api/v0/documents/:id.json")[cache.MISS])
+
+  def test_delete_invalidates(self):
+    self.http_session.get(self.document_url + ".json")
+    response = self.http_session.delete(
+      self.document_url, headers={http.AUTHORIZATION: self.authorization})
+    self.assertEqual(requests.codes.no_content, response.status_code)
+    response = self.http_session.get(self.document_url + ".json")
+    self.assertEqual(requests.codes.not_found, response.status_code)
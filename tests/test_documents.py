@@ -0,0 +1,73 @@
+"""Unit tests for the shared and orphaned document pools of
+:mod:`prov_service_tests.test_provstore`.
+"""
+# Copyright (c) 2015 University of Southampton
+#
+# Permission is hereby granted, free of charge, to any person
+# obtaining a copy of this software and associated documentation files
+# (the "Software"), to deal in the Software without restriction,
+# including without limitation the rights to use, copy, modify, merge,
+# publish, distribute, sublicense, and/or sell copies of the Software,
+# and to permit persons to whom the Software is furnished to do so,
+# subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be
+# included in all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND,
+# EXPRESS OR IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF
+# MERCHANTABILITY, FITNESS FOR A PARTICULAR PURPOSE AND
+# NONINFRINGEMENT. IN NO EVENT SHALL THE AUTHORS OR COPYRIGHT HOLDERS
+# BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER LIABILITY, WHETHER IN AN
+# ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM, OUT OF OR IN
+# CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+
+from __future__ import (absolute_import, division, print_function,
+                        unicode_literals)
+
+
+import threading
+import time
+import unittest
+
+from prov_service_tests import test_provstore
+
+
+class DeleteDocumentsTestCase(unittest.TestCase):
+
+  def test_bounded(self):
+    lock = threading.Lock()
+    running = [0, 0]
+
+    def delete(url):
+      with lock:
+        running[0] += 1
+        running[1] = max(running)
+      time.sleep(0.01)
+      with lock:
+        running[0] -= 1
+      return True
+
+    urls = ["http://h/d/%d" % index for index in range(20)]
+    self.assertEqual([], test_provstore.delete_documents(delete, urls, 3))
+    self.assertEqual(3, running[1])
+
+  def test_failed(self):
+    def delete(url):
+      if url.endswith("2"):
+        raise IOError(url)
+      return not url.endswith("1")
+
+    urls = ["http://h/d/%d" % index for index in range(3)]
+    self.assertEqual(["http://h/d/1", "http://h/d/2"],
+                     sorted(test_provstore.delete_documents(delete, urls)))
+
+  def test_failures_remain_recorded(self):
+    orphans = test_provstore.OrphanedDocuments(
+      lambda url: url.endswith("0"))
+    orphans.add("http://h/d/0")
+    orphans.add("http://h/d/1")
+    self.assertEqual(["http://h/d/1"], orphans.delete_all())
+    self.assertEqual(["http://h/d/1"], orphans.urls)
+    self.assertEqual(1, orphans.deleted)
@@ -0,0 +1,132 @@
+"""Unit tests for :mod:`prov_service_tests.fidelity`.
+"""
+# Copyright (c) 2015 University of Southampton
+#
+# Permission is hereby granted, free of charge, to any person
+# obtaining a copy of this software and associated documentation files
+# (the "Software"), to deal in the Software without restriction,
+# including without limitation the rights to use, copy, modify, merge,
+# publish, distribute, sublicense, and/or sell copies of the Software,
+# and to permit persons to whom the Software is furnished to do so,
+# subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be
+# included in all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND,
+# EXPRESS OR IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF
+# MERCHANTABILITY, FITNESS FOR A PARTICULAR PURPOSE AND
+# NONINFRINGEMENT. IN NO EVENT SHALL THE AUTHORS OR COPYRIGHT HOLDERS
+# BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER LIABILITY, WHETHER IN AN
+# ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM, OUT OF OR IN
+# CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+
+from __future__ import (absolute_import, division, print_function,
+                        unicode_literals)
+
+import unittest
+
+from prov_service_tests import fidelity
+
+DOCUMENT = b"""document
+prefix ex <http://example/>
+entity(ex:a,[ex:x = "1  2" %% xsd:string, prov:type='ex:T'])
+activity(ex:c,-,-)
+used(ex:c,ex:a,-)
+endDocument
+"""
+"""bytes: PROV-N document"""
+
+REFORMATTED = b"""document
+  prefix ex <http://example/>
+  used(ex:c, ex:a)
+  // A statement spanning lines, with attributes in another order.
+  entity(ex:a, [prov:type = 'ex:T',
+                ex:x = "1  2" %% xsd:string])
+  activity(ex:c)
+endDocument
+"""
+"""bytes: :data:`DOCUMENT`, reformatted and with statements in another
+order"""
+
+
+def get_fingerprint(document, chunk_size=7):
+  """Get the fingerprint of a document, added a chunk at a time.
+
+  :param document: document
+  :type document: bytes
+  :param chunk_size: chunk size
+  :type chunk_size: int
+  :return: fingerprint
+  :rtype: str or unicode
+  """
+  fingerprint = fidelity.Fingerprint()
+  for start in range(0, len(document), chunk_size):
+    fingerprint.update(document[start:start + chunk_size])
+  return fingerprint.hexdigest()
+
+
+class FingerprintTestCase(unittest.TestCase):
+
+  def test_chunk_size(self):
+    self.assertEqual(get_fingerprint(DOCUMENT),
+                     get_fingerprint(DOCUMENT, len(DOCUMENT)))
+
+  def test_statement_count(self):
+    self.assertTrue(get_fingerprint(DOCUMENT).endswith("-6"))
+
+  def test_reformatting_and_order(self):
+    self.assertEqual(get_fingerprint(DOCUMENT), get_fingerprint(REFORMATTED))
+
+  def test_line_order(self):
+    lines = DOCUMENT.strip().split(b"\n")
+    self.assertEqual(get_fingerprint(DOCUMENT),
+                     get_fingerprint(b"\n".join(reversed(lines))))
+
+  def test_repeated_statement(self):
+    self.assertNotEqual(get_fingerprint(DOCUMENT),
+                        get_fingerprint(DOCUMENT + b"activity(ex:c)\n"))
+
+  def test_changed_literal(self):
+    self.assertNotEqual(get_fingerprint(DOCUMENT),
+                        get_fingerprint(DOCUMENT.replace(b"1  2", b"1 2")))
+
+  def test_changed_argument(self):
+    self.assertNotEqual(
+      get_fingerprint(DOCUMENT),
+      get_fingerprint(DOCUMENT.replace(b"used(ex:c,ex:a,-)",
+                                       b"used(ex:c,ex:b,-)")))
+
+
+class CanonicalizeTestCase(unittest.TestCase):
+
+  def canonicalize(self, statement):
+    return fidelity.canonicalize(
+      [match.group(3) for match in fidelity.TOKEN.finditer(statement)
+       if match.group(3)])
+
+  def test_keyword(self):
+    self.assertEqual(b"prefix ex <http://example/>",
+                     self.canonicalize(b"prefix  ex   <http://example/>"))
+
+  def test_placeholders(self):
+    self.assertEqual(b"activity(ex:c)",
+                     self.canonicalize(b"activity(ex:c, -, -)"))
+
+  def test_blank_node_identifier(self):
+    self.assertEqual(b"used(ex:c,ex:a,[prov:role='ex:r'])",
+                     self.canonicalize(
+                       b"used(_:u1; ex:c, ex:a, -, [prov:role = 'ex:r'])"))
+
+  def test_identifier(self):
+    self.assertEqual(b"used(ex:u1;ex:c,ex:a)",
+                     self.canonicalize(b"used(ex:u1; ex:c, ex:a)"))
+
+  def test_attribute_order(self):
+    self.assertEqual(self.canonicalize(b"agent(ex:d,[ex:b=1,ex:a=2])"),
+                     self.canonicalize(b"agent(ex:d,[ex:a=2,ex:b=1])"))
+
+  def test_whitespace_in_string(self):
+    self.assertNotEqual(self.canonicalize(b'entity(ex:a,[ex:x="a b"])'),
+                        self.canonicalize(b'entity(ex:a,[ex:x="ab"])'))
@@ -0,0 +1,67 @@
+"""Unit tests for :mod:`prov_service_tests.history`.
+"""
+# Copyright (c) 2015 University of Southampton
+#
+# Permission is hereby granted, free of charge, to any person
+# obtaining a copy of this software and associated documentation files
+# (the "Software"), to deal in the Software without restriction,
+# including without limitation the rights to use, copy, modify, merge,
+# publish, distribute, sublicense, and/or sell copies of the Software,
+# and to permit persons to whom the Software is furnished to do so,
+# subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be
+# included in all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND,
+# EXPRESS OR IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF
+# MERCHANTABILITY, FITNESS FOR A PARTICULAR PURPOSE AND
+# NONINFRINGEMENT. IN NO EVENT SHALL THE AUTHORS OR COPYRIGHT HOLDERS
+# BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER LIABILITY, WHETHER IN AN
+# ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM, OUT OF OR IN
+# CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+
+from __future__ import (absolute_import, division, print_function,
+                        unicode_literals)
+
+
+import os
+import shutil
+import tempfile
+import unittest
+
+from prov_service_tests import history
+
+
+class HistoryTestCase(unittest.TestCase):
+
+  def setUp(self):
+    directory = tempfile.mkdtemp()
+    self.addCleanup(shutil.rmtree, directory)
+    self.history = history.History(os.path.join(directory, "h.sqlite"),
+                                   max_runs=3)
+
+  def test_failed_durations_ignored(self):
+    self.history.record("1", {"a": (1.0, True), "b": 2.0})
+    self.history.record("2", {"a": (30.0, False), "b": (3.0, None)})
+    self.assertEqual({"a": 1.0, "b": 2.5}, self.history.get_durations())
+
+  def test_failed_durations_not_trends(self):
+    self.history.record("1", {"a": (1.0, True)})
+    self.history.record("2", {"a": (30.0, False)})
+    self.assertEqual([], self.history.get_trends(recent=1, baseline=1))
+
+  def test_old_runs_removed(self):
+    for run in range(5):
+      self.history.record(str(run), {"a": float(run)},
+                          {"GET /": {"count": 1,
+                                     "total": {"p50": 1, "p90": 1,
+                                               "p99": 1}}})
+    with self.history.connect() as connection:
+      self.assertEqual(
+        [("2",), ("3",), ("4",)],
+        connection.execute("SELECT name FROM runs ORDER BY id").fetchall())
+      self.assertEqual(3, connection.execute(
+        "SELECT COUNT(*) FROM endpoints").fetchone()[0])
+    self.assertEqual({"a": 3.0}, self.history.get_durations())
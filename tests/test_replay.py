@@ -0,0 +1,181 @@
+"""Unit tests for :mod:`prov_service_tests.replay`.
+"""
+# Copyright (c) 2015 University of Southampton
+#
+# Permission is hereby granted, free of charge, to any person
+# obtaining a copy of this software and associated documentation files
+# (the "Software"), to deal in the Software without restriction,
+# including without limitation the rights to use, copy, modify, merge,
+# publish, distribute, sublicense, and/or sell copies of the Software,
+# and to permit persons to whom the Software is furnished to do so,
+# subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be
+# included in all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND,
+# EXPRESS OR IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF
+# MERCHANTABILITY, FITNESS FOR A PARTICULAR PURPOSE AND
+# NONINFRINGEMENT. IN NO EVENT SHALL THE AUTHORS OR COPYRIGHT HOLDERS
+# BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER LIABILITY, WHETHER IN AN
+# ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM, OUT OF OR IN
+# CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+
+from __future__ import (absolute_import, division, print_function,
+                        unicode_literals)
+
+import json
+import os
+import shutil
+import tempfile
+import unittest
+
+from prov_service_tests import http
+from prov_service_tests import recording
+from prov_service_tests import replay
+from prov_service_tests import standards
+from prov_service_tests import test_provstore
+from tests import LocalServerTestCase
+
+RECORDED_URL = "http://recorded/store/api/v0/documents/"
+"""str or unicode: ProvStore URL at which requests were recorded"""
+
+
+def create_record(method, url, status, created=None, body=None):
+  """Create a recorded request.
+
+  :param method: HTTP method
+  :type method: str or unicode
+  :param url: URL
+  :type url: str or unicode
+  :param status: recorded status code
+  :type status: int
+  :param created: URL of document created by the request, or None
+  :type created: str or unicode
+  :param body: digest of stored request body, or None
+  :type body: str or unicode
+  :return: record
+  :rtype: dict
+  """
+  record = {"at": 0, "m": method, "u": url, "p": "/", "h": {}, "s": status,
+            "t": 0.001, "b": body}
+  if created is not None:
+    record["l"] = created
+  return record
+
+
+class PrefixesTestCase(unittest.TestCase):
+
+  def test_prefixes(self):
+    self.assertEqual(["http://h/d/1.json", "http://h/d/1", "http://h/d",
+                      "http://h"],
+                     replay.get_prefixes("http://h/d/1.json")[:4])
+
+  def test_statuses_match(self):
+    self.assertTrue(replay.statuses_match(200, 304))
+    self.assertTrue(replay.statuses_match(404, 404))
+    self.assertFalse(replay.statuses_match(201, 400))
+
+
+class LoadRecordingTestCase(unittest.TestCase):
+
+  def setUp(self):
+    directory = tempfile.mkdtemp()
+    self.addCleanup(shutil.rmtree, directory)
+    self.path = os.path.join(directory, "traffic.jsonl")
+
+  def write(self, entries):
+    """Write a recording file.
+
+    :param entries: header lines and records
+    :type entries: list of dict
+    """
+    with open(self.path, "wb") as f:
+      for entry in entries:
+        f.write(recording.to_line(entry))
+
+  def test_processes_of_run(self):
+    first = create_record("GET", RECORDED_URL + "1", 200)
+    first.update({"at": 2, "i": "a"})
+    second = create_record("GET", RECORDED_URL + "2", 200)
+    second.update({"at": 1, "i": "a"})
+    other = create_record("GET", RECORDED_URL + "3", 200)
+    other["i"] = "b"
+    # Processes of runs "a" and "b" write to the file at the same time.
+    self.write([{"run": "a", "started": 10}, first,
+                {"run": "b", "started": 11},
+                {"run": "a", "started": 9}, second, other])
+    recorded = replay.load_recording(self.path, 0)
+    self.assertEqual(9, recorded.header["started"])
+    self.assertEqual([RECORDED_URL + "2", RECORDED_URL + "1"],
+                     [record["u"] for record in recorded.records])
+    recorded = replay.load_recording(self.path)
+    self.assertEqual("b", recorded.header["run"])
+    self.assertEqual([RECORDED_URL + "3"],
+                     [record["u"] for record in recorded.records])
+
+  def test_without_run_identifiers(self):
+    self.write([{"started": 1}, create_record("GET", RECORDED_URL, 200),
+                {"started": 2}, create_record("GET", RECORDED_URL, 404)])
+    self.assertEqual(404,
+                     replay.load_recording(self.path).records[0]["s"])
+    with self.assertRaises(IndexError):
+      replay.load_recording(self.path, 2)
+
+
+class ReplayTestCase(LocalServerTestCase):
+
+  def setUp(self):
+    super(ReplayTestCase, self).setUp()
+    directory = tempfile.mkdtemp()
+    self.addCleanup(shutil.rmtree, directory)
+    self.path = os.path.join(directory, "traffic.jsonl")
+    # The replayed document has a different ID to the recorded one.
+    self.server.provstore.add(b"{}", "application/json")
+
+  def create_replay(self, records):
+    """Create a replay of records recorded against
+    :data:`RECORDED_URL`.
+
+    :param records: records
+    :type records: list of dict
+    :return: replay
+    :rtype: :class:`prov_service_tests.replay.Replay`
+    """
+    recorded = replay.Recording(self.path, {"provstore": RECORDED_URL},
+                                records)
+    return replay.Replay(recorded, speed=None, concurrency=4)
+
+  def test_dependencies(self):
+    document = RECORDED_URL + "7"
+    records = [create_record("POST", RECORDED_URL, 201, document),
+               create_record("GET", document + ".json", 200),
+               create_record("GET", RECORDED_URL + "70", 404),
+               create_record("GET", document + "/bundles", 200),
+               create_record("DELETE", document, 204)]
+    current = self.server.provstore_url + "7"
+    dependencies = self.create_replay(records)._dependencies
+    self.assertIsNone(dependencies[0])
+    self.assertEqual((0, current, 0), dependencies[1])
+    self.assertIsNone(dependencies[2])
+    # Each request waits for the previous request for the document.
+    self.assertEqual((0, current, 1), dependencies[3])
+    self.assertEqual((0, current, 3), dependencies[4])
+
+  def test_replay(self):
+    body = json.dumps({"public": True, "rec_id": "replay",
+                       "content": '{"entity": {"ex:a": {}}}'})
+    digest = recording.Recorder(self.path).store_body(body.encode("utf-8"))
+    document = RECORDED_URL + "7"
+    records = [create_record("POST", RECORDED_URL, 201, document, digest),
+               create_record("GET", document + ".json", 200),
+               create_record("GET", document, 200),
+               create_record("DELETE", document, 204),
+               create_record("GET", document + ".json", 404)]
+    records[0]["h"] = test_provstore.ProvStoreTestCase.get_headers(
+      standards.JSON, "-")
+    records[3]["h"] = {http.AUTHORIZATION: "-"}
+    report = self.create_replay(records).run()
+    self.assertEqual(0, report.error_count, report.to_table())
+    self.assertEqual(["1"], self.server.provstore.ids())
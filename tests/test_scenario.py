@@ -0,0 +1,123 @@
+"""Unit tests for :mod:`prov_service_tests.scenario`.
+"""
+# Copyright (c) 2015 University of Southampton
+#
+# Permission is hereby granted, free of charge, to any person
+# obtaining a copy of this software and associated documentation files
+# (the "Software"), to deal in the Software without restriction,
+# including without limitation the rights to use, copy, modify, merge,
+# publish, distribute, sublicense, and/or sell copies of the Software,
+# and to permit persons to whom the Software is furnished to do so,
+# subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be
+# included in all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND,
+# EXPRESS OR IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF
+# MERCHANTABILITY, FITNESS FOR A PARTICULAR PURPOSE AND
+# NONINFRINGEMENT. IN NO EVENT SHALL THE AUTHORS OR COPYRIGHT HOLDERS
+# BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER LIABILITY, WHETHER IN AN
+# ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM, OUT OF OR IN
+# CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+
+from __future__ import (absolute_import, division, print_function,
+                        unicode_literals)
+
+import random
+import unittest
+
+from prov_service_tests import scenario
+from prov_service_tests import standards
+from tests import LocalServerTestCase
+
+SCENARIO = {
+  "name": "mix",
+  "duration": 0.2,
+  "concurrency": 2,
+  "seed": 1,
+  "think_time": 0.01,
+  "mix": [
+    {"operation": "translate", "weight": 3, "from": "json", "to": "provn"},
+    {"operation": "validate", "then": ["validation/normalForm"],
+     "name": "validate and normalize"}
+  ]
+}
+"""dict: scenario which only uses ProvValidator"""
+
+
+class ThinkTimeTestCase(unittest.TestCase):
+
+  def test_constant(self):
+    self.assertEqual(0.5, scenario.compile_think_time(0.5)(random.Random()))
+    self.assertEqual(0, scenario.compile_think_time(None)(random.Random()))
+
+  def test_range(self):
+    think_time = scenario.compile_think_time([1, 2])
+    rng = random.Random(1)
+    for _ in range(10):
+      self.assertTrue(1 <= think_time(rng) <= 2)
+
+  def test_invalid(self):
+    self.assertRaises(ValueError, scenario.compile_think_time, [1, 2, 3])
+
+
+class CompileScenarioTestCase(LocalServerTestCase):
+
+  def compile_mix(self, *entries):
+    return scenario.compile_scenario({"mix": list(entries)})
+
+  def test_plan(self):
+    plan = scenario.compile_scenario(SCENARIO)
+    self.assertEqual("mix", plan.name)
+    self.assertEqual(["translate primer json to provn",
+                      "validate and normalize"],
+                     [operation.name for operation in plan.operations])
+    self.assertEqual([3, 4], plan.cumulative)
+    self.assertEqual(4, plan.total)
+    self.assertEqual((0.2, 2, 1),
+                     (plan.duration, plan.concurrency, plan.seed))
+
+  def test_defaults(self):
+    plan = self.compile_mix({"operation": "validate"})
+    self.assertEqual("validate primer json", plan.operations[0].name)
+    self.assertEqual(1, plan.operations[0].weight)
+    self.assertEqual((scenario.DEFAULT_DURATION,
+                      scenario.DEFAULT_CONCURRENCY),
+                     (plan.duration, plan.concurrency))
+
+  def test_invalid(self):
+    self.assertRaises(ValueError, scenario.compile_scenario, {})
+    self.assertRaises(ValueError, self.compile_mix, {"operation": "fetch"})
+    self.assertRaises(ValueError, self.compile_mix,
+                      {"operation": "validate", "document": "missing"})
+    self.assertRaises(ValueError, self.compile_mix,
+                      {"operation": "validate", "weight": 0})
+    self.assertRaises(ValueError, self.compile_mix,
+                      {"operation": "translate", "to": "pdf"})
+    self.assertRaises(ValueError, scenario.compile_scenario,
+                      {"documents": {"large": {"unknown": 1}},
+                       "mix": [{"operation": "validate"}]})
+
+  def test_operations(self):
+    plan = scenario.compile_scenario(SCENARIO)
+    for operation in plan.operations:
+      self.assertIsNone(operation.run(random.Random(1)), operation.name)
+
+  def test_get_format(self):
+    self.addCleanup(scenario.STORED.delete_all)
+    plan = self.compile_mix({"operation": "get-format",
+                             "formats": [standards.PROVN, standards.TTL]})
+    rng = random.Random(1)
+    for _ in range(4):
+      self.assertIsNone(plan.operations[0].run(rng))
+    self.assertEqual(1, len(self.server.provstore.ids()))
+
+  def test_run(self):
+    plan = scenario.compile_scenario(SCENARIO)
+    report = plan.run()
+    self.assertTrue(report.count > 0)
+    self.assertEqual(0, report.error_count)
+    self.assertTrue(set(report.operations) <=
+                    set([operation.name for operation in plan.operations]))
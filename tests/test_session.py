@@ -0,0 +1,114 @@
+"""Unit tests for :mod:`prov_service_tests.session`.
+"""
+# Copyright (c) 2015 University of Southampton
+#
+# Permission is hereby granted, free of charge, to any person
+# obtaining a copy of this software and associated documentation files
+# (the "Software"), to deal in the Software without restriction,
+# including without limitation the rights to use, copy, modify, merge,
+# publish, distribute, sublicense, and/or sell copies of the Software,
+# and to permit persons to whom the Software is furnished to do so,
+# subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be
+# included in all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND,
+# EXPRESS OR IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF
+# MERCHANTABILITY, FITNESS FOR A PARTICULAR PURPOSE AND
+# NONINFRINGEMENT. IN NO EVENT SHALL THE AUTHORS OR COPYRIGHT HOLDERS
+# BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER LIABILITY, WHETHER IN AN
+# ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM, OUT OF OR IN
+# CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+
+from __future__ import (absolute_import, division, print_function,
+                        unicode_literals)
+
+import json
+import os
+
+import requests
+
+from prov_service_tests import compression
+from prov_service_tests import http
+from prov_service_tests import server
+from prov_service_tests import session
+from prov_service_tests import standards
+from prov_service_tests import test_provstore
+from tests import LocalServerTestCase
+from tests import restore_env
+
+ENDPOINT = "POST /store/api/v0/documents/"
+"""str or unicode: endpoint to which documents are posted"""
+
+
+class UncompressedRequestHandler(server.ServiceRequestHandler):
+  """Request handler which, like some deployments of the services,
+  refuses compressed request bodies with 415 UNSUPPORTED MEDIA TYPE.
+  The content coding of each request is recorded in the server's
+  ``codings``.
+  """
+
+  def route(self):
+    coding = self.get_request_coding()
+    self.server.codings.append(coding)
+    if coding != compression.IDENTITY:
+      self.read_raw_body()
+      self.respond(415)
+      return
+    server.ServiceRequestHandler.route(self)
+
+  do_GET = route
+  do_POST = route
+  do_DELETE = route
+
+
+class CompressionTestCase(LocalServerTestCase):
+
+  def setUp(self):
+    super(CompressionTestCase, self).setUp()
+    self.addCleanup(restore_env, compression.COMPRESSION_ENV,
+                    os.environ.get(compression.COMPRESSION_ENV))
+    os.environ[compression.COMPRESSION_ENV] = compression.GZIP
+    refused = set(compression.REFUSED)
+    compression.REFUSED.clear()
+    self.addCleanup(compression.REFUSED.update, refused)
+    self.addCleanup(compression.REFUSED.clear)
+    self.server.codings = []
+    self.http_session = session.create_session()
+    self.addCleanup(self.http_session.close)
+
+  def post(self):
+    """Post a document to the server.
+
+    :return: response
+    :rtype: :class:`requests.Response`
+    """
+    authorization = "ApiKey " + server.API_KEY
+    return self.http_session.post(
+      self.server.provstore_url,
+      headers=test_provstore.ProvStoreTestCase.get_headers(standards.JSON,
+                                                           authorization),
+      data=json.dumps({"public": True, "rec_id": "compression",
+                       "content": '{"entity": {"ex:a": {}}}'}))
+
+  def test_compressed(self):
+    response = self.post()
+    self.assertEqual(requests.codes.created, response.status_code)
+    self.assertEqual(compression.GZIP,
+                     response.request.headers[http.CONTENT_ENCODING])
+    self.assertNotIn(ENDPOINT, compression.REFUSED)
+
+  def test_refused(self):
+    self.server.RequestHandlerClass = UncompressedRequestHandler
+    response = self.post()
+    self.assertEqual(requests.codes.created, response.status_code)
+    self.assertNotIn(http.CONTENT_ENCODING, response.request.headers)
+    self.assertEqual([compression.GZIP, compression.IDENTITY],
+                     self.server.codings)
+    self.assertIn(ENDPOINT, compression.REFUSED)
+    # Later requests to the endpoint are not compressed.
+    self.assertEqual(requests.codes.created, self.post().status_code)
+    self.assertEqual([compression.GZIP, compression.IDENTITY,
+                      compression.IDENTITY], self.server.codings)
@@ -0,0 +1,89 @@
+"""Unit tests for :mod:`prov_service_tests.timing`.
+"""
+# Copyright (c) 2015 University of Southampton
+#
+# Permission is hereby granted, free of charge, to any person
+# obtaining a copy of this software and associated documentation files
+# (the "Software"), to deal in the Software without restriction,
+# including without limitation the rights to use, copy, modify, merge,
+# publish, distribute, sublicense, and/or sell copies of the Software,
+# and to permit persons to whom the Software is furnished to do so,
+# subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be
+# included in all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND,
+# EXPRESS OR IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF
+# MERCHANTABILITY, FITNESS FOR A PARTICULAR PURPOSE AND
+# NONINFRINGEMENT. IN NO EVENT SHALL THE AUTHORS OR COPYRIGHT HOLDERS
+# BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER LIABILITY, WHETHER IN AN
+# ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM, OUT OF OR IN
+# CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+
+from __future__ import (absolute_import, division, print_function,
+                        unicode_literals)
+
+import unittest
+
+from prov_service_tests import timing
+
+
+class PercentileTestCase(unittest.TestCase):
+
+  def test_empty(self):
+    self.assertIsNone(timing.percentile([], 50))
+
+  def test_nearest_rank(self):
+    values = [15, 20, 35, 40, 50]
+    self.assertEqual(20, timing.percentile(values, 30))
+    self.assertEqual(20, timing.percentile(values, 40))
+    self.assertEqual(35, timing.percentile(values, 50))
+    self.assertEqual(50, timing.percentile(values, 100))
+
+  def test_bounds(self):
+    self.assertEqual(1, timing.percentile([1, 2, 3], 0))
+    self.assertEqual(3, timing.percentile([1, 2, 3], 150))
+
+  def test_summarise(self):
+    summary = timing.summarise([float(value) for value in range(100, 0, -1)])
+    self.assertEqual({"p50": 50, "p90": 90, "p99": 99, "max": 100}, summary)
+
+
+class EndpointTemplateTestCase(unittest.TestCase):
+
+  def test_documents(self):
+    self.assertEqual(
+      "/store/api/v0/documents/",
+      timing.endpoint_template("https://host/store/api/v0/documents/"))
+
+  def test_document_extension(self):
+    self.assertEqual(
+      "/store/api/v0/documents/:id.json",
+      timing.endpoint_template(
+        "https://host/store/api/v0/documents/123.json"))
+
+  def test_bundle(self):
+    self.assertEqual(
+      "/store/api/v0/documents/:id/bundles/:bundle_id.json",
+      timing.endpoint_template(
+        "https://host/store/api/v0/documents/123/bundles/45.json"))
+
+  def test_query(self):
+    self.assertEqual(
+      "/store/api/v0/documents/:id",
+      timing.endpoint_template(
+        "http://host/store/api/v0/documents/123?format=json"))
+
+  def test_validator_resource(self):
+    self.assertEqual(
+      "/validator/provapi/documents/:id/validation/report",
+      timing.endpoint_template(
+        "http://host/validator/provapi/documents/abc/validation/report"))
+
+  def test_random_graph(self):
+    self.assertEqual(
+      "/validator/provapi/documents/random/:nodes/:degree/:seed",
+      timing.endpoint_template(
+        "http://host/validator/provapi/documents/random/10/2/5"))
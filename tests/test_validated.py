@@ -0,0 +1,90 @@
+"""Unit tests for the validated graph shared by ProvValidator tests,
+:class:`prov_service_tests.test_provvalidator.ValidatedGraph`.
+"""
+# Copyright (c) 2015 University of Southampton
+#
+# Permission is hereby granted, free of charge, to any person
+# obtaining a copy of this software and associated documentation files
+# (the "Software"), to deal in the Software without restriction,
+# including without limitation the rights to use, copy, modify, merge,
+# publish, distribute, sublicense, and/or sell copies of the Software,
+# and to permit persons to whom the Software is furnished to do so,
+# subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be
+# included in all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND,
+# EXPRESS OR IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF
+# MERCHANTABILITY, FITNESS FOR A PARTICULAR PURPOSE AND
+# NONINFRINGEMENT. IN NO EVENT SHALL THE AUTHORS OR COPYRIGHT HOLDERS
+# BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER LIABILITY, WHETHER IN AN
+# ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM, OUT OF OR IN
+# CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+
+from __future__ import (absolute_import, division, print_function,
+                        unicode_literals)
+
+import os
+import shutil
+import tempfile
+import time
+import unittest
+
+from prov_service_tests import runid
+from prov_service_tests import test_provvalidator
+from tests import restore_env
+
+URL = "http://localhost/provapi/documents/"
+""":class:`str` or :class:`unicode`: ProvValidator URL"""
+
+
+class ValidatedGraphTestCase(unittest.TestCase):
+
+  def setUp(self):
+    self.directory = tempfile.mkdtemp()
+    self.addCleanup(shutil.rmtree, self.directory)
+    self.addCleanup(restore_env, runid.RUN_ID_ENV,
+                    os.environ.get(runid.RUN_ID_ENV))
+    os.environ[runid.RUN_ID_ENV] = "run-1"
+    self.validations = []
+
+  def validate(self):
+    self.validations.append(1)
+    return URL + "graph-%d" % len(self.validations)
+
+  def test_shared_by_run(self):
+    graph = test_provvalidator.ValidatedGraph(self.directory)
+    self.assertEqual(URL + "graph-1", graph.get(URL, self.validate))
+    # Another process in the same run reads the graph from the file.
+    other = test_provvalidator.ValidatedGraph(self.directory)
+    self.assertEqual(URL + "graph-1", other.get(URL, self.validate))
+    self.assertEqual(1, len(self.validations))
+
+  def test_not_shared_by_other_run(self):
+    test_provvalidator.ValidatedGraph(self.directory).get(URL,
+                                                          self.validate)
+    os.environ[runid.RUN_ID_ENV] = "run-2"
+    other = test_provvalidator.ValidatedGraph(self.directory)
+    self.assertEqual(URL + "graph-2", other.get(URL, self.validate))
+
+  def test_remove_shared(self):
+    graph = test_provvalidator.ValidatedGraph(self.directory)
+    graph.get(URL, self.validate)
+    os.environ[runid.RUN_ID_ENV] = "run-2"
+    graph.get(URL + "other", self.validate)
+    graph.remove_shared("run-1")
+    names = os.listdir(self.directory)
+    self.assertEqual(2, len(names))
+    prefix = graph.get_prefix("run-2")
+    self.assertTrue(all(name.startswith(prefix) for name in names))
+
+  def test_remove_expired(self):
+    graph = test_provvalidator.ValidatedGraph(self.directory)
+    graph.get(URL, self.validate)
+    expired = time.time() - test_provvalidator.VALIDATED_MAX_AGE - 1
+    for name in os.listdir(self.directory):
+      os.utime(os.path.join(self.directory, name), (expired, expired))
+    graph.remove_shared("run-2")
+    self.assertEqual([], os.listdir(self.directory))